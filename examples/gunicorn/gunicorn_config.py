@@ -0,0 +1,20 @@
+"""
+Gunicorn Example Server Hooks
+
+Used with ``--preload`` so the application is created once in the master
+and shared with the workers.
+"""
+
+
+def pre_fork(server, worker):
+    """
+    Prepare the preloaded application before each worker is forked
+    """
+    server.app.wsgi().pre_fork()
+
+
+def post_fork(server, worker):
+    """
+    Re-initialize the per-worker state in the new worker
+    """
+    server.app.wsgi().post_fork()
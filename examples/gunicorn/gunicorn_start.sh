@@ -48,4 +48,4 @@ if [ -v INITIALIZE_VENV ]; then
 fi
 
 echo "Starting new instances..."
-gunicorn -b 127.0.0.1:8081 -w ${WORKER_COUNT} --error-logfile app-errors.log --access-logfile app-access.log --log-level DEBUG -D app:app
+gunicorn -b 127.0.0.1:8081 -w ${WORKER_COUNT} -c gunicorn_config.py --preload --error-logfile app-errors.log --access-logfile app-access.log --log-level DEBUG -D app:app
@@ -2,16 +2,26 @@
 Python WSGI-Ref Example App
 """
 import logging
+import os
 
 from stackinabox.services.hello import HelloService
 
 from stackinawsgi import App
 
-lf = logging.FileHandler('python-wsgi-ref.log')
-lf.setLevel(logging.DEBUG)
-log = logging.getLogger()
-log.addHandler(lf)
-log.setLevel(logging.DEBUG)
+# Debug logging slows down start-up and every request; enable it with
+# STACKINAWSGI_LOG_LEVEL=DEBUG when needed.
+log_level = os.environ.get('STACKINAWSGI_LOG_LEVEL', 'WARNING').upper()
+if log_level == 'DEBUG':
+    lf = logging.FileHandler('python-wsgi-ref.log')
+    lf.setLevel(logging.DEBUG)
+    logging.getLogger().addHandler(lf)
+try:
+    logging.getLogger().setLevel(log_level)
+except ValueError:
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger(__name__).warning(
+        'Unknown STACKINAWSGI_LOG_LEVEL {0}; using WARNING'.format(log_level)
+    )
 
 app = App([HelloService])
 app.StackInABoxUriUpdate('localhost:8081')
@@ -3,7 +3,7 @@ from setuptools import setup, find_packages
 
 REQUIRES = [
     'stackinabox',
-    'six',
+    'six>=1.12.0',
     'sphinx'
 ]
 
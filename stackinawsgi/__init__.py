@@ -3,4 +3,41 @@ Stack-In-A-WSGI
 """
 from __future__ import absolute_import
 
-from .wsgi.app import App  # noqa
+import importlib
+import sys
+
+
+__all__ = ['App']
+
+# Public names and the module providing them. They are imported on first
+# access so importing the package does not load the session and admin
+# stack, or StackInABox, until an App is actually needed.
+_lazy_attributes = {
+    'App': 'stackinawsgi.wsgi.app'
+}
+
+
+def __getattr__(name):
+    """
+    Import the lazy attributes on first access (PEP-562)
+    """
+    if name in _lazy_attributes:
+        module = importlib.import_module(_lazy_attributes[name])
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(
+        "module {0!r} has no attribute {1!r}".format(__name__, name)
+    )
+
+
+def __dir__():
+    """
+    Include the lazy attributes
+    """
+    return sorted(set(globals().keys()) | set(_lazy_attributes.keys()))
+
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    # module level __getattr__ is not supported; import eagerly
+    from .wsgi.app import App  # noqa
@@ -1,21 +1,41 @@
 """
 Stack-In-A-WSGI: StackInAWsgiAdmin
 """
+import cProfile
 import json
 import logging
+import math
+import pstats
 import re
+import weakref
+
+import six
+from six.moves.urllib.parse import parse_qs, unquote
 
 from stackinabox.services.service import StackInABoxService
 
-from stackinawsgi.exceptions import InvalidSessionId
+from stackinawsgi.exceptions import (
+    HoldQuotaExceeded,
+    InvalidSessionId,
+    RecordingConflict,
+    SessionExists
+)
+from stackinawsgi.session.faults import FaultInjector
+from stackinawsgi.session.ratelimit import RateLimiter
+from stackinawsgi.session.recorder import read_request_body
+from stackinawsgi.session.shaping import Shaper
 from stackinawsgi.session.service import (
-    global_sessions,
+    reserved_session_ids,
     session_regex
 )
+from stackinawsgi.wsgi import etag
 
 
 logger = logging.getLogger(__name__)
 
+session_id_matcher = re.compile(session_regex)
+session_id_segment_matcher = re.compile(r'^[\w-]+$')
+
 
 class StackInAWsgiAdmin(StackInABoxService):
     """
@@ -25,8 +45,24 @@ class StackInAWsgiAdmin(StackInABoxService):
     :ivar text_type base_uri: base URI for accessing the session to which the
         session uuid will be appended, http://localhost/stackinabox/ which
         would result in http://localhost/stackinabox/<session-id>/
+    :ivar dict dispatch_table: (HTTP method, path shape) to handler
+    :ivar :obj:`weakref.WeakKeyDictionary` info_cache: session information
+        documents of the sessions
     """
 
+    # default and maximum seconds GET /admin/events waits for an event
+    events_wait = 25.0
+    events_max_wait = 60.0
+
+    # maximum number of sessions created by POST /admin/{session}/clone
+    clone_max_targets = 1000
+
+    # maximum number of sessions changed by POST /admin/bulk
+    bulk_max_sessions = 1000
+
+    # default number of functions listed by GET /admin/{session}/profile
+    profile_limit = 50
+
     def __init__(self, session_manager, base_uri):
         """
         Initialize the Admin Interface
@@ -34,25 +70,64 @@ class StackInAWsgiAdmin(StackInABoxService):
         super(StackInAWsgiAdmin, self).__init__('admin')
         self.manager = session_manager
         self.base_uri = base_uri
+        # session -> (cache key, (document, ETag)), see helper_session_info
+        self.info_cache = weakref.WeakKeyDictionary()
 
-        self.register(
-            StackInABoxService.GET,
-            re.compile('^{0}$'.format(session_regex)),
-            StackInAWsgiAdmin.get_session_info
-        )
-
-        self.register(
-            StackInABoxService.DELETE, '/', StackInAWsgiAdmin.remove_session
-        )
-        self.register(
-            StackInABoxService.POST, '/', StackInAWsgiAdmin.create_session
-        )
-        self.register(
-            StackInABoxService.PUT, '/', StackInAWsgiAdmin.reset_session
-        )
-        self.register(
-            StackInABoxService.GET, '/', StackInAWsgiAdmin.get_sessions
-        )
+        # (method, path shape) -> handler, see :meth:`path_shape`
+        self.dispatch_table = {
+            (StackInABoxService.GET, '/'): StackInAWsgiAdmin.get_sessions,
+            (StackInABoxService.POST, '/'): StackInAWsgiAdmin.create_session,
+            (StackInABoxService.PUT, '/'): StackInAWsgiAdmin.reset_session,
+            (StackInABoxService.DELETE, '/'):
+                StackInAWsgiAdmin.remove_session,
+            (StackInABoxService.GET, '/events'): StackInAWsgiAdmin.get_events,
+            (StackInABoxService.POST, '/bulk'):
+                StackInAWsgiAdmin.bulk_sessions,
+            (StackInABoxService.GET, '/{session}'):
+                StackInAWsgiAdmin.get_session_info,
+            (StackInABoxService.GET, '/{session}/metrics'):
+                StackInAWsgiAdmin.get_metrics,
+            (StackInABoxService.POST, '/{session}/clone'):
+                StackInAWsgiAdmin.clone_session,
+            (StackInABoxService.PUT, '/{session}/journal'):
+                StackInAWsgiAdmin.start_journal,
+            (StackInABoxService.DELETE, '/{session}/journal'):
+                StackInAWsgiAdmin.stop_journal,
+            (StackInABoxService.GET, '/{session}/journal'):
+                StackInAWsgiAdmin.get_journal,
+            (StackInABoxService.PUT, '/{session}/shaping'):
+                StackInAWsgiAdmin.put_shaping,
+            (StackInABoxService.DELETE, '/{session}/shaping'):
+                StackInAWsgiAdmin.remove_shaping,
+            (StackInABoxService.GET, '/{session}/shaping'):
+                StackInAWsgiAdmin.get_shaping,
+            (StackInABoxService.PUT, '/{session}/faults'):
+                StackInAWsgiAdmin.put_faults,
+            (StackInABoxService.DELETE, '/{session}/faults'):
+                StackInAWsgiAdmin.remove_faults,
+            (StackInABoxService.GET, '/{session}/faults'):
+                StackInAWsgiAdmin.get_faults,
+            (StackInABoxService.PUT, '/{session}/profile'):
+                StackInAWsgiAdmin.start_profile,
+            (StackInABoxService.DELETE, '/{session}/profile'):
+                StackInAWsgiAdmin.stop_profile,
+            (StackInABoxService.GET, '/{session}/profile'):
+                StackInAWsgiAdmin.get_profile,
+            (StackInABoxService.GET, '/{session}/hold'):
+                StackInAWsgiAdmin.get_hold,
+            (StackInABoxService.GET, '/{session}/hold/{key}'):
+                StackInAWsgiAdmin.get_hold_value,
+            (StackInABoxService.PUT, '/{session}/hold/{key}'):
+                StackInAWsgiAdmin.put_hold_value,
+            (StackInABoxService.DELETE, '/{session}/hold/{key}'):
+                StackInAWsgiAdmin.remove_hold_value,
+        }
+        # path shape -> methods, for the 405 responses
+        self.dispatch_methods = {}
+        for method, shape in self.dispatch_table:
+            self.dispatch_methods.setdefault(shape, []).append(method)
+        for methods in self.dispatch_methods.values():
+            methods.sort()
 
     @property
     def base_uri(self):
@@ -79,6 +154,70 @@ class StackInAWsgiAdmin(StackInABoxService):
             )
         )
 
+    @staticmethod
+    def path_shape(uri):
+        """
+        Shape of an admin URI used as the dispatch table key
+
+        The session-id and hold key segments are replaced by placeholders,
+        f.e. /<session-id>/hold/<key> is /{session}/hold/{key}.
+
+        :param text_type uri: the URI for the request per StackInABox
+        :returns: text_type, or None when the URI is not an admin URI
+        """
+        path = uri.split('?', 1)[0]
+        if path in ('', '/'):
+            return '/'
+
+        segments = path[1:].split('/', 2)
+        if not session_id_segment_matcher.match(segments[0]):
+            return None
+        if len(segments) == 1:
+            if segments[0] in reserved_session_ids:
+                return '/' + segments[0]
+            return '/{session}'
+        if len(segments) == 3:
+            if segments[1] == 'hold' and segments[2]:
+                return '/{session}/hold/{key}'
+            return None
+        return '/{session}/' + segments[1]
+
+    def request(self, method, request, uri, headers):
+        """
+        Dispatch an admin request through the dispatch table
+
+        Requests the table does not route fall back to the StackInABox
+        routes registered on the service.
+
+        :param text_type method: HTTP method of the request
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+        :returns: tuple for StackInABox HTTP Response
+        """
+        shape = self.path_shape(uri)
+        handler = self.dispatch_table.get((method, shape))
+        if handler is not None:
+            return handler(self, request, uri, headers)
+
+        methods = self.dispatch_methods.get(shape)
+        if methods is not None:
+            return (
+                405,
+                {'allow': ', '.join(methods)},
+                '{0} not supported. Supported Methods are {1}'.format(
+                    method,
+                    methods
+                )
+            )
+
+        return super(StackInAWsgiAdmin, self).request(
+            method,
+            request,
+            uri,
+            headers
+        )
+
     def helper_get_session_id(self, headers):
         """
         Helper to retrieve the session id or build a new one
@@ -86,16 +225,32 @@ class StackInAWsgiAdmin(StackInABoxService):
         :param dict headers: case insensitive header dictionary
         :returns: text_type with the UUID of the session
         """
-        session_id = None
-
-        if 'x-session-id' in headers:
-            session_id = headers['x-session-id']
-        else:
+        session_id = self.helper_get_header(headers, 'x-session-id')
+        if session_id is None:
             logger.debug('x-session-id not in headers')
 
         logger.debug('Found Session Id: {0}'.format(session_id))
         return session_id
 
+    def helper_get_header(self, headers, name, default=None):
+        """
+        Helper to retrieve an optional header value
+
+        WSGI servers provide the header names with underscores instead of
+        dashes so both forms are checked.
+
+        :param dict headers: header dictionary
+        :param text_type name: lower-case header name, e.g x-session-id
+        :param default: value to return if the header is not present
+        :returns: the header value or the default
+        """
+        wsgi_name = name.replace('-', '_')
+        for k, v in headers.items():
+            key = k.lower()
+            if key == name or key == wsgi_name:
+                return v
+        return default
+
     def helper_get_session_id_from_uri(self, uri):
         """
         Helper to retrieve the Session-ID FROM a URI
@@ -103,9 +258,8 @@ class StackInAWsgiAdmin(StackInABoxService):
         :param text_type uri: complete URI
         :returns: text_type with the session-id
         """
-        matcher = re.compile(session_regex)
         try:
-            matched_groups = matcher.match(uri)
+            matched_groups = session_id_matcher.match(uri)
             session_id = matched_groups.group(0)[1:]
             logger.debug(
                 'Helper Get Session From URI - URI: "{0}", '
@@ -138,6 +292,40 @@ class StackInAWsgiAdmin(StackInABoxService):
             session_id
         )
 
+    def helper_get_rate_limiter(self, request, headers):
+        """
+        Build the rate limits requested for a new session
+
+        The JSON body takes precedence over the headers.
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param dict headers: case insensitive header dictionary
+        :returns: :obj:`RateLimiter` or None if no limit was requested
+        :raises: ValueError if the requested limits are invalid
+        """
+        config = {}
+        rate_limit = self.helper_get_header(headers, 'x-rate-limit')
+        if rate_limit is not None:
+            config.update(RateLimiter.parse_header(rate_limit))
+        service_limits = self.helper_get_header(
+            headers,
+            'x-service-rate-limit'
+        )
+        if service_limits is not None:
+            config['services'] = RateLimiter.parse_service_header(
+                service_limits
+            )
+
+        body = read_request_body(request) if request is not None else b''
+        if body.strip():
+            document = json.loads(body.decode('utf-8'))
+            if not isinstance(document, dict):
+                raise ValueError('Session options must be an object')
+            if 'rate-limit' in document:
+                config = document['rate-limit']
+
+        return RateLimiter.from_config(config)
+
     def create_session(self, request, uri, headers):
         """
         Create a new session
@@ -151,12 +339,22 @@ class StackInAWsgiAdmin(StackInABoxService):
         HTTP Request:
             POST /admin/
                 X-Session-ID: (Optional) Session-ID to use when creating the
-                    new session
+                    new session; letters, digits, '_' and '-' only, and not
+                    one of the admin resources "bulk" and "events"
+                X-Rate-Limit: (Optional) <rate>[/<burst>] requests per second
+                    allowed for the session
+                X-Service-Rate-Limit: (Optional) <service>=<rate>[/<burst>]
+                    comma separated requests per second allowed per service
+
+                Body: (Optional) JSON object, replaces the rate limit headers
+                    {"rate-limit": {"rate": 10, "burst": 20,
+                                    "services": {"hello": {"rate": 5}}}}
 
         HTTP Responses:
             201 - Session Created
                 X-Session-ID header contains the session-id
                 Location header contains the URL for the session
+            400 - Invalid rate limit, invalid or reserved Session-ID
         """
         requested_session_id = self.helper_get_session_id(
             headers
@@ -164,19 +362,27 @@ class StackInAWsgiAdmin(StackInABoxService):
         logging.debug(
             'Requested Session Id: {0}'.format(requested_session_id)
         )
+        try:
+            rate_limiter = self.helper_get_rate_limiter(request, headers)
+        except ValueError as ex:
+            return (400, {}, 'Invalid Rate Limit: {0}'.format(ex))
 
-        session_id = self.manager.create_session(
-            requested_session_id
-        )
+        try:
+            session_id = self.manager.create_session(
+                requested_session_id,
+                rate_limiter=rate_limiter
+            )
+        except InvalidSessionId as ex:
+            return (400, {}, str(ex))
         logging.debug(
             'Created Session Id: {0}'.format(session_id)
         )
 
-        headers['x-session-id'] = session_id
-        headers['location'] = self.helper_get_uri(
-            session_id
-        )
-        return (201, headers, '')
+        response_headers = {
+            'x-session-id': session_id,
+            'location': self.helper_get_uri(session_id)
+        }
+        return (201, response_headers, '')
 
     def remove_session(self, request, uri, headers):
         """
@@ -204,9 +410,9 @@ class StackInAWsgiAdmin(StackInABoxService):
             )
 
         except InvalidSessionId as ex:
-            return (404, headers, str(ex))
+            return (404, {}, str(ex))
         else:
-            return (204, headers, '')
+            return (204, {}, '')
 
     def reset_session(self, request, uri, headers):
         """
@@ -235,13 +441,66 @@ class StackInAWsgiAdmin(StackInABoxService):
             )
 
         except InvalidSessionId as ex:
-            return (404, headers, str(ex))
+            return (404, {}, str(ex))
         else:
-            return (205, headers, '')
+            return (205, {}, '')
 
-    def get_session_info(self, request, uri, headers):
+    def helper_get_clone_targets(self, session_id, request):
         """
-        Get Session Information - TBD
+        Read the session ids of the clones from the request body
+
+        :param text_type session_id: session being cloned
+        :param :obj:`Request` request: object containing the HTTP Request
+        :returns: tuple of (list of text_type session ids, int number of
+            session ids to generate)
+        :raises: ValueError if the request is invalid
+        """
+        body = read_request_body(request) if request is not None else b''
+        document = json.loads(body.decode('utf-8')) if body.strip() else {}
+        if not isinstance(document, dict):
+            raise ValueError('Clone options must be an object')
+
+        target_ids = document.get('session-ids', [])
+        if not isinstance(target_ids, list):
+            raise ValueError('session-ids must be a list')
+        for target_id in target_ids:
+            if not isinstance(target_id, six.string_types) or (
+                    not session_id_segment_matcher.match(target_id)):
+                raise ValueError(
+                    'Invalid Session ID: {0}'.format(target_id)
+                )
+            if target_id in reserved_session_ids:
+                raise ValueError(
+                    'Reserved Session ID: {0}'.format(target_id)
+                )
+        if len(set(target_ids)) != len(target_ids):
+            raise ValueError('Duplicate Session IDs')
+        if session_id in target_ids:
+            raise ValueError('A session cannot be cloned into itself')
+
+        count = document.get('count', 0 if target_ids else 1)
+        if isinstance(count, bool) or not isinstance(
+                count, six.integer_types) or count < 0:
+            raise ValueError('count must be a non-negative integer')
+
+        total = len(target_ids) + count
+        if not total:
+            raise ValueError('No sessions to create')
+        if total > self.clone_max_targets:
+            raise ValueError(
+                'At most {0} sessions can be created'.format(
+                    self.clone_max_targets
+                )
+            )
+        return (target_ids, count)
+
+    def clone_session(self, request, uri, headers):
+        """
+        Create sessions in the same state as an existing session
+
+        The services, hold, fixtures and rate limit, shaping and fault
+        configurations are copied into each new session; the trackers and
+        the journal are not.
 
         :param :obj:`Request` request: object containing the HTTP Request
         :param text_type uri: the URI for the request per StackInABox
@@ -250,55 +509,310 @@ class StackInAWsgiAdmin(StackInABoxService):
         :returns: tuple for StackInABox HTTP Response
 
         HTTP Request:
-            GET /admin/{X-Session-ID}
-                X-Session-ID: (Required) Session-ID to reset
+            POST /admin/{X-Session-ID}/clone
+                Body: (Optional) JSON object, every key is optional
+                    {"session-ids": ["shard-1", "shard-2"], "count": 2}
+
+                session-ids are created as given and count more sessions
+                are created with new session-ids; one session is created
+                when neither is provided.
 
         HTTP Responses:
-            200 - Session Data in JSON format
+            201 - Sessions created; JSON object with the session-id and
+                location of each session
+            400 - Invalid options
+            404 - Session-ID Not Found
+            409 - A requested Session-ID is already in use
         """
-        requested_session_id = self.helper_get_session_id_from_uri(
-            uri
+        session_id = self.helper_get_session_id_from_uri(uri)
+        try:
+            target_ids, count = self.helper_get_clone_targets(
+                session_id,
+                request
+            )
+            target_ids = self.manager.clone_session(
+                session_id,
+                target_ids,
+                count
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        except SessionExists as ex:
+            return (409, {}, str(ex))
+
+        except ValueError as ex:
+            return (400, {}, 'Invalid Clone: {0}'.format(ex))
+
+        return (201, {'content-type': 'application/json'}, json.dumps({
+            'sessions': [
+                {
+                    'session-id': target_id,
+                    'location': self.helper_get_uri(target_id)
+                }
+                for target_id in target_ids
+            ]
+        }))
+
+    def helper_get_bulk_request(self, request):
+        """
+        Read the action and the session ids of a bulk request
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :returns: tuple of (text_type action, list of text_type session ids)
+        :raises: ValueError if the request is invalid
+        """
+        body = read_request_body(request) if request is not None else b''
+        document = json.loads(body.decode('utf-8')) if body.strip() else {}
+        if not isinstance(document, dict):
+            raise ValueError('Bulk options must be an object')
+
+        action = document.get('action')
+        if action not in ('create', 'reset', 'remove'):
+            raise ValueError('action must be create, reset or remove')
+
+        session_ids = document.get('session-ids')
+        if not isinstance(session_ids, list) or not session_ids:
+            raise ValueError('session-ids must be a non-empty list')
+        for session_id in session_ids:
+            if not isinstance(session_id, six.string_types):
+                raise ValueError('session-ids must be strings')
+        if len(set(session_ids)) != len(session_ids):
+            raise ValueError('Duplicate Session IDs')
+        if len(session_ids) > self.bulk_max_sessions:
+            raise ValueError(
+                'At most {0} sessions can be changed'.format(
+                    self.bulk_max_sessions
+                )
+            )
+        return (action, session_ids)
+
+    def bulk_sessions(self, request, uri, headers):
+        """
+        Create, reset or remove many sessions in one request
+
+        Each session is handled as by the single session request and the
+        outcome is reported per session; a failure does not stop the
+        remaining sessions.
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            POST /admin/bulk
+                Body: JSON object
+                    {"action": "create", "session-ids": ["a", "b"]}
+
+                action is "create", "reset" or "remove".
+
+        HTTP Responses:
+            200 - JSON object with the status each session would have had
+                from the single session request
+                {"results": [{"session-id": "a", "status": 201}]}
+            400 - Invalid options
+        """
+        try:
+            action, session_ids = self.helper_get_bulk_request(request)
+        except ValueError as ex:
+            return (400, {}, 'Invalid Bulk Request: {0}'.format(ex))
+
+        results = []
+        for session_id in session_ids:
+            try:
+                if action == 'create':
+                    self.manager.create_session(session_id)
+                    status = 201
+                elif action == 'reset':
+                    self.manager.reset_session(session_id)
+                    status = 205
+                else:
+                    self.manager.remove_session(session_id)
+                    status = 204
+
+            except InvalidSessionId:
+                status = 400 if action == 'create' else 404
+
+            results.append({'session-id': session_id, 'status': status})
+
+        return (200, {'content-type': 'application/json'}, json.dumps({
+            'results': results
+        }))
+
+    def start_journal(self, request, uri, headers):
+        """
+        Start recording the traffic sent to a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            PUT /admin/{X-Session-ID}/journal
+                X-Journal-Bodies: (Optional) true to store the request and
+                    response bodies instead of only their digests
+                X-Journal-Max-Bytes: (Optional) journal rotation size
+
+        HTTP Responses:
+            200 - Recording; journal information in JSON format
+            400 - Invalid X-Journal-Max-Bytes value
+            404 - Session-ID Not Found
+            409 - Session already recorded with other options
+        """
+        session_id = self.helper_get_session_id_from_uri(uri)
+        include_bodies = self.helper_get_header(
+            headers,
+            'x-journal-bodies',
+            'false'
+        ).lower() in ('1', 'true', 'yes')
+        max_bytes = self.helper_get_header(headers, 'x-journal-max-bytes')
+
+        if max_bytes is not None:
+            try:
+                max_bytes = int(max_bytes)
+            except ValueError:
+                return (400, {}, 'Invalid X-Journal-Max-Bytes')
+
+        try:
+            recorder = self.manager.start_recording(
+                session_id,
+                include_bodies=include_bodies,
+                max_bytes=max_bytes
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        except RecordingConflict as ex:
+            return (409, {}, str(ex))
+
+        return (200, {}, json.dumps({
+            'journal': recorder.path,
+            'include_bodies': recorder.include_bodies,
+            'max_bytes': recorder.max_bytes,
+            'dropped': recorder.dropped
+        }))
+
+    def stop_journal(self, request, uri, headers):
+        """
+        Stop recording the traffic sent to a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            DELETE /admin/{X-Session-ID}/journal
+
+        HTTP Responses:
+            204 - Recording stopped
+            404 - Session-ID Not Found
+        """
+        try:
+            self.manager.stop_recording(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+        else:
+            return (204, {}, '')
+
+    def get_journal(self, request, uri, headers):
+        """
+        Stream the recorded traffic of a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            GET /admin/{X-Session-ID}/journal
+
+        HTTP Responses:
+            200 - Journal entries, one JSON document per line
+            404 - Session-ID Not Found or the session is not being recorded
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        recorder = session.recorder
+        if recorder is None:
+            return (404, {}, 'Session is not being recorded')
+
+        return (
+            200,
+            {'content-type': 'application/x-ndjson'},
+            recorder.iter_journal()
         )
 
-        session_info = {
-            'session_valid': requested_session_id in global_sessions,
-            'created-time': None,
-            'accessed-time': None,
-            'accessed-count': 0,
-            'http-status': {}
-        }
+    def put_shaping(self, request, uri, headers):
+        """
+        Configure the simulated latency and bandwidth of a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            PUT /admin/{X-Session-ID}/shaping
+                Body: JSON object, every key is optional
+                    {"latency": {"distribution": "normal", "mean-ms": 100,
+                                 "stddev-ms": 20},
+                     "bandwidth": 65536,
+                     "seed": 42,
+                     "routes": [{"method": "GET", "path": "^/hello/",
+                                 "latency": {"distribution": "fixed",
+                                             "ms": 250}}]}
+
+                Latency distributions are "fixed" (ms), "normal" (mean-ms,
+                stddev-ms) or "histogram" (buckets: [[upper-ms, count]]);
+                bandwidth is in bytes per second.
 
-        if session_info['session_valid']:
-            session = global_sessions[requested_session_id]
-            session_info['created-time'] = session.created_at.isoformat()
-            session_info['accessed-time'] = (
-                session.last_accessed_at.isoformat()
+        HTTP Responses:
+            200 - Shaping configured; configuration in JSON format
+            400 - Invalid configuration
+            404 - Session-ID Not Found
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+            shaper = Shaper.from_config(
+                json.loads(read_request_body(request).decode('utf-8'))
             )
-            session_info['accessed-count'] = session.access_count
-            session_info['http-status'] = session.status_tracker
 
-        data = {
-            'base_url': self.base_uri,
-            'services': {
-                svc().name: svc.__name__
-                for svc in self.manager.services
-            },
-            'trackers': {
-                'created-time': session_info['created-time'],
-                'accessed': {
-                    'time': session_info['accessed-time'],
-                    'count': session_info['accessed-count']
-                },
-                'status': session_info['http-status']
-            },
-            'session_valid': session_info['session_valid']
-        }
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
 
-        return (200, headers, json.dumps(data))
+        except ValueError as ex:
+            return (400, {}, 'Invalid Shaping: {0}'.format(ex))
 
-    def get_sessions(self, request, uri, headers):
+        session.shaper = shaper
+        session.dirty = True
+        return (200, {'content-type': 'application/json'}, json.dumps(
+            shaper.config() if shaper is not None else None
+        ))
+
+    def get_shaping(self, request, uri, headers):
         """
-        Get Session List - TBD
+        Get the simulated latency and bandwidth of a session
 
         :param :obj:`Request` request: object containing the HTTP Request
         :param text_type uri: the URI for the request per StackInABox
@@ -307,21 +821,658 @@ class StackInAWsgiAdmin(StackInABoxService):
         :returns: tuple for StackInABox HTTP Response
 
         HTTP Request:
-            GET /admin/
+            GET /admin/{X-Session-ID}/shaping
 
         HTTP Responses:
-            200 - Session List in JSON format
+            200 - Configuration in JSON format, null when not shaped
+            404 - Session-ID Not Found
         """
-        data = {
-            'base_url': self.base_uri,
-            'services': {
-                svc().name: svc.__name__
-                for svc in self.manager.services
-            },
-            'sessions': [
-                requested_session_id
-                for requested_session_id in global_sessions
-            ]
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        return (200, {'content-type': 'application/json'}, json.dumps(
+            session.shaper.config() if session.shaper is not None else None
+        ))
+
+    def remove_shaping(self, request, uri, headers):
+        """
+        Stop simulating latency and bandwidth for a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            DELETE /admin/{X-Session-ID}/shaping
+
+        HTTP Responses:
+            204 - Shaping removed
+            404 - Session-ID Not Found
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        session.shaper = None
+        session.dirty = True
+        return (204, {}, '')
+
+    def helper_faults_info(self, session):
+        """
+        Fault injection configuration and counters of a session
+
+        :param :obj:`Session` session: the session
+        :returns: dict or None when no faults are injected
+        """
+        if session.faults is None:
+            return None
+        info = session.faults.config()
+        info['injected'] = dict(session.faults.injected)
+        return info
+
+    def put_faults(self, request, uri, headers):
+        """
+        Configure the faults injected into the responses of a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            PUT /admin/{X-Session-ID}/faults
+                Body: JSON object
+                    {"seed": 42,
+                     "rules": [{"fault": "error", "probability": 0.1,
+                                "method": "GET", "path": "^/hello/",
+                                "status": 503},
+                               {"fault": "reset", "probability": 0.05,
+                                "after-bytes": 0},
+                               {"fault": "truncate", "probability": 0.05,
+                                "after-bytes": 10},
+                               {"fault": "drip", "probability": 0.05,
+                                "chunk-bytes": 1, "interval-ms": 100}]}
+
+        HTTP Responses:
+            200 - Faults configured; configuration in JSON format
+            400 - Invalid configuration
+            404 - Session-ID Not Found
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+            faults = FaultInjector.from_config(
+                json.loads(read_request_body(request).decode('utf-8'))
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        except ValueError as ex:
+            return (400, {}, 'Invalid Faults: {0}'.format(ex))
+
+        with session.lock:
+            session.faults = faults
+            session.dirty = True
+        return (
+            200,
+            {'content-type': 'application/json'},
+            json.dumps(self.helper_faults_info(session))
+        )
+
+    def get_faults(self, request, uri, headers):
+        """
+        Get the fault injection rules and counters of a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            GET /admin/{X-Session-ID}/faults
+
+        HTTP Responses:
+            200 - Configuration and injected fault counts in JSON format,
+                null when no faults are injected
+            404 - Session-ID Not Found
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        return (
+            200,
+            {'content-type': 'application/json'},
+            json.dumps(self.helper_faults_info(session))
+        )
+
+    def remove_faults(self, request, uri, headers):
+        """
+        Stop injecting faults into a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            DELETE /admin/{X-Session-ID}/faults
+
+        HTTP Responses:
+            204 - Fault injection removed
+            404 - Session-ID Not Found
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        with session.lock:
+            session.faults = None
+            session.dirty = True
+        return (204, {}, '')
+
+    def start_profile(self, request, uri, headers):
+        """
+        Start profiling the calls into a session
+
+        Starting again discards the statistics collected so far.
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            PUT /admin/{X-Session-ID}/profile
+
+        HTTP Responses:
+            204 - Profiling started
+            404 - Session-ID Not Found
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        with session.lock:
+            session.profiler = cProfile.Profile()
+        return (204, {}, '')
+
+    def get_profile(self, request, uri, headers):
+        """
+        Get the profile of the calls into a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            GET /admin/{X-Session-ID}/profile?sort=<key>&limit=<count>
+                sort: (Optional) :mod:`pstats` sort key, defaults to
+                    cumulative
+                limit: (Optional) number of functions listed, defaults to
+                    :attr:`profile_limit`
+
+        HTTP Responses:
+            200 - Profile in the :mod:`pstats` text format, empty when no
+                call was profiled yet
+            400 - Invalid sort or limit value
+            404 - Session-ID Not Found or the session is not profiled
+        """
+        query = parse_qs(getattr(request, 'query', None) or '')
+        sort = query.get('sort', ['cumulative'])[0]
+        try:
+            limit = query.get('limit')
+            limit = int(limit[0]) if limit else self.profile_limit
+        except ValueError:
+            return (400, {}, 'Invalid Profile Query')
+        if limit <= 0 or sort not in pstats.Stats.sort_arg_dict_default:
+            return (400, {}, 'Invalid Profile Query')
+
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        stream = six.StringIO()
+        with session.lock:
+            profiler = session.profiler
+            if profiler is None:
+                return (404, {}, 'Session is not being profiled')
+            if profiler.getstats():
+                stats = pstats.Stats(profiler, stream=stream)
+                stats.sort_stats(sort).print_stats(limit)
+
+        return (
+            200,
+            {'content-type': 'text/plain'},
+            stream.getvalue()
+        )
+
+    def stop_profile(self, request, uri, headers):
+        """
+        Stop profiling the calls into a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            DELETE /admin/{X-Session-ID}/profile
+
+        HTTP Responses:
+            204 - Profiling stopped; the statistics are discarded
+            404 - Session-ID Not Found
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        with session.lock:
+            session.profiler = None
+        return (204, {}, '')
+
+    def helper_get_hold_name(self, uri):
+        """
+        Helper to retrieve the hold value name from a URI
+
+        :param text_type uri: complete URI, /<session-id>/hold/<name>
+        :returns: text_type with the name
+        """
+        return unquote(uri.split('/hold/', 1)[1])
+
+    def get_hold(self, request, uri, headers):
+        """
+        Get the hold usage of a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            GET /admin/{X-Session-ID}/hold
+
+        HTTP Responses:
+            200 - Hold usage in JSON format
+            404 - Session-ID Not Found
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        hold = session.hold
+        return (200, {}, json.dumps({
+            'quota': hold.quota,
+            'used': hold.used,
+            'evictions': hold.evictions,
+            'values': hold.sizes()
+        }))
+
+    def get_hold_value(self, request, uri, headers):
+        """
+        Get a value from the hold of a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            GET /admin/{X-Session-ID}/hold/{name}
+
+        HTTP Responses:
+            200 - The value; bytes and text as-is, anything else as JSON
+            404 - Session-ID or value Not Found
+            406 - Value cannot be represented
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+            value = session.hold[self.helper_get_hold_name(uri)]
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        except KeyError:
+            return (404, {}, 'No such hold value')
+
+        if isinstance(value, (six.binary_type, six.text_type)):
+            return (200, {'content-type': 'application/octet-stream'}, value)
+
+        try:
+            body = json.dumps(value)
+        except (TypeError, ValueError):
+            return (406, {}, 'Hold value cannot be represented')
+
+        return (200, {'content-type': 'application/json'}, body)
+
+    def put_hold_value(self, request, uri, headers):
+        """
+        Store the request body in the hold of a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            PUT /admin/{X-Session-ID}/hold/{name}
+
+        HTTP Responses:
+            204 - Value stored
+            404 - Session-ID Not Found
+            413 - Value is larger than the session's hold quota
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+            session.hold[self.helper_get_hold_name(uri)] = (
+                read_request_body(request)
+            )
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        except HoldQuotaExceeded as ex:
+            return (413, {}, str(ex))
+
+        return (204, {}, '')
+
+    def remove_hold_value(self, request, uri, headers):
+        """
+        Remove a value from the hold of a session
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            DELETE /admin/{X-Session-ID}/hold/{name}
+
+        HTTP Responses:
+            204 - Value removed
+            404 - Session-ID or value Not Found
+        """
+        try:
+            session = self.manager.get_session(
+                self.helper_get_session_id_from_uri(uri)
+            )
+            del session.hold[self.helper_get_hold_name(uri)]
+
+        except InvalidSessionId as ex:
+            return (404, {}, str(ex))
+
+        except KeyError:
+            return (404, {}, 'No such hold value')
+
+        return (204, {}, '')
+
+    def helper_queue_depth(self, session_id):
+        """
+        Number of calls queued for a session
+
+        :param text_type session_id: session-id
+        :returns: int, or None when the calls are not run on an executor
+        """
+        if self.manager.executor is None:
+            return None
+        return self.manager.executor.queue_depth(session_id)
+
+    def helper_trackers(self, session, queue_depth=None):
+        """
+        Access and status trackers of a session
+
+        :param :obj:`Session` session: the session or None if it is unknown
+        :param int queue_depth: calls queued for the session, if known
+        :returns: dict
+        """
+        trackers = {
+            'created-time': None,
+            'accessed': {
+                'time': None,
+                'count': 0
+            },
+            'status': {}
+        }
+        if session is not None:
+            trackers['created-time'] = session.created_at.isoformat()
+            trackers['accessed'] = {
+                'time': session.last_accessed_at.isoformat(),
+                'count': session.access_count
+            }
+            trackers['status'] = session.status_tracker
+        if queue_depth is not None:
+            trackers['queue-depth'] = queue_depth
+        return trackers
+
+    def helper_session_info(self, session_id, session):
+        """
+        Session information document and its entity tag
+
+        The document of a session is cached and only rebuilt once one of
+        its tracker values, its queue depth, the base URI or the services
+        changed.
+
+        :param text_type session_id: session-id
+        :param :obj:`Session` session: the session or None if it is unknown
+        :returns: tuple of (text_type JSON document, text_type ETag)
+        """
+        queue_depth = self.helper_queue_depth(session_id)
+        service_map = self.manager.service_map
+        key = None
+        if session is not None:
+            # read before the document is built so a concurrent change
+            # leaves a stale key that is rebuilt on the next call
+            key = (
+                session.tracker_version,
+                queue_depth,
+                self.base_uri,
+                service_map
+            )
+            cached = self.info_cache.get(session)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+
+        data = {
+            'base_url': self.base_uri,
+            'services': service_map,
+            'trackers': self.helper_trackers(session, queue_depth),
+            'session_valid': session is not None
+        }
+        if session is not None:
+            data['stats'] = session.stats.info()
+            if session.rate_limiter is not None:
+                data['rate-limit'] = session.rate_limiter.config()
+
+        body = json.dumps(data)
+        info = (body, etag.hash_body(body))
+        if session is not None:
+            self.info_cache[session] = (key, info)
+        return info
+
+    def get_session_info(self, request, uri, headers):
+        """
+        Get Session Information
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            GET /admin/{X-Session-ID}
+                If-None-Match: (Optional) ETag of a previous response
+
+        HTTP Responses:
+            200 - Session Data in JSON format, including the call counts
+                and latency histograms per service and per route
+                ETag header contains the entity tag of the document
+            304 - Session Data is unchanged
+        """
+        requested_session_id = self.helper_get_session_id_from_uri(
+            uri
+        )
+
+        session = self.manager.restore_session(requested_session_id)
+        body, tag = self.helper_session_info(requested_session_id, session)
+
+        response_headers = {'etag': tag}
+        if_none_match = self.helper_get_header(headers, 'if-none-match')
+        if if_none_match is not None and etag.etag_matches(
+                tag, if_none_match):
+            return (304, response_headers, '')
+
+        return (200, response_headers, body)
+
+    def get_metrics(self, request, uri, headers):
+        """
+        Get the trackers of a session, for frequent polling
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            GET /admin/{X-Session-ID}/metrics
+
+        HTTP Responses:
+            200 - Session trackers and statistics in JSON format
+            404 - Session-ID Not Found
+        """
+        session_id = self.helper_get_session_id_from_uri(uri)
+        session = self.manager.restore_session(session_id)
+        if session is None:
+            return (404, {}, 'Invalid Session ID')
+
+        return (200, {'content-type': 'application/json'}, json.dumps({
+            'trackers': self.helper_trackers(
+                session,
+                self.helper_queue_depth(session_id)
+            ),
+            'stats': session.stats.info()
+        }))
+
+    def get_events(self, request, uri, headers):
+        """
+        Long-poll the session lifecycle and tracker events
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            GET /admin/events?since=<version>&wait=<seconds>
+                since: (Optional) version of the last event received;
+                    without it the current version is returned at once
+                wait: (Optional) seconds to wait for an event, up to
+                    :attr:`events_max_wait`
+
+        HTTP Responses:
+            200 - Events in JSON format
+                {"version": <next cursor>, "reset": <re-fetch the sessions>,
+                 "events": [{"version": 1, "event": "created",
+                             "session-id": "...", "data": {}}]}
+            400 - Invalid since or wait value
+        """
+        query = parse_qs(getattr(request, 'query', None) or '')
+        try:
+            since = query.get('since')
+            since = int(since[0]) if since else None
+            wait = query.get('wait')
+            wait = float(wait[0]) if wait else self.events_wait
+        except ValueError:
+            return (400, {}, 'Invalid Events Query')
+        if wait < 0 or math.isnan(wait) or math.isinf(wait):
+            return (400, {}, 'Invalid Events Query')
+
+        feed = self.manager.events.since(
+            since,
+            min(wait, self.events_max_wait)
+        )
+        return (
+            200,
+            {'content-type': 'application/json'},
+            json.dumps(feed)
+        )
+
+    def get_sessions(self, request, uri, headers):
+        """
+        Get Session List - TBD
+
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request per StackInABox
+        :param dict headers: case insensitive header dictionary
+
+        :returns: tuple for StackInABox HTTP Response
+
+        HTTP Request:
+            GET /admin/
+
+        HTTP Responses:
+            200 - Session List in JSON format
+        """
+        data = {
+            'base_url': self.base_uri,
+            'services': self.manager.service_map,
+            'sessions': self.manager.session_ids()
         }
+        if self.manager.executor is not None:
+            data['executor'] = self.manager.executor.metrics()
 
-        return (200, headers, json.dumps(data))
+        return (200, {}, json.dumps(data))
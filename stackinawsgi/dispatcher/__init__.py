@@ -0,0 +1,3 @@
+"""
+Stack-In-A-WSGI: Dispatcher Module
+"""
@@ -0,0 +1,741 @@
+r"""
+Stack-In-A-WSGI: Multi-process Dispatcher
+
+Runs several worker processes, each serving its own :obj:`App` on a Unix
+socket, behind a single HTTP front-end. Requests for a session are always
+sent to the same worker so the session's in-memory state stays valid:
+
+- ``/stackinabox/<session-id>/...`` and ``/admin/<session-id>...`` go to
+  the worker selected by hashing the session-id
+- ``/admin/`` requests carrying an ``X-Session-ID`` go to the worker of that
+  session
+- ``POST /admin/`` without a session-id is assigned round-robin; the
+  dispatcher picks a session-id that hashes to the chosen worker
+- ``GET /admin/`` is sent to every worker and the session lists are merged
+- ``POST /admin/<session-id>/clone`` goes to the worker of the cloned
+  session, which keeps the clones; the dispatcher picks session-ids of
+  that worker for the clones and rejects requested session-ids owned by
+  another worker
+
+``GET /admin/events`` is not supported with more than one worker: every
+worker has its own event feed and versions, so the dispatcher answers 501
+instead of following the events of a single worker. ``POST /admin/bulk``
+is answered with 501 as well since its sessions belong to several workers;
+send the single session requests instead.
+
+Command line usage (POSIX only):
+
+    python -m stackinawsgi.dispatcher.dispatcher mymodule:make_app \
+        --workers 4 --port 8081 [--preload]
+
+where ``make_app`` returns a configured :obj:`App`.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import six
+from six.moves import BaseHTTPServer, http_client, socketserver
+
+from stackinawsgi.admin.admin import StackInAWsgiAdmin
+
+
+logger = logging.getLogger(__name__)
+
+session_path_regex = re.compile(r'^/(?:stackinabox|admin)/([\w-]+)(?:/|$)')
+admin_root_regex = re.compile(r'^/admin/?$')
+events_path_regex = re.compile(r'^/admin/events/?$')
+bulk_path_regex = re.compile(r'^/admin/bulk/?$')
+clone_path_regex = re.compile(r'^/admin/[\w-]+/clone$')
+
+# headers that only apply to a single connection and are not forwarded
+hop_by_hop_headers = (
+    'connection',
+    'keep-alive',
+    'proxy-authenticate',
+    'proxy-authorization',
+    'te',
+    'trailer',
+    'transfer-encoding',
+    'upgrade'
+)
+
+
+class UnixWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """
+    wsgiref server listening on a Unix socket
+    """
+
+    address_family = socket.AF_UNIX
+    daemon_threads = True
+
+    def server_bind(self):
+        """
+        Bind the socket and set up the WSGI environment
+        """
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 80
+        self.setup_environ()
+
+    def get_request(self):
+        """
+        Accept a connection; Unix sockets have no peer address
+        """
+        request, _ = self.socket.accept()
+        return (request, ('127.0.0.1', 0))
+
+
+class WorkerRequestHandler(WSGIRequestHandler):
+    """
+    wsgiref request handler logging through the module logger
+    """
+
+    def log_message(self, format, *args):
+        """
+        Log the access line at debug level
+        """
+        logger.debug(format % args)
+
+
+def text_to_bytes(app):
+    """
+    WSGI middleware encoding text body chunks as UTF-8
+
+    Services may return text bodies, which WSGI servers reject on Python 3.
+
+    :param callable app: WSGI application
+    :returns: WSGI application
+    """
+    def encoded(environ, start_response):
+        return EncodedBody(app(environ, start_response))
+    return encoded
+
+
+class EncodedBody(object):
+    """
+    Response body encoding text chunks as UTF-8
+
+    The body of the wrapped application is closed with this one, as the
+    server only calls close() on the iterable it was given.
+    """
+
+    def __init__(self, body):
+        """
+        :param iterable body: response body of the wrapped application
+        """
+        self.body = body
+
+    def __iter__(self):
+        """
+        Iterate the chunks as bytes
+        """
+        for chunk in self.body:
+            if isinstance(chunk, six.text_type):
+                chunk = chunk.encode('utf-8')
+            yield chunk
+
+    def close(self):
+        """
+        Close the wrapped body
+        """
+        close = getattr(self.body, 'close', None)
+        if close is not None:
+            close()
+
+
+class UnixHTTPConnection(http_client.HTTPConnection):
+    """
+    HTTP connection to a worker's Unix socket
+    """
+
+    def __init__(self, path, timeout=60):
+        """
+        :param text_type path: path of the Unix socket
+        :param float timeout: socket timeout in seconds
+        """
+        http_client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        """
+        Connect to the Unix socket
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class FrontServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    HTTP server accepting the client connections
+    """
+
+    daemon_threads = True
+
+
+class DispatchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Forwards each request to the worker chosen by the :obj:`Dispatcher`
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    # number of bytes relayed at a time
+    chunk_size = 64 * 1024
+
+    def log_message(self, format, *args):
+        """
+        Log the access line at debug level
+        """
+        logger.debug(format % args)
+
+    def forward(self):
+        """
+        Forward the request and relay the response
+        """
+        dispatcher = self.server.dispatcher
+        path = self.path.split('?', 1)[0]
+        if events_path_regex.match(path) and dispatcher.workers > 1:
+            self.send_error(501, 'Events are per worker')
+            return
+        if bulk_path_regex.match(path) and dispatcher.workers > 1:
+            self.send_error(501, 'Bulk requests span several workers')
+            return
+
+        if 'chunked' in (self.headers.get('Transfer-Encoding') or '').lower():
+            self.send_error(411)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                raise ValueError('negative length')
+        except ValueError:
+            self.send_error(400, 'Invalid Content-Length')
+            return
+        body = self.rfile.read(length) if length else None
+        # the Content-Length is set again for the body sent to the worker
+        headers = [
+            (name, value)
+            for name, value in self.headers.items()
+            if name.lower() not in hop_by_hop_headers and (
+                name.lower() != 'content-length')
+        ]
+
+        index, extra_headers = dispatcher.route(
+            self.command,
+            self.path,
+            self.headers
+        )
+        headers.extend(extra_headers)
+
+        if self.command == 'POST' and clone_path_regex.match(path):
+            try:
+                body = dispatcher.clone_body(index, body)
+            except ValueError as ex:
+                self.send_error(400, 'Invalid Clone: {0}'.format(ex))
+                return
+
+        try:
+            if index is None:
+                self.relay_merged(dispatcher, headers, body)
+            else:
+                self.relay(dispatcher, index, headers, body)
+        except (IOError, OSError, http_client.HTTPException):
+            logger.exception('Worker failed to answer {0} {1}'.format(
+                self.command,
+                self.path
+            ))
+            self.send_error(502)
+
+    do_DELETE = do_GET = do_HEAD = do_OPTIONS = forward
+    do_PATCH = do_POST = do_PUT = forward
+
+    def relay(self, dispatcher, index, headers, body):
+        """
+        Send the request to a worker and stream the response to the client
+        """
+        connection, response = dispatcher.send(
+            index,
+            self.command,
+            self.path,
+            headers,
+            body
+        )
+        try:
+            self.send_response(response.status, response.reason)
+            length = None
+            for name, value in response.getheaders():
+                if name.lower() in hop_by_hop_headers:
+                    continue
+                if name.lower() == 'content-length':
+                    length = value
+                self.send_header(name, value)
+
+            bodiless = any((
+                self.command == 'HEAD',
+                response.status in (204, 304),
+                response.status < 200
+            ))
+            if length is None and not bodiless:
+                # the worker ends the body by closing the connection
+                self.close_connection = True
+                self.send_header('Connection', 'close')
+            self.end_headers()
+
+            if bodiless:
+                return
+            while True:
+                chunk = response.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+        finally:
+            connection.close()
+
+    def relay_merged(self, dispatcher, headers, body):
+        """
+        Send the request to every worker and merge the session lists
+
+        The first worker answering with an error has its response relayed.
+        """
+        merged = None
+        for index in range(dispatcher.workers):
+            connection, response = dispatcher.send(
+                index,
+                self.command,
+                self.path,
+                headers,
+                body
+            )
+            try:
+                status = response.status
+                content_type = response.getheader(
+                    'Content-Type',
+                    'text/plain'
+                )
+                data = response.read()
+            finally:
+                connection.close()
+            if status != 200:
+                # the request is invalid for every worker, f.e. a bad query
+                self.send_payload(status, content_type, data)
+                return
+
+            data = json.loads(data.decode('utf-8'))
+            if merged is None:
+                merged = data
+            else:
+                merged['sessions'].extend(data['sessions'])
+
+        self.send_payload(
+            200,
+            'application/json',
+            json.dumps(merged).encode('utf-8')
+        )
+
+    def send_payload(self, status, content_type, payload):
+        """
+        Send a complete response to the client
+
+        :param int status: HTTP status
+        :param text_type content_type: Content-Type of the payload
+        :param bytes payload: the response body
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class Dispatcher(object):
+    """
+    Front-end routing requests to worker processes by session affinity
+
+    :ivar callable app_factory: creates the :obj:`App` served by a worker
+    :ivar int workers: number of worker processes
+    :ivar bool preload: create the :obj:`App` once before forking the
+        workers instead of in each worker
+    :ivar text_type socket_dir: directory of the worker Unix sockets
+    """
+
+    def __init__(self, app_factory, workers=None, host='127.0.0.1',
+                 port=8081, preload=False, socket_dir=None, timeout=60):
+        """
+        Configure the dispatcher
+
+        :param callable app_factory: callable returning an :obj:`App`
+        :param int workers: number of worker processes, defaults to the
+            number of CPUs
+        :param text_type host: address the front-end listens on
+        :param int port: port the front-end listens on; 0 picks a free port
+        :param bool preload: create the :obj:`App` in this process and fork
+            the workers from it; see :meth:`App.pre_fork`
+        :param text_type socket_dir: directory for the worker sockets,
+            defaults to a new temporary directory
+        :param float timeout: seconds to wait for a worker
+        """
+        self.app_factory = app_factory
+        self.workers = workers or multiprocessing.cpu_count()
+        self.host = host
+        self.port = port
+        self.preload = preload
+        self.timeout = timeout
+        self._owns_socket_dir = socket_dir is None
+        self.socket_dir = socket_dir
+        self.server = None
+        self._pids = []
+        self._round_robin = itertools.count()
+        self._serving = False
+
+    def socket_path(self, index):
+        """
+        Unix socket path of a worker
+
+        :param int index: worker index
+        :returns: text_type
+        """
+        return os.path.join(self.socket_dir, 'worker-{0}.sock'.format(index))
+
+    def worker_index(self, session_id):
+        """
+        Worker owning a session
+
+        :param text_type session_id: the session-id
+        :returns: int worker index
+        """
+        if isinstance(session_id, six.text_type):
+            session_id = session_id.encode('utf-8')
+        return (zlib.crc32(session_id) & 0xffffffff) % self.workers
+
+    def new_session_id(self, index=None):
+        """
+        Generate a session-id for a worker
+
+        :param int index: worker index, defaults to the next worker in
+            round-robin order
+        :returns: tuple of (int worker index, text_type session-id)
+        """
+        if index is None:
+            index = next(self._round_robin) % self.workers
+        while True:
+            session_id = str(uuid.uuid4())
+            if self.worker_index(session_id) == index:
+                return (index, session_id)
+
+    def route(self, method, path, headers):
+        """
+        Choose the worker for a request
+
+        :param text_type method: HTTP method
+        :param text_type path: request path including any query string
+        :param headers: request headers supporting case-insensitive get()
+        :returns: tuple of (worker index or None to send the request to all
+            workers, list of additional header tuples)
+        """
+        path = path.split('?', 1)[0]
+        matches = session_path_regex.match(path)
+        if matches:
+            return (self.worker_index(matches.group(1)), [])
+
+        if admin_root_regex.match(path):
+            session_id = headers.get('X-Session-ID')
+            if session_id:
+                return (self.worker_index(session_id), [])
+            if method == 'POST':
+                index, session_id = self.new_session_id()
+                return (index, [('X-Session-ID', session_id)])
+            if method == 'GET':
+                return (None, [])
+
+        return (next(self._round_robin) % self.workers, [])
+
+    def clone_body(self, index, body):
+        """
+        Choose the session-ids of the clones of a session
+
+        The clones are kept by the worker of the cloned session, so the
+        requested number of session-ids are generated for that worker and
+        listed in the body. Options the worker rejects anyway are left
+        unchanged.
+
+        :param int index: worker of the cloned session
+        :param bytes body: body of the clone request, None when empty
+        :returns: bytes, the body to send to the worker
+        :raises: ValueError if a requested session-id belongs to another
+            worker
+        """
+        if body is None or not body.strip():
+            document = {}
+        else:
+            try:
+                document = json.loads(body.decode('utf-8'))
+            except ValueError:
+                return body
+        if not isinstance(document, dict):
+            return body
+
+        session_ids = document.get('session-ids', [])
+        count = document.get('count', 0 if session_ids else 1)
+        if not isinstance(session_ids, list) or isinstance(count, bool) or (
+                not isinstance(count, six.integer_types)) or (
+                not 0 <= count <= StackInAWsgiAdmin.clone_max_targets):
+            return body
+
+        for session_id in session_ids:
+            if isinstance(session_id, six.string_types) and (
+                    self.worker_index(session_id) != index):
+                raise ValueError(
+                    'Session ID {0} belongs to another worker'.format(
+                        session_id
+                    )
+                )
+
+        document['session-ids'] = session_ids + [
+            self.new_session_id(index)[1] for _ in range(count)
+        ]
+        document['count'] = 0
+        return json.dumps(document).encode('utf-8')
+
+    def send(self, index, method, path, headers, body):
+        """
+        Send a request to a worker
+
+        :returns: tuple of (connection, :obj:`http_client.HTTPResponse`);
+            the caller closes the connection
+        """
+        connection = UnixHTTPConnection(
+            self.socket_path(index),
+            timeout=self.timeout
+        )
+        try:
+            connection.putrequest(
+                method,
+                path,
+                skip_host=True,
+                skip_accept_encoding=True
+            )
+            for name, value in headers:
+                connection.putheader(name, value)
+            if body is not None:
+                connection.putheader('Content-Length', str(len(body)))
+            connection.endheaders(body)
+            return (connection, connection.getresponse())
+        except Exception:
+            connection.close()
+            raise
+
+    def _worker_server(self, index, app):
+        """
+        Create the server of a worker's socket
+
+        :param int index: worker index
+        :param :obj:`App` app: the preloaded :obj:`App`, None to create one
+        :returns: :obj:`UnixWSGIServer`
+        """
+        if app is None:
+            app = self.app_factory()
+        else:
+            app.post_fork()
+        path = self.socket_path(index)
+        if os.path.exists(path):
+            os.remove(path)
+        server = UnixWSGIServer(path, WorkerRequestHandler)
+        server.set_app(text_to_bytes(app))
+        logger.debug('Worker {0} serving on {1}'.format(index, path))
+        return server
+
+    def _run_worker(self, index, app):
+        """
+        Serve an :obj:`App` on a worker's socket; runs in the worker
+        """
+        self._worker_server(index, app).serve_forever()
+
+    def _spawn(self, index, app):
+        """
+        Fork a worker process
+
+        :returns: int process id
+        """
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                self._run_worker(index, app)
+            except BaseException:
+                logger.exception('Worker {0} failed'.format(index))
+                code = 1
+            finally:
+                os._exit(code)
+        return pid
+
+    def _wait_for_workers(self):
+        """
+        Wait until every worker listens on its socket
+
+        :raises: RuntimeError if a worker exits or does not start in time
+        """
+        deadline = time.time() + self.timeout
+        for index, pid in enumerate(self._pids):
+            while not os.path.exists(self.socket_path(index)):
+                exited, _ = os.waitpid(pid, os.WNOHANG)
+                if exited or time.time() > deadline:
+                    raise RuntimeError(
+                        'Worker {0} failed to start'.format(index)
+                    )
+                time.sleep(0.01)
+
+    def start(self):
+        """
+        Start the workers and bind the front-end
+
+        :returns: tuple of the (host, port) the front-end listens on
+        """
+        if self.socket_dir is None:
+            self.socket_dir = tempfile.mkdtemp(prefix='stackinawsgi-')
+
+        app = None
+        if self.preload:
+            app = self.app_factory()
+            app.pre_fork()
+
+        try:
+            for index in range(self.workers):
+                self._pids.append(self._spawn(index, app))
+            self._wait_for_workers()
+            return self.bind()
+        except Exception:
+            self.stop_workers()
+            raise
+
+    def bind(self):
+        """
+        Bind the front-end to the workers' sockets
+
+        :returns: tuple of the (host, port) the front-end listens on
+        """
+        self.server = FrontServer((self.host, self.port), DispatchHandler)
+        self.server.dispatcher = self
+        logger.debug('Dispatching {0}:{1} to {2} workers'.format(
+            self.server.server_address[0],
+            self.server.server_address[1],
+            self.workers
+        ))
+        return self.server.server_address[:2]
+
+    def serve_forever(self):
+        """
+        Serve client requests until :meth:`shutdown` is called
+        """
+        self._serving = True
+        try:
+            self.server.serve_forever()
+        finally:
+            self._serving = False
+
+    def stop_workers(self):
+        """
+        Terminate the worker processes and remove their sockets
+        """
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in self._pids:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self._pids = []
+        if self._owns_socket_dir and self.socket_dir is not None:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+            self.socket_dir = None
+
+    def shutdown(self):
+        """
+        Stop the front-end and the workers
+
+        Must be called from another thread than :meth:`serve_forever`.
+        """
+        if self.server is not None:
+            if self._serving:
+                self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.stop_workers()
+
+
+def load_factory(path):
+    """
+    Import an application factory
+
+    :param text_type path: ``module:callable``
+    :returns: callable
+    """
+    module_name, _, name = path.partition(':')
+    return getattr(importlib.import_module(module_name), name)
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description='Serve stackinawsgi from several worker processes'
+    )
+    parser.add_argument('factory', help='module:callable returning an App')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--preload', action='store_true',
+                        help='create the App once before forking')
+    parser.add_argument('--socket-dir', default=None)
+    args = parser.parse_args(argv)
+
+    dispatcher = Dispatcher(
+        load_factory(args.factory),
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
+        preload=args.preload,
+        socket_dir=args.socket_dir
+    )
+    host, port = dispatcher.start()
+    print('Serving on http://{0}:{1}/ with {2} workers'.format(
+        host,
+        port,
+        dispatcher.workers
+    ))
+    try:
+        dispatcher.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.shutdown()
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -22,3 +22,31 @@ class NoServicesProvided(ValueError):
     Services were not provided
     """
     pass
+
+
+class HoldQuotaExceeded(ValueError):
+    """
+    Value is larger than the session's hold quota
+    """
+    pass
+
+
+class SessionBusy(RuntimeError):
+    """
+    Session lock could not be acquired in time
+    """
+    pass
+
+
+class SessionExists(ValueError):
+    """
+    Session-ID is already in use
+    """
+    pass
+
+
+class RecordingConflict(ValueError):
+    """
+    Session is already recorded with other options
+    """
+    pass
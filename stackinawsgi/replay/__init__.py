@@ -0,0 +1,3 @@
+"""
+Stack-In-A-WSGI: Replay Module
+"""
@@ -0,0 +1,445 @@
+r"""
+Stack-In-A-WSGI: Journal Replay
+
+Drives the entries of a session journal (see
+:obj:`stackinawsgi.session.recorder.Recorder`) against an :obj:`App`
+in-process or against a live server.
+
+Command line usage:
+
+    python -m stackinawsgi.replay.replay journal.jsonl \
+        --url http://localhost:8081/stackinabox/ --session-id <id> \
+        --concurrency 8 [--timing [--speed 2.0]]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import base64
+import io
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from timeit import default_timer
+
+import six
+from six.moves import http_client, queue
+from six.moves.urllib.parse import urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_journal(source):
+    """
+    Load journal entries
+
+    :param source: path to a journal or an iterable of lines
+    :returns: list of dict entries ordered by their recorded time
+    """
+    if isinstance(source, six.string_types):
+        with io.open(source, 'rb') as journal:
+            lines = journal.read().splitlines()
+    else:
+        lines = source
+
+    entries = []
+    for line in lines:
+        if isinstance(line, six.binary_type):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if line:
+            entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry.get('time', 0))
+    return entries
+
+
+def entry_body(entry):
+    """
+    Request body of a journal entry
+
+    :param dict entry: journal entry
+    :returns: bytes; empty if the journal did not include bodies
+    """
+    body = entry.get('request_body')
+    if body is None:
+        return b''
+    return base64.b64decode(body)
+
+
+def split_uri(uri):
+    """
+    Split a journal URI into its path and query string
+
+    :param text_type uri: URI relative to the session
+    :returns: tuple of (path, query string or None)
+    """
+    if '?' in uri:
+        path, query = uri.split('?', 1)
+        return (path, query)
+    return (uri, None)
+
+
+class AppTarget(object):
+    """
+    Replay target calling a WSGI :obj:`App` in-process
+    """
+
+    def __init__(self, app, server_name='localhost', port=80,
+                 prefix='/stackinabox'):
+        """
+        Configure the target
+
+        :param callable app: the WSGI application
+        :param text_type server_name: SERVER_NAME for the environment
+        :param int port: SERVER_PORT for the environment
+        :param text_type prefix: path prefix in front of the session-id
+        """
+        self.app = app
+        self.server_name = server_name
+        self.port = port
+        self.prefix = prefix
+
+    def send(self, entry, session_id):
+        """
+        Send a journal entry to the application
+
+        :param dict entry: journal entry
+        :param text_type session_id: session to send the entry to
+        :returns: int HTTP status code
+        """
+        path, query = split_uri(entry['uri'])
+        body = entry_body(entry)
+        environ = {
+            'wsgi.version': (1, 0),
+            'wsgi.errors': tempfile.TemporaryFile(),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.url_scheme': 'http',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REQUEST_METHOD': entry['method'],
+            'PATH_INFO': '{0}/{1}{2}'.format(self.prefix, session_id, path),
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': self.server_name,
+            'SERVER_PORT': str(self.port),
+            'CONTENT_LENGTH': str(len(body))
+        }
+        if query is not None:
+            environ['QUERY_STRING'] = query
+        for k, v in entry.get('headers', {}).items():
+            key = k.upper()
+            if key == 'CONTENT_TYPE':
+                # kept without the HTTP_ prefix per PEP-3333
+                environ[key] = v
+            elif key not in ('HOST', 'CONTENT_LENGTH'):
+                environ['HTTP_' + k] = v
+
+        status_line = []
+
+        def start_response(status, headers, exc_info=None):
+            status_line.append(status)
+
+        try:
+            for _ in self.app(environ, start_response):
+                pass
+        finally:
+            environ['wsgi.errors'].close()
+        return int(status_line[0].split(' ', 1)[0])
+
+
+class HttpTarget(object):
+    """
+    Replay target sending requests to a live server
+    """
+
+    # headers managed by the HTTP client
+    skip_headers = ('HOST', 'CONTENT_LENGTH', 'CONNECTION')
+
+    def __init__(self, url, timeout=30):
+        """
+        Configure the target
+
+        :param text_type url: URL of the session root, e.g
+            http://localhost:8081/stackinabox/
+        :param int timeout: socket timeout in seconds
+        """
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        """
+        Per-thread persistent connection
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self.scheme == 'https':
+                connection = http_client.HTTPSConnection(
+                    self.netloc,
+                    timeout=self.timeout
+                )
+            else:
+                connection = http_client.HTTPConnection(
+                    self.netloc,
+                    timeout=self.timeout
+                )
+            self._local.connection = connection
+        return connection
+
+    def send(self, entry, session_id):
+        """
+        Send a journal entry to the server
+
+        :param dict entry: journal entry
+        :param text_type session_id: session to send the entry to
+        :returns: int HTTP status code
+        """
+        headers = {
+            k.replace('_', '-'): v
+            for k, v in entry.get('headers', {}).items()
+            if k.upper().replace('-', '_') not in self.skip_headers
+        }
+        connection = self._connection()
+        try:
+            connection.request(
+                entry['method'],
+                '{0}/{1}{2}'.format(self.prefix, session_id, entry['uri']),
+                entry_body(entry),
+                headers
+            )
+            response = connection.getresponse()
+            response.read()
+        except Exception:
+            connection.close()
+            self._local.connection = None
+            raise
+        return response.status
+
+
+class ReplayResult(object):
+    """
+    Statistics from a replay run
+
+    :ivar int sent: number of entries sent
+    :ivar int errors: number of entries that failed to send
+    :ivar int mismatches: number of responses whose status differed from
+        the recorded one
+    :ivar dict status: count of responses per status code
+    :ivar list latencies: latency of each request in seconds
+    :ivar float elapsed: wall time of the run in seconds
+    """
+
+    def __init__(self):
+        """
+        Create an empty result
+        """
+        self.sent = 0
+        self.errors = 0
+        self.mismatches = 0
+        self.status = {}
+        self.latencies = []
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, entry, status, latency):
+        """
+        Record the outcome of a single request
+        """
+        with self._lock:
+            self.sent = self.sent + 1
+            if status is None:
+                self.errors = self.errors + 1
+                return
+
+            self.status[status] = self.status.get(status, 0) + 1
+            self.latencies.append(latency)
+            if entry.get('status') is not None and entry['status'] != status:
+                self.mismatches = self.mismatches + 1
+
+    @property
+    def throughput(self):
+        """
+        Requests per second over the run
+        """
+        if self.elapsed <= 0:
+            return 0.0
+        return self.sent / self.elapsed
+
+    def percentile(self, percent):
+        """
+        Latency percentile in seconds
+
+        :param float percent: percentile between 0 and 100
+        :returns: float, or None if there were no successful requests
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = int(round((percent / 100.0) * (len(ordered) - 1)))
+        return ordered[index]
+
+    def as_dict(self):
+        """
+        Summary suitable for JSON output
+        """
+        return {
+            'sent': self.sent,
+            'errors': self.errors,
+            'mismatches': self.mismatches,
+            'status': {str(k): v for k, v in self.status.items()},
+            'elapsed': self.elapsed,
+            'throughput': self.throughput,
+            'latency': {
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'max': self.percentile(100)
+            }
+        }
+
+
+class Replayer(object):
+    """
+    Replay journal entries against a target
+
+    :ivar list entries: journal entries to replay
+    :ivar target: :obj:`AppTarget` or :obj:`HttpTarget`
+    :ivar text_type session_id: session the entries are sent to
+    :ivar int concurrency: number of worker threads
+    :ivar bool preserve_timing: whether to keep the recorded spacing
+        between requests instead of sending at the maximum rate
+    :ivar float speed: timing multiplier when preserving timing
+    """
+
+    _stop = object()
+
+    def __init__(self, entries, target, session_id, concurrency=1,
+                 preserve_timing=False, speed=1.0):
+        """
+        Configure the replay
+        """
+        self.entries = entries
+        self.target = target
+        self.session_id = session_id
+        self.concurrency = max(1, concurrency)
+        self.preserve_timing = preserve_timing
+        self.speed = speed
+
+    def _send(self, entry, result):
+        """
+        Send one entry, recording the outcome
+        """
+        started = default_timer()
+        try:
+            status = self.target.send(entry, self.session_id)
+        except Exception:
+            logger.exception('Failed to replay {0} {1}'.format(
+                entry.get('method'),
+                entry.get('uri')
+            ))
+            status = None
+        result.add(entry, status, default_timer() - started)
+
+    def _worker(self, work, result):
+        """
+        Worker thread main loop
+        """
+        while True:
+            entry = work.get()
+            if entry is self._stop:
+                return
+            self._send(entry, result)
+
+    def _schedule(self, work, start):
+        """
+        Feed the workers, waiting for each entry's offset when preserving
+        timing
+        """
+        if not self.entries:
+            return
+
+        first = self.entries[0].get('time', 0)
+        for entry in self.entries:
+            if self.preserve_timing:
+                offset = (entry.get('time', first) - first) / self.speed
+                delay = offset - (default_timer() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            work.put(entry)
+
+    def run(self):
+        """
+        Replay all entries
+
+        :returns: :obj:`ReplayResult`
+        """
+        result = ReplayResult()
+        work = queue.Queue(maxsize=self.concurrency * 2)
+        workers = [
+            threading.Thread(target=self._worker, args=(work, result))
+            for _ in range(self.concurrency)
+        ]
+        start = default_timer()
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        self._schedule(work, start)
+        for _ in workers:
+            work.put(self._stop)
+        for worker in workers:
+            worker.join()
+
+        result.elapsed = default_timer() - start
+        return result
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description='Replay a Stack-In-A-WSGI session journal'
+    )
+    parser.add_argument('journal', help='path to the journal file')
+    parser.add_argument(
+        '--url',
+        required=True,
+        help='session root URL, e.g http://localhost:8081/stackinabox/'
+    )
+    parser.add_argument(
+        '--session-id',
+        required=True,
+        help='session to replay the journal into'
+    )
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument(
+        '--timing',
+        action='store_true',
+        help='preserve the recorded spacing between requests'
+    )
+    parser.add_argument('--speed', type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    replayer = Replayer(
+        load_journal(args.journal),
+        HttpTarget(args.url),
+        args.session_id,
+        concurrency=args.concurrency,
+        preserve_timing=args.timing,
+        speed=args.speed
+    )
+    result = replayer.run()
+    print(json.dumps(result.as_dict(), indent=2, sort_keys=True))
+    return 0 if result.errors == 0 else 1
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Stack-In-A-WSGI: Session Request Context
+"""
+from __future__ import absolute_import
+
+import contextlib
+import threading
+
+
+# Services reach the session serving the current request through this
+# thread-local; see current_session()
+_local = threading.local()
+
+
+def current_session():
+    """
+    The session handling the current request
+
+    :returns: :obj:`Session` or None if called outside of a session
+    """
+    return getattr(_local, 'session', None)
+
+
+@contextlib.contextmanager
+def serving(session):
+    """
+    Make a session the current session for the thread while serving a
+    request
+
+    :param :obj:`Session` session: the session serving the request
+    """
+    previous = current_session()
+    _local.session = session
+    try:
+        yield session
+    finally:
+        _local.session = previous
@@ -0,0 +1,154 @@
+"""
+Stack-In-A-WSGI: Session Event Feed
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventFeed(object):
+    """
+    Bounded feed of session lifecycle and tracker events
+
+    Every event gets the next version number. A client keeps the version of
+    the last event it received as its cursor and waits for the events after
+    it, receiving only what changed instead of re-fetching the session
+    documents. Consecutive updates of the same session are merged into one
+    event so a busy session does not push the other events out of the
+    feed. A client whose cursor is older than the oldest event kept is told
+    to reset, i.e. to re-fetch the documents and continue from the current
+    version.
+
+    Events are per process; each worker of a pre-fork server has its own.
+
+    Events:
+
+    - created: a session was created
+    - reset: a session was reset
+    - removed: a session was removed
+    - updated: a session was accessed, data holds the changed trackers
+
+    :ivar int max_events: number of events kept
+    :ivar int version: version of the latest event
+    """
+
+    def __init__(self, max_events=1024):
+        """
+        Create an empty feed
+        """
+        self.max_events = max_events
+        self.version = 0
+        self._init_process_state()
+
+    def _init_process_state(self):
+        """
+        Create the per-process events and condition
+        """
+        self._events = collections.deque()
+        self._condition = threading.Condition()
+        # clients waiting on the condition; publishers only notify when
+        # there is one
+        self._waiters = 0
+        # events up to this version are no longer kept
+        self._dropped = self.version
+
+    def post_fork(self):
+        """
+        Re-initialize the feed in a forked worker
+
+        Clients following the parent are told to reset.
+        """
+        self._init_process_state()
+
+    def publish(self, event, session_id, data=None):
+        """
+        Add an event and wake the waiting clients
+
+        :param text_type event: event name
+        :param text_type session_id: session the event is about
+        :param dict data: optional changed values; the data of merged
+            updates is combined
+        :returns: int, version of the event
+        """
+        with self._condition:
+            if event == 'updated' and self._events:
+                last = self._events[-1]
+                if last['event'] == 'updated' and (
+                        last['session-id'] == session_id):
+                    self._events.pop()
+                    merged = dict(last['data'])
+                    for name, value in (data or {}).items():
+                        if isinstance(value, dict) and isinstance(
+                                merged.get(name), dict):
+                            combined = dict(merged[name])
+                            combined.update(value)
+                            value = combined
+                        merged[name] = value
+                    data = merged
+
+            self.version = self.version + 1
+            self._events.append({
+                'version': self.version,
+                'event': event,
+                'session-id': session_id,
+                'data': data if data is not None else {}
+            })
+            while len(self._events) > self.max_events:
+                self._dropped = self._events.popleft()['version']
+            if self._waiters:
+                self._condition.notify_all()
+            return self.version
+
+    def _after(self, cursor):
+        """
+        Events after a cursor; caller holds the condition
+
+        Events are never modified once published, so they are shared with
+        the clients.
+
+        :returns: tuple of (list of events, boolean reset)
+        """
+        if cursor < self._dropped or cursor > self.version:
+            return ([], True)
+        return (
+            [event for event in self._events if event['version'] > cursor],
+            False
+        )
+
+    def since(self, cursor, timeout=0.0):
+        """
+        Wait for the events after a cursor
+
+        :param int cursor: version of the last event received, None to get
+            the current version without any event
+        :param float timeout: seconds to wait for an event
+        :returns: dict with the 'version' to use as the next cursor, the
+            'events' and whether the client must 'reset'
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            if cursor is None:
+                return {'version': self.version, 'events': [], 'reset': False}
+
+            while True:
+                events, reset = self._after(cursor)
+                remaining = deadline - time.time()
+                if events or reset or remaining <= 0:
+                    break
+                self._waiters = self._waiters + 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self._waiters = self._waiters - 1
+
+            return {
+                'version': self.version,
+                'events': events,
+                'reset': reset
+            }
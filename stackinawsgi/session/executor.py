@@ -0,0 +1,274 @@
+"""
+Stack-In-A-WSGI: Session Executor
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import threading
+from timeit import default_timer
+
+from six.moves import queue
+
+from stackinawsgi.exceptions import SessionBusy
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Job(object):
+    """
+    A queued session call
+    """
+
+    __slots__ = ('session', 'args', 'done', 'result', 'abandoned')
+
+    def __init__(self, session, args):
+        """
+        :param :obj:`Session` session: the session to call
+        :param tuple args: arguments for :meth:`Session.call`
+        """
+        self.session = session
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.abandoned = False
+
+
+class SessionExecutor(object):
+    """
+    Runs session calls on a bounded thread pool with backpressure
+
+    Each session has its own bounded queue, and its calls run one at a
+    time in order. The server thread only waits for the result, up to a
+    timeout. A hung handler therefore ties up one pool thread, not every
+    server thread sending requests to that session. Overload is answered
+    quickly with a Retry-After header:
+
+    - 429 when the session's queue is full
+    - 503 when the call did not complete in time, or the session lock could
+      not be acquired in time
+    - 503 right away for the calls waiting behind, or sent to, a session
+      whose running call has exceeded the timeout, instead of each of them
+      waiting out the timeout in turn
+
+    :ivar int workers: number of pool threads
+    :ivar int queue_size: maximum number of calls waiting per session
+    :ivar float timeout: seconds a request waits for its result
+    :ivar float lock_timeout: seconds a pool thread waits for a session lock
+    :ivar int retry_after: seconds sent in the Retry-After header
+    """
+
+    def __init__(self, workers=8, queue_size=32, timeout=30.0,
+                 lock_timeout=5.0, retry_after=1):
+        """
+        Configure the executor; the threads start with the first call
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.retry_after = retry_after
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.busy = 0
+        self._init_process_state()
+
+    def _init_process_state(self):
+        """
+        Create the per-process queues and thread state
+        """
+        self._lock = threading.Lock()
+        self._queues = {}
+        # session-id to the time its running call started
+        self._running = {}
+        self._ready = queue.Queue()
+        self._threads = []
+
+    def _start(self):
+        """
+        Start the pool threads if they are not running; caller holds the lock
+        """
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run,
+                name='stackinawsgi-executor-{0}'.format(index)
+            )
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def overloaded(self, status, reason):
+        """
+        Response for a call that was not served
+
+        :param int status: 429 or 503
+        :param text_type reason: body text
+        :returns: StackInABox response tuple
+        """
+        return (
+            status,
+            {'Retry-After': str(self.retry_after)},
+            'StackInAWSGI - {0}'.format(reason)
+        )
+
+    def _execute(self, job):
+        """
+        Run a job on a pool thread
+        """
+        try:
+            job.result = job.session.call_with_timeout(
+                self.lock_timeout,
+                *job.args
+            )
+        except SessionBusy:
+            with self._lock:
+                self.busy = self.busy + 1
+            job.result = self.overloaded(503, 'Session Busy')
+        except Exception:
+            logger.exception('Session {0}: call failed'.format(
+                job.session.session_id
+            ))
+            job.result = (500, {}, 'StackInAWSGI - Session Call Failed')
+        job.done.set()
+
+    def _run(self):
+        """
+        Pool thread main loop
+        """
+        while True:
+            session_id = self._ready.get()
+            if session_id is None:
+                return
+
+            with self._lock:
+                pending = self._queues[session_id]
+                job = pending.popleft() if pending else None
+                if job is not None:
+                    self._running[session_id] = default_timer()
+
+            if job is not None:
+                self._execute(job)
+
+            with self._lock:
+                self._running.pop(session_id, None)
+                if job is not None and not job.abandoned:
+                    self.completed = self.completed + 1
+                # the session keeps a single ready entry while calls wait
+                if self._queues[session_id]:
+                    self._ready.put(session_id)
+                else:
+                    del self._queues[session_id]
+
+    def call(self, session, *args):
+        """
+        Queue a call to :meth:`Session.call` and wait for the result
+
+        :param :obj:`Session` session: the session to call
+        :param args: arguments for :meth:`Session.call`
+        :returns: StackInABox response tuple
+        """
+        job = _Job(session, args)
+        session_id = session.session_id
+        with self._lock:
+            self._start()
+            if self._hung(session_id):
+                self.busy = self.busy + 1
+                logger.debug('Session {0}: call hung'.format(session_id))
+                return self.overloaded(503, 'Session Busy')
+            pending = self._queues.get(session_id)
+            if pending is None:
+                pending = self._queues[session_id] = collections.deque()
+                self._ready.put(session_id)
+            elif len(pending) >= self.queue_size:
+                self.rejected = self.rejected + 1
+                logger.debug('Session {0}: queue full'.format(session_id))
+                return self.overloaded(429, 'Session Queue Full')
+            pending.append(job)
+
+        if job.done.wait(self.timeout):
+            return job.result
+
+        with self._lock:
+            job.abandoned = True
+            self.timed_out = self.timed_out + 1
+            # drop the job unless a pool thread already took it
+            pending = self._queues.get(session_id, ())
+            hung = job not in pending and not job.done.is_set()
+            if job in pending:
+                pending.remove(job)
+            if hung:
+                # the calls behind a hung call would only time out as well
+                for waiting in pending:
+                    waiting.abandoned = True
+                    waiting.result = self.overloaded(503, 'Session Busy')
+                    waiting.done.set()
+                    self.busy = self.busy + 1
+                pending.clear()
+        logger.debug('Session {0}: call timed out'.format(session_id))
+        return self.overloaded(503, 'Session Call Timed Out')
+
+    def _hung(self, session_id):
+        """
+        Whether the running call of a session exceeded the timeout; caller
+        holds the lock
+
+        :param text_type session_id: the session-id
+        :returns: boolean
+        """
+        started = self._running.get(session_id)
+        return started is not None and (
+            default_timer() - started >= self.timeout)
+
+    def queue_depth(self, session_id):
+        """
+        Number of calls waiting for a session
+
+        :param text_type session_id: the session-id
+        :returns: int
+        """
+        with self._lock:
+            return len(self._queues.get(session_id, ()))
+
+    def metrics(self):
+        """
+        Executor counters and queue depths
+
+        :returns: dict
+        """
+        with self._lock:
+            depths = {
+                session_id: len(pending)
+                for session_id, pending in self._queues.items()
+            }
+            return {
+                'workers': self.workers,
+                'queue-size': self.queue_size,
+                'queued': sum(depths.values()),
+                'queue-depth': depths,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed-out': self.timed_out,
+                'busy': self.busy
+            }
+
+    def post_fork(self):
+        """
+        Reset the queues in a forked worker; the pool threads do not
+        survive the fork and are started again with the next call
+        """
+        self._init_process_state()
+
+    def shutdown(self):
+        """
+        Stop the pool threads after the queued calls
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+            for _ in threads:
+                self._ready.put(None)
+        for thread in threads:
+            thread.join()
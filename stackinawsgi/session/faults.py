@@ -0,0 +1,309 @@
+"""
+Stack-In-A-WSGI: Session Fault Injection
+"""
+from __future__ import absolute_import
+
+import logging
+import random
+import socket
+import struct
+
+from .shaping import RouteRule, ShapedBody
+
+
+logger = logging.getLogger(__name__)
+
+# WSGI environ key used to hand a response body fault to the application
+environ_key = 'stackinawsgi.fault'
+
+
+class InjectedReset(IOError):
+    """
+    Raised from a response body to make the server abort the connection
+    """
+    pass
+
+
+class FaultRule(RouteRule):
+    """
+    A fault injected into the requests matching a method and path
+
+    Faults:
+
+    - error: answer with ``status``, 100 to 599, without calling the
+      service
+    - reset: abort the connection after ``after-bytes`` of the body
+    - truncate: end the body after ``after-bytes`` while the Content-Length
+      announces the full body
+    - drip: send the body ``chunk-bytes`` at a time every ``interval-ms``
+
+    :ivar text_type fault: one of :attr:`faults`
+    :ivar float probability: chance a matching request gets the fault
+    :ivar dict options: fault specific options
+    """
+
+    faults = ('error', 'reset', 'truncate', 'drip')
+
+    defaults = {
+        'error': {'status': 503, 'body': 'StackInAWSGI - Injected Fault'},
+        'reset': {'after-bytes': 0},
+        'truncate': {'after-bytes': 0},
+        'drip': {'chunk-bytes': 1, 'interval-ms': 100.0}
+    }
+
+    def __init__(self, fault, probability=1.0, method=None, path=None,
+                 **options):
+        """
+        :raises: ValueError if the rule is invalid
+        """
+        super(FaultRule, self).__init__(method, path)
+        if fault not in self.faults:
+            raise ValueError('Unknown fault: {0}'.format(fault))
+        try:
+            probability = float(probability)
+        except TypeError:
+            raise ValueError('Probability must be a number')
+        if not 0.0 <= probability <= 1.0:
+            raise ValueError('Probability must be between 0 and 1')
+
+        self.fault = fault
+        self.probability = probability
+        self.options = dict(self.defaults[fault])
+        for name, value in options.items():
+            if name not in self.options:
+                raise ValueError(
+                    'Unknown {0} option: {1}'.format(fault, name)
+                )
+            self.options[name] = value
+
+        try:
+            for name in ('status', 'after-bytes', 'chunk-bytes'):
+                if name in self.options:
+                    self.options[name] = int(self.options[name])
+            if 'interval-ms' in self.options:
+                self.options['interval-ms'] = float(
+                    self.options['interval-ms']
+                )
+        except (TypeError, ValueError):
+            raise ValueError('Invalid {0} options'.format(fault))
+        invalid = (
+            not 100 <= self.options.get('status', 100) <= 599,
+            self.options.get('after-bytes', 0) < 0,
+            self.options.get('chunk-bytes', 1) < 1,
+            self.options.get('interval-ms', 0.0) < 0
+        )
+        if any(invalid):
+            raise ValueError('Invalid {0} options'.format(fault))
+
+    def config(self):
+        """
+        :returns: dict for :meth:`FaultInjector.from_config`
+        """
+        config = {
+            'fault': self.fault,
+            'probability': self.probability,
+            'method': self.method,
+            'path': self.path
+        }
+        config.update(self.options)
+        return config
+
+
+class FaultInjector(object):
+    """
+    Rule based fault injection for a session
+
+    Rules are checked in order and each matching rule draws from a random
+    generator seeded per session, so a run with the same seed and the same
+    requests injects the same faults. The first rule drawn is applied.
+
+    :ivar list rules: list of :obj:`FaultRule`
+    :ivar int seed: random seed or None
+    :ivar dict injected: fault name to number of faults injected
+    """
+
+    def __init__(self, rules, seed=None):
+        """
+        Create the injector and its random generator
+        """
+        self.rules = list(rules)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.injected = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the injector from its configuration
+
+        :param dict config: {'seed': int, 'rules': [{'fault': text_type,
+            'probability': float, 'method': text_type, 'path': regex,
+            ...fault options}]}
+        :returns: :obj:`FaultInjector` or None if there are no rules
+        :raises: ValueError if the configuration is invalid
+        """
+        if config is None:
+            return None
+        if not isinstance(config, dict):
+            raise ValueError('Faults must be an object')
+
+        rules = config.get('rules')
+        if rules is None:
+            rules = []
+        if not isinstance(rules, list):
+            raise ValueError('Fault rules must be a list')
+
+        fault_rules = []
+        for rule in rules:
+            if not isinstance(rule, dict):
+                raise ValueError('Fault rule must be an object')
+            options = dict(rule)
+            if 'fault' not in options:
+                raise ValueError('Fault rule is missing the fault')
+            fault_rules.append(FaultRule(**{
+                str(name): value for name, value in options.items()
+            }))
+
+        if not fault_rules:
+            return None
+        return cls(fault_rules, seed=config.get('seed'))
+
+    def config(self):
+        """
+        :returns: dict accepted by :meth:`from_config`
+        """
+        config = {'rules': [rule.config() for rule in self.rules]}
+        if self.seed is not None:
+            config['seed'] = self.seed
+        return config
+
+    def choose(self, method, uri):
+        """
+        Draw the fault for a request
+
+        :param text_type method: HTTP method of the request
+        :param text_type uri: URI of the request within the session
+        :returns: :obj:`FaultRule` or None
+        """
+        for rule in self.rules:
+            if rule.matches(method, uri) and (
+                    self.rng.random() < rule.probability):
+                self.injected[rule.fault] = (
+                    self.injected.get(rule.fault, 0) + 1
+                )
+                return rule
+        return None
+
+    def call(self, stack_call, method, request, uri, headers):
+        """
+        Call the service unless a fault replaces the response
+
+        Called by the session with its lock held.
+
+        :param callable stack_call: StackInABox.call of the session
+        :param text_type method: HTTP method of the request
+        :param :obj:`Request` request: object containing the HTTP Request
+        :param text_type uri: the URI for the request, <session-id>/...
+        :param dict headers: case insensitive header dictionary
+        :returns: StackInABox response tuple
+        """
+        rule = self.choose(method, uri[uri.find('/'):])
+        if rule is None:
+            return stack_call(method, request, uri, headers)
+
+        logger.debug('Injecting {0} fault into {1} {2}'.format(
+            rule.fault,
+            method,
+            uri
+        ))
+        if rule.fault == 'error':
+            return (rule.options['status'], {}, rule.options['body'])
+
+        result = stack_call(method, request, uri, headers)
+        environment = getattr(request, 'environment', None)
+        if environment is not None:
+            environment[environ_key] = rule
+        return result
+
+
+class FaultBody(object):
+    """
+    Response body iterable applying a reset, truncate or drip fault
+
+    :ivar iterable body: the response body chunks
+    :ivar :obj:`FaultRule` rule: the fault
+    :ivar dict environ: the WSGI environ of the request
+    """
+
+    def __init__(self, body, rule, environ):
+        """
+        Wrap a response body
+        """
+        self.body = body
+        self.rule = rule
+        self.environ = environ
+
+    def head(self, limit):
+        """
+        Yield the first bytes of the body
+
+        :param int limit: number of bytes to yield
+        """
+        sent = 0
+        for chunk in self.body:
+            if sent >= limit:
+                break
+            chunk = chunk[:limit - sent]
+            sent = sent + len(chunk)
+            yield chunk
+
+    def reset(self):
+        """
+        Abort the connection
+
+        The socket is closed with a zero linger time, sending a TCP reset,
+        when the server exposes it; otherwise an exception makes the server
+        drop the connection.
+        """
+        sock = self.environ.get('gunicorn.socket')
+        if sock is not None:
+            try:
+                sock.setsockopt(
+                    socket.SOL_SOCKET,
+                    socket.SO_LINGER,
+                    struct.pack('ii', 1, 0)
+                )
+                sock.close()
+            except (socket.error, OSError):
+                logger.debug('Failed to reset the connection')
+        raise InjectedReset('StackInAWSGI - Injected Connection Reset')
+
+    def __iter__(self):
+        """
+        Yield the body with the fault applied
+        """
+        options = self.rule.options
+        if self.rule.fault == 'drip':
+            interval = options['interval-ms'] / 1000.0
+            body = ShapedBody(
+                self.body,
+                0.0,
+                options['chunk-bytes'] / interval if interval else None,
+                chunk_size=options['chunk-bytes']
+            )
+            for chunk in body:
+                yield chunk
+            return
+
+        for chunk in self.head(options['after-bytes']):
+            yield chunk
+        if self.rule.fault == 'reset':
+            self.reset()
+
+    def close(self):
+        """
+        Close the wrapped body per PEP-3333
+        """
+        close = getattr(self.body, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,331 @@
+"""
+Stack-In-A-WSGI: Shared Fixture Store
+"""
+from __future__ import absolute_import
+
+import logging
+import mmap
+import threading
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping, MutableMapping
+
+import six
+
+from .context import current_session
+
+
+logger = logging.getLogger(__name__)
+
+
+class FrozenDict(Mapping):
+    """
+    Read-only mapping used for frozen fixture data
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        """
+        Wrap a dictionary
+
+        :param dict data: the dictionary; it must not be modified afterwards
+        """
+        self._data = data
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return 'FrozenDict({0!r})'.format(self._data)
+
+
+def freeze(value):
+    """
+    Convert a value to an immutable equivalent so it can be shared
+
+    dicts become :obj:`FrozenDict`, lists become tuples, sets become
+    frozensets and bytearrays become bytes. Containers are converted
+    recursively.
+
+    :param value: the value to freeze
+    :returns: the frozen value
+    """
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, Mapping):
+        return FrozenDict({
+            key: freeze(item)
+            for key, item in value.items()
+        })
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    if isinstance(value, bytearray):
+        return six.binary_type(value)
+    return value
+
+
+def thaw(value):
+    """
+    Create a mutable copy of a frozen value
+
+    :param value: a value produced by :func:`freeze` or a memory-mapped file
+    :returns: the mutable copy
+    """
+    if isinstance(value, Mapping):
+        return {
+            key: thaw(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    if isinstance(value, frozenset):
+        return set(thaw(item) for item in value)
+    if isinstance(value, mmap.mmap):
+        return bytearray(value[:])
+    return value
+
+
+def current_fixtures():
+    """
+    The fixture overlay of the session handling the current request
+
+    :returns: :obj:`FixtureOverlay` or None if called outside of a session
+    """
+    session = current_session()
+    if session is None:
+        return None
+    return session.fixtures
+
+
+class FixtureStore(object):
+    """
+    Read-only fixture data shared by every session
+
+    Data is registered once, normally while the services are registered,
+    and is frozen or memory-mapped so sessions can share it safely. Sessions
+    change fixtures through their :obj:`FixtureOverlay`.
+    """
+
+    def __init__(self):
+        """
+        Create an empty store
+        """
+        self._fixtures = {}
+        self._files = []
+        self._lock = threading.Lock()
+
+    def register(self, name, data):
+        """
+        Add a fixture
+
+        :param text_type name: name of the fixture
+        :param data: the fixture data; it is frozen recursively
+        :returns: the frozen data
+        """
+        frozen = freeze(data)
+        with self._lock:
+            self._fixtures[name] = frozen
+        logger.debug('Registered fixture {0}'.format(name))
+        return frozen
+
+    def register_file(self, name, path):
+        """
+        Add a fixture backed by a read-only memory map of a file
+
+        The pages are shared with the OS page cache instead of being copied
+        into each process.
+
+        :param text_type name: name of the fixture
+        :param text_type path: file to map
+        :returns: the :obj:`mmap.mmap`, or empty bytes for an empty file
+        """
+        with open(path, 'rb') as data_file:
+            try:
+                data = mmap.mmap(
+                    data_file.fileno(),
+                    0,
+                    access=mmap.ACCESS_READ
+                )
+            except ValueError:
+                # empty files cannot be mapped
+                data = b''
+
+        with self._lock:
+            self._fixtures[name] = data
+            if isinstance(data, mmap.mmap):
+                self._files.append(data)
+        logger.debug('Registered fixture {0} from {1}'.format(name, path))
+        return data
+
+    def __getitem__(self, name):
+        """
+        Retrieve the shared fixture data
+        """
+        return self._fixtures[name]
+
+    def __contains__(self, name):
+        return name in self._fixtures
+
+    def __len__(self):
+        return len(self._fixtures)
+
+    def names(self):
+        """
+        Names of the registered fixtures
+
+        :returns: list of text_type
+        """
+        return list(self._fixtures.keys())
+
+    def post_fork(self):
+        """
+        Replace the lock in a forked worker
+
+        The fixture data and memory maps stay shared with the parent.
+        """
+        self._lock = threading.Lock()
+
+    def close(self):
+        """
+        Remove all fixtures and release the memory maps
+        """
+        with self._lock:
+            self._fixtures.clear()
+            files, self._files = self._files, []
+        for data in files:
+            data.close()
+
+
+class FixtureOverlay(MutableMapping):
+    """
+    Per-session copy-on-write view of a :obj:`FixtureStore`
+
+    Reads return the shared data until the session changes a fixture;
+    only the changed fixtures are copied into the session.
+    """
+
+    __slots__ = ('store', '_overrides')
+
+    # marks a shared fixture removed from this session
+    _removed = object()
+
+    def __init__(self, store):
+        """
+        Create an overlay without any changes
+
+        :param :obj:`FixtureStore` store: the shared fixtures
+        """
+        self.store = store
+        self._overrides = {}
+
+    def __getitem__(self, name):
+        """
+        Retrieve the session's version of a fixture
+        """
+        if name in self._overrides:
+            value = self._overrides[name]
+            if value is self._removed:
+                raise KeyError(name)
+            return value
+        return self.store[name]
+
+    def __setitem__(self, name, value):
+        """
+        Replace a fixture for this session only
+        """
+        self._overrides[name] = value
+
+    def __delitem__(self, name):
+        """
+        Remove a fixture for this session only
+        """
+        if name not in self:
+            raise KeyError(name)
+        if name in self.store:
+            self._overrides[name] = self._removed
+        else:
+            del self._overrides[name]
+
+    def __iter__(self):
+        names = [
+            name
+            for name in self.store.names()
+            if name not in self._overrides
+        ]
+        names.extend(
+            name
+            for name, value in self._overrides.items()
+            if value is not self._removed
+        )
+        return iter(names)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def mutable(self, name):
+        """
+        Retrieve a fixture that the session may modify in place
+
+        The first call copies the shared data into the session.
+
+        :param text_type name: name of the fixture
+        :returns: the session's mutable copy
+        """
+        value = self[name]
+        if name not in self._overrides:
+            value = thaw(value)
+            self._overrides[name] = value
+        return value
+
+    def is_shared(self, name):
+        """
+        Whether the session still uses the shared copy of a fixture
+
+        :param text_type name: name of the fixture
+        :returns: boolean
+        """
+        return name not in self._overrides and name in self.store
+
+    def export_overrides(self):
+        """
+        The fixtures changed by the session
+
+        :returns: tuple of (dict of name to value, list of removed names)
+        """
+        overrides = {}
+        removed = []
+        for name, value in self._overrides.items():
+            if value is self._removed:
+                removed.append(name)
+            else:
+                overrides[name] = value
+        return (overrides, removed)
+
+    def import_overrides(self, overrides, removed):
+        """
+        Replace the session's changes with those from
+        :meth:`export_overrides`
+
+        :param dict overrides: name to value
+        :param list removed: names of removed fixtures
+        """
+        self._overrides = dict(overrides)
+        for name in removed:
+            self._overrides[name] = self._removed
+
+    def reset(self):
+        """
+        Drop the session's changes
+        """
+        self._overrides = {}
@@ -0,0 +1,168 @@
+"""
+Stack-In-A-WSGI: Session Hold (KV Store)
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import pickle
+import sys
+import threading
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping
+
+import six
+
+from stackinawsgi.exceptions import HoldQuotaExceeded
+from .context import current_session
+
+
+logger = logging.getLogger(__name__)
+
+
+def sizeof(value):
+    """
+    Estimate the memory used by a value stored in the hold
+
+    :param value: the value
+    :returns: int number of bytes
+    """
+    if isinstance(value, (six.binary_type, bytearray)):
+        return len(value)
+    if isinstance(value, six.text_type):
+        return len(value.encode('utf-8'))
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def current_hold():
+    """
+    The hold of the session handling the current request
+
+    :returns: :obj:`SessionHold` or None if called outside of a session
+    """
+    session = current_session()
+    if session is None:
+        return None
+    return session.hold
+
+
+class SessionHold(MutableMapping):
+    """
+    Per-session key-value store with a byte quota and LRU eviction
+
+    The hold replaces the session's ``StackInABox.holds`` dictionary so the
+    standard StackInABox hold calls operate on it.
+
+    :ivar int quota: maximum number of bytes stored; None for unlimited
+    :ivar int used: number of bytes currently stored
+    :ivar int evictions: number of values evicted to stay within the quota
+    """
+
+    __slots__ = ('quota', 'used', 'evictions', '_entries', '_lock')
+
+    def __init__(self, quota=None):
+        """
+        Create an empty hold
+
+        :param int quota: maximum number of bytes stored; None for unlimited
+        """
+        self.quota = quota
+        self.used = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __setitem__(self, name, value):
+        """
+        Store a value, evicting the least recently used values as needed
+
+        :raises: HoldQuotaExceeded if the value alone exceeds the quota
+        """
+        size = sizeof(value)
+        if self.quota is not None and size > self.quota:
+            raise HoldQuotaExceeded(
+                'Value of {0} bytes exceeds the hold quota of {1} '
+                'bytes'.format(size, self.quota)
+            )
+
+        with self._lock:
+            if name in self._entries:
+                self.used = self.used - self._entries.pop(name)[1]
+
+            if self.quota is not None:
+                while self._entries and self.used + size > self.quota:
+                    evicted, (_, evicted_size) = self._entries.popitem(
+                        last=False
+                    )
+                    self.used = self.used - evicted_size
+                    self.evictions = self.evictions + 1
+                    logger.debug(
+                        'Hold evicted {0} ({1} bytes)'.format(
+                            evicted,
+                            evicted_size
+                        )
+                    )
+
+            self._entries[name] = (value, size)
+            self.used = self.used + size
+
+    def __getitem__(self, name):
+        """
+        Retrieve a value, marking it as recently used
+        """
+        with self._lock:
+            entry = self._entries.pop(name)
+            self._entries[name] = entry
+            return entry[0]
+
+    def __delitem__(self, name):
+        """
+        Remove a value
+        """
+        with self._lock:
+            self.used = self.used - self._entries.pop(name)[1]
+
+    def __iter__(self):
+        """
+        Iterate the names, least recently used first
+        """
+        with self._lock:
+            return iter(list(self._entries.keys()))
+
+    def __len__(self):
+        """
+        Number of values stored
+        """
+        return len(self._entries)
+
+    def clear(self):
+        """
+        Remove all values
+        """
+        with self._lock:
+            self._entries.clear()
+            self.used = 0
+
+    def post_fork(self):
+        """
+        Replace the lock in a forked worker
+        """
+        self._lock = threading.RLock()
+
+    def sizes(self):
+        """
+        Size of each stored value
+
+        :returns: dict of name to int number of bytes
+        """
+        with self._lock:
+            return {
+                name: size
+                for name, (_, size) in self._entries.items()
+            }
@@ -0,0 +1,531 @@
+"""
+Stack-In-A-WSGI: Session Persistence
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+
+from stackinawsgi.exceptions import InvalidSessionId
+
+from .session import Session, session_id_matcher
+
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(object):
+    """
+    Storage backend interface for session checkpoints
+
+    Checkpoints are opaque bytes keyed by the session-id.
+    """
+
+    def save(self, session_id, data):
+        """
+        Store a checkpoint, replacing any previous one
+
+        :param text_type session_id: session the checkpoint is for
+        :param bytes data: the checkpoint
+        """
+        raise NotImplementedError()
+
+    def load(self, session_id):
+        """
+        Retrieve a checkpoint
+
+        :param text_type session_id: session to retrieve
+        :returns: bytes or None if there is no checkpoint
+        """
+        raise NotImplementedError()
+
+    def delete(self, session_id):
+        """
+        Remove a checkpoint if it exists
+
+        :param text_type session_id: session to remove
+        """
+        raise NotImplementedError()
+
+    def session_ids(self):
+        """
+        Session-ids with a checkpoint
+
+        :returns: list of text_type
+        """
+        raise NotImplementedError()
+
+    def post_fork(self):
+        """
+        Re-initialize per-process resources in a forked worker
+        """
+        pass
+
+    def close(self):
+        """
+        Release any resources held by the store
+        """
+        pass
+
+
+class FileSessionStore(SessionStore):
+    """
+    Stores each session checkpoint in its own file in a directory
+    """
+
+    suffix = '.session'
+
+    def __init__(self, directory):
+        """
+        Open the checkpoint directory
+
+        :param text_type directory: directory to store the checkpoints in
+        """
+        self.directory = directory
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, session_id):
+        """
+        Path of the checkpoint for a session
+
+        :raises: :obj:`InvalidSessionId` if the session-id is not a plain
+            file name
+        """
+        if not session_id_matcher.match(session_id):
+            raise InvalidSessionId(
+                'Invalid Session ID: {0}'.format(session_id)
+            )
+        return os.path.join(
+            self.directory,
+            '{0}{1}'.format(session_id, self.suffix)
+        )
+
+    def save(self, session_id, data):
+        """
+        Atomically replace the checkpoint file
+        """
+        handle, temp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as checkpoint:
+                checkpoint.write(data)
+            os.rename(temp_path, self._path(session_id))
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def load(self, session_id):
+        """
+        Read the checkpoint file
+        """
+        try:
+            with open(self._path(session_id), 'rb') as checkpoint:
+                return checkpoint.read()
+        except (IOError, OSError):
+            return None
+
+    def delete(self, session_id):
+        """
+        Remove the checkpoint file
+        """
+        try:
+            os.remove(self._path(session_id))
+        except (IOError, OSError):
+            pass
+
+    def session_ids(self):
+        """
+        Session-ids from the checkpoint file names
+        """
+        return [
+            name[:-len(self.suffix)]
+            for name in os.listdir(self.directory)
+            if name.endswith(self.suffix)
+        ]
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Stores the session checkpoints in a SQLite database
+    """
+
+    def __init__(self, path):
+        """
+        Open the checkpoint database
+
+        :param text_type path: path of the SQLite database
+        """
+        self.path = path
+        self._connect()
+
+    def _connect(self):
+        """
+        Open the database connection and create the table
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'session_id TEXT PRIMARY KEY, data BLOB NOT NULL)'
+            )
+            self._db.commit()
+
+    def save(self, session_id, data):
+        """
+        Insert or replace the checkpoint row
+        """
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO sessions (session_id, data) '
+                'VALUES (?, ?)',
+                (session_id, sqlite3.Binary(data))
+            )
+            self._db.commit()
+
+    def load(self, session_id):
+        """
+        Read the checkpoint row
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT data FROM sessions WHERE session_id = ?',
+                (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return bytes(row[0])
+
+    def delete(self, session_id):
+        """
+        Delete the checkpoint row
+        """
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM sessions WHERE session_id = ?',
+                (session_id,)
+            )
+            self._db.commit()
+
+    def session_ids(self):
+        """
+        Session-ids of all checkpoint rows
+        """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT session_id FROM sessions'
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def post_fork(self):
+        """
+        Open a new connection in a forked worker
+
+        SQLite connections must not be used across a fork. The inherited
+        connection is kept referenced, but unused, so it is not closed from
+        the worker either.
+        """
+        self._inherited_db = self._db
+        self._connect()
+
+    def close(self):
+        """
+        Close the database
+        """
+        with self._lock:
+            self._db.close()
+
+
+def is_persistable(service):
+    """
+    Whether a service instance opted in to persistence
+
+    Services opt out by setting ``stackinawsgi_persist = False`` on the
+    class.
+
+    :param :obj:`StackInABoxService` service: service instance
+    :returns: boolean
+    """
+    return getattr(service, 'stackinawsgi_persist', True)
+
+
+class SessionPersistence(object):
+    """
+    Checkpoints sessions to a :obj:`SessionStore` and restores them
+
+    Only sessions that were used since their last checkpoint are written.
+    Services that opted out, or that cannot be pickled, are not written
+    and start fresh when the session is restored.
+
+    Session-ids without a checkpoint are remembered for
+    :attr:`missing_ttl` seconds, so requests for unknown sessions do not
+    query the store every time.
+
+    :ivar :obj:`SessionStore` store: the storage backend
+    :ivar float interval: seconds between checkpoints; 0 disables the
+        background checkpoint thread
+    """
+
+    protocol = pickle.HIGHEST_PROTOCOL
+
+    # number of session-ids without a checkpoint remembered, and for how
+    # many seconds
+    max_missing = 4096
+    missing_ttl = 10.0
+
+    def __init__(self, store, interval=30.0):
+        """
+        Configure persistence
+        """
+        self.store = store
+        self.interval = interval
+        self._init_process_state()
+
+    def _init_process_state(self):
+        """
+        Create the per-process thread state
+        """
+        self._stopped = threading.Event()
+        self._thread = None
+        self._restore_lock = threading.Lock()
+        # session-id to the time the store had no checkpoint for it
+        self._missing = collections.OrderedDict()
+
+    def dumps(self, session):
+        """
+        Serialize a session
+
+        :param :obj:`Session` session: session to serialize
+        :returns: bytes
+        """
+        with session.lock:
+            state, stack_services = session.export_state()
+            services = {}
+            for name, service in stack_services.items():
+                if not is_persistable(service):
+                    continue
+                try:
+                    services[name] = pickle.dumps(service, self.protocol)
+                except Exception:
+                    logger.debug(
+                        'Session {0}: service {1} cannot be pickled; '
+                        'it will not be persisted'.format(
+                            session.session_id,
+                            name
+                        )
+                    )
+            state['services'] = services
+            state['hold'] = self._dump_values(
+                session,
+                'hold value',
+                state['hold']
+            )
+            overrides, removed = state['fixtures']
+            state['fixtures'] = (
+                self._dump_values(session, 'fixture', overrides),
+                removed
+            )
+            return pickle.dumps(state, self.protocol)
+
+    def _dump_values(self, session, kind, values):
+        """
+        Pickle each value separately, skipping those that cannot be pickled
+
+        :param :obj:`Session` session: session the values belong to
+        :param text_type kind: description of the values for logging
+        :param dict values: name to value
+        :returns: dict of name to bytes
+        """
+        pickled = {}
+        for name, value in values.items():
+            try:
+                pickled[name] = pickle.dumps(value, self.protocol)
+            except Exception:
+                logger.debug(
+                    'Session {0}: {1} {2} cannot be pickled; '
+                    'it will not be persisted'.format(
+                        session.session_id,
+                        kind,
+                        name
+                    )
+                )
+        return pickled
+
+    def loads(self, session_id, services, data, **session_options):
+        """
+        Rebuild a session from its serialized form
+
+        :param text_type session_id: the session-id
+        :param list services: registered, non-instantiated services
+        :param bytes data: output of :meth:`dumps`
+        :param session_options: keyword arguments for :obj:`Session`
+        :returns: :obj:`Session`
+        """
+        state = pickle.loads(data)
+        state['hold'] = {
+            name: pickle.loads(value)
+            for name, value in state.get('hold', {}).items()
+        }
+        overrides, removed = state.get('fixtures', ({}, []))
+        state['fixtures'] = (
+            {
+                name: pickle.loads(value)
+                for name, value in overrides.items()
+            },
+            removed
+        )
+        stack_services = {}
+        for name, pickled in state.pop('services').items():
+            try:
+                stack_services[name] = pickle.loads(pickled)
+            except Exception:
+                logger.exception(
+                    'Session {0}: failed to restore service {1}'.format(
+                        session_id,
+                        name
+                    )
+                )
+        session = Session(session_id, services, **session_options)
+        session.import_state(state, stack_services)
+        return session
+
+    def checkpoint(self, session):
+        """
+        Write a session if it changed since the last checkpoint
+
+        :param :obj:`Session` session: the session to write
+        :returns: boolean, True if the session was written
+        """
+        if not session.dirty:
+            return False
+
+        session.dirty = False
+        try:
+            self.store.save(session.session_id, self.dumps(session))
+        except Exception:
+            session.dirty = True
+            logger.exception(
+                'Session {0}: checkpoint failed'.format(session.session_id)
+            )
+            return False
+        return True
+
+    def checkpoint_all(self, sessions):
+        """
+        Write all changed sessions
+
+        :param dict sessions: session-id to :obj:`Session`
+        :returns: int number of sessions written
+        """
+        written = 0
+        for session in list(sessions.values()):
+            if self.checkpoint(session):
+                written = written + 1
+        return written
+
+    def restore(self, session_id, services, sessions, **session_options):
+        """
+        Restore a session from the store into ``sessions``
+
+        :param text_type session_id: session to restore
+        :param list services: registered, non-instantiated services
+        :param dict sessions: session-id to :obj:`Session`
+        :param session_options: keyword arguments for :obj:`Session`
+        :returns: :obj:`Session` or None if there is no checkpoint
+        """
+        with self._restore_lock:
+            if session_id in sessions:
+                return sessions[session_id]
+
+            missing_since = self._missing.get(session_id)
+            now = time.time()
+            if missing_since is not None:
+                if now - missing_since < self.missing_ttl:
+                    return None
+                del self._missing[session_id]
+
+            data = self.store.load(session_id)
+            if data is None:
+                self._missing[session_id] = now
+                while len(self._missing) > self.max_missing:
+                    self._missing.popitem(last=False)
+                return None
+
+            try:
+                session = self.loads(
+                    session_id,
+                    services,
+                    data,
+                    **session_options
+                )
+            except Exception:
+                logger.exception(
+                    'Session {0}: failed to restore'.format(session_id)
+                )
+                return None
+
+            logger.debug('Session {0}: restored'.format(session_id))
+            sessions[session_id] = session
+            return session
+
+    def discard(self, session_id):
+        """
+        Remove a session's checkpoint
+
+        :param text_type session_id: session to remove
+        """
+        self.store.delete(session_id)
+
+    def start(self, sessions):
+        """
+        Start the background checkpoint thread
+
+        :param dict sessions: session-id to :obj:`Session`
+        """
+        if self.interval <= 0 or self._thread is not None:
+            return
+
+        self._stopped.clear()
+
+        def run():
+            while not self._stopped.wait(self.interval):
+                self.checkpoint_all(sessions)
+
+        self._thread = threading.Thread(
+            target=run,
+            name='stackinawsgi-checkpoint'
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, sessions=None):
+        """
+        Stop the background thread, optionally writing a final checkpoint
+
+        :param dict sessions: session-id to :obj:`Session` to checkpoint
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if sessions is not None:
+            self.checkpoint_all(sessions)
+
+    def post_fork(self, sessions):
+        """
+        Re-initialize persistence in a forked worker
+
+        Call :meth:`stop` in the parent before forking; the worker then gets
+        fresh locks and store connections and restarts the checkpoint thread.
+
+        :param dict sessions: session-id to :obj:`Session`
+        """
+        self._init_process_state()
+        self.store.post_fork()
+        self.start(sessions)
@@ -0,0 +1,242 @@
+"""
+Stack-In-A-WSGI: Session Rate Limits
+"""
+from __future__ import absolute_import
+
+import logging
+import math
+import threading
+from timeit import default_timer
+
+import six
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled continuously at a fixed rate
+
+    Taking a token is O(1): the bucket is refilled from the time elapsed
+    since the last call instead of by a timer.
+
+    :ivar float rate: tokens added per second
+    :ivar float burst: maximum number of tokens held
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'lock')
+
+    def __init__(self, rate, burst=None):
+        """
+        Create a full bucket
+
+        :param float rate: requests allowed per second
+        :param float burst: requests allowed at once, defaults to the rate
+            with a minimum of one
+        :raises: ValueError if the rate or burst is not positive
+        """
+        try:
+            rate = float(rate)
+            burst = max(rate, 1.0) if burst is None else float(burst)
+        except TypeError:
+            raise ValueError('Rate and burst must be numbers')
+        if not rate > 0 or not burst >= 1:
+            raise ValueError('Rate must be positive and burst at least 1')
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = default_timer()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """
+        Take a token
+
+        :returns: float, 0.0 if a token was taken otherwise the seconds
+            until one is available
+        """
+        with self.lock:
+            now = default_timer()
+            tokens = min(
+                self.burst,
+                self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if tokens >= 1.0:
+                self.tokens = tokens - 1.0
+                return 0.0
+
+            self.tokens = tokens
+            return (1.0 - tokens) / self.rate
+
+    def refund(self):
+        """
+        Return a token taken by :meth:`take`
+        """
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + 1.0)
+
+    def config(self):
+        """
+        Bucket configuration
+
+        :returns: dict
+        """
+        return {'rate': self.rate, 'burst': self.burst}
+
+    def post_fork(self):
+        """
+        Replace the lock, which may have been held during the fork
+        """
+        self.lock = threading.Lock()
+
+
+class RateLimiter(object):
+    """
+    Rate limits of a session, for the session and for each service
+
+    A request must get a token from both the session's bucket and its
+    service's bucket, when they are configured.
+
+    :ivar :obj:`TokenBucket` bucket: session-wide bucket or None
+    :ivar dict services: service name to :obj:`TokenBucket`
+    """
+
+    def __init__(self, bucket=None, services=None):
+        """
+        :param :obj:`TokenBucket` bucket: optional session-wide bucket
+        :param dict services: optional service name to :obj:`TokenBucket`
+        """
+        self.bucket = bucket
+        self.services = dict(services or {})
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the limiter from its configuration
+
+        :param dict config: {'rate': float, 'burst': float, 'services':
+            {name: {'rate': float, 'burst': float}}}, every key is optional
+        :returns: :obj:`RateLimiter` or None if no limit is configured
+        :raises: ValueError if the configuration is invalid
+        """
+        if config is None:
+            return None
+        if not isinstance(config, dict):
+            raise ValueError('Rate limit must be an object')
+
+        bucket = None
+        if config.get('rate') is not None:
+            bucket = TokenBucket(config['rate'], config.get('burst'))
+
+        service_configs = config.get('services') or {}
+        if not isinstance(service_configs, dict):
+            raise ValueError('Service rate limits must be an object')
+        services = {}
+        for name, service_config in service_configs.items():
+            if not isinstance(service_config, dict):
+                service_config = {'rate': service_config}
+            services[name] = TokenBucket(
+                service_config.get('rate'),
+                service_config.get('burst')
+            )
+
+        if bucket is None and not services:
+            return None
+        return cls(bucket, services)
+
+    @staticmethod
+    def parse_header(value):
+        """
+        Parse a rate limit header value
+
+        :param text_type value: <rate>[/<burst>]
+        :returns: dict with the rate and burst
+        :raises: ValueError if the value is invalid
+        """
+        rate, _, burst = value.strip().partition('/')
+        return {
+            'rate': float(rate),
+            'burst': float(burst) if burst else None
+        }
+
+    @classmethod
+    def parse_service_header(cls, value):
+        """
+        Parse a per-service rate limit header value
+
+        :param text_type value: <service>=<rate>[/<burst>][, ...]
+        :returns: dict of service name to rate and burst
+        :raises: ValueError if the value is invalid
+        """
+        services = {}
+        for item in value.split(','):
+            if not item.strip():
+                continue
+            name, separator, limit = item.partition('=')
+            if not separator or not name.strip():
+                raise ValueError(
+                    'Invalid service rate limit: {0}'.format(item)
+                )
+            services[name.strip()] = cls.parse_header(limit)
+        return services
+
+    def config(self):
+        """
+        Limiter configuration accepted by :meth:`from_config`
+
+        :returns: dict
+        """
+        config = {}
+        if self.bucket is not None:
+            config.update(self.bucket.config())
+        if self.services:
+            config['services'] = {
+                name: bucket.config()
+                for name, bucket in six.iteritems(self.services)
+            }
+        return config
+
+    def take(self, service_name):
+        """
+        Take a token for a request to a service
+
+        :param text_type service_name: name of the service being called
+        :returns: float, 0.0 if the request may proceed otherwise the
+            seconds until it may be retried
+        """
+        service_bucket = self.services.get(service_name)
+        if service_bucket is not None:
+            wait = service_bucket.take()
+            if wait:
+                return wait
+
+        if self.bucket is not None:
+            wait = self.bucket.take()
+            if wait:
+                if service_bucket is not None:
+                    service_bucket.refund()
+                return wait
+
+        return 0.0
+
+    @staticmethod
+    def retry_after(wait):
+        """
+        Retry-After header value for a wait
+
+        :param float wait: seconds returned by :meth:`take`
+        :returns: text_type with whole seconds, at least 1
+        """
+        return str(max(1, int(math.ceil(wait))))
+
+    def post_fork(self):
+        """
+        Re-initialize the bucket locks in a forked worker
+        """
+        if self.bucket is not None:
+            self.bucket.post_fork()
+        for bucket in self.services.values():
+            bucket.post_fork()
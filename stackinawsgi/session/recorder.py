@@ -0,0 +1,304 @@
+"""
+Stack-In-A-WSGI: Session Traffic Recorder
+"""
+from __future__ import absolute_import
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from timeit import default_timer
+
+import six
+from six.moves import queue
+
+
+logger = logging.getLogger(__name__)
+
+
+def _as_bytes(data):
+    """
+    Normalize a body to bytes
+
+    :param data: bytes or text_type
+    :returns: bytes
+    """
+    if isinstance(data, six.text_type):
+        return data.encode('utf-8')
+    return data
+
+
+def read_request_body(request):
+    """
+    Read the request body while leaving it readable for the service
+
+    :param :obj:`Request` request: the request being recorded
+    :returns: bytes with the request body
+    """
+    try:
+        length = int(request.environment.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+
+    if length <= 0:
+        return b''
+
+    data = request.stream.read(length)
+    request.stream = io.BytesIO(data)
+    request.environment['wsgi.input'] = request.stream
+    return data
+
+
+class Recorder(object):
+    """
+    Append-only JSONL journal of the traffic sent to a session
+
+    Entries are queued by the request thread and written by a background
+    thread so recording never blocks the session. When the queue is full
+    the entry is dropped and counted in :attr:`dropped`.
+
+    :ivar text_type path: path of the active journal file
+    :ivar int max_bytes: size at which the journal is rotated
+    :ivar int backup_count: number of rotated journals to keep
+    :ivar bool include_bodies: whether to store the bodies themselves in
+        addition to their digests
+    :ivar int dropped: number of entries dropped due to a full queue
+    """
+
+    _stop = object()
+
+    def __init__(self, path, max_bytes=16 * 1024 * 1024, backup_count=3,
+                 queue_size=1024, include_bodies=False):
+        """
+        Open the journal and start the writer thread
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.include_bodies = include_bodies
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._start()
+
+    def _start(self):
+        """
+        Open the journal and start the writer thread
+        """
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._file_lock = threading.Lock()
+        self._stream = io.open(self.path, 'ab')
+        self._writer = threading.Thread(
+            target=self._run,
+            name='stackinawsgi-recorder'
+        )
+        self._writer.daemon = True
+        self._writer.start()
+
+    @property
+    def journals(self):
+        """
+        Journal files from oldest to newest
+
+        :returns: list of paths that exist on disk
+        """
+        paths = [
+            '{0}.{1}'.format(self.path, index)
+            for index in range(self.backup_count, 0, -1)
+        ]
+        paths.append(self.path)
+        return [path for path in paths if os.path.exists(path)]
+
+    def _rotate(self):
+        """
+        Rotate the journal files; caller must hold the file lock
+        """
+        self._stream.close()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = '{0}.{1}'.format(self.path, index)
+                if os.path.exists(source):
+                    os.rename(
+                        source,
+                        '{0}.{1}'.format(self.path, index + 1)
+                    )
+            os.rename(self.path, '{0}.1'.format(self.path))
+        else:
+            os.remove(self.path)
+        self._stream = io.open(self.path, 'ab')
+
+    def _write(self, entry):
+        """
+        Write a single entry to the journal
+
+        :param dict entry: the entry to serialize
+        """
+        line = (json.dumps(entry, sort_keys=True) + '\n').encode('utf-8')
+        with self._file_lock:
+            size = self._stream.tell()
+            if size and size + len(line) > self.max_bytes:
+                self._rotate()
+            self._stream.write(line)
+
+    def _run(self):
+        """
+        Writer thread main loop
+        """
+        while True:
+            entry = self._queue.get()
+            try:
+                if entry is self._stop:
+                    return
+                self._write(entry)
+            except Exception:
+                logger.exception('Failed to write journal entry')
+            finally:
+                self._queue.task_done()
+
+    def record(self, entry):
+        """
+        Queue an entry for writing without blocking
+
+        :param dict entry: the entry to write
+        :returns: boolean, False if the entry was dropped
+        """
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped = self.dropped + 1
+            return False
+
+    def make_entry(self, method, request, uri, request_body, result,
+                   started, duration):
+        """
+        Build a journal entry for a completed call
+
+        :param text_type method: HTTP method of the request
+        :param :obj:`Request` request: the request that was served
+        :param text_type uri: URI relative to the session
+        :param bytes request_body: the request body
+        :param tuple result: (status, headers, body) from the session
+        :param float started: wall-clock time the call started
+        :param float duration: time spent in the session, in seconds
+        :returns: dict
+        """
+        status, _, response_body = result
+        headers = dict(request.headers)
+        # the WSGI environ holds these without the HTTP_ prefix
+        for key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            value = request.environment.get(key)
+            if value:
+                headers[key] = value
+        entry = {
+            'time': started,
+            'duration': duration,
+            'method': method,
+            'uri': uri,
+            'headers': headers,
+            'request_digest': hashlib.md5(request_body).hexdigest(),
+            'status': status,
+            'response_digest': None
+        }
+        if isinstance(response_body, (six.binary_type, six.text_type)):
+            response_body = _as_bytes(response_body)
+            entry['response_digest'] = hashlib.md5(
+                response_body
+            ).hexdigest()
+        else:
+            response_body = None
+
+        if self.include_bodies:
+            entry['request_body'] = base64.b64encode(
+                request_body
+            ).decode('ascii')
+            if response_body is not None:
+                entry['response_body'] = base64.b64encode(
+                    response_body
+                ).decode('ascii')
+        return entry
+
+    def capture(self, call, method, request, uri, headers, journal_uri):
+        """
+        Call into the session and record the exchange
+
+        :param callable call: the session's call method
+        :param text_type method: HTTP method of the request
+        :param :obj:`Request` request: the request being served
+        :param text_type uri: URI to pass to ``call``
+        :param dict headers: case insensitive header dictionary
+        :param text_type journal_uri: URI relative to the session that is
+            stored in the journal
+        :returns: the result of ``call``
+        """
+        request_body = read_request_body(request)
+        started = time.time()
+        timer = default_timer()
+        result = call(method, request, uri, headers)
+        duration = default_timer() - timer
+        try:
+            self.record(
+                self.make_entry(
+                    method,
+                    request,
+                    journal_uri,
+                    request_body,
+                    result,
+                    started,
+                    duration
+                )
+            )
+        except Exception:
+            logger.exception('Failed to record journal entry')
+        return result
+
+    def flush(self):
+        """
+        Wait for all queued entries to be written to disk
+        """
+        self._queue.join()
+        with self._file_lock:
+            self._stream.flush()
+
+    def iter_journal(self, chunk_size=64 * 1024):
+        """
+        Stream the journal contents, oldest entries first
+
+        :param int chunk_size: size of each chunk read from disk
+        :returns: generator of bytes
+        """
+        self.flush()
+        for path in self.journals:
+            try:
+                with io.open(path, 'rb') as journal:
+                    while True:
+                        chunk = journal.read(chunk_size)
+                        if not chunk:
+                            break
+                        yield chunk
+            except (IOError, OSError):
+                # rotated away while streaming
+                continue
+
+    def post_fork(self):
+        """
+        Restart the recorder in a forked worker
+
+        The writer thread does not survive the fork and the queue and lock
+        may have been in use when the process forked, so they are replaced.
+        The journal is re-opened in append mode; entries still queued in the
+        parent are not written by the worker.
+        """
+        self._start()
+
+    def close(self):
+        """
+        Flush outstanding entries and stop the writer thread
+        """
+        self._queue.put(self._stop)
+        self._writer.join()
+        with self._file_lock:
+            self._stream.close()
@@ -3,16 +3,29 @@ Stack-In-A-WSGI: StackInAWsgiSessionManager
 """
 from __future__ import absolute_import
 
+import copy
+import datetime
+import functools
 import logging
+import os
+import pickle
 import re
+import tempfile
+import threading
 import uuid
 
 from stackinabox.services.service import StackInABoxService
 
 from stackinawsgi.exceptions import (
-    InvalidSessionId
+    InvalidSessionId,
+    RecordingConflict,
+    SessionExists
 )
-from .session import Session
+from .events import EventFeed
+from .fixtures import FixtureStore
+from .recorder import Recorder
+from .session import Session, session_id_matcher
+from .shaping import environ_key as shaping_environ_key
 
 
 # Use a shared dictionary to try to ensure its availability under
@@ -23,6 +36,13 @@ from .session import Session
 global_sessions = dict()
 session_regex = r'^\/([\w-]+)'
 session_regex_instance = r'{0}\/.*'.format(session_regex)
+session_matcher = re.compile(session_regex_instance)
+
+# admin resources at the root of /admin/ that cannot be session ids
+reserved_session_ids = frozenset(['bulk', 'events'])
+
+# Default per-session hold quota in bytes
+default_hold_quota = 64 * 1024 * 1024
 
 
 logger = logging.getLogger(__name__)
@@ -42,15 +62,59 @@ class StackInAWsgiSessionManager(StackInABoxService):
 
     :ivar list services: a list of StackInABoxService objects that
         have not yet been initialized.
+    :ivar text_type journal_dir: directory session traffic journals are
+        written to
+    :ivar :obj:`SessionPersistence` persistence: optional session
+        checkpointing; None keeps sessions in memory only
+    :ivar dict session_options: keyword arguments for each new
+        :obj:`Session`
+    :ivar :obj:`FixtureStore` fixtures: fixture data shared by all sessions
+    :ivar :obj:`SessionExecutor` executor: optional thread pool running the
+        session calls; None runs them on the server thread
+    :ivar :obj:`EventFeed` events: session lifecycle and tracker events
     """
 
-    def __init__(self):
+    def __init__(self, journal_dir=None, persistence=None,
+                 hold_quota=default_hold_quota, fixtures=None,
+                 executor=None):
         """
         Initialize the session manager
+
+        :param text_type journal_dir: optional directory for session traffic
+            journals, defaults to a directory in the system temp location.
+        :param :obj:`SessionPersistence` persistence: optional session
+            checkpointing so sessions survive a worker restart.
+        :param int hold_quota: maximum number of bytes each session may
+            keep in its hold; None for unlimited.
+        :param :obj:`FixtureStore` fixtures: optional fixture store to share
+            between the sessions, a new store is created when not provided.
+        :param :obj:`SessionExecutor` executor: optional thread pool with
+            per-session bounded queues to run the session calls on.
         """
         super(StackInAWsgiSessionManager, self).__init__('stackinabox')
         logger.debug('Initializing Service Manager')
         self.services = []
+        self._service_map = None
+        if journal_dir is None:
+            journal_dir = os.path.join(
+                tempfile.gettempdir(),
+                'stackinawsgi-journals'
+            )
+        self.journal_dir = journal_dir
+        if fixtures is None:
+            fixtures = FixtureStore()
+        self.fixtures = fixtures
+        self.session_options = {
+            'hold_quota': hold_quota,
+            'fixtures': self.fixtures
+        }
+        self.executor = executor
+        self.events = EventFeed()
+        # makes checking that a session-id is free and using it atomic
+        self._sessions_lock = threading.Lock()
+        self.persistence = persistence
+        if self.persistence is not None:
+            self.persistence.start(global_sessions)
 
     @staticmethod
     def extract_session_id(uri):
@@ -68,9 +132,7 @@ class StackInAWsgiSessionManager(StackInABoxService):
                 uri
             )
         )
-        matcher = re.compile(session_regex_instance)
-
-        matches = matcher.match(uri)
+        matches = session_matcher.match(uri)
         if matches:
             session_id = matches.groups()[0]
             logger.debug(
@@ -115,20 +177,83 @@ class StackInAWsgiSessionManager(StackInABoxService):
         :param object-type service: an uninstantiated object what is derived
             from :obj:`StackInABoxService`. When a session is created then it
             will be instantiated and added to the StackInABox Service.
+
+        Services load shared data once by providing a
+        ``stackinawsgi_fixtures(store)`` classmethod, which is called with
+        the :obj:`FixtureStore` when the service is registered.
         """
         logger.debug(
             'Adding service'
         )
+        load_fixtures = getattr(service, 'stackinawsgi_fixtures', None)
+        if load_fixtures is not None:
+            load_fixtures(self.fixtures)
         self.services.append(service)
+        self._service_map = None
+
+    @property
+    def service_map(self):
+        """
+        Service name to class name of the registered services
 
-    def create_session(self, session_id=None):
+        Computed once, instantiating each service for its name, and again
+        only after a service is registered.
+
+        :returns: dict
+        """
+        service_map = self._service_map
+        if service_map is None:
+            service_map = {
+                svc().name: svc.__name__
+                for svc in self.services
+            }
+            self._service_map = service_map
+        return service_map
+
+    def pre_fork(self):
+        """
+        Prepare the manager for the process to be forked
+
+        Background checkpointing is stopped after a final checkpoint and
+        the journals are flushed so the workers do not inherit pending
+        writes.
+        """
+        if self.persistence is not None:
+            self.persistence.stop(global_sessions)
+        for session in list(global_sessions.values()):
+            if session.recorder is not None:
+                session.recorder.flush()
+
+    def post_fork(self):
+        """
+        Re-initialize the per-process state in a forked worker
+
+        Sessions created before the fork are copied into every worker and
+        keep evolving independently.
+        """
+        self._sessions_lock = threading.Lock()
+        self.fixtures.post_fork()
+        self.events.post_fork()
+        if self.executor is not None:
+            self.executor.post_fork()
+        for session in list(global_sessions.values()):
+            session.post_fork()
+        if self.persistence is not None:
+            self.persistence.post_fork(global_sessions)
+
+    def create_session(self, session_id=None, rate_limiter=None):
         """
         Create a new session and return its uuid
 
         :param text_type session_id: optional session id to create, if not
             provided then one will be created.
+        :param :obj:`RateLimiter` rate_limiter: optional rate limits for the
+            new session
 
         :returns: text_type with the session id
+        :raises: InvalidSessionId if the session id contains characters
+            other than letters, digits, '_' and '-', or is one of the
+            :data:`reserved_session_ids`
         """
         global global_sessions
 
@@ -148,19 +273,147 @@ class StackInAWsgiSessionManager(StackInABoxService):
                 session_id
             )
         )
+        if not session_id_matcher.match(session_id):
+            raise InvalidSessionId(
+                'Invalid Session ID: {0}'.format(session_id)
+            )
+        if session_id in reserved_session_ids:
+            raise InvalidSessionId(
+                'Reserved Session ID: {0}'.format(session_id)
+            )
 
-        if session_id not in global_sessions:
-            logger.debug(
-                'Creating new session for session id {0}'.format(
-                    session_id
-                )
+        if self.restore_session(session_id) is None:
+            # the session is built outside of the lock; only checking that
+            # the session id is still free and using it must be atomic
+            session = self._build_session(session_id, rate_limiter)
+            with self._sessions_lock:
+                if self.restore_session(session_id) is None:
+                    global_sessions[session_id] = session
+                    self.events.publish('created', session_id)
+
+        return session_id
+
+    def _build_session(self, session_id, rate_limiter):
+        """
+        Create the session for a session id without making it available
+
+        :param text_type session_id: session id
+        :param :obj:`RateLimiter` rate_limiter: rate limits or None
+        :returns: :obj:`Session`
+        """
+        logger.debug(
+            'Creating new session for session id {0}'.format(
+                session_id
             )
-            global_sessions[session_id] = Session(
+        )
+        session = Session(
+            session_id,
+            self.services,
+            **self.session_options
+        )
+        session.rate_limiter = rate_limiter
+        return session
+
+    def _new_session(self, session_id, rate_limiter):
+        """
+        Create the session for a session id
+
+        :param text_type session_id: session id
+        :param :obj:`RateLimiter` rate_limiter: rate limits or None
+        :returns: :obj:`Session`
+        """
+        session = self._build_session(session_id, rate_limiter)
+        global_sessions[session_id] = session
+        return session
+
+    def clone_session(self, session_id, target_ids=None, count=0):
+        """
+        Create new sessions in the same state as a session
+
+        The services, hold, fixtures and rate limit, shaping and fault
+        configurations are copied; the trackers and the journal are not.
+        The state is captured once as a pickled template, or deep copied
+        when it cannot be pickled, so the source session is only locked
+        while the template is made and every clone is rebuilt from it.
+
+        :param text_type session_id: session to clone
+        :param list target_ids: session ids of the clones
+        :param int count: number of clones to create with new session ids,
+            in addition to ``target_ids``
+
+        :returns: list of text_type with the session ids of the clones
+        :raises: InvalidSessionId if the Session ID is not found
+        :raises: ValueError if a target Session ID is invalid or reserved
+        :raises: SessionExists if a target Session ID is already in use
+        """
+        source = self.restore_session(session_id)
+        if source is None:
+            raise InvalidSessionId('Invalid Session ID')
+
+        target_ids = list(target_ids or [])
+        for target_id in target_ids:
+            if not session_id_matcher.match(target_id) or (
+                    target_id in reserved_session_ids):
+                raise ValueError(
+                    'Invalid Session ID: {0}'.format(target_id)
+                )
+        if count:
+            target_ids.extend(str(uuid.uuid4()) for _ in range(count))
+
+        logger.debug(
+            'Cloning Session {0} into {1} sessions'.format(
                 session_id,
-                self.services
+                len(target_ids)
             )
+        )
+        with source.lock:
+            template = source.export_state()
+            try:
+                snapshot = pickle.dumps(template, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                logger.debug(
+                    'Session {0}: state cannot be pickled; '
+                    'it will be deep copied'.format(session_id)
+                )
+                snapshot = None
+                template = copy.deepcopy(template)
+
+        clones = []
+        for target_id in target_ids:
+            if snapshot is not None:
+                state, services = pickle.loads(snapshot)
+            else:
+                state, services = copy.deepcopy(template)
+
+            now = datetime.datetime.utcnow()
+            state['created_at'] = now
+            state['last_accessed_at'] = now
+            state['access_count'] = 0
+            state['status'] = {}
+            state['stats'] = None
+            if state['base_url'].startswith(session_id):
+                state['base_url'] = target_id + (
+                    state['base_url'][len(session_id):]
+                )
 
-        return session_id
+            session = self._build_session(target_id, None)
+            session.import_state(state, services)
+            session.dirty = True
+            clones.append(session)
+
+        # the clones are only made available once they are complete, and
+        # either all of them or none are
+        with self._sessions_lock:
+            for target_id in target_ids:
+                if self.restore_session(target_id) is not None:
+                    raise SessionExists(
+                        'Session {0} already exists'.format(target_id)
+                    )
+            for session in clones:
+                global_sessions[session.session_id] = session
+                self.events.publish('created', session.session_id)
+
+        return target_ids
 
     def reset_session(self, session_id):
         """
@@ -173,19 +426,32 @@ class StackInAWsgiSessionManager(StackInABoxService):
                 session_id
             )
         )
+        self.restore_session(session_id)
         if session_id in global_sessions:
             logger.debug(
                 'Removing Session {0}'.format(
                     session_id
                 )
             )
+            recorder = global_sessions[session_id].recorder
+            rate_limiter = global_sessions[session_id].rate_limiter
+            shaper = global_sessions[session_id].shaper
+            faults = global_sessions[session_id].faults
+            profiler = global_sessions[session_id].profiler
             del global_sessions[session_id]
+            if self.persistence is not None:
+                self.persistence.discard(session_id)
             logger.debug(
                 'Re-creating Session {0}'.format(
                     session_id
                 )
             )
-            self.create_session(session_id=session_id)
+            session = self._new_session(session_id, rate_limiter)
+            session.recorder = recorder
+            session.shaper = shaper
+            session.faults = faults
+            session.profiler = profiler
+            self.events.publish('reset', session_id)
             logger.debug(
                 'Reset of Session {0} Completed'.format(
                     session_id
@@ -205,11 +471,141 @@ class StackInAWsgiSessionManager(StackInABoxService):
         """
         global global_sessions
 
+        self.restore_session(session_id)
         if session_id in global_sessions:
-            del global_sessions[session_id]
+            session = global_sessions.pop(session_id)
+            if session.recorder is not None:
+                session.recorder.close()
+            if self.persistence is not None:
+                self.persistence.discard(session_id)
+            self.events.publish('removed', session_id)
         else:
             raise InvalidSessionId('Invalid Session ID')
 
+    def restore_session(self, session_id):
+        """
+        Restore a checkpointed session that is not in memory
+
+        :param text_type session_id: session id to restore
+
+        :returns: :obj:`Session` or None if the session is unknown
+        """
+        if session_id in global_sessions:
+            return global_sessions[session_id]
+
+        if self.persistence is None or session_id is None or (
+                not session_id_matcher.match(session_id)):
+            return None
+
+        return self.persistence.restore(
+            session_id,
+            self.services,
+            global_sessions,
+            **self.session_options
+        )
+
+    def session_ids(self):
+        """
+        Session ids of all known sessions, including checkpointed sessions
+        that have not been restored yet
+
+        :returns: list of text_type
+        """
+        session_ids = list(global_sessions.keys())
+        if self.persistence is not None:
+            known = set(session_ids)
+            session_ids.extend(
+                session_id
+                for session_id in self.persistence.store.session_ids()
+                if session_id not in known
+            )
+        return session_ids
+
+    def get_session(self, session_id):
+        """
+        Retrieve a session
+
+        :param text_type session_id: session id to retrieve
+
+        :raises: InvalidSessionId if session id is not found
+        :returns: :obj:`Session`
+        """
+        session = self.restore_session(session_id)
+        if session is None:
+            raise InvalidSessionId('Invalid Session ID')
+        return session
+
+    def start_recording(self, session_id, include_bodies=False,
+                        max_bytes=None):
+        """
+        Start recording the traffic sent to a session
+
+        Recording an already recorded session with the same options keeps
+        the existing journal.
+
+        :param text_type session_id: session id to record
+        :param bool include_bodies: store bodies in addition to digests
+        :param int max_bytes: optional journal rotation size
+
+        :raises: InvalidSessionId if session id is not found
+        :raises: RecordingConflict if the session is already recorded with
+            other options
+        :returns: :obj:`Recorder`
+        """
+        session = self.get_session(session_id)
+        recorder = session.recorder
+        if recorder is not None:
+            if recorder.include_bodies != include_bodies or (
+                    max_bytes not in (None, recorder.max_bytes)):
+                raise RecordingConflict(
+                    'Session {0} is already recorded with other '
+                    'options'.format(session_id)
+                )
+        else:
+            if not os.path.isdir(self.journal_dir):
+                os.makedirs(self.journal_dir)
+
+            kwargs = {}
+            if max_bytes is not None:
+                kwargs['max_bytes'] = max_bytes
+
+            recorder = session.recorder = Recorder(
+                os.path.join(
+                    self.journal_dir,
+                    '{0}.jsonl'.format(session_id)
+                ),
+                include_bodies=include_bodies,
+                **kwargs
+            )
+        return recorder
+
+    def stop_recording(self, session_id):
+        """
+        Stop recording the traffic sent to a session
+
+        The journal is left on disk.
+
+        :param text_type session_id: session id to stop recording
+
+        :raises: InvalidSessionId if session id is not found
+        """
+        session = self.get_session(session_id)
+        if session.recorder is not None:
+            session.recorder.close()
+            session.recorder = None
+
+    def publish_update(self, session, status):
+        """
+        Publish the trackers a request changed
+
+        :param :obj:`Session` session: the session that was called
+        :param int status: HTTP status of the response
+        """
+        self.events.publish('updated', session.session_id, {
+            'access-count': session.access_count,
+            'status': {status: session.status_count(status)}
+        })
+
     def request(self, method, request, uri, headers):
         """
         Override the standard handler in order to redirect to the
@@ -227,6 +623,7 @@ class StackInAWsgiSessionManager(StackInABoxService):
         HTTP Response:
             593 - Session-ID was not present in the URI
             594 - Invalid Session-ID
+            429 - The session or service rate limit was exceeded
 
             Other responses are from StackInABox or the session.
         """
@@ -239,7 +636,7 @@ class StackInAWsgiSessionManager(StackInABoxService):
                     uri
                 )
             )
-            return (593, headers, 'StackInAWSGI - Missing Session')
+            return (593, {}, 'StackInAWSGI - Missing Session')
 
         logger.debug(
             'Operating with Session Id {0}'.format(
@@ -247,7 +644,8 @@ class StackInAWsgiSessionManager(StackInABoxService):
             )
         )
 
-        if session_id in global_sessions:
+        session = self.restore_session(session_id)
+        if session is not None:
             logger.debug(
                 'Located session id {0}'.format(
                     session_id
@@ -262,13 +660,48 @@ class StackInAWsgiSessionManager(StackInABoxService):
                 )
             )
 
+            # Rate limits are applied before waiting for the session
+            if session.rate_limiter is not None:
+                limited = session.throttle(
+                    session_uri[len(session_id):].split('/', 2)[1]
+                )
+                if limited is not None:
+                    self.publish_update(session, limited[0])
+                    return limited
+
             # Let the session handle the request
-            return global_sessions[session_id].call(
-                method,
-                request,
-                session_uri,
-                headers
-            )
+            call = session.call
+            if self.executor is not None:
+                call = functools.partial(self.executor.call, session)
+
+            recorder = session.recorder
+            if recorder is not None:
+                result = recorder.capture(
+                    call,
+                    method,
+                    request,
+                    session_uri,
+                    headers,
+                    session_uri[len(session_id):]
+                )
+            else:
+                result = call(
+                    method,
+                    request,
+                    session_uri,
+                    headers
+                )
+
+            # The simulated delays are left to the application, which
+            # waits while sending the body after the session lock is freed
+            shaper = session.shaper
+            if shaper is not None and request is not None:
+                plan = shaper.plan(method, session_uri[len(session_id):])
+                if plan is not None:
+                    request.environment[shaping_environ_key] = plan
+
+            self.publish_update(session, result[0])
+            return result
 
         else:
             logger.debug(
@@ -277,4 +710,4 @@ class StackInAWsgiSessionManager(StackInABoxService):
                 )
             )
             # Report an unknown session
-            return (594, headers, 'StackInAWSGI - Unknown Session')
+            return (594, {}, 'StackInAWSGI - Unknown Session')
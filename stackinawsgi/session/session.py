@@ -3,36 +3,208 @@ Stack-In-A-WSGI Session Module
 """
 from __future__ import absolute_import
 
+import array
+import collections
 import datetime
+import functools
 import logging
+import re
+import time
 from threading import Lock
+from timeit import default_timer
+
+import six
 
 from stackinabox.stack import StackInABox
 
 from stackinawsgi.exceptions import (
     InvalidSessionId,
     InvalidServiceList,
-    NoServicesProvided
+    NoServicesProvided,
+    SessionBusy
 )
+from .context import serving
+from .faults import FaultInjector
+from .fixtures import FixtureOverlay, FixtureStore
+from .hold import SessionHold
+from .ratelimit import RateLimiter
+from .shaping import Shaper
+from .stats import SessionStats
 
 
 logger = logging.getLogger(__name__)
 
+# HTTP statuses counted in a fixed array instead of a dictionary
+common_statuses = (
+    200, 201, 202, 204, 301, 302, 304, 400, 401, 403, 404, 405, 409, 429,
+    500, 502, 503, 504
+)
+common_status_index = {
+    status: index for index, status in enumerate(common_statuses)
+}
+
+epoch = datetime.datetime(1970, 1, 1)
+
+# session-ids appear in URLs and in checkpoint file names
+session_id_matcher = re.compile(r'^[\w-]+\Z')
+
+# Serializes the creation of the StackInABox instances and the services;
+# only taken the first time a session uses them
+stack_creation_lock = Lock()
+
+# Serializes the creation of the session locks, holds and fixture overlays;
+# only taken the first time a session uses them
+session_creation_lock = Lock()
+
+# Tuple of service classes to dict of service name to service class, the
+# oldest lists are dropped past service_routes_cache_size
+service_routes_cache = collections.OrderedDict()
+service_routes_cache_size = 64
+service_routes_lock = Lock()
+
+
+def service_routes(services):
+    """
+    Names the services are routed by
+
+    The names are only known once a service is created, so each class is
+    created once per process and the names are cached for the most recent
+    service lists.
+
+    :param list services: service classes
+    :returns: dict of service name to service class
+    """
+    key = tuple(services)
+    routes = service_routes_cache.get(key)
+    if routes is None:
+        routes = collections.OrderedDict(
+            (service().name, service) for service in services
+        )
+        with service_routes_lock:
+            service_routes_cache[key] = routes
+            while len(service_routes_cache) > service_routes_cache_size:
+                service_routes_cache.popitem(last=False)
+    return routes
+
+
+def timestamp_now():
+    """
+    Current UTC time
+
+    :returns: int microseconds since the epoch
+    """
+    return int(time.time() * 1000000)
+
+
+def timestamp_to_datetime(timestamp):
+    """
+    :param int timestamp: microseconds since the epoch
+    :returns: naive UTC datetime
+    """
+    return epoch + datetime.timedelta(microseconds=timestamp)
+
+
+def datetime_to_timestamp(value):
+    """
+    :param datetime value: naive UTC datetime
+    :returns: int microseconds since the epoch
+    """
+    delta = value - epoch
+    return (
+        (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    )
+
+
+def acquire_lock(lock, timeout):
+    """
+    Acquire a lock, giving up after a timeout
+
+    :param Lock lock: the lock
+    :param float timeout: seconds to wait; None waits forever
+    :returns: boolean, True if the lock was acquired
+    """
+    if timeout is None:
+        return lock.acquire()
+    if six.PY3:
+        return lock.acquire(True, timeout)
+
+    # Python 2 locks do not support a timeout
+    deadline = time.time() + timeout
+    delay = 0.0005
+    while not lock.acquire(False):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        delay = min(delay * 2, remaining, 0.05)
+        time.sleep(delay)
+    return True
+
 
 class Session(object):
     """
     Wrapper for StackInABox to be safely use it in a multi-request
     supported environment.
+
+    Servers may hold many thousands of sessions, most of them idle, so the
+    session uses slots, integer timestamps and a fixed array for the common
+    status codes. The lock, hold, fixture overlay and StackInABox instance
+    are created the first time the session is used and each service the
+    first time a request is routed to it.
     """
 
-    def __init__(self, session_id, services):
+    __slots__ = (
+        'session_id',
+        'services',
+        '_lock',
+        '_stack',
+        '_base_url',
+        '_hold',
+        '_hold_quota',
+        '_fixtures',
+        '_fixture_store',
+        '_stats',
+        '_created',
+        '_accessed',
+        '_access_count',
+        '_status_counts',
+        '_status_other',
+        'recorder',
+        'rate_limiter',
+        'shaper',
+        'faults',
+        'profiler',
+        'tracker_version',
+        'dirty',
+        '__weakref__'
+    )
+
+    def __init__(self, session_id, services, hold_quota=None, fixtures=None):
         """
         Initialize the wrapper
 
         :ivar str session_id: session-id for the StackInABox instance
         :ivar list services: list of non-instances services
-        :ivar Lock lock: Lock for ensuring StackInABox is safely used
-        :ivar StackInABox stack: StackInABox instance being managed
+        :ivar Lock lock: Lock for ensuring StackInABox is safely used,
+            created on first use
+        :ivar StackInABox stack: StackInABox instance being managed, with
+            all of the services; see :meth:`materialize` for creating only
+            the services used
+        :ivar SessionHold hold: the session's KV store, also used as the
+            StackInABox hold, created on first use
+        :ivar FixtureOverlay fixtures: the session's copy-on-write view of
+            the shared fixtures, created on first use
+        :ivar Recorder recorder: traffic recorder, None when not recording
+        :ivar RateLimiter rate_limiter: the session's rate limits, None when
+            the session is not limited
+        :ivar Shaper shaper: the session's simulated latency and bandwidth,
+            None when responses are not shaped
+        :ivar FaultInjector faults: the session's fault injection rules,
+            None when no faults are injected
+        :ivar Profile profiler: :obj:`cProfile.Profile` the session calls
+            are run under, None when the session is not profiled
+        :ivar SessionStats stats: per-service and per-route call statistics,
+            created on first use
+        :ivar int tracker_version: changed whenever a tracker value changes
         """
         logger.debug(
             'Creating wrapper for session: {0}'.format(session_id)
@@ -55,42 +227,214 @@ class Session(object):
 
         self.session_id = session_id
         self.services = services
-        self.lock = Lock()
-        self.stack = StackInABox()
-        self.stack.base_url = self.session_id
-        self.init_services()
-        self.created_at = datetime.datetime.utcnow()
-        self._last_accessed_time = self.created_at
+        self._lock = None
+        self._stack = None
+        self._base_url = self.session_id
+        self._hold = None
+        self._hold_quota = hold_quota
+        self._fixtures = None
+        self._fixture_store = fixtures
+        self._stats = None
+        self._created = timestamp_now()
+        self._accessed = self._created
         self._access_count = 0
-        self._http_status_dict = {}
+        self._status_counts = None
+        self._status_other = None
+        self.recorder = None
+        self.rate_limiter = None
+        self.shaper = None
+        self.faults = None
+        self.profiler = None
+        self.tracker_version = 0
+        self.dirty = True
+
+    @property
+    def lock(self):
+        """
+        Lock for ensuring StackInABox is safely used, created on first use
+        """
+        lock = self._lock
+        if lock is None:
+            with session_creation_lock:
+                lock = self._lock
+                if lock is None:
+                    lock = self._lock = Lock()
+        return lock
+
+    @property
+    def hold(self):
+        """
+        The session's KV store, created on first use
+        """
+        hold = self._hold
+        if hold is None:
+            with session_creation_lock:
+                hold = self._hold
+                if hold is None:
+                    hold = self._hold = SessionHold(self._hold_quota)
+        return hold
+
+    @property
+    def fixtures(self):
+        """
+        The session's view of the shared fixtures, created on first use
+        """
+        fixtures = self._fixtures
+        if fixtures is None:
+            with session_creation_lock:
+                fixtures = self._fixtures
+                if fixtures is None:
+                    store = self._fixture_store
+                    if store is None:
+                        store = self._fixture_store = FixtureStore()
+                    fixtures = self._fixtures = FixtureOverlay(store)
+        return fixtures
+
+    def _create_stack(self):
+        """
+        The StackInABox instance, created without any service
+
+        The caller must hold the stack creation lock.
+        """
+        stack = self._stack
+        if stack is None:
+            stack = StackInABox()
+            stack.base_url = self._base_url
+            stack.holds = self.hold
+            self._stack = stack
+        return stack
+
+    def _register_service(self, stack, service):
+        """
+        Create a service and register it
+
+        The caller must hold the stack creation lock.
+
+        :param StackInABox stack: the session's StackInABox instance
+        :param service: service class
+        """
+        svc = service()
+        logger.debug(
+            'Session {0}: Initializing service {1}'.format(
+                self.session_id,
+                svc.name
+            )
+        )
+        stack.register(svc)
+
+    def materialize(self, name):
+        """
+        The StackInABox instance, with the named service created on first
+        use
+
+        :param text_type name: service name, None or unknown names only
+            create the StackInABox instance
+        :returns: :obj:`StackInABox`
+        """
+        stack = self._stack
+        if stack is not None and (name is None or name in stack.services):
+            return stack
+
+        service = service_routes(self.services).get(name)
+        if stack is not None and service is None:
+            return stack
+
+        with stack_creation_lock:
+            stack = self._create_stack()
+            if service is not None and name not in stack.services:
+                self._register_service(stack, service)
+        return stack
+
+    @property
+    def stack(self):
+        """
+        The StackInABox instance, with all of the services created
+        """
+        stack = self._stack
+        if stack is None or any(
+                name not in stack.services
+                for name in service_routes(self.services)):
+            self.init_services()
+            stack = self._stack
+        return stack
+
+    @property
+    def stats(self):
+        """
+        Per-service and per-route call statistics, created on first use
+        """
+        stats = self._stats
+        if stats is None:
+            stats = self._stats = SessionStats()
+        return stats
 
     def _update_trackers(self):
         """
         Update the session trackers
         """
         self._access_count = self._access_count + 1
-        self._last_accessed_time = datetime.datetime.utcnow()
+        self._accessed = timestamp_now()
+        self.tracker_version = self.tracker_version + 1
+        self.dirty = True
+
+    def _count_status(self, status, count=1):
+        """
+        Add to the HTTP Status Code Tracker of a status
+
+        :param int status: HTTP status
+        :param int count: number of responses with the status
+        """
+        index = common_status_index.get(status)
+        if index is not None:
+            counts = self._status_counts
+            if counts is None:
+                counts = self._status_counts = array.array(
+                    'L', [0] * len(common_statuses)
+                )
+            counts[index] = counts[index] + count
+        else:
+            if self._status_other is None:
+                self._status_other = {}
+            self._status_other[status] = (
+                self._status_other.get(status, 0) + count
+            )
 
     def _track_result(self, result):
         """
         Track the results from StackInABox
         """
-        status, _, _ = result
-        if status not in self._http_status_dict:
-            self._http_status_dict[status] = 0
-
-        self._http_status_dict[status] = (
-            self._http_status_dict[status] + 1
-        )
+        self._count_status(result[0])
+        self.tracker_version = self.tracker_version + 1
 
         return result
 
+    def _clear_status(self):
+        """
+        Drop the HTTP Status Code Trackers
+        """
+        self._status_counts = None
+        self._status_other = None
+
+    @property
+    def created_at(self):
+        """
+        Return the time the session was created
+        """
+        return timestamp_to_datetime(self._created)
+
+    @created_at.setter
+    def created_at(self, value):
+        """
+        Set the time the session was created
+        """
+        self._created = datetime_to_timestamp(value)
+
     @property
     def last_accessed_at(self):
         """
         Return the time the session was last accessed
         """
-        return self._last_accessed_time
+        return timestamp_to_datetime(self._accessed)
 
     @property
     def access_count(self):
@@ -99,27 +443,149 @@ class Session(object):
         """
         return self._access_count
 
+    def status_count(self, status):
+        """
+        Return the number of responses with an HTTP status
+
+        :param int status: HTTP status
+        :returns: int
+        """
+        index = common_status_index.get(status)
+        if index is not None:
+            if self._status_counts is None:
+                return 0
+            return self._status_counts[index]
+        if self._status_other is None:
+            return 0
+        return self._status_other.get(status, 0)
+
     @property
     def status_tracker(self):
         """
         Return the current copy of HTTP Status Code Trackers
         """
-        return self._http_status_dict
+        tracker = {}
+        if self._status_counts is not None:
+            for status, count in zip(common_statuses, self._status_counts):
+                if count:
+                    tracker[status] = count
+        if self._status_other is not None:
+            tracker.update(self._status_other)
+        return tracker
+
+    def export_state(self):
+        """
+        Capture the session state for persistence
 
-    def init_services(self):
+        The caller must hold the session lock.
+
+        :returns: tuple of (dict of tracker values, dict of service name to
+            service instance)
         """
-        Initialize the StackInABox instance with the services
+        stack = self._stack
+        state = {
+            'created_at': self.created_at,
+            'last_accessed_at': self.last_accessed_at,
+            'access_count': self._access_count,
+            'status': self.status_tracker,
+            'stats': (
+                self._stats.export() if self._stats is not None else None
+            ),
+            'base_url': (
+                stack.base_url if stack is not None else self._base_url
+            ),
+            'hold': (
+                dict(self._hold.items()) if self._hold is not None else {}
+            ),
+            'fixtures': (
+                self._fixtures.export_overrides()
+                if self._fixtures is not None else ({}, [])
+            ),
+            'rate_limit': (
+                self.rate_limiter.config()
+                if self.rate_limiter is not None else None
+            ),
+            'shaping': (
+                self.shaper.config() if self.shaper is not None else None
+            ),
+            'faults': (
+                self.faults.config() if self.faults is not None else None
+            )
+        }
+        services = {}
+        if stack is not None:
+            services = {
+                name: service
+                for name, (_, service) in stack.services.items()
+            }
+        return (state, services)
+
+    def import_state(self, state, services):
         """
-        for service in self.services:
-            svc = service()
-            logger.debug(
-                'Session {0}: Initializing service {1}'.format(
-                    self.session_id,
-                    svc.name
-                )
+        Restore state captured by :meth:`export_state`
+
+        Services not present in ``services`` keep their fresh instance.
+
+        :param dict state: tracker values
+        :param dict services: service name to service instance
+        """
+        with self.lock:
+            if services:
+                stack = self.materialize(None)
+                for name, service in services.items():
+                    if name in stack.services:
+                        del stack.services[name]
+                    stack.register(service)
+            self._base_url = state['base_url']
+            if self._stack is not None:
+                self._stack.base_url = self._base_url
+            self.created_at = state['created_at']
+            self._accessed = datetime_to_timestamp(state['last_accessed_at'])
+            self._access_count = state['access_count']
+            self._clear_status()
+            for status, count in state['status'].items():
+                self._count_status(status, count)
+            if state.get('stats'):
+                self.stats.load(state['stats'])
+            else:
+                self._stats = None
+            self.tracker_version = self.tracker_version + 1
+            self.hold.clear()
+            self.hold.update(state.get('hold', {}))
+            self.fixtures.import_overrides(*state.get('fixtures', ({}, [])))
+            self.rate_limiter = RateLimiter.from_config(
+                state.get('rate_limit')
             )
-            self.stack.register(svc)
-        self._http_status_dict = {}
+            self.shaper = Shaper.from_config(state.get('shaping'))
+            self.faults = FaultInjector.from_config(state.get('faults'))
+            self.dirty = False
+
+    def post_fork(self):
+        """
+        Re-initialize the per-process state in a forked worker
+
+        Locks may have been held by another thread when the process forked
+        and background threads do not survive the fork.
+        """
+        self._lock = None
+        if self._hold is not None:
+            self._hold.post_fork()
+        if self.recorder is not None:
+            self.recorder.post_fork()
+        if self.rate_limiter is not None:
+            self.rate_limiter.post_fork()
+
+    def init_services(self):
+        """
+        Initialize the StackInABox instance with the services that have not
+        been created yet
+        """
+        routes = service_routes(self.services)
+        with stack_creation_lock:
+            stack = self._create_stack()
+            for name, service in routes.items():
+                if name not in stack.services:
+                    self._register_service(stack, service)
 
     @property
     def base_url(self):
@@ -132,7 +598,9 @@ class Session(object):
             )
         )
         with self.lock:
-            return self.stack.base_url
+            if self._stack is None:
+                return self._base_url
+            return self._stack.base_url
 
     @base_url.setter
     def base_url(self, value):
@@ -145,14 +613,17 @@ class Session(object):
             )
         )
         with self.lock:
-            self.stack.base_url = value
+            self._base_url = value
+            if self._stack is not None:
+                self._stack.base_url = value
 
     def reset(self):
         """
-        Reset the StackInABox instance to the initial state by
-        resetting the instance then re-registering all the services.
+        Reset the StackInABox instance to the initial state
+
+        The services created so far are reset and dropped; new instances are
+        created the next time they are used.
         """
-        self._update_trackers()
         logger.debug(
             'Session {0}: Waiting for lock'.format(
                 self.session_id
@@ -164,15 +635,94 @@ class Session(object):
                     self.session_id
                 )
             )
+            self._update_trackers()
+
+            stack = self._stack
+            if stack is not None:
+                self._base_url = stack.base_url
+                stack.reset()
+                self._stack = None
+            if self._hold is not None:
+                self._hold.clear()
+            if self._fixtures is not None:
+                self._fixtures.reset()
+            self._clear_status()
+            self._stats = None
+
+    def throttle(self, service_name):
+        """
+        Apply the session's rate limits to a request
 
-            self.stack.reset()
-            self.init_services()
+        Runs without the session lock; a limited request is only counted in
+        the status tracker.
+
+        :param text_type service_name: name of the service being called
+        :returns: StackInABox response tuple if the request is limited,
+            otherwise None
+        """
+        rate_limiter = self.rate_limiter
+        if rate_limiter is None:
+            return None
+
+        wait = rate_limiter.take(service_name)
+        if not wait:
+            return None
+
+        logger.debug(
+            'Session {0}: rate limited for {1:.3f} seconds'.format(
+                self.session_id,
+                wait
+            )
+        )
+        self.dirty = True
+        return self._track_result((
+            429,
+            {'Retry-After': RateLimiter.retry_after(wait)},
+            'StackInAWSGI - Rate Limit Exceeded'
+        ))
+
+    def _call_stack(self, args, kwargs):
+        """
+        Call StackInABox, through the fault injector when it has rules and
+        under the profiler when the session is profiled
+
+        The caller must hold the session lock. Only the service the URI is
+        routed to is created. Calls with the method and URI are counted in
+        the session statistics.
+        """
+        start = default_timer()
+        uri = None
+        stack = self.materialize(None)
+        if len(args) >= 3 and isinstance(args[2], six.string_types):
+            uri = args[2]
+            service_uri = StackInABox.get_services_url(uri, stack.base_url)
+            if service_uri.startswith('/'):
+                stack = self.materialize(service_uri.split('/', 2)[1])
+
+        call = stack.call
+        faults = self.faults
+        if faults is not None:
+            call = functools.partial(faults.call, call)
+        profiler = self.profiler
+        if profiler is not None:
+            call = functools.partial(profiler.runcall, call)
+        result = call(*args, **kwargs)
+
+        if uri is not None:
+            if uri.startswith(self.session_id):
+                uri = uri[len(self.session_id):]
+            self.stats.record(
+                args[0],
+                uri,
+                result[0],
+                default_timer() - start
+            )
+        return result
 
     def call(self, *args, **kwargs):
         """
         Wrapper to same in the StackInABox instance
         """
-        self._update_trackers()
         logger.debug(
             'Session {0}: Waiting for lock'.format(
                 self.session_id
@@ -184,16 +734,43 @@ class Session(object):
                     self.session_id
                 )
             )
+            self._update_trackers()
+            with serving(self):
+                return self._track_result(self._call_stack(args, kwargs))
+
+    def call_with_timeout(self, lock_timeout, *args, **kwargs):
+        """
+        Same as :meth:`call` but gives up waiting for the session lock
 
-            return self._track_result(
-                self.stack.call(*args, **kwargs)
+        :param float lock_timeout: seconds to wait for the lock
+        :raises: SessionBusy if the lock was not acquired in time
+        """
+        logger.debug(
+            'Session {0}: Waiting up to {1} seconds for lock'.format(
+                self.session_id,
+                lock_timeout
+            )
+        )
+        if not acquire_lock(self.lock, lock_timeout):
+            raise SessionBusy(
+                'Session {0} is busy'.format(self.session_id)
+            )
+        try:
+            logger.debug(
+                'Session {0}: Acquired lock'.format(
+                    self.session_id
+                )
             )
+            self._update_trackers()
+            with serving(self):
+                return self._track_result(self._call_stack(args, kwargs))
+        finally:
+            self.lock.release()
 
     def try_handle_route(self, *args, **kwargs):
         """
         Wrapper to same in the StackInABox instance
         """
-        self._update_trackers()
         logger.debug(
             'Session {0}: Waiting for lock'.format(
                 self.session_id
@@ -205,16 +782,16 @@ class Session(object):
                     self.session_id
                 )
             )
-
-            return self._track_result(
-                self.stack.try_handle_route(*args, **kwargs)
-            )
+            self._update_trackers()
+            with serving(self):
+                return self._track_result(
+                    self.stack.try_handle_route(*args, **kwargs)
+                )
 
     def request(self, *args, **kwargs):
         """
         Wrapper to same in the StackInABox instance
         """
-        self._update_trackers()
         logger.debug(
             'Session {0}: Waiting for lock'.format(
                 self.session_id
@@ -226,16 +803,16 @@ class Session(object):
                     self.session_id
                 )
             )
-
-            return self._track_result(
-                self.stack.request(*args, **kwargs)
-            )
+            self._update_trackers()
+            with serving(self):
+                return self._track_result(
+                    self.stack.request(*args, **kwargs)
+                )
 
     def sub_request(self, *args, **kwargs):
         """
         Pass-thru to the StackInABox instance's sub_request
         """
-        self._update_trackers()
         logger.debug(
             'Session {0}: Waiting for lock'.format(
                 self.session_id
@@ -247,7 +824,8 @@ class Session(object):
                     self.session_id
                 )
             )
-
-            return self._track_result(
-                self.stack.sub_request(*args, **kwargs)
-            )
+            self._update_trackers()
+            with serving(self):
+                return self._track_result(
+                    self.stack.sub_request(*args, **kwargs)
+                )
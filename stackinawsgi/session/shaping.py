@@ -0,0 +1,414 @@
+"""
+Stack-In-A-WSGI: Session Latency and Bandwidth Shaping
+"""
+from __future__ import absolute_import
+
+import bisect
+import logging
+import random
+import re
+import time
+from timeit import default_timer
+
+import six
+
+
+logger = logging.getLogger(__name__)
+
+# WSGI environ key used to hand the shaping plan to the application
+environ_key = 'stackinawsgi.shaping'
+
+
+class FixedLatency(object):
+    """
+    The same delay for every response
+
+    :ivar float ms: delay in milliseconds
+    """
+
+    def __init__(self, ms):
+        """
+        :param float ms: delay in milliseconds
+        """
+        self.ms = float(ms)
+        if self.ms < 0:
+            raise ValueError('Latency cannot be negative')
+
+    def sample(self, rng):
+        """
+        :param :obj:`random.Random` rng: unused
+        :returns: float delay in seconds
+        """
+        return self.ms / 1000.0
+
+    def config(self):
+        """
+        :returns: dict accepted by :func:`latency_from_config`
+        """
+        return {'distribution': 'fixed', 'ms': self.ms}
+
+
+class NormalLatency(object):
+    """
+    Normally distributed delays, never below zero
+
+    :ivar float mean: mean delay in milliseconds
+    :ivar float stddev: standard deviation in milliseconds
+    """
+
+    def __init__(self, mean, stddev):
+        """
+        :param float mean: mean delay in milliseconds
+        :param float stddev: standard deviation in milliseconds
+        """
+        self.mean = float(mean)
+        self.stddev = float(stddev)
+        if self.mean < 0 or self.stddev < 0:
+            raise ValueError('Latency cannot be negative')
+
+    def sample(self, rng):
+        """
+        :param :obj:`random.Random` rng: the session's random generator
+        :returns: float delay in seconds
+        """
+        return max(0.0, rng.normalvariate(self.mean, self.stddev)) / 1000.0
+
+    def config(self):
+        """
+        :returns: dict accepted by :func:`latency_from_config`
+        """
+        return {
+            'distribution': 'normal',
+            'mean-ms': self.mean,
+            'stddev-ms': self.stddev
+        }
+
+
+class HistogramLatency(object):
+    """
+    Delays drawn from a recorded histogram
+
+    A bucket is chosen in proportion to its count and the delay is uniform
+    between the previous bucket's upper bound (zero for the first) and the
+    bucket's upper bound.
+
+    :ivar list buckets: list of [upper-ms, count] sorted by upper bound
+    """
+
+    def __init__(self, buckets):
+        """
+        :param list buckets: list of [upper-ms, count]
+        """
+        self.buckets = sorted(
+            [float(upper), int(count)] for upper, count in buckets
+        )
+        self.bounds = [0.0] + [upper for upper, _ in self.buckets]
+        self.cumulative = []
+        total = 0
+        for upper, count in self.buckets:
+            if upper < 0 or count < 0:
+                raise ValueError('Histogram values cannot be negative')
+            total = total + count
+            self.cumulative.append(total)
+        if not total:
+            raise ValueError('Histogram is empty')
+
+    def sample(self, rng):
+        """
+        :param :obj:`random.Random` rng: the session's random generator
+        :returns: float delay in seconds
+        """
+        index = bisect.bisect_right(
+            self.cumulative,
+            rng.random() * self.cumulative[-1]
+        )
+        index = min(index, len(self.buckets) - 1)
+        return rng.uniform(self.bounds[index], self.bounds[index + 1]) / 1000.0
+
+    def config(self):
+        """
+        :returns: dict accepted by :func:`latency_from_config`
+        """
+        return {'distribution': 'histogram', 'buckets': self.buckets}
+
+
+def latency_from_config(config):
+    """
+    Build a latency distribution
+
+    :param dict config: {'distribution': 'fixed', 'ms': float},
+        {'distribution': 'normal', 'mean-ms': float, 'stddev-ms': float} or
+        {'distribution': 'histogram', 'buckets': [[upper-ms, count], ...]}
+    :returns: latency distribution or None
+    :raises: ValueError if the configuration is invalid
+    """
+    if config is None:
+        return None
+    if not isinstance(config, dict):
+        raise ValueError('Latency must be an object')
+
+    distribution = config.get('distribution', 'fixed')
+    try:
+        if distribution == 'fixed':
+            return FixedLatency(config['ms'])
+        if distribution == 'normal':
+            return NormalLatency(config['mean-ms'], config.get('stddev-ms', 0))
+        if distribution == 'histogram':
+            return HistogramLatency(config['buckets'])
+    except (KeyError, TypeError) as ex:
+        raise ValueError('Invalid latency: {0}'.format(ex))
+
+    raise ValueError('Unknown latency distribution: {0}'.format(distribution))
+
+
+def bandwidth_from_config(value):
+    """
+    Validate a bandwidth
+
+    :param value: bytes per second or None
+    :returns: float or None
+    :raises: ValueError if the bandwidth is not positive
+    """
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except TypeError:
+        raise ValueError('Bandwidth must be a number')
+    if not value > 0:
+        raise ValueError('Bandwidth must be positive')
+    return value
+
+
+class RouteRule(object):
+    """
+    Base for the rules applied to the requests matching a method and path
+
+    :ivar text_type method: HTTP method or None for any method
+    :ivar text_type path: regex searched in the service URI, e.g. /hello/
+    """
+
+    def __init__(self, method=None, path=None):
+        """
+        :raises: ValueError if the method or path is invalid
+        """
+        if method is not None and not isinstance(method, six.string_types):
+            raise ValueError('Route method must be a string')
+        self.method = method.upper() if method else None
+        self.path = path
+        try:
+            self.matcher = re.compile(path or '')
+        except (re.error, TypeError) as ex:
+            raise ValueError('Invalid route path: {0}'.format(ex))
+
+    def matches(self, method, uri):
+        """
+        :param text_type method: HTTP method of the request
+        :param text_type uri: URI of the request within the session
+        :returns: boolean
+        """
+        if self.method is not None and self.method != method:
+            return False
+        return self.matcher.search(uri) is not None
+
+
+class ShapingRule(RouteRule):
+    """
+    Latency and bandwidth for the routes matching a method and path
+
+    :ivar latency: latency distribution, None to keep the session's
+    :ivar float bandwidth: bytes per second, None to keep the session's
+    """
+
+    def __init__(self, method=None, path=None, latency=None, bandwidth=None):
+        """
+        :raises: ValueError if the method or path is invalid
+        """
+        super(ShapingRule, self).__init__(method, path)
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def config(self):
+        """
+        :returns: dict for :meth:`Shaper.from_config`
+        """
+        config = {'method': self.method, 'path': self.path}
+        if self.latency is not None:
+            config['latency'] = self.latency.config()
+        if self.bandwidth is not None:
+            config['bandwidth'] = self.bandwidth
+        return config
+
+
+class Shaper(object):
+    """
+    Simulated latency and bandwidth of a session
+
+    The first matching route overrides the session's latency and
+    bandwidth. Delays are drawn from a random generator seeded per session
+    so runs are reproducible.
+
+    :ivar latency: session latency distribution or None
+    :ivar float bandwidth: session bandwidth in bytes per second or None
+    :ivar list routes: list of :obj:`ShapingRule`
+    :ivar int seed: random seed or None
+    """
+
+    def __init__(self, latency=None, bandwidth=None, routes=None, seed=None):
+        """
+        Create the shaper and its random generator
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.routes = list(routes or [])
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the shaper from its configuration
+
+        :param dict config: {'latency': {...}, 'bandwidth': float,
+            'seed': int, 'routes': [{'method': text_type, 'path': regex,
+            'latency': {...}, 'bandwidth': float}]}, every key is optional
+        :returns: :obj:`Shaper` or None if nothing is shaped
+        :raises: ValueError if the configuration is invalid
+        """
+        if config is None:
+            return None
+        if not isinstance(config, dict):
+            raise ValueError('Shaping must be an object')
+
+        routes = config.get('routes')
+        if routes is None:
+            routes = []
+        if not isinstance(routes, list):
+            raise ValueError('Shaping routes must be a list')
+        rules = []
+        for route in routes:
+            if not isinstance(route, dict):
+                raise ValueError('Shaping route must be an object')
+            rules.append(ShapingRule(
+                method=route.get('method'),
+                path=route.get('path'),
+                latency=latency_from_config(route.get('latency')),
+                bandwidth=bandwidth_from_config(route.get('bandwidth'))
+            ))
+
+        shaper = cls(
+            latency=latency_from_config(config.get('latency')),
+            bandwidth=bandwidth_from_config(config.get('bandwidth')),
+            routes=rules,
+            seed=config.get('seed')
+        )
+        unshaped = shaper.latency is None and shaper.bandwidth is None
+        if unshaped and not shaper.routes:
+            return None
+        return shaper
+
+    def config(self):
+        """
+        :returns: dict accepted by :meth:`from_config`
+        """
+        config = {'routes': [rule.config() for rule in self.routes]}
+        if self.latency is not None:
+            config['latency'] = self.latency.config()
+        if self.bandwidth is not None:
+            config['bandwidth'] = self.bandwidth
+        if self.seed is not None:
+            config['seed'] = self.seed
+        return config
+
+    def plan(self, method, uri):
+        """
+        Delay and bandwidth for a response
+
+        :param text_type method: HTTP method of the request
+        :param text_type uri: URI of the request within the session
+        :returns: tuple of (delay in seconds, bytes per second or None), or
+            None when the response is not shaped
+        """
+        latency = self.latency
+        bandwidth = self.bandwidth
+        for rule in self.routes:
+            if rule.matches(method, uri):
+                if rule.latency is not None:
+                    latency = rule.latency
+                if rule.bandwidth is not None:
+                    bandwidth = rule.bandwidth
+                break
+
+        delay = latency.sample(self.rng) if latency is not None else 0.0
+        if not delay and bandwidth is None:
+            return None
+        return (delay, bandwidth)
+
+
+class ShapedBody(object):
+    """
+    Response body iterable delaying the first chunk and pacing the rest
+
+    The waits happen while the server iterates the body, after the session
+    lock was released, so other requests to the session are not held up.
+    Pacing is against a deadline computed from the bytes sent so far,
+    so it does not drift with the time spent writing.
+
+    :ivar iterable body: the response body chunks
+    :ivar float delay: seconds to wait before the first chunk
+    :ivar float bandwidth: bytes per second or None
+    :ivar int chunk_size: largest chunk sent when pacing
+    """
+
+    def __init__(self, body, delay, bandwidth=None, chunk_size=None):
+        """
+        Wrap a response body
+        """
+        self.body = body
+        self.delay = delay
+        self.bandwidth = bandwidth
+        if chunk_size is None and bandwidth is not None:
+            # roughly ten writes per second
+            chunk_size = max(1, int(bandwidth / 10))
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def wait_until(deadline):
+        """
+        Sleep until a deadline
+
+        time.sleep is looked up on each call so cooperative servers that
+        patch it, e.g. gevent or eventlet, wait without blocking a thread.
+
+        :param float deadline: default_timer() value to wait for
+        """
+        remaining = deadline - default_timer()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def __iter__(self):
+        """
+        Yield the body chunks at the simulated speed
+        """
+        start = default_timer() + self.delay
+        self.wait_until(start)
+        if self.bandwidth is None:
+            for chunk in self.body:
+                yield chunk
+            return
+
+        sent = 0
+        for chunk in self.body:
+            for offset in six.moves.range(0, len(chunk), self.chunk_size):
+                piece = chunk[offset:offset + self.chunk_size]
+                sent = sent + len(piece)
+                yield piece
+                self.wait_until(start + sent / self.bandwidth)
+
+    def close(self):
+        """
+        Close the wrapped body per PEP-3333
+        """
+        close = getattr(self.body, 'close', None)
+        if close is not None:
+            close()
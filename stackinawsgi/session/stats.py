@@ -0,0 +1,221 @@
+"""
+Stack-In-A-WSGI: Session Service and Route Statistics
+"""
+from __future__ import absolute_import
+
+import array
+import bisect
+import logging
+import re
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in milliseconds, of the latency histogram buckets; a last
+# bucket counts the calls above the highest bound
+latency_buckets_ms = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000
+)
+
+# Path segments replaced by {id} in the route templates
+id_segment_matcher = re.compile(
+    r'^(\d+|[0-9a-fA-F]{16,}|'
+    r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+    r'[0-9a-fA-F]{12})$'
+)
+
+# Route recorded once a session has seen max_routes distinct routes
+overflow_route = '(other)'
+
+
+def route_template(path):
+    """
+    Template of a path with the id-like segments replaced by {id}
+
+    :param text_type path: path of the request within the session
+    :returns: text_type
+    """
+    path = path.split('?', 1)[0]
+    return '/'.join(
+        '{id}' if id_segment_matcher.match(segment) else segment
+        for segment in path.split('/')
+    )
+
+
+class CallStats(object):
+    """
+    Call counter and fixed-bucket latency histogram
+
+    :ivar int count: number of calls
+    :ivar int errors: number of calls answered with a 5xx status
+    :ivar float total: seconds spent in the calls
+    :ivar array buckets: calls per latency bucket, see
+        :data:`latency_buckets_ms`
+    """
+
+    __slots__ = ('count', 'errors', 'total', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = array.array('L', [0] * (len(latency_buckets_ms) + 1))
+
+    def record(self, status, seconds):
+        """
+        Count a call
+
+        :param int status: HTTP status of the response
+        :param float seconds: time the call took
+        """
+        self.count = self.count + 1
+        if status >= 500:
+            self.errors = self.errors + 1
+        self.total = self.total + seconds
+        index = bisect.bisect_left(latency_buckets_ms, seconds * 1000.0)
+        self.buckets[index] = self.buckets[index] + 1
+
+    def info(self):
+        """
+        :returns: dict for the admin API
+        """
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total-ms': round(self.total * 1000.0, 3),
+            'histogram': self.buckets.tolist()
+        }
+
+    def export(self):
+        """
+        :returns: tuple accepted by :meth:`load`
+        """
+        return (self.count, self.errors, self.total, self.buckets.tolist())
+
+    @classmethod
+    def load(cls, state):
+        """
+        Restore the statistics captured by :meth:`export`
+
+        :param tuple state: (count, errors, total, buckets)
+        :returns: :obj:`CallStats`
+        """
+        stats = cls()
+        stats.count, stats.errors, stats.total, buckets = state
+        if len(buckets) == len(stats.buckets):
+            stats.buckets = array.array('L', buckets)
+        return stats
+
+
+class SessionStats(object):
+    """
+    Per-service and per-route call statistics of a session
+
+    Routes are the request method and the template of the path, see
+    :func:`route_template`. Once ``max_routes`` routes, or services, are
+    tracked, calls to new ones are counted under :data:`overflow_route` so
+    the memory used stays bounded whatever URIs a test uses. Updated under
+    the session lock.
+
+    :ivar int max_routes: maximum number of routes, and of services, tracked
+    :ivar dict services: service name to :obj:`CallStats`
+    :ivar dict routes: (method, route template) to :obj:`CallStats`
+    """
+
+    def __init__(self, max_routes=256):
+        """
+        Create empty statistics
+        """
+        self.max_routes = max_routes
+        self.services = {}
+        self.routes = {}
+        # (method, path) to route key, dropped when it grows too large
+        self._keys = {}
+
+    def clear(self):
+        """
+        Drop the statistics
+        """
+        self.services = {}
+        self.routes = {}
+        self._keys = {}
+
+    def record(self, method, path, status, seconds):
+        """
+        Count a call
+
+        :param text_type method: HTTP method of the request
+        :param text_type path: path of the request within the session, f.e.
+            /hello/
+        :param int status: HTTP status of the response
+        :param float seconds: time the call took
+        """
+        service_name = path.split('/', 2)[1] if '/' in path else path
+        stats = self.services.get(service_name)
+        if stats is None:
+            # unknown services are named by the path as well
+            if len(self.services) >= self.max_routes:
+                service_name = overflow_route
+                stats = self.services.get(service_name)
+            if stats is None:
+                stats = self.services[service_name] = CallStats()
+        stats.record(status, seconds)
+
+        key = self._keys.get((method, path))
+        if key is None:
+            key = (method, route_template(path))
+            if key not in self.routes and (
+                    len(self.routes) >= self.max_routes):
+                key = (method, overflow_route)
+            if len(self._keys) >= 4 * self.max_routes:
+                self._keys = {}
+            self._keys[(method, path)] = key
+
+        stats = self.routes.get(key)
+        if stats is None:
+            stats = self.routes[key] = CallStats()
+        stats.record(status, seconds)
+
+    def info(self):
+        """
+        :returns: dict for the admin API; routes are keyed by
+            "<method> <route template>"
+        """
+        return {
+            'buckets-ms': list(latency_buckets_ms),
+            'services': {
+                name: stats.info() for name, stats in self.services.items()
+            },
+            'routes': {
+                '{0} {1}'.format(method, route): stats.info()
+                for (method, route), stats in self.routes.items()
+            }
+        }
+
+    def export(self):
+        """
+        :returns: dict accepted by :meth:`load`
+        """
+        return {
+            'services': {
+                name: stats.export() for name, stats in self.services.items()
+            },
+            'routes': [
+                (method, route, stats.export())
+                for (method, route), stats in self.routes.items()
+            ]
+        }
+
+    def load(self, state):
+        """
+        Restore the statistics captured by :meth:`export`
+
+        :param dict state: exported statistics, None to clear them
+        """
+        self.clear()
+        if not state:
+            return
+        for name, stats in state.get('services', {}).items():
+            self.services[name] = CallStats.load(stats)
+        for method, route, stats in state.get('routes', []):
+            self.routes[(method, route)] = CallStats.load(stats)
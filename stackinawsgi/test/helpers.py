@@ -5,6 +5,7 @@ Stack-In-A-WSGI: Test Helpers
 import logging
 import tempfile
 
+from stackinabox.services.service import StackInABoxService
 from stackinabox.util.tools import CaseInsensitiveDict
 
 
@@ -15,6 +16,25 @@ class InvalidService(object):
     pass
 
 
+class BytesHelloService(StackInABoxService):
+    """
+    Hello service returning a bytes body as required by real WSGI servers
+    """
+
+    def __init__(self):
+        """
+        Register the single end-point
+        """
+        super(BytesHelloService, self).__init__('hello')
+        self.register(StackInABoxService.GET, '/', BytesHelloService.handler)
+
+    def handler(self, request, uri, headers):
+        """
+        Return hello
+        """
+        return (200, {}, b'Hello')
+
+
 class WsgiMock(object):
     """
     StackInAWSGI WSGI Mock for the WSGI start_response() callable
@@ -2,7 +2,10 @@
 Stack-In-A-WSGI: stackinawsgi.admin.admin.StackInAWsgiSessionManager
 """
 import datetime
+import io
 import json
+import shutil
+import tempfile
 import unittest
 
 import ddt
@@ -30,7 +33,10 @@ class TestSessionManager(unittest.TestCase):
         """
         configure env for the test
         """
-        self.manager = StackInAWsgiSessionManager()
+        self.journal_dir = tempfile.mkdtemp()
+        self.manager = StackInAWsgiSessionManager(
+            journal_dir=self.journal_dir
+        )
         self.manager.register_service(HelloService)
         self.base_uri = 'test://testing-url'
 
@@ -40,7 +46,8 @@ class TestSessionManager(unittest.TestCase):
         """
         keys = tuple(global_sessions.keys())
         for k in keys:
-            del global_sessions[k]
+            self.manager.remove_session(k)
+        shutil.rmtree(self.journal_dir)
 
     def test_construction(self):
         """
@@ -204,6 +211,11 @@ class TestSessionManager(unittest.TestCase):
             response.headers['location']
         )
 
+        # the request headers are not echoed or modified
+        self.assertIsNot(result[1], request.headers)
+        self.assertEqual({'x-session-id'}, set(result[1]) - {'location'})
+        self.assertNotIn('location', request.headers)
+
     def test_session_remove(self):
         """
         test removing a session
@@ -560,3 +572,948 @@ class TestSessionManager(unittest.TestCase):
             uri
         )
         self.assertIsNone(extracted_session_id)
+
+    @ddt.unpack
+    @ddt.data(
+        ('x-session-id', 'value'),
+        ('X-Session-ID', 'value'),
+        ('X_SESSION_ID', 'value'),
+        ('x-other', None),
+    )
+    def test_helper_get_header(self, header_name, expected_value):
+        """
+        test retrieving headers in either the HTTP or WSGI naming
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        self.assertEqual(
+            expected_value,
+            admin.helper_get_header({header_name: 'value'}, 'x-session-id')
+        )
+
+    def helper_call_journal(self, admin, handler, method, session_id,
+                            headers=None):
+        """
+        call one of the journal handlers
+        """
+        uri = u'/{0}/journal'.format(session_id)
+        environment = make_environment(
+            self,
+            method=method,
+            path=uri,
+            headers=headers or {}
+        )
+        request = Request(environment)
+        response = Response()
+        result = handler(admin, request, uri, request.headers)
+        response.from_stackinabox(
+            result[0],
+            result[1],
+            result[2]
+        )
+        return response
+
+    def test_journal(self):
+        """
+        test recording, streaming, and stopping a session journal
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+
+        response = self.helper_call_journal(
+            admin,
+            StackInAWsgiAdmin.start_journal,
+            'PUT',
+            session_id,
+            headers={
+                'x-journal-bodies': 'true',
+                'x-journal-max-bytes': '4096'
+            }
+        )
+        self.assertEqual(response.status, 200)
+        journal_info = json.loads(response.body)
+        self.assertTrue(journal_info['include_bodies'])
+        self.assertEqual(4096, journal_info['max_bytes'])
+        self.assertTrue(journal_info['journal'].startswith(self.journal_dir))
+
+        uri = u'/{0}/hello/'.format(session_id)
+        request = Request(make_environment(self, method='GET', path=uri))
+        result = self.manager.request('GET', request, uri, request.headers)
+        self.assertEqual(200, result[0])
+
+        response = self.helper_call_journal(
+            admin,
+            StackInAWsgiAdmin.get_journal,
+            'GET',
+            session_id
+        )
+        self.assertEqual(response.status, 200)
+        self.assertEqual(
+            'application/x-ndjson',
+            response.headers['content-type']
+        )
+        entries = [
+            json.loads(line)
+            for line in b''.join(response.body).decode('utf-8').splitlines()
+        ]
+        self.assertEqual(1, len(entries))
+        self.assertEqual('GET', entries[0]['method'])
+        self.assertEqual('/hello/', entries[0]['uri'])
+        self.assertEqual(200, entries[0]['status'])
+
+        # recording survives a reset
+        self.manager.reset_session(session_id)
+        self.assertIsNotNone(global_sessions[session_id].recorder)
+
+        response = self.helper_call_journal(
+            admin,
+            StackInAWsgiAdmin.stop_journal,
+            'DELETE',
+            session_id
+        )
+        self.assertEqual(response.status, 204)
+        self.assertIsNone(global_sessions[session_id].recorder)
+
+        response = self.helper_call_journal(
+            admin,
+            StackInAWsgiAdmin.get_journal,
+            'GET',
+            session_id
+        )
+        self.assertEqual(response.status, 404)
+
+    @ddt.data(
+        (StackInAWsgiAdmin.start_journal, 'PUT'),
+        (StackInAWsgiAdmin.stop_journal, 'DELETE'),
+        (StackInAWsgiAdmin.get_journal, 'GET'),
+    )
+    @ddt.unpack
+    def test_journal_invalid_session_id(self, handler, method):
+        """
+        test the journal handlers with an invalid session id
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        response = self.helper_call_journal(
+            admin,
+            handler,
+            method,
+            'my-session-id'
+        )
+        self.assertEqual(response.status, 404)
+
+    def test_journal_invalid_max_bytes(self):
+        """
+        test starting a journal with an invalid rotation size
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        response = self.helper_call_journal(
+            admin,
+            StackInAWsgiAdmin.start_journal,
+            'PUT',
+            session_id,
+            headers={'x-journal-max-bytes': 'lots'}
+        )
+        self.assertEqual(response.status, 400)
+        self.assertIsNone(global_sessions[session_id].recorder)
+
+    def test_journal_conflicting_options(self):
+        """
+        test recording a recorded session again with other options
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        response = self.helper_call_journal(
+            admin,
+            StackInAWsgiAdmin.start_journal,
+            'PUT',
+            session_id,
+            headers={'x-journal-max-bytes': '4096'}
+        )
+        self.assertEqual(response.status, 200)
+        recorder = global_sessions[session_id].recorder
+
+        for headers in (
+            {'x-journal-max-bytes': '4096'},
+            {}
+        ):
+            response = self.helper_call_journal(
+                admin,
+                StackInAWsgiAdmin.start_journal,
+                'PUT',
+                session_id,
+                headers=headers
+            )
+            self.assertEqual(response.status, 200)
+
+        for headers in (
+            {'x-journal-max-bytes': '8192'},
+            {'x-journal-bodies': 'true'}
+        ):
+            response = self.helper_call_journal(
+                admin,
+                StackInAWsgiAdmin.start_journal,
+                'PUT',
+                session_id,
+                headers=headers
+            )
+            self.assertEqual(response.status, 409)
+        self.assertIs(recorder, global_sessions[session_id].recorder)
+        self.assertEqual(4096, recorder.max_bytes)
+
+    def helper_call_hold(self, admin, handler, method, uri, body=None):
+        """
+        call one of the hold handlers
+        """
+        environment = make_environment(self, method=method, path=uri)
+        if body is not None:
+            environment['wsgi.input'] = io.BytesIO(body)
+            environment['CONTENT_LENGTH'] = str(len(body))
+        request = Request(environment)
+        response = Response()
+        result = handler(admin, request, uri, request.headers)
+        response.from_stackinabox(
+            result[0],
+            result[1],
+            result[2]
+        )
+        return response
+
+    def test_hold(self):
+        """
+        test storing, listing, retrieving, and removing hold values
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        hold_uri = u'/{0}/hold'.format(session_id)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.put_hold_value, 'PUT',
+            hold_uri + '/fixture%2Fone', body=b'fixture-data'
+        )
+        self.assertEqual(response.status, 204)
+        global_sessions[session_id].hold['structured'] = {'key': [1, 2]}
+        global_sessions[session_id].hold['opaque'] = object()
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_hold, 'GET', hold_uri
+        )
+        self.assertEqual(response.status, 200)
+        hold_info = json.loads(response.body)
+        self.assertEqual(self.manager.session_options['hold_quota'],
+                         hold_info['quota'])
+        self.assertEqual(12, hold_info['values']['fixture/one'])
+        self.assertEqual(0, hold_info['evictions'])
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_hold_value, 'GET',
+            hold_uri + '/fixture%2Fone'
+        )
+        self.assertEqual(response.status, 200)
+        self.assertEqual(b'fixture-data', response.body)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_hold_value, 'GET',
+            hold_uri + '/structured'
+        )
+        self.assertEqual(response.status, 200)
+        self.assertEqual({'key': [1, 2]}, json.loads(response.body))
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_hold_value, 'GET',
+            hold_uri + '/opaque'
+        )
+        self.assertEqual(response.status, 406)
+
+        for _ in range(2):
+            response = self.helper_call_hold(
+                admin, StackInAWsgiAdmin.remove_hold_value, 'DELETE',
+                hold_uri + '/structured'
+            )
+        self.assertEqual(response.status, 404)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_hold_value, 'GET',
+            hold_uri + '/structured'
+        )
+        self.assertEqual(response.status, 404)
+
+    def test_hold_quota(self):
+        """
+        test storing a hold value larger than the quota
+        """
+        self.manager.session_options['hold_quota'] = 4
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.put_hold_value, 'PUT',
+            u'/{0}/hold/big'.format(session_id), body=b'too-big'
+        )
+        self.assertEqual(response.status, 413)
+
+    @ddt.data(
+        (StackInAWsgiAdmin.get_hold, 'GET', ''),
+        (StackInAWsgiAdmin.get_hold_value, 'GET', '/name'),
+        (StackInAWsgiAdmin.put_hold_value, 'PUT', '/name'),
+        (StackInAWsgiAdmin.remove_hold_value, 'DELETE', '/name'),
+    )
+    @ddt.unpack
+    def test_hold_invalid_session_id(self, handler, method, suffix):
+        """
+        test the hold handlers with an invalid session id
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        response = self.helper_call_hold(
+            admin, handler, method, u'/my-session-id/hold' + suffix
+        )
+        self.assertEqual(response.status, 404)
+
+    @ddt.data(
+        (
+            {'x-rate-limit': '5/10', 'x-service-rate-limit': 'hello=1'},
+            None,
+            {
+                'rate': 5.0,
+                'burst': 10.0,
+                'services': {'hello': {'rate': 1.0, 'burst': 1.0}}
+            }
+        ),
+        (
+            {'x-rate-limit': '5'},
+            b'{"rate-limit": {"services": {"hello": {"rate": 2}}}}',
+            {'services': {'hello': {'rate': 2.0, 'burst': 2.0}}}
+        ),
+        ({}, None, None),
+        ({}, b'{"other": "option"}', None),
+    )
+    @ddt.unpack
+    def test_create_session_rate_limit(self, headers, body, expected):
+        """
+        test creating a session with rate limits
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        environment = make_environment(
+            self,
+            method='POST',
+            path='/',
+            headers=headers
+        )
+        if body is not None:
+            environment['wsgi.input'] = io.BytesIO(body)
+            environment['CONTENT_LENGTH'] = str(len(body))
+        request = Request(environment)
+        result = admin.create_session(request, u'/', request.headers)
+        self.assertEqual(201, result[0])
+
+        session_id = result[1]['x-session-id']
+        result = admin.get_session_info(
+            request,
+            u'/{0}'.format(session_id),
+            request.headers
+        )
+        self.assertEqual(
+            expected,
+            json.loads(result[2]).get('rate-limit')
+        )
+
+    @ddt.data(
+        ({'x-rate-limit': 'fast'}, None),
+        ({'x-service-rate-limit': 'hello'}, None),
+        ({}, b'not json'),
+        ({}, b'[]'),
+        ({}, b'{"rate-limit": {"rate": -1}}'),
+    )
+    @ddt.unpack
+    def test_create_session_invalid_rate_limit(self, headers, body):
+        """
+        test creating a session with invalid rate limits
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        environment = make_environment(
+            self,
+            method='POST',
+            path='/',
+            headers=headers
+        )
+        if body is not None:
+            environment['wsgi.input'] = io.BytesIO(body)
+            environment['CONTENT_LENGTH'] = str(len(body))
+        request = Request(environment)
+        result = admin.create_session(request, u'/', request.headers)
+        self.assertEqual(400, result[0])
+        self.assertEqual([], self.manager.session_ids())
+
+    def test_shaping(self):
+        """
+        test configuring, retrieving, and removing the session shaping
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        shaping_uri = u'/{0}/shaping'.format(session_id)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_shaping, 'GET', shaping_uri
+        )
+        self.assertEqual(response.status, 200)
+        self.assertIsNone(json.loads(response.body))
+
+        config = {
+            'latency': {'distribution': 'fixed', 'ms': 5.0},
+            'routes': [{'method': None, 'path': '^/hello/',
+                        'bandwidth': 10.0}]
+        }
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.put_shaping, 'PUT', shaping_uri,
+            body=json.dumps(config).encode('utf-8')
+        )
+        self.assertEqual(response.status, 200)
+        self.assertEqual(config, json.loads(response.body))
+        self.assertIsNotNone(global_sessions[session_id].shaper)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_shaping, 'GET', shaping_uri
+        )
+        self.assertEqual(config, json.loads(response.body))
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.put_shaping, 'PUT', shaping_uri,
+            body=b'{"bandwidth": -1}'
+        )
+        self.assertEqual(response.status, 400)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.remove_shaping, 'DELETE', shaping_uri
+        )
+        self.assertEqual(response.status, 204)
+        self.assertIsNone(global_sessions[session_id].shaper)
+
+    @ddt.data(
+        (StackInAWsgiAdmin.get_shaping, 'GET'),
+        (StackInAWsgiAdmin.put_shaping, 'PUT'),
+        (StackInAWsgiAdmin.remove_shaping, 'DELETE'),
+    )
+    @ddt.unpack
+    def test_shaping_invalid_session_id(self, handler, method):
+        """
+        test the shaping handlers with an invalid session id
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        response = self.helper_call_hold(
+            admin, handler, method, u'/my-session-id/shaping', body=b'{}'
+        )
+        self.assertEqual(response.status, 404)
+
+    def test_faults(self):
+        """
+        test configuring, retrieving, and removing the session faults
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        faults_uri = u'/{0}/faults'.format(session_id)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_faults, 'GET', faults_uri
+        )
+        self.assertEqual(response.status, 200)
+        self.assertIsNone(json.loads(response.body))
+
+        config = {'seed': 1, 'rules': [{'fault': 'error', 'status': 500}]}
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.put_faults, 'PUT', faults_uri,
+            body=json.dumps(config).encode('utf-8')
+        )
+        self.assertEqual(response.status, 200)
+        self.assertEqual(
+            500,
+            json.loads(response.body)['rules'][0]['status']
+        )
+
+        result = self.manager.request(
+            'GET', None, u'/{0}/hello/'.format(session_id), {}
+        )
+        self.assertEqual(500, result[0])
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_faults, 'GET', faults_uri
+        )
+        self.assertEqual({'error': 1}, json.loads(response.body)['injected'])
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.put_faults, 'PUT', faults_uri,
+            body=b'{"rules": [{"fault": "explode"}]}'
+        )
+        self.assertEqual(response.status, 400)
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.put_faults, 'PUT', faults_uri,
+            body=b'{"rules": [{"fault": "error", "status": 600}]}'
+        )
+        self.assertEqual(response.status, 400)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.remove_faults, 'DELETE', faults_uri
+        )
+        self.assertEqual(response.status, 204)
+        self.assertIsNone(global_sessions[session_id].faults)
+
+    @ddt.data(
+        (StackInAWsgiAdmin.get_faults, 'GET'),
+        (StackInAWsgiAdmin.put_faults, 'PUT'),
+        (StackInAWsgiAdmin.remove_faults, 'DELETE'),
+    )
+    @ddt.unpack
+    def test_faults_invalid_session_id(self, handler, method):
+        """
+        test the fault handlers with an invalid session id
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        response = self.helper_call_hold(
+            admin, handler, method, u'/my-session-id/faults', body=b'{}'
+        )
+        self.assertEqual(response.status, 404)
+
+    @ddt.data(
+        (u'', '/'),
+        (u'/', '/'),
+        (u'/my-session-id', '/{session}'),
+        (u'/my-session-id/metrics', '/{session}/metrics'),
+        (u'/my-session-id/clone', '/{session}/clone'),
+        (u'/events', '/events'),
+        (u'/bulk', '/bulk'),
+        (u'/my-session-id/profile', '/{session}/profile'),
+        (u'/events/journal', '/{session}/journal'),
+        (u'/my-session-id/journal', '/{session}/journal'),
+        (u'/my-session-id/hold', '/{session}/hold'),
+        (u'/my-session-id/hold/a/b', '/{session}/hold/{key}'),
+        (u'/my-session-id?verbose=1', '/{session}'),
+        (u'/my-session-id/hold/', None),
+        (u'/my-session-id/journal/extra', None),
+        (u'/bad.session', None),
+    )
+    @ddt.unpack
+    def test_path_shape(self, uri, expected):
+        """
+        test the admin URIs are reduced to their dispatch table keys
+        """
+        self.assertEqual(expected, StackInAWsgiAdmin.path_shape(uri))
+
+    def test_dispatch_table(self):
+        """
+        test every registered handler is reachable through the table
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        for (method, shape), handler in admin.dispatch_table.items():
+            self.assertIn(method, admin.dispatch_methods[shape])
+            self.assertTrue(callable(handler))
+
+        session_id = self.manager.create_session()
+        response = self.helper_call_hold(
+            admin,
+            lambda admin, request, uri, headers: admin.request(
+                'GET', request, uri, headers
+            ),
+            'GET',
+            u'/{0}'.format(session_id)
+        )
+        self.assertEqual(response.status, 200)
+        self.assertTrue(json.loads(response.body)['session_valid'])
+
+    @ddt.data(
+        ('PATCH', u'/', 405),
+        ('POST', u'/my-session-id/journal', 405),
+        ('GET', u'/my-session-id/unknown', 595),
+        ('GET', u'/bad.session', 595),
+    )
+    @ddt.unpack
+    def test_dispatch_unrouted(self, method, uri, status):
+        """
+        test unsupported methods and unknown URIs
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        response = self.helper_call_hold(
+            admin,
+            lambda admin, request, uri, headers: admin.request(
+                method, request, uri, headers
+            ),
+            method,
+            uri
+        )
+        self.assertEqual(response.status, status)
+        if status == 405:
+            self.assertEqual(
+                ', '.join(admin.dispatch_methods[admin.path_shape(uri)]),
+                response.headers['allow']
+            )
+
+    def test_get_metrics(self):
+        """
+        test retrieving the trackers of a session
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        self.manager.request(
+            'GET', None, u'/{0}/hello/'.format(session_id), {}
+        )
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_metrics, 'GET',
+            u'/{0}/metrics'.format(session_id)
+        )
+        self.assertEqual(response.status, 200)
+        trackers = json.loads(response.body)['trackers']
+        self.assertEqual(1, trackers['accessed']['count'])
+        self.assertEqual({'200': 1}, trackers['status'])
+        stats = json.loads(response.body)['stats']
+        self.assertEqual(1, stats['services']['hello']['count'])
+        self.assertEqual(1, stats['routes']['GET /hello/']['count'])
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_metrics, 'GET',
+            u'/my-session-id/metrics'
+        )
+        self.assertEqual(response.status, 404)
+
+    def test_get_session_info_cached(self):
+        """
+        test the session info document is cached until a tracker changes
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        uri = u'/{0}'.format(session_id)
+
+        first = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_session_info, 'GET', uri
+        )
+        self.assertEqual(first.status, 200)
+        second = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.get_session_info, 'GET', uri
+        )
+        self.assertIs(first.body, second.body)
+        self.assertEqual(first.headers['etag'], second.headers['etag'])
+
+        environment = make_environment(
+            self,
+            method='GET',
+            path=uri,
+            headers={'IF_NONE_MATCH': first.headers['etag']}
+        )
+        request = Request(environment)
+        result = admin.get_session_info(request, uri, request.headers)
+        self.assertEqual(304, result[0])
+        self.assertEqual(first.headers['etag'], result[1]['etag'])
+        self.assertEqual('', result[2])
+
+        self.manager.request(
+            'GET', None, u'/{0}/hello/'.format(session_id), {}
+        )
+        result = admin.get_session_info(request, uri, request.headers)
+        self.assertEqual(200, result[0])
+        self.assertNotEqual(first.headers['etag'], result[1]['etag'])
+        self.assertEqual(
+            1,
+            json.loads(result[2])['trackers']['accessed']['count']
+        )
+
+        self.manager.remove_session(session_id)
+        result = admin.get_session_info(request, uri, request.headers)
+        self.assertFalse(json.loads(result[2])['session_valid'])
+
+    def helper_get_events(self, admin, qs):
+        """
+        call the events handler with a query string
+        """
+        environment = make_environment(
+            self,
+            method='GET',
+            path=u'/events',
+            qs=qs
+        )
+        request = Request(environment)
+        return admin.get_events(request, u'/events', request.headers)
+
+    def test_get_events(self):
+        """
+        test following the session events
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        result = self.helper_get_events(admin, None)
+        self.assertEqual(200, result[0])
+        cursor = json.loads(result[2])['version']
+
+        session_id = self.manager.create_session()
+        result = self.helper_get_events(
+            admin, 'since={0}&wait=0'.format(cursor)
+        )
+        feed = json.loads(result[2])
+        self.assertFalse(feed['reset'])
+        self.assertEqual(
+            [('created', session_id)],
+            [
+                (event['event'], event['session-id'])
+                for event in feed['events']
+            ]
+        )
+
+        result = self.helper_get_events(
+            admin, 'since={0}&wait=0.01'.format(feed['version'])
+        )
+        self.assertEqual([], json.loads(result[2])['events'])
+
+    @ddt.data(
+        'since=abc', 'since=1&wait=soon', 'since=1&wait=-1',
+        'since=1&wait=nan', 'since=1&wait=inf'
+    )
+    def test_get_events_invalid(self, qs):
+        """
+        test invalid event queries
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        self.assertEqual(400, self.helper_get_events(admin, qs)[0])
+
+    @ddt.data('bulk', 'events')
+    def test_create_reserved_session_id(self, session_id):
+        """
+        test the admin resources cannot be used as session ids
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        environment = make_environment(
+            self,
+            method='POST',
+            path=u'/',
+            headers={'x-session-id': session_id}
+        )
+        request = Request(environment)
+        result = admin.create_session(request, u'/', request.headers)
+        self.assertEqual(400, result[0])
+        self.assertNotIn(session_id, global_sessions)
+
+    def helper_bulk(self, admin, action, session_ids):
+        """
+        call the bulk handler and return the status of each session
+        """
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.bulk_sessions, 'POST', u'/bulk',
+            body=json.dumps({
+                'action': action,
+                'session-ids': session_ids
+            }).encode('utf-8')
+        )
+        self.assertEqual(response.status, 200)
+        return [
+            (result['session-id'], result['status'])
+            for result in json.loads(response.body)['results']
+        ]
+
+    def test_bulk_sessions(self):
+        """
+        test creating, resetting and removing sessions in bulk
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        self.assertEqual(
+            [('shard-1', 201), ('shard-2', 201), ('bulk', 400)],
+            self.helper_bulk(admin, 'create', ['shard-1', 'shard-2', 'bulk'])
+        )
+        self.assertEqual(
+            set(['shard-1', 'shard-2']),
+            set(global_sessions)
+        )
+
+        global_sessions['shard-1'].hold['key'] = b'value'
+        self.assertEqual(
+            [('shard-1', 205), ('missing', 404)],
+            self.helper_bulk(admin, 'reset', ['shard-1', 'missing'])
+        )
+        self.assertNotIn('key', global_sessions['shard-1'].hold)
+
+        self.assertEqual(
+            [('shard-1', 204), ('shard-2', 204), ('missing', 404)],
+            self.helper_bulk(
+                admin, 'remove', ['shard-1', 'shard-2', 'missing']
+            )
+        )
+        self.assertEqual({}, global_sessions)
+
+    @ddt.data(
+        b'[]',
+        b'{"session-ids": ["a"]}',
+        b'{"action": "explode", "session-ids": ["a"]}',
+        b'{"action": "create"}',
+        b'{"action": "create", "session-ids": []}',
+        b'{"action": "create", "session-ids": [1]}',
+        b'{"action": "create", "session-ids": ["a", "a"]}',
+        json.dumps({
+            'action': 'create',
+            'session-ids': [str(index) for index in range(1001)]
+        }).encode('utf-8'),
+    )
+    def test_bulk_sessions_invalid(self, body):
+        """
+        test invalid bulk requests
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.bulk_sessions, 'POST', u'/bulk',
+            body=body
+        )
+        self.assertEqual(response.status, 400)
+        self.assertEqual({}, global_sessions)
+
+    def helper_get_profile(self, admin, session_id, qs=None):
+        """
+        call the profile handler with a query string
+        """
+        uri = u'/{0}/profile'.format(session_id)
+        environment = make_environment(self, method='GET', path=uri, qs=qs)
+        request = Request(environment)
+        return admin.get_profile(request, uri, request.headers)
+
+    def test_profile(self):
+        """
+        test starting, retrieving, and stopping the session profile
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        profile_uri = u'/{0}/profile'.format(session_id)
+
+        result = self.helper_get_profile(admin, session_id)
+        self.assertEqual(404, result[0])
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.start_profile, 'PUT', profile_uri
+        )
+        self.assertEqual(response.status, 204)
+        self.assertEqual(
+            (200, ''),
+            self.helper_get_profile(admin, session_id)[::2]
+        )
+
+        result = self.manager.request(
+            'GET', None, u'/{0}/hello/'.format(session_id), {}
+        )
+        self.assertEqual(200, result[0])
+        result = self.helper_get_profile(
+            admin, session_id, 'sort=calls&limit=5'
+        )
+        self.assertEqual(200, result[0])
+        self.assertIn('function calls', result[2])
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.stop_profile, 'DELETE', profile_uri
+        )
+        self.assertEqual(response.status, 204)
+        self.assertIsNone(global_sessions[session_id].profiler)
+
+    @ddt.data('sort=nothing', 'limit=0', 'limit=many')
+    def test_profile_invalid_query(self, qs):
+        """
+        test invalid profile queries
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        self.assertEqual(
+            400,
+            self.helper_get_profile(admin, session_id, qs)[0]
+        )
+
+    @ddt.data(
+        (StackInAWsgiAdmin.get_profile, 'GET'),
+        (StackInAWsgiAdmin.start_profile, 'PUT'),
+        (StackInAWsgiAdmin.stop_profile, 'DELETE'),
+    )
+    @ddt.unpack
+    def test_profile_invalid_session_id(self, handler, method):
+        """
+        test the profile handlers with an invalid session id
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        response = self.helper_call_hold(
+            admin, handler, method, u'/my-session-id/profile'
+        )
+        self.assertEqual(response.status, 404)
+
+    def test_create_invalid_session_id(self):
+        """
+        test session ids are limited to URL and file name safe characters
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        environment = make_environment(
+            self,
+            method='POST',
+            path=u'/',
+            headers={'x-session-id': '../../tmp/evil'}
+        )
+        request = Request(environment)
+        result = admin.create_session(request, u'/', request.headers)
+        self.assertEqual(400, result[0])
+        self.assertNotIn('../../tmp/evil', global_sessions)
+
+    def test_clone_session(self):
+        """
+        test cloning a session through the admin API
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session()
+        global_sessions[session_id].hold['seed'] = b'data'
+        clone_uri = u'/{0}/clone'.format(session_id)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.clone_session, 'POST', clone_uri
+        )
+        self.assertEqual(response.status, 201)
+        sessions = json.loads(response.body)['sessions']
+        self.assertEqual(1, len(sessions))
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.clone_session, 'POST', clone_uri,
+            body=b'{"session-ids": ["shard-1", "shard-2"], "count": 1}'
+        )
+        self.assertEqual(response.status, 201)
+        sessions = json.loads(response.body)['sessions']
+        self.assertEqual(
+            ['shard-1', 'shard-2'],
+            [session['session-id'] for session in sessions[:2]]
+        )
+        self.assertEqual(3, len(sessions))
+        for session in sessions:
+            self.assertEqual(
+                admin.helper_get_uri(session['session-id']),
+                session['location']
+            )
+            self.assertEqual(
+                b'data',
+                global_sessions[session['session-id']].hold['seed']
+            )
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.clone_session, 'POST', clone_uri,
+            body=b'{"session-ids": ["shard-1"]}'
+        )
+        self.assertEqual(response.status, 409)
+
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.clone_session, 'POST',
+            u'/my-session-id/clone'
+        )
+        self.assertEqual(response.status, 404)
+
+    @ddt.data(
+        b'[]',
+        b'{"session-ids": "shard-1"}',
+        b'{"session-ids": ["bad.id"]}',
+        b'{"session-ids": ["events"]}',
+        b'{"session-ids": ["a", "a"]}',
+        b'{"count": -1}',
+        b'{"count": true}',
+        b'{"count": 0}',
+        b'{"count": 1001}',
+        b'{"session-ids": ["origin"]}',
+    )
+    def test_clone_session_invalid(self, body):
+        """
+        test invalid clone requests
+        """
+        admin = StackInAWsgiAdmin(self.manager, self.base_uri)
+        session_id = self.manager.create_session(session_id='origin')
+        response = self.helper_call_hold(
+            admin, StackInAWsgiAdmin.clone_session, 'POST',
+            u'/{0}/clone'.format(session_id), body=body
+        )
+        self.assertEqual(response.status, 400)
+        self.assertEqual([session_id], list(global_sessions))
@@ -0,0 +1,746 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.dispatcher.dispatcher testing
+"""
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+import ddt
+import mock
+import six
+from six.moves import BaseHTTPServer, http_client, socketserver
+
+from stackinabox.services.hello import HelloService
+
+from stackinawsgi.dispatcher import dispatcher as dispatcher_module
+from stackinawsgi.dispatcher.dispatcher import (
+    Dispatcher,
+    UnixHTTPConnection,
+    main,
+    text_to_bytes
+)
+from stackinawsgi.session.service import global_sessions
+from stackinawsgi.wsgi.app import App
+from stackinawsgi.test.helpers import BytesHelloService
+
+
+def make_app():
+    """
+    Application factory used by the workers
+    """
+    app = App([BytesHelloService])
+    app.StackInABoxUriUpdate('localhost')
+    return app
+
+
+def make_text_app():
+    """
+    Application factory whose service returns text bodies
+    """
+    app = App([HelloService])
+    app.StackInABoxUriUpdate('localhost')
+    return app
+
+
+class StubWorkerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Worker answering with canned responses
+    """
+
+    def log_message(self, format, *args):
+        """
+        Do not log the requests
+        """
+        pass
+
+    def do_GET(self):
+        """
+        Answer the session lists and the service requests
+        """
+        if self.path.startswith('/admin/'):
+            if self.server.failing:
+                status, content_type, body = (
+                    400, 'text/plain', b'Invalid Query'
+                )
+            else:
+                status, content_type = (200, 'application/json')
+                body = json.dumps(
+                    {'sessions': [self.server.name]}
+                ).encode('utf-8')
+        else:
+            status, content_type, body = (200, 'text/plain', b'ok')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Keep-Alive', 'timeout=5')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        """
+        Echo the request body
+        """
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@ddt.ddt
+class TestDispatcherRouting(unittest.TestCase):
+    """
+    Test choosing the worker for a request
+    """
+
+    def setUp(self):
+        """
+        configure env for the test
+        """
+        self.dispatcher = Dispatcher(make_app, workers=4)
+
+    @ddt.data(
+        '/stackinabox/{0}/hello/',
+        '/stackinabox/{0}',
+        '/admin/{0}',
+        '/admin/{0}/hold/name?x=1',
+    )
+    def test_session_affinity(self, path):
+        """
+        Test requests for a session go to the session's worker
+        """
+        session_id = 'session-1'
+        index = self.dispatcher.worker_index(session_id)
+        self.assertEqual(
+            (index, []),
+            self.dispatcher.route('GET', path.format(session_id), {})
+        )
+
+    def test_admin_root(self):
+        """
+        Test the admin requests without a session in the path
+        """
+        index = self.dispatcher.worker_index('session-1')
+        self.assertEqual(
+            (index, []),
+            self.dispatcher.route(
+                'DELETE',
+                '/admin/',
+                {'X-Session-ID': 'session-1'}
+            )
+        )
+        self.assertEqual(
+            (None, []),
+            self.dispatcher.route('GET', '/admin/', {})
+        )
+
+        created = [
+            self.dispatcher.route('POST', '/admin/', {})
+            for _ in range(8)
+        ]
+        self.assertEqual(
+            [0, 1, 2, 3, 0, 1, 2, 3],
+            [index for index, _ in created]
+        )
+        for index, headers in created:
+            name, session_id = headers[0]
+            self.assertEqual('X-Session-ID', name)
+            self.assertEqual(index, self.dispatcher.worker_index(session_id))
+
+    def test_other_paths(self):
+        """
+        Test requests without a session are spread round-robin
+        """
+        self.assertEqual(
+            [0, 1, 2, 3, 0],
+            [
+                self.dispatcher.route('GET', '/other', {})[0]
+                for _ in range(5)
+            ]
+        )
+        self.assertEqual(
+            (1, []),
+            self.dispatcher.route('PUT', '/admin/', {})
+        )
+        self.assertEqual(
+            self.dispatcher.worker_index(u'session-1'),
+            self.dispatcher.worker_index(b'session-1')
+        )
+
+    def helper_own_session_id(self, index, prefix):
+        """
+        A readable session-id owned by a worker
+        """
+        for number in range(1000):
+            session_id = '{0}-{1}'.format(prefix, number)
+            if self.dispatcher.worker_index(session_id) == index:
+                return session_id
+
+    def test_clone_body(self):
+        """
+        Test the clones are given session-ids of the cloned session's worker
+        """
+        index = self.dispatcher.worker_index('session-1')
+        document = json.loads(
+            self.dispatcher.clone_body(index, None).decode('utf-8')
+        )
+        self.assertEqual(0, document['count'])
+        self.assertEqual(1, len(document['session-ids']))
+
+        own_id = self.helper_own_session_id(index, 'shard')
+        document = json.loads(self.dispatcher.clone_body(
+            index,
+            json.dumps({'session-ids': [own_id], 'count': 3}).encode('utf-8')
+        ).decode('utf-8'))
+        self.assertEqual(own_id, document['session-ids'][0])
+        self.assertEqual(4, len(document['session-ids']))
+        for session_id in document['session-ids']:
+            self.assertEqual(index, self.dispatcher.worker_index(session_id))
+
+        other_id = self.helper_own_session_id((index + 1) % 4, 'shard')
+        with self.assertRaises(ValueError):
+            self.dispatcher.clone_body(
+                index,
+                json.dumps({'session-ids': [other_id]}).encode('utf-8')
+            )
+
+    @ddt.data(b'not json', b'[]', b'{"count": -1}', b'{"count": "2"}')
+    def test_clone_body_left_to_worker(self, body):
+        """
+        Test invalid clone options are left for the worker to reject
+        """
+        self.assertEqual(body, self.dispatcher.clone_body(0, body))
+
+    def test_text_to_bytes(self):
+        """
+        Test text body chunks are encoded
+        """
+        app = text_to_bytes(lambda environ, start_response: [u'a', b'b'])
+        body = app({}, None)
+        self.assertEqual([b'a', b'b'], list(body))
+        body.close()
+
+    def test_text_to_bytes_close(self):
+        """
+        Test the body of the application is closed
+        """
+        inner = mock.MagicMock()
+        inner.__iter__.return_value = iter([u'a'])
+        app = text_to_bytes(lambda environ, start_response: inner)
+        body = app({}, None)
+        self.assertEqual([b'a'], list(body))
+        self.assertFalse(inner.close.called)
+        body.close()
+        inner.close.assert_called_once_with()
+
+
+class TestDispatcherLifecycle(unittest.TestCase):
+    """
+    Test starting and stopping the dispatcher without workers
+    """
+
+    def test_start_failure(self):
+        """
+        Test the workers are stopped when one of them fails to start
+        """
+        socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, socket_dir, True)
+        dispatcher = Dispatcher(
+            make_app,
+            workers=1,
+            socket_dir=socket_dir,
+            timeout=5
+        )
+        spawn = mock.patch.object(dispatcher, '_spawn', return_value=-1)
+        waitpid = mock.patch.object(
+            dispatcher_module.os,
+            'waitpid',
+            side_effect=[(-1, 256), OSError()]
+        )
+        kill = mock.patch.object(
+            dispatcher_module.os,
+            'kill',
+            side_effect=OSError()
+        )
+        with spawn, waitpid, kill:
+            with self.assertRaises(RuntimeError):
+                dispatcher.start()
+        self.assertEqual([], dispatcher._pids)
+        self.assertIsNone(dispatcher.server)
+        # the directory was provided so it is kept
+        self.assertEqual(socket_dir, dispatcher.socket_dir)
+        dispatcher.shutdown()
+
+    def helper_spawn_child(self, run_worker):
+        """
+        Run the child side of a fork in this process
+
+        :returns: the code the child exited with
+        """
+        dispatcher = Dispatcher(make_app, workers=1)
+        fork = mock.patch.object(dispatcher_module.os, 'fork', return_value=0)
+        exit_ = mock.patch.object(dispatcher_module.os, '_exit')
+        signal = mock.patch.object(dispatcher_module.signal, 'signal')
+        run = mock.patch.object(
+            dispatcher,
+            '_run_worker',
+            side_effect=run_worker
+        )
+        with fork, exit_ as exited, signal, run as run_worker:
+            self.assertEqual(0, dispatcher._spawn(0, None))
+        run_worker.assert_called_once_with(0, None)
+        self.assertEqual(1, exited.call_count)
+        return exited.call_args[0][0]
+
+    def test_spawn_child(self):
+        """
+        Test a worker exits once it stops serving
+        """
+        self.assertEqual(0, self.helper_spawn_child(None))
+
+    def test_spawn_child_failure(self):
+        """
+        Test a failing worker exits with an error code
+        """
+        self.assertEqual(1, self.helper_spawn_child(RuntimeError('failed')))
+
+    def test_run_worker(self):
+        """
+        Test a worker serves its socket
+        """
+        dispatcher = Dispatcher(make_app, workers=1)
+        with mock.patch.object(dispatcher, '_worker_server') as server:
+            dispatcher._run_worker(0, None)
+        server.assert_called_once_with(0, None)
+        server.return_value.serve_forever.assert_called_once_with()
+
+    def test_bind_without_serving(self):
+        """
+        Test shutting down a front-end that never served
+        """
+        dispatcher = Dispatcher(make_app, workers=1, port=0)
+        host, port = dispatcher.bind()
+        self.assertEqual('127.0.0.1', host)
+        self.assertNotEqual(0, port)
+        dispatcher.shutdown()
+        self.assertIsNone(dispatcher.server)
+
+    def test_main(self):
+        """
+        Test the command line entry point
+        """
+        start = mock.patch.object(
+            Dispatcher,
+            'start',
+            return_value=('127.0.0.1', 8081)
+        )
+        serve_forever = mock.patch.object(
+            Dispatcher,
+            'serve_forever',
+            side_effect=KeyboardInterrupt
+        )
+        stdout = mock.patch('sys.stdout', new_callable=six.StringIO)
+        with start, serve_forever, stdout as out:
+            with mock.patch.object(Dispatcher, 'shutdown') as shutdown:
+                self.assertEqual(0, main([
+                    'stackinawsgi.test.test_dispatcher_dispatcher:make_app',
+                    '--workers', '3'
+                ]))
+        self.assertTrue(shutdown.called)
+        self.assertIn('with 3 workers', out.getvalue())
+
+
+@unittest.skipUnless(
+    hasattr(socket, 'AF_UNIX'),
+    'requires Unix sockets'
+)
+@ddt.ddt
+class TestWorkerServer(unittest.TestCase):
+    """
+    Test the server run by each worker, in this process
+    """
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        for session_id in tuple(global_sessions.keys()):
+            del global_sessions[session_id]
+
+    @ddt.data(False, True)
+    def test_worker_server(self, preload):
+        """
+        Test a worker serves its App on its socket
+        """
+        socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, socket_dir, True)
+        dispatcher = Dispatcher(
+            make_text_app,
+            workers=1,
+            socket_dir=socket_dir
+        )
+        if not preload:
+            # a socket left by a previous worker is replaced
+            open(dispatcher.socket_path(0), 'w').close()
+
+        app = make_text_app() if preload else None
+        server = dispatcher._worker_server(0, app)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.shutdown)
+
+        def request(method, path):
+            connection = UnixHTTPConnection(
+                dispatcher.socket_path(0),
+                timeout=10
+            )
+            try:
+                connection.request(
+                    method,
+                    path,
+                    headers={'Host': 'localhost'}
+                )
+                response = connection.getresponse()
+                return (response.status, response.getheaders(),
+                        response.read())
+            finally:
+                connection.close()
+
+        status, headers, _ = request('POST', '/admin/')
+        self.assertEqual(201, status)
+        session_id = dict(
+            (name.lower(), value) for name, value in headers
+        )['x-session-id']
+
+        status, _, body = request(
+            'GET',
+            '/stackinabox/{0}/hello/'.format(session_id)
+        )
+        self.assertEqual(200, status)
+        self.assertEqual(b'Hello', body)
+
+
+@unittest.skipUnless(
+    hasattr(socketserver, 'ThreadingUnixStreamServer'),
+    'requires Unix sockets'
+)
+@ddt.ddt
+class TestDispatchHandler(unittest.TestCase):
+    """
+    Test relaying requests to stub workers
+    """
+
+    def setUp(self):
+        """
+        configure env for the test
+        """
+        socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, socket_dir, True)
+        self.dispatcher = Dispatcher(
+            make_app,
+            workers=2,
+            port=0,
+            socket_dir=socket_dir,
+            timeout=10
+        )
+        self.workers = []
+        for index in range(2):
+            server = socketserver.ThreadingUnixStreamServer(
+                self.dispatcher.socket_path(index),
+                StubWorkerHandler
+            )
+            server.daemon_threads = True
+            server.name = 'worker-{0}'.format(index)
+            server.failing = False
+            self.addCleanup(server.server_close)
+            thread = threading.Thread(
+                target=server.serve_forever,
+                kwargs={'poll_interval': 0.05}
+            )
+            thread.daemon = True
+            thread.start()
+            self.addCleanup(server.shutdown)
+            self.workers.append(server)
+
+        self.host, self.port = self.dispatcher.bind()
+        thread = threading.Thread(target=self.dispatcher.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.dispatcher.shutdown)
+
+    def helper_request(self, method, path, headers={}, body=None):
+        """
+        Send a request to the front-end
+        """
+        connection = http_client.HTTPConnection(
+            self.host,
+            self.port,
+            timeout=10
+        )
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            return (response.status, response.getheaders(), response.read())
+        finally:
+            connection.close()
+
+    def test_relay(self):
+        """
+        Test the worker headers are relayed without the hop-by-hop headers
+        """
+        status, headers, body = self.helper_request(
+            'GET',
+            '/stackinabox/session-1/hello/'
+        )
+        self.assertEqual(200, status)
+        self.assertEqual(b'ok', body)
+        headers = dict((name.lower(), value) for name, value in headers)
+        self.assertEqual('2', headers['content-length'])
+        self.assertNotIn('keep-alive', headers)
+
+    def test_relay_body(self):
+        """
+        Test the request body is forwarded
+        """
+        status, _, body = self.helper_request(
+            'POST',
+            '/stackinabox/session-1/hello/',
+            body=b'payload'
+        )
+        self.assertEqual(200, status)
+        self.assertEqual(b'payload', body)
+
+    @ddt.unpack
+    @ddt.data(
+        ({'Transfer-Encoding': 'chunked'}, 411),
+        ({'Content-Length': 'abc'}, 400),
+        ({'Content-Length': '-1'}, 400),
+    )
+    def test_invalid_body(self, headers, expected):
+        """
+        Test requests whose body cannot be forwarded
+        """
+        status, _, _ = self.helper_request(
+            'POST',
+            '/stackinabox/session-1/hello/',
+            headers
+        )
+        self.assertEqual(expected, status)
+
+    def test_worker_unavailable(self):
+        """
+        Test a worker that cannot be reached
+        """
+        os.remove(
+            self.dispatcher.socket_path(
+                self.dispatcher.worker_index('session-1')
+            )
+        )
+        status, _, _ = self.helper_request(
+            'GET',
+            '/stackinabox/session-1/hello/'
+        )
+        self.assertEqual(502, status)
+
+    def test_merged(self):
+        """
+        Test the session lists of the workers are merged
+        """
+        status, _, body = self.helper_request('GET', '/admin/')
+        self.assertEqual(200, status)
+        self.assertEqual(
+            ['worker-0', 'worker-1'],
+            sorted(json.loads(body.decode('utf-8'))['sessions'])
+        )
+
+        self.workers[1].failing = True
+        status, headers, body = self.helper_request('GET', '/admin/')
+        self.assertEqual(400, status)
+        self.assertEqual(b'Invalid Query', body)
+
+    def test_events(self):
+        """
+        Test the events are only relayed from a single worker
+        """
+        status, _, _ = self.helper_request('GET', '/admin/events?since=0')
+        self.assertEqual(501, status)
+
+        self.dispatcher.workers = 1
+        status, _, body = self.helper_request('GET', '/admin/events')
+        self.assertEqual(200, status)
+        self.assertEqual(
+            ['worker-0'],
+            json.loads(body.decode('utf-8'))['sessions']
+        )
+
+    def test_bulk(self):
+        """
+        Test bulk requests are only relayed to a single worker
+        """
+        status, _, _ = self.helper_request('POST', '/admin/bulk')
+        self.assertEqual(501, status)
+
+        self.dispatcher.workers = 1
+        status, _, body = self.helper_request(
+            'POST',
+            '/admin/bulk',
+            body=b'{}'
+        )
+        self.assertEqual((200, b'{}'), (status, body))
+
+
+@unittest.skipUnless(
+    hasattr(os, 'fork') and hasattr(socket, 'AF_UNIX'),
+    'requires fork and Unix sockets'
+)
+@ddt.ddt
+class TestDispatcher(unittest.TestCase):
+    """
+    Test serving requests through worker processes
+    """
+
+    def helper_start(self, preload):
+        """
+        Start a dispatcher with two workers
+        """
+        dispatcher = Dispatcher(
+            make_app,
+            workers=2,
+            port=0,
+            preload=preload,
+            timeout=10
+        )
+        self.host, self.port = dispatcher.start()
+        thread = threading.Thread(target=dispatcher.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(dispatcher.shutdown)
+        return dispatcher
+
+    def helper_request(self, method, path, headers={}, body=None):
+        """
+        Send a request to the front-end
+        """
+        connection = http_client.HTTPConnection(
+            self.host,
+            self.port,
+            timeout=10
+        )
+        # the App's base URI is 'localhost'
+        request_headers = {'Host': 'localhost'}
+        request_headers.update(headers)
+        try:
+            connection.request(
+                method,
+                path,
+                body=body,
+                headers=request_headers
+            )
+            response = connection.getresponse()
+            return (response.status, response.getheaders(), response.read())
+        finally:
+            connection.close()
+
+    @ddt.data(False, True)
+    def test_sessions(self, preload):
+        """
+        Test sessions are created across the workers and keep affinity
+        """
+        dispatcher = self.helper_start(preload)
+        session_ids = []
+        for _ in range(4):
+            status, headers, _ = self.helper_request('POST', '/admin/')
+            self.assertEqual(201, status)
+            session_ids.append(dict(
+                (name.lower(), value) for name, value in headers
+            )['x-session-id'])
+        self.assertEqual(
+            set([0, 1]),
+            set(dispatcher.worker_index(sid) for sid in session_ids)
+        )
+
+        for session_id in session_ids:
+            status, _, body = self.helper_request(
+                'GET',
+                '/stackinabox/{0}/hello/'.format(session_id)
+            )
+            self.assertEqual(200, status)
+            self.assertEqual(b'Hello', body)
+
+        status, _, body = self.helper_request('GET', '/admin/')
+        self.assertEqual(200, status)
+        self.assertEqual(
+            sorted(session_ids),
+            sorted(json.loads(body.decode('utf-8'))['sessions'])
+        )
+
+        status, _, _ = self.helper_request(
+            'DELETE',
+            '/admin/',
+            {'X-Session-ID': session_ids[0]}
+        )
+        self.assertEqual(204, status)
+        status, _, _ = self.helper_request(
+            'GET',
+            '/stackinabox/{0}/hello/'.format(session_ids[0])
+        )
+        self.assertEqual(594, status)
+
+    def test_clone(self):
+        """
+        Test the clones of a session are reachable through the dispatcher
+        """
+        dispatcher = self.helper_start(False)
+        status, headers, _ = self.helper_request('POST', '/admin/')
+        session_id = dict(
+            (name.lower(), value) for name, value in headers
+        )['x-session-id']
+        status, _, _ = self.helper_request(
+            'PUT',
+            '/admin/{0}/hold/seed'.format(session_id),
+            body=b'data'
+        )
+        self.assertEqual(204, status)
+
+        index = dispatcher.worker_index(session_id)
+        other_id = next(
+            'shard-{0}'.format(number) for number in range(1000)
+            if dispatcher.worker_index('shard-{0}'.format(number)) != index
+        )
+        status, _, _ = self.helper_request(
+            'POST',
+            '/admin/{0}/clone'.format(session_id),
+            body=json.dumps({'session-ids': [other_id]}).encode('utf-8')
+        )
+        self.assertEqual(400, status)
+
+        status, _, body = self.helper_request(
+            'POST',
+            '/admin/{0}/clone'.format(session_id),
+            body=b'{"count": 3}'
+        )
+        self.assertEqual(201, status)
+        clone_ids = [
+            session['session-id']
+            for session in json.loads(body.decode('utf-8'))['sessions']
+        ]
+        self.assertEqual(3, len(clone_ids))
+        for clone_id in clone_ids:
+            status, _, body = self.helper_request(
+                'GET',
+                '/admin/{0}/hold/seed'.format(clone_id)
+            )
+            self.assertEqual((200, b'data'), (status, body))
+            status, _, body = self.helper_request(
+                'GET',
+                '/stackinabox/{0}/hello/'.format(clone_id)
+            )
+            self.assertEqual((200, b'Hello'), (status, body))
@@ -0,0 +1,75 @@
+"""
+Stack-In-A-WSGI: stackinawsgi package testing
+"""
+import json
+import subprocess
+import sys
+import unittest
+
+import stackinawsgi
+
+
+# Generous budgets in seconds; regressions that load the full stack on a
+# bare package import are orders of magnitude above the package budget.
+package_import_budget = 0.25
+app_import_budget = 3.0
+
+measure_script = """
+import json, sys
+from timeit import default_timer
+start = default_timer()
+import stackinawsgi
+imported = default_timer()
+loaded = sorted(
+    name for name in ('stackinawsgi.wsgi.app', 'stackinawsgi.session.service',
+                      'stackinawsgi.admin.admin', 'stackinabox.stack')
+    if name in sys.modules
+)
+stackinawsgi.App
+print(json.dumps({
+    'import': imported - start,
+    'app': default_timer() - imported,
+    'loaded': loaded,
+}))
+"""
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'requires PEP-562')
+class TestPackage(unittest.TestCase):
+    """
+    Test the package imports its modules lazily
+    """
+
+    def helper_measure(self):
+        """
+        Import the package in a new interpreter
+        """
+        output = subprocess.check_output(
+            [sys.executable, '-c', measure_script]
+        )
+        return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+    def test_lazy_import(self):
+        """
+        Test importing the package does not load the application stack
+        """
+        result = self.helper_measure()
+        self.assertEqual([], result['loaded'])
+
+    def test_import_budget(self):
+        """
+        Test the import time stays within its budget
+        """
+        result = self.helper_measure()
+        self.assertLess(result['import'], package_import_budget)
+        self.assertLess(result['app'], app_import_budget)
+
+    def test_attributes(self):
+        """
+        Test the lazy attributes resolve to the implementation
+        """
+        from stackinawsgi.wsgi.app import App
+        self.assertIs(App, stackinawsgi.App)
+        self.assertIn('App', dir(stackinawsgi))
+        with self.assertRaises(AttributeError):
+            stackinawsgi.NotAnAttribute
@@ -0,0 +1,339 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.replay.replay testing
+"""
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+from six.moves import http_client
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+from stackinawsgi.session.service import global_sessions
+from stackinawsgi.replay.replay import (
+    AppTarget,
+    HttpTarget,
+    Replayer,
+    ReplayResult,
+    load_journal,
+    main,
+    split_uri
+)
+from stackinawsgi.wsgi.app import App
+from stackinawsgi.test.helpers import (
+    BytesHelloService,
+    WsgiMock,
+    make_environment
+)
+
+
+class QuietHandler(WSGIRequestHandler):
+    """
+    wsgiref request handler that does not log to stderr
+    """
+
+    def log_message(self, *args):
+        """
+        Suppress the access log
+        """
+        pass
+
+
+class JsonOnlyService(StackInABoxService):
+    """
+    Service only accepting JSON request bodies
+    """
+
+    def __init__(self):
+        """
+        Register the single end-point
+        """
+        super(JsonOnlyService, self).__init__('json')
+        self.register(StackInABoxService.POST, '/', JsonOnlyService.handler)
+
+    def handler(self, request, uri, headers):
+        """
+        Answer 415 unless the body is JSON
+        """
+        content_type = request.environment.get('CONTENT_TYPE')
+        if content_type != 'application/json':
+            return (415, {}, b'')
+        length = int(request.environment['CONTENT_LENGTH'])
+        json.loads(request.stream.read(length).decode('utf-8'))
+        return (200, {}, b'')
+
+
+class TestReplay(unittest.TestCase):
+    """
+    Test replaying session journals
+    """
+
+    def setUp(self):
+        """
+        Test setup
+        """
+        self.journal_dir = tempfile.mkdtemp()
+        self.app = App(
+            [BytesHelloService, JsonOnlyService],
+            journal_dir=self.journal_dir
+        )
+        self.app.StackInABoxUriUpdate('localhost')
+
+    def tearDown(self):
+        """
+        Test Teardown
+        """
+        StackInABox.reset_services()
+        keys = tuple(global_sessions.keys())
+        for k in keys:
+            self.app.stack_service.remove_session(k)
+        shutil.rmtree(self.journal_dir)
+
+    def helper_record(self, count):
+        """
+        Record traffic against a session and return the journal entries
+        """
+        session_id = self.app.stack_service.create_session()
+        recorder = self.app.stack_service.start_recording(session_id)
+        for index in range(count):
+            path = u'/stackinabox/{0}/hello/'.format(session_id)
+            if index % 2:
+                path = u'/stackinabox/{0}/missing'.format(session_id)
+            for _ in self.app(
+                make_environment(self, method='GET', path=path),
+                WsgiMock()
+            ):
+                pass
+        return load_journal(b''.join(recorder.iter_journal()).splitlines())
+
+    def test_split_uri(self):
+        """
+        Test splitting the query string from the URI
+        """
+        self.assertEqual(('/hello/', None), split_uri('/hello/'))
+        self.assertEqual(('/hello/', 'a=b&c'), split_uri('/hello/?a=b&c'))
+
+    def test_load_journal(self):
+        """
+        Test loading a journal from disk sorts by time
+        """
+        path = os.path.join(self.journal_dir, 'journal.jsonl')
+        with open(path, 'w') as journal:
+            journal.write(json.dumps({'time': 2, 'uri': '/b'}) + '\n\n')
+            journal.write(json.dumps({'time': 1, 'uri': '/a'}) + '\n')
+
+        entries = load_journal(path)
+        self.assertEqual(['/a', '/b'], [entry['uri'] for entry in entries])
+
+    def test_load_journal_text(self):
+        """
+        Test loading a journal from text lines
+        """
+        entries = load_journal([
+            json.dumps({'time': 2, 'uri': '/b'}),
+            u'',
+            json.dumps({'time': 1, 'uri': '/a'})
+        ])
+        self.assertEqual(['/a', '/b'], [entry['uri'] for entry in entries])
+
+    def test_app_target_environment(self):
+        """
+        Test the query string and headers reach the application
+        """
+        environments = []
+
+        def capture(environ, start_response):
+            environments.append(environ)
+            start_response('204 No Content', [])
+            return []
+
+        status = AppTarget(capture).send(
+            {
+                'method': 'GET',
+                'uri': '/hello/?a=b',
+                'headers': {
+                    'CONTENT_TYPE': 'text/plain',
+                    'HOST': 'localhost',
+                    'X_TRACE': 'yes'
+                }
+            },
+            'session'
+        )
+        self.assertEqual(204, status)
+        environ = environments[0]
+        self.assertEqual('a=b', environ['QUERY_STRING'])
+        self.assertEqual('text/plain', environ['CONTENT_TYPE'])
+        self.assertEqual('yes', environ['HTTP_X_TRACE'])
+        self.assertNotIn('HTTP_HOST', environ)
+
+    def test_replay_in_process(self):
+        """
+        Test replaying a recorded journal into another session
+        """
+        entries = self.helper_record(6)
+        self.assertEqual(6, len(entries))
+
+        target_session = self.app.stack_service.create_session()
+        result = Replayer(
+            entries,
+            AppTarget(self.app),
+            target_session,
+            concurrency=3
+        ).run()
+
+        self.assertEqual(6, result.sent)
+        self.assertEqual(0, result.errors)
+        self.assertEqual(0, result.mismatches)
+        self.assertEqual({200: 3, 597: 3}, result.status)
+        self.assertEqual(
+            6,
+            global_sessions[target_session].access_count
+        )
+        summary = result.as_dict()
+        self.assertGreater(summary['throughput'], 0)
+        self.assertIsNotNone(summary['latency']['p99'])
+
+    def test_replay_json_post(self):
+        """
+        Test a replayed POST keeps its Content-Type
+        """
+        session_id = self.app.stack_service.create_session()
+        recorder = self.app.stack_service.start_recording(
+            session_id,
+            include_bodies=True
+        )
+        body = b'{"name": "value"}'
+        environment = make_environment(
+            self,
+            method='POST',
+            path=u'/stackinabox/{0}/json/'.format(session_id)
+        )
+        environment['wsgi.input'] = io.BytesIO(body)
+        environment['CONTENT_LENGTH'] = str(len(body))
+        environment['CONTENT_TYPE'] = 'application/json'
+        wsgi_mock = WsgiMock()
+        for _ in self.app(environment, wsgi_mock):
+            pass
+        self.assertEqual('200 OK', wsgi_mock.status)
+        entries = load_journal(
+            b''.join(recorder.iter_journal()).splitlines()
+        )
+
+        target_session = self.app.stack_service.create_session()
+        result = Replayer(
+            entries,
+            AppTarget(self.app),
+            target_session
+        ).run()
+        self.assertEqual({200: 1}, result.status)
+        self.assertEqual(0, result.mismatches)
+
+    def test_replay_preserve_timing(self):
+        """
+        Test the recorded spacing between requests is kept
+        """
+        entries = [
+            {'time': 10.0, 'method': 'GET', 'uri': '/hello/', 'status': 200},
+            {'time': 10.2, 'method': 'GET', 'uri': '/hello/', 'status': 200},
+        ]
+        target_session = self.app.stack_service.create_session()
+        result = Replayer(
+            entries,
+            AppTarget(self.app),
+            target_session,
+            preserve_timing=True,
+            speed=2.0
+        ).run()
+        self.assertEqual(2, result.sent)
+        self.assertGreaterEqual(result.elapsed, 0.1)
+
+    def test_replay_errors(self):
+        """
+        Test failures to send are counted
+        """
+        class BrokenTarget(object):
+            def send(self, entry, session_id):
+                raise RuntimeError('broken')
+
+        result = Replayer([{'method': 'GET', 'uri': '/'}], BrokenTarget(),
+                          'session').run()
+        self.assertEqual(1, result.errors)
+        self.assertEqual(0.0, ReplayResult().throughput)
+        self.assertIsNone(ReplayResult().percentile(50))
+
+    def test_replay_empty(self):
+        """
+        Test replaying an empty journal sends nothing
+        """
+        result = Replayer([], AppTarget(self.app), 'session').run()
+        self.assertEqual(0, result.sent)
+        self.assertEqual(0, result.errors)
+
+    def test_http_target_https(self):
+        """
+        Test an https URL uses an HTTPS connection
+        """
+        target = HttpTarget('https://localhost/stackinabox/')
+        connection = target._connection()
+        self.assertIsInstance(connection, http_client.HTTPSConnection)
+        self.assertIs(connection, target._connection())
+
+    def test_http_target_send_failure(self):
+        """
+        Test a failed send drops the connection and re-raises
+        """
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('localhost', 0))
+        port = listener.getsockname()[1]
+        listener.close()
+
+        target = HttpTarget(
+            'http://localhost:{0}/stackinabox/'.format(port),
+            timeout=5
+        )
+        with self.assertRaises(Exception):
+            target.send({'method': 'GET', 'uri': '/hello/'}, 'session')
+        self.assertIsNone(target._local.connection)
+
+    def test_replay_http(self):
+        """
+        Test replaying against a live server from the command line
+        """
+        entries = self.helper_record(2)
+        path = os.path.join(self.journal_dir, 'journal.jsonl')
+        with open(path, 'w') as journal:
+            for entry in entries:
+                journal.write(json.dumps(entry) + '\n')
+
+        server = make_server(
+            'localhost', 0, self.app, handler_class=QuietHandler
+        )
+        port = server.server_address[1]
+        self.app.StackInABoxUriUpdate('localhost:{0}'.format(port))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            target_session = self.app.stack_service.create_session()
+            url = 'http://localhost:{0}/stackinabox/'.format(port)
+            self.assertEqual(
+                0,
+                main([path, '--url', url, '--session-id', target_session])
+            )
+            self.assertEqual(
+                2,
+                global_sessions[target_session].access_count
+            )
+            self.assertEqual(
+                200,
+                HttpTarget(url).send(entries[0], target_session)
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
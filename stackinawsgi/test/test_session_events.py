@@ -0,0 +1,127 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.events testing
+"""
+import threading
+import time
+import unittest
+
+import mock
+
+from stackinawsgi.session.events import EventFeed
+
+
+class TestEventFeed(unittest.TestCase):
+    """
+    Test the session event feed
+    """
+
+    def test_since(self):
+        """
+        test clients receive the events after their cursor
+        """
+        feed = EventFeed()
+        self.assertEqual(
+            {'version': 0, 'events': [], 'reset': False},
+            feed.since(None)
+        )
+        feed.publish('created', 'a')
+        feed.publish('created', 'b')
+
+        result = feed.since(0)
+        self.assertEqual(2, result['version'])
+        self.assertFalse(result['reset'])
+        self.assertEqual(
+            [(1, 'created', 'a'), (2, 'created', 'b')],
+            [
+                (event['version'], event['event'], event['session-id'])
+                for event in result['events']
+            ]
+        )
+        self.assertEqual(['b'], [
+            event['session-id'] for event in feed.since(1)['events']
+        ])
+        self.assertEqual([], feed.since(2)['events'])
+        self.assertEqual(
+            {'version': 2, 'events': [], 'reset': False},
+            feed.since(None)
+        )
+
+    def test_merge_updates(self):
+        """
+        test consecutive updates of a session are merged
+        """
+        feed = EventFeed()
+        feed.publish('updated', 'a', {'access-count': 1, 'status': {200: 1}})
+        first = feed.since(0)['events'][0]
+        feed.publish('updated', 'a', {'access-count': 2, 'status': {404: 1}})
+
+        events = feed.since(0)['events']
+        self.assertEqual(1, len(events))
+        self.assertEqual(2, events[0]['version'])
+        self.assertEqual(
+            {'access-count': 2, 'status': {200: 1, 404: 1}},
+            events[0]['data']
+        )
+        # events already handed out are not modified
+        self.assertEqual(
+            {'access-count': 1, 'status': {200: 1}},
+            first['data']
+        )
+        self.assertEqual(events, feed.since(1)['events'])
+
+        feed.publish('updated', 'b', {'access-count': 1})
+        feed.publish('updated', 'a', {'access-count': 3})
+        self.assertEqual(3, len(feed.since(0)['events']))
+
+    def test_reset(self):
+        """
+        test clients that missed events are told to reset
+        """
+        feed = EventFeed(max_events=2)
+        for session_id in ('a', 'b', 'c'):
+            feed.publish('created', session_id)
+
+        self.assertTrue(feed.since(0)['reset'])
+        self.assertFalse(feed.since(1)['reset'])
+        self.assertEqual(2, len(feed.since(1)['events']))
+        self.assertTrue(feed.since(10)['reset'])
+
+        feed.post_fork()
+        self.assertTrue(feed.since(2)['reset'])
+        self.assertFalse(feed.since(3)['reset'])
+        feed.publish('removed', 'a')
+        self.assertEqual(4, feed.since(3)['events'][0]['version'])
+
+    def test_notify_waiters(self):
+        """
+        test publishers only wake the clients when one is waiting
+        """
+        feed = EventFeed()
+        with mock.patch.object(feed._condition, 'notify_all') as notify:
+            feed.publish('created', 'a')
+            self.assertFalse(notify.called)
+
+            feed._waiters = 1
+            feed.publish('created', 'b')
+            notify.assert_called_once_with()
+
+    def test_wait(self):
+        """
+        test clients wait for the next event
+        """
+        feed = EventFeed()
+        start = time.time()
+        self.assertEqual([], feed.since(0, 0.05)['events'])
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+        publisher = threading.Timer(0.05, feed.publish, ('created', 'a'))
+        publisher.start()
+        try:
+            start = time.time()
+            result = feed.since(0, 5.0)
+            self.assertLess(time.time() - start, 5.0)
+        finally:
+            publisher.join()
+        self.assertEqual(['a'], [
+            event['session-id'] for event in result['events']
+        ])
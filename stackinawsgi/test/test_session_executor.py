@@ -0,0 +1,432 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.executor testing
+"""
+import json
+import threading
+import unittest
+
+import ddt
+import mock
+
+from stackinabox.services.hello import HelloService
+from stackinabox.services.service import StackInABoxService
+
+from stackinawsgi.admin.admin import StackInAWsgiAdmin
+from stackinawsgi.exceptions import SessionBusy
+from stackinawsgi.session import session as session_module
+from stackinawsgi.session.executor import SessionExecutor
+from stackinawsgi.session.service import (
+    global_sessions,
+    StackInAWsgiSessionManager
+)
+from stackinawsgi.session.session import (
+    Session,
+    acquire_lock
+)
+
+
+class BlockingService(StackInABoxService):
+    """
+    Service whose handler waits for the test to release it
+    """
+
+    release = threading.Event()
+    entered = threading.Event()
+
+    def __init__(self):
+        """
+        Register the end-point
+        """
+        super(BlockingService, self).__init__('block')
+        self.register(StackInABoxService.GET, '/', BlockingService.handler)
+
+    def handler(self, request, uri, headers):
+        """
+        Wait for the release event
+        """
+        BlockingService.entered.set()
+        BlockingService.release.wait(10)
+        return (200, headers, 'released')
+
+
+@ddt.ddt
+class TestSessionExecutor(unittest.TestCase):
+    """
+    Test running session calls on the executor
+    """
+
+    def setUp(self):
+        """
+        configure env for the test
+        """
+        BlockingService.release.clear()
+        BlockingService.entered.clear()
+        self.executor = SessionExecutor(
+            workers=2,
+            queue_size=1,
+            timeout=5.0,
+            lock_timeout=1.0,
+            retry_after=3
+        )
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        BlockingService.release.set()
+        self.executor.shutdown()
+
+    def helper_call(self, session, path, results):
+        """
+        Call the session on the executor, saving the result
+        """
+        results.append(self.executor.call(
+            session,
+            'GET',
+            None,
+            '{0}/{1}'.format(session.session_id, path),
+            {}
+        ))
+
+    def helper_start(self, session, path, results):
+        """
+        Call the session from another thread
+        """
+        thread = threading.Thread(
+            target=self.helper_call,
+            args=(session, path, results)
+        )
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_call(self):
+        """
+        test a call runs on the pool and updates the session
+        """
+        session = Session('executor', [HelloService])
+        results = []
+        self.helper_call(session, 'hello/', results)
+        self.assertEqual(200, results[0][0])
+        self.assertEqual('Hello', results[0][2])
+        self.assertEqual(1, session.access_count)
+        self.assertEqual(1, session.status_tracker[200])
+
+        metrics = self.executor.metrics()
+        self.assertEqual(1, metrics['completed'])
+        self.assertEqual(0, metrics['queued'])
+        self.assertEqual({}, metrics['queue-depth'])
+
+    def test_queue_full(self):
+        """
+        test a call is rejected when the session's queue is full
+        """
+        session = Session('executor', [BlockingService])
+        results = []
+        first = self.helper_start(session, 'block/', results)
+        self.assertTrue(BlockingService.entered.wait(5))
+
+        # the running call left the queue, so one more call fits
+        second = self.helper_start(session, 'block/', results)
+        for _ in range(100):
+            if self.executor.queue_depth('executor'):
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(1, self.executor.queue_depth('executor'))
+
+        rejected = []
+        self.helper_call(session, 'block/', rejected)
+        self.assertEqual(
+            [(429, {'Retry-After': '3'}, 'StackInAWSGI - Session Queue Full')],
+            rejected
+        )
+
+        BlockingService.release.set()
+        first.join()
+        second.join()
+        self.assertEqual([200, 200], [result[0] for result in results])
+
+        metrics = self.executor.metrics()
+        self.assertEqual(2, metrics['completed'])
+        self.assertEqual(1, metrics['rejected'])
+
+    def test_timeout(self):
+        """
+        test a call waiting too long is answered with a 503
+        """
+        self.executor.timeout = 0.1
+        session = Session('executor', [BlockingService])
+        results = []
+        self.helper_call(session, 'block/', results)
+        self.assertEqual(503, results[0][0])
+        self.assertEqual({'Retry-After': '3'}, results[0][1])
+        self.assertEqual(1, self.executor.metrics()['timed-out'])
+
+    def test_session_busy(self):
+        """
+        test a call is answered with a 503 when the lock is held
+        """
+        self.executor.lock_timeout = 0.05
+        session = Session('executor', [HelloService])
+        results = []
+        with session.lock:
+            self.helper_call(session, 'hello/', results)
+        self.assertEqual(
+            [(503, {'Retry-After': '3'}, 'StackInAWSGI - Session Busy')],
+            results
+        )
+        self.assertEqual(1, self.executor.metrics()['busy'])
+
+    def test_hung_call(self):
+        """
+        test the calls to a session whose call hangs are answered at once
+        """
+        self.executor.timeout = 0.3
+        session = Session('executor', [BlockingService])
+        results = []
+        first = self.helper_start(session, 'block/', results)
+        self.assertTrue(BlockingService.entered.wait(5))
+        # the first call has to time out well before the second one
+        threading.Event().wait(0.15)
+
+        waiting = []
+        second = self.helper_start(session, 'block/', waiting)
+        for _ in range(100):
+            if self.executor.queue_depth('executor'):
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(1, self.executor.queue_depth('executor'))
+
+        first.join()
+        second.join()
+        self.assertEqual(
+            'StackInAWSGI - Session Call Timed Out',
+            results[0][2]
+        )
+        self.assertEqual(
+            [(503, {'Retry-After': '3'}, 'StackInAWSGI - Session Busy')],
+            waiting
+        )
+        self.assertEqual(0, self.executor.queue_depth('executor'))
+
+        # new calls are not queued while the call is still running
+        rejected = []
+        self.helper_call(session, 'block/', rejected)
+        self.assertEqual('StackInAWSGI - Session Busy', rejected[0][2])
+
+        metrics = self.executor.metrics()
+        self.assertEqual(1, metrics['timed-out'])
+        self.assertEqual(2, metrics['busy'])
+
+        BlockingService.release.set()
+        for _ in range(100):
+            if not self.executor._running:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual({}, self.executor._running)
+        self.assertEqual(0, self.executor.metrics()['completed'])
+
+    def test_call_failed(self):
+        """
+        test a call raising an exception is answered with a 500
+        """
+        session = Session('executor', [HelloService])
+        results = []
+        call_with_timeout = mock.patch.object(
+            Session,
+            'call_with_timeout',
+            side_effect=RuntimeError('failed')
+        )
+        with call_with_timeout:
+            self.helper_call(session, 'hello/', results)
+        self.assertEqual(
+            [(500, {}, 'StackInAWSGI - Session Call Failed')],
+            results
+        )
+        self.assertEqual(1, self.executor.metrics()['completed'])
+
+    def test_queued_call_timeout(self):
+        """
+        test a call that timed out in the queue is dropped
+        """
+        session = Session('executor', [BlockingService])
+        results = []
+        first = self.helper_start(session, 'block/', results)
+        self.assertTrue(BlockingService.entered.wait(5))
+
+        self.executor.timeout = 0.2
+        self.helper_call(session, 'block/', results)
+        self.assertEqual(
+            'StackInAWSGI - Session Call Timed Out',
+            results[0][2]
+        )
+        self.assertEqual(0, self.executor.queue_depth('executor'))
+
+        BlockingService.release.set()
+        first.join()
+        self.assertEqual(200, results[1][0])
+
+    def test_queued_call_timeout_without_threads(self):
+        """
+        test a session whose calls all timed out before a pool thread was
+        free is dropped
+        """
+        self.executor.workers = 1
+        blocked = Session('blocked', [BlockingService])
+        results = []
+        first = self.helper_start(blocked, 'block/', results)
+        self.assertTrue(BlockingService.entered.wait(5))
+
+        self.executor.timeout = 0.05
+        session = Session('executor', [HelloService])
+        self.helper_call(session, 'hello/', results)
+        self.assertEqual(
+            'StackInAWSGI - Session Call Timed Out',
+            results[0][2]
+        )
+
+        BlockingService.release.set()
+        first.join()
+        for _ in range(100):
+            if not self.executor.metrics()['queue-depth']:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual({}, self.executor.metrics()['queue-depth'])
+        self.assertEqual(0, session.access_count)
+
+    def test_sessions_independent(self):
+        """
+        test a blocked session does not hold up other sessions
+        """
+        blocked = Session('blocked', [BlockingService])
+        session = Session('executor', [HelloService])
+
+        results = []
+        thread = self.helper_start(blocked, 'block/', results)
+        self.assertTrue(BlockingService.entered.wait(5))
+
+        other = []
+        self.helper_call(session, 'hello/', other)
+        self.assertEqual(200, other[0][0])
+
+        BlockingService.release.set()
+        thread.join()
+        self.assertEqual(200, results[0][0])
+
+    def test_post_fork(self):
+        """
+        test the executor starts fresh threads after a fork
+        """
+        session = Session('executor', [HelloService])
+        results = []
+        self.helper_call(session, 'hello/', results)
+        self.executor.post_fork()
+        self.assertEqual([], self.executor._threads)
+        self.helper_call(session, 'hello/', results)
+        self.assertEqual([200, 200], [result[0] for result in results])
+
+    @ddt.data(None, 0.01)
+    def test_acquire_lock(self, timeout):
+        """
+        test acquiring a lock with a timeout
+        """
+        lock = threading.Lock()
+        self.assertTrue(acquire_lock(lock, timeout))
+        if timeout is not None:
+            self.assertFalse(acquire_lock(lock, timeout))
+        lock.release()
+
+    def test_acquire_lock_polling(self):
+        """
+        test acquiring a lock whose acquire() takes no timeout
+        """
+        lock = threading.Lock()
+        with mock.patch.object(session_module.six, 'PY3', False):
+            self.assertTrue(acquire_lock(lock, 0.01))
+            self.assertFalse(acquire_lock(lock, 0.01))
+
+            timer = threading.Timer(0.02, lock.release)
+            timer.start()
+            self.assertTrue(acquire_lock(lock, 5.0))
+            timer.join()
+        lock.release()
+
+    def test_call_with_timeout(self):
+        """
+        test the session raises when its lock is not acquired in time
+        """
+        session = Session('executor', [HelloService])
+        with session.lock:
+            with self.assertRaises(SessionBusy):
+                session.call_with_timeout(0.01, 'GET', None, '/', {})
+        self.assertEqual(0, session.access_count)
+
+
+class TestSessionManagerExecutor(unittest.TestCase):
+    """
+    Test the session manager with an executor
+    """
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        for session_id in tuple(global_sessions.keys()):
+            del global_sessions[session_id]
+
+    def test_request(self):
+        """
+        test the manager sends session calls to the executor
+        """
+        executor = SessionExecutor(workers=1)
+        self.addCleanup(executor.shutdown)
+        manager = StackInAWsgiSessionManager(executor=executor)
+        manager.register_service(HelloService)
+        session_id = manager.create_session()
+
+        result = manager.request(
+            'GET',
+            None,
+            u'/{0}/hello/'.format(session_id),
+            {}
+        )
+        self.assertEqual(200, result[0])
+        self.assertEqual(1, executor.metrics()['completed'])
+
+        manager.post_fork()
+        self.assertEqual([], executor._threads)
+        result = manager.request(
+            'GET',
+            None,
+            u'/{0}/hello/'.format(session_id),
+            {}
+        )
+        self.assertEqual(200, result[0])
+
+    def test_admin_metrics(self):
+        """
+        test the admin interface reports the executor metrics
+        """
+        executor = SessionExecutor(workers=1)
+        self.addCleanup(executor.shutdown)
+        manager = StackInAWsgiSessionManager(executor=executor)
+        manager.register_service(HelloService)
+        session_id = manager.create_session()
+        admin = StackInAWsgiAdmin(manager, 'test://testing-url')
+
+        result = admin.get_sessions(None, '/', {})
+        self.assertEqual(200, result[0])
+        metrics = json.loads(result[2])['executor']
+        self.assertEqual(1, metrics['workers'])
+        self.assertEqual(0, metrics['queued'])
+
+        result = admin.get_session_info(
+            None,
+            '/{0}'.format(session_id),
+            {}
+        )
+        self.assertEqual(200, result[0])
+        self.assertEqual(
+            0,
+            json.loads(result[2])['trackers']['queue-depth']
+        )
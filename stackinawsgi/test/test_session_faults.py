@@ -0,0 +1,346 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.faults testing
+"""
+import socket
+import unittest
+from timeit import default_timer
+
+import ddt
+import mock
+
+from stackinabox.services.hello import HelloService
+from stackinabox.stack import StackInABox
+
+from stackinawsgi.session.faults import (
+    FaultBody,
+    FaultInjector,
+    FaultRule,
+    InjectedReset
+)
+from stackinawsgi.session.service import global_sessions
+from stackinawsgi.session.session import Session
+from stackinawsgi.wsgi.app import App
+from stackinawsgi.test.helpers import (
+    BytesHelloService,
+    WsgiMock,
+    make_environment
+)
+
+
+@ddt.ddt
+class TestFaultRule(unittest.TestCase):
+    """
+    Test the fault rules
+    """
+
+    @ddt.data(
+        {'fault': 'error', 'probability': 0.5, 'method': 'GET',
+         'path': '^/hello/', 'status': 500, 'body': 'oops'},
+        {'fault': 'reset', 'probability': 1.0, 'method': None,
+         'path': None, 'after-bytes': 10},
+        {'fault': 'truncate', 'probability': 1.0, 'method': None,
+         'path': None, 'after-bytes': 0},
+        {'fault': 'drip', 'probability': 1.0, 'method': None,
+         'path': None, 'chunk-bytes': 2, 'interval-ms': 10.0},
+    )
+    def test_config(self, config):
+        """
+        test the rules round-trip their configuration
+        """
+        self.assertEqual(config, FaultRule(**config).config())
+
+    @ddt.data(
+        {'fault': 'explode'},
+        {'fault': 'error', 'probability': 2},
+        {'fault': 'error', 'probability': None},
+        {'fault': 'error', 'status': 'bad'},
+        {'fault': 'error', 'status': 99},
+        {'fault': 'error', 'status': 600},
+        {'fault': 'error', 'after-bytes': 1},
+        {'fault': 'reset', 'after-bytes': -1},
+        {'fault': 'drip', 'chunk-bytes': 0},
+        {'fault': 'drip', 'path': '('},
+    )
+    def test_invalid(self, config):
+        """
+        test invalid rules
+        """
+        with self.assertRaises(ValueError):
+            FaultRule(**config)
+
+
+@ddt.ddt
+class TestFaultInjector(unittest.TestCase):
+    """
+    Test the session fault injector
+    """
+
+    def test_config(self):
+        """
+        test the injector round-trips its configuration
+        """
+        config = {
+            'seed': 5,
+            'rules': [FaultRule('error', 0.25).config()]
+        }
+        self.assertEqual(config, FaultInjector.from_config(config).config())
+
+        del config['seed']
+        self.assertEqual(config, FaultInjector.from_config(config).config())
+
+    @ddt.data(None, {}, {'rules': []})
+    def test_config_none(self, config):
+        """
+        test configurations without rules
+        """
+        self.assertIsNone(FaultInjector.from_config(config))
+
+    @ddt.data(
+        [],
+        {'rules': {}},
+        {'rules': [1]},
+        {'rules': [{'probability': 1}]},
+        {'rules': [{'fault': 'error', 'typo': 1}]},
+    )
+    def test_config_invalid(self, config):
+        """
+        test invalid configurations
+        """
+        with self.assertRaises(ValueError):
+            FaultInjector.from_config(config)
+
+    def test_choose_seeded(self):
+        """
+        test injectors with the same seed inject the same faults
+        """
+        config = {
+            'seed': 9,
+            'rules': [
+                {'fault': 'error', 'probability': 0.3},
+                {'fault': 'reset', 'probability': 0.3}
+            ]
+        }
+        first = FaultInjector.from_config(config)
+        second = FaultInjector.from_config(config)
+        picks = [first.choose('GET', '/') for _ in range(50)]
+        self.assertEqual(
+            [rule and rule.fault for rule in picks],
+            [
+                rule and rule.fault
+                for rule in (second.choose('GET', '/') for _ in range(50))
+            ]
+        )
+        self.assertEqual(
+            set([None, 'error', 'reset']),
+            set(rule and rule.fault for rule in picks)
+        )
+        self.assertEqual(
+            sum(1 for rule in picks if rule is not None),
+            sum(first.injected.values())
+        )
+
+    def test_choose_route(self):
+        """
+        test only the matching routes get faults
+        """
+        injector = FaultInjector.from_config({'rules': [
+            {'fault': 'error', 'method': 'post', 'path': '^/hello/'}
+        ]})
+        self.assertIsNone(injector.choose('GET', '/hello/'))
+        self.assertIsNone(injector.choose('POST', '/other/'))
+        self.assertEqual('error', injector.choose('POST', '/hello/').fault)
+
+
+class TestSessionFaults(unittest.TestCase):
+    """
+    Test the session applies the faults
+    """
+
+    def test_no_faults(self):
+        """
+        test the session calls StackInABox directly without rules
+        """
+        session = Session('faults', [HelloService])
+        session.stack.call = mock.Mock(return_value=(200, {}, 'ok'))
+        self.assertEqual((200, {}, 'ok'), session.call('GET', None, 'x/', {}))
+
+    def test_error(self):
+        """
+        test an error fault replaces the response
+        """
+        session = Session('faults', [HelloService])
+        session.stack.call = mock.Mock(return_value=(200, {}, 'ok'))
+        session.faults = FaultInjector.from_config({'rules': [
+            {'fault': 'error', 'status': 502}
+        ]})
+        result = session.call('GET', None, 'faults/hello/', {})
+        self.assertEqual(502, result[0])
+        self.assertFalse(session.stack.call.called)
+        self.assertEqual({502: 1}, session.status_tracker)
+
+    def test_unmatched(self):
+        """
+        test requests no rule matches are passed to StackInABox
+        """
+        session = Session('faults', [HelloService])
+        session.stack.call = mock.Mock(return_value=(200, {}, 'ok'))
+        session.faults = FaultInjector.from_config({'rules': [
+            {'fault': 'error', 'path': '^/other/'}
+        ]})
+        result = session.call('GET', None, 'faults/hello/', {})
+        self.assertEqual((200, {}, 'ok'), result)
+        self.assertEqual({}, session.faults.injected)
+
+    def test_body_fault_without_request(self):
+        """
+        test a body fault is skipped without a request to hand it to
+        """
+        session = Session('faults', [HelloService])
+        session.stack.call = mock.Mock(return_value=(200, {}, 'ok'))
+        session.faults = FaultInjector.from_config({'rules': [
+            {'fault': 'truncate'}
+        ]})
+        result = session.call('GET', None, 'faults/hello/', {})
+        self.assertEqual((200, {}, 'ok'), result)
+        self.assertEqual({'truncate': 1}, session.faults.injected)
+
+    def test_body_fault(self):
+        """
+        test a body fault is handed to the application
+        """
+        session = Session('faults', [HelloService])
+        session.stack.call = mock.Mock(return_value=(200, {}, 'ok'))
+        session.faults = FaultInjector.from_config({'rules': [
+            {'fault': 'truncate'}
+        ]})
+        request = mock.Mock(environment={})
+        result = session.call('GET', request, 'faults/hello/', {})
+        self.assertEqual((200, {}, 'ok'), result)
+        self.assertEqual(
+            'truncate',
+            request.environment['stackinawsgi.fault'].fault
+        )
+
+
+class TestFaultBody(unittest.TestCase):
+    """
+    Test the response body faults
+    """
+
+    def test_truncate(self):
+        """
+        test the body ends early
+        """
+        rule = FaultRule('truncate', **{'after-bytes': 3})
+        body = FaultBody([b'ab', b'cd', b'ef'], rule, {})
+        self.assertEqual([b'ab', b'c'], list(body))
+
+    def test_reset(self):
+        """
+        test the body aborts the connection
+        """
+        rule = FaultRule('reset', **{'after-bytes': 2})
+        sent = []
+        with self.assertRaises(InjectedReset):
+            for chunk in FaultBody([b'ab', b'cd'], rule, {}):
+                sent.append(chunk)
+        self.assertEqual([b'ab'], sent)
+
+    def test_reset_socket(self):
+        """
+        test the server socket is closed when the server exposes it
+        """
+        sock = mock.Mock()
+        rule = FaultRule('reset')
+        with self.assertRaises(InjectedReset):
+            list(FaultBody([b'ab'], rule, {'gunicorn.socket': sock}))
+        self.assertTrue(sock.setsockopt.called)
+        self.assertTrue(sock.close.called)
+
+    def test_reset_socket_error(self):
+        """
+        test the reset is still raised when the socket cannot be closed
+        """
+        sock = mock.Mock()
+        sock.setsockopt.side_effect = socket.error('closed')
+        rule = FaultRule('reset')
+        with self.assertRaises(InjectedReset):
+            list(FaultBody([b'ab'], rule, {'gunicorn.socket': sock}))
+        self.assertFalse(sock.close.called)
+
+    def test_close(self):
+        """
+        test the wrapped body is closed when it can be
+        """
+        rule = FaultRule('truncate')
+        body = mock.Mock()
+        FaultBody(body, rule, {}).close()
+        body.close.assert_called_once_with()
+
+        FaultBody([b'ab'], rule, {}).close()
+
+    def test_drip(self):
+        """
+        test the body is sent a few bytes at a time
+        """
+        rule = FaultRule('drip', **{'chunk-bytes': 2, 'interval-ms': 20})
+        start = default_timer()
+        chunks = list(FaultBody([b'abcdef'], rule, {}))
+        self.assertEqual([b'ab', b'cd', b'ef'], chunks)
+        self.assertGreaterEqual(default_timer() - start, 0.06)
+
+
+class TestAppFaults(unittest.TestCase):
+    """
+    Test the application applies the body faults
+    """
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        StackInABox.reset_services()
+        for session_id in tuple(global_sessions.keys()):
+            del global_sessions[session_id]
+
+    def test_truncate(self):
+        """
+        test a truncated body still announces its full length
+        """
+        the_app = App([BytesHelloService])
+        the_app.StackInABoxUriUpdate('localhost')
+        session_id = the_app.stack_service.create_session()
+        global_sessions[session_id].faults = FaultInjector.from_config({
+            'rules': [{'fault': 'truncate', 'after-bytes': 2}]
+        })
+        environment = make_environment(
+            self,
+            method='GET',
+            path=u'/stackinabox/{0}/hello/'.format(session_id)
+        )
+
+        wsgi_mock = WsgiMock()
+        body = b''.join(the_app(environment, wsgi_mock))
+        self.assertEqual(b'He', body)
+        self.assertEqual('5', wsgi_mock.headers['Content-Length'])
+
+    def test_truncate_unknown_length(self):
+        """
+        test a truncated body of unknown length announces no length
+        """
+        the_app = App([HelloService])
+        the_app.StackInABoxUriUpdate('localhost')
+        session_id = the_app.stack_service.create_session()
+        global_sessions[session_id].faults = FaultInjector.from_config({
+            'rules': [{'fault': 'truncate', 'after-bytes': 2}]
+        })
+        environment = make_environment(
+            self,
+            method='GET',
+            path=u'/stackinabox/{0}/hello/'.format(session_id)
+        )
+
+        wsgi_mock = WsgiMock()
+        body = ''.join(the_app(environment, wsgi_mock))
+        self.assertEqual('He', body)
+        self.assertNotIn('Content-Length', wsgi_mock.headers)
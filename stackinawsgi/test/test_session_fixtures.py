@@ -0,0 +1,255 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.fixtures testing
+"""
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+import ddt
+
+from stackinabox.services.service import StackInABoxService
+
+from stackinawsgi.session.context import serving
+from stackinawsgi.session.fixtures import (
+    FixtureOverlay,
+    FixtureStore,
+    FrozenDict,
+    current_fixtures,
+    freeze,
+    thaw
+)
+from stackinawsgi.session.persistence import (
+    FileSessionStore,
+    SessionPersistence
+)
+from stackinawsgi.session.service import (
+    global_sessions,
+    StackInAWsgiSessionManager
+)
+from stackinawsgi.session.session import Session
+
+
+class CatalogService(StackInABoxService):
+    """
+    Service serving a large shared catalog
+    """
+
+    def __init__(self):
+        """
+        Register the end-points
+        """
+        super(CatalogService, self).__init__('catalog')
+        self.register(StackInABoxService.GET, '/', CatalogService.count)
+        self.register(StackInABoxService.POST, '/', CatalogService.add)
+
+    @classmethod
+    def stackinawsgi_fixtures(cls, store):
+        """
+        Load the catalog once for all sessions
+        """
+        store.register('catalog', {'items': ['a', 'b']})
+
+    def count(self, request, uri, headers):
+        """
+        Return the number of items in the catalog
+        """
+        items = current_fixtures()['catalog']['items']
+        return (200, headers, str(len(items)))
+
+    def add(self, request, uri, headers):
+        """
+        Add an item to the session's catalog
+        """
+        current_fixtures().mutable('catalog')['items'].append('c')
+        return (201, headers, '')
+
+
+@ddt.ddt
+class TestSessionFixtures(unittest.TestCase):
+    """
+    Test the shared fixture store and the per-session overlays
+    """
+
+    def setUp(self):
+        """
+        configure env for the test
+        """
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        keys = tuple(global_sessions.keys())
+        for k in keys:
+            del global_sessions[k]
+        shutil.rmtree(self.directory)
+
+    @ddt.unpack
+    @ddt.data(
+        ([1, [2]], (1, (2,))),
+        ({3}, frozenset([3])),
+        (bytearray(b'data'), b'data'),
+        ('text', 'text'),
+    )
+    def test_freeze(self, value, expected):
+        """
+        Test containers are converted to immutable equivalents
+        """
+        self.assertEqual(expected, freeze(value))
+
+    def test_freeze_thaw_mapping(self):
+        """
+        Test mappings are frozen and thawed recursively
+        """
+        frozen = freeze({'key': {'nested': [1, 2]}, 'tags': {'a'}})
+        self.assertIsInstance(frozen, FrozenDict)
+        self.assertIsInstance(frozen['key'], FrozenDict)
+        self.assertEqual((1, 2), frozen['key']['nested'])
+        self.assertEqual(2, len(frozen))
+        self.assertEqual(
+            "FrozenDict({'nested': (1, 2)})",
+            repr(frozen['key'])
+        )
+        self.assertIs(frozen, freeze(frozen))
+        with self.assertRaises(TypeError):
+            frozen['key'] = 'value'
+
+        thawed = thaw(frozen)
+        self.assertEqual(
+            {'key': {'nested': [1, 2]}, 'tags': {'a'}},
+            thawed
+        )
+        self.assertIsInstance(thawed['tags'], set)
+        thawed['key']['nested'].append(3)
+        self.assertEqual((1, 2), frozen['key']['nested'])
+
+    def test_register_file(self):
+        """
+        Test file fixtures are memory-mapped
+        """
+        path = os.path.join(self.directory, 'fixture.bin')
+        with open(path, 'wb') as data_file:
+            data_file.write(b'0123456789')
+        empty = os.path.join(self.directory, 'empty.bin')
+        open(empty, 'wb').close()
+
+        store = FixtureStore()
+        data = store.register_file('payload', path)
+        self.assertIsInstance(data, mmap.mmap)
+        self.assertEqual(b'0123', store['payload'][:4])
+        self.assertEqual(b'', store.register_file('empty', empty))
+
+        overlay = FixtureOverlay(store)
+        copy = overlay.mutable('payload')
+        copy[0:1] = b'X'
+        self.assertEqual(b'X123', bytes(overlay['payload'][:4]))
+        self.assertEqual(b'0123', store['payload'][:4])
+
+        store.close()
+        self.assertTrue(data.closed)
+        self.assertEqual(0, len(store))
+
+    def test_overlay(self):
+        """
+        Test the overlay only copies the fixtures the session changes
+        """
+        store = FixtureStore()
+        shared = store.register('users', {'alice': 1})
+        store.register('groups', ['admin'])
+        overlay = FixtureOverlay(store)
+
+        self.assertIs(shared, overlay['users'])
+        self.assertTrue(overlay.is_shared('users'))
+
+        overlay.mutable('users')['bob'] = 2
+        self.assertIs(overlay.mutable('users'), overlay['users'])
+        self.assertFalse(overlay.is_shared('users'))
+        self.assertEqual({'alice': 1}, dict(store['users']))
+
+        overlay['local'] = 'value'
+        del overlay['groups']
+        self.assertNotIn('groups', overlay)
+        self.assertIn('groups', store)
+        self.assertEqual(['local', 'users'], sorted(overlay))
+        self.assertEqual(2, len(overlay))
+        with self.assertRaises(KeyError):
+            del overlay['groups']
+
+        del overlay['local']
+        self.assertEqual(({'users': {'alice': 1, 'bob': 2}}, ['groups']),
+                         overlay.export_overrides())
+
+        overlay.reset()
+        self.assertIs(shared, overlay['users'])
+        self.assertEqual(['admin'], list(overlay['groups']))
+
+    def test_session_sharing(self):
+        """
+        Test sessions share fixture data until they change it
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(CatalogService)
+        first = global_sessions[manager.create_session()]
+        second = global_sessions[manager.create_session()]
+        self.assertIsNone(current_fixtures())
+        self.assertIs(first.fixtures['catalog'], second.fixtures['catalog'])
+
+        self.assertEqual(
+            201,
+            first.call('POST', None, first.session_id + '/catalog/', {})[0]
+        )
+        self.assertEqual(
+            '3',
+            first.call('GET', None, first.session_id + '/catalog/', {})[2]
+        )
+        self.assertEqual(
+            '2',
+            second.call('GET', None, second.session_id + '/catalog/', {})[2]
+        )
+
+        with serving(second):
+            self.assertIs(second.fixtures, current_fixtures())
+
+        first.reset()
+        self.assertIs(first.fixtures['catalog'], second.fixtures['catalog'])
+
+    def test_manager_store(self):
+        """
+        Test the manager hands its fixture store to the sessions
+        """
+        store = FixtureStore()
+        store.register('extra', ['shared'])
+        manager = StackInAWsgiSessionManager(fixtures=store)
+        manager.register_service(CatalogService)
+        self.assertIs(store, manager.fixtures)
+        session = global_sessions[manager.create_session()]
+        self.assertEqual(('shared',), session.fixtures['extra'])
+        self.assertIn('catalog', store)
+
+    def test_persistence(self):
+        """
+        Test the session's fixture changes are checkpointed
+        """
+        store = FixtureStore()
+        store.register('catalog', {'items': ['a']})
+        store.register('removed', 'value')
+        persistence = SessionPersistence(
+            FileSessionStore(self.directory),
+            interval=0
+        )
+        session = Session('session-id', [CatalogService], fixtures=store)
+        session.fixtures.mutable('catalog')['items'].append('b')
+        del session.fixtures['removed']
+        self.assertTrue(persistence.checkpoint(session))
+
+        restored = persistence.restore(
+            'session-id',
+            [CatalogService],
+            {},
+            fixtures=store
+        )
+        self.assertEqual(['a', 'b'], restored.fixtures['catalog']['items'])
+        self.assertNotIn('removed', restored.fixtures)
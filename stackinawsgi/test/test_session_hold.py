@@ -0,0 +1,156 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.hold testing
+"""
+import threading
+import unittest
+
+import ddt
+
+from stackinabox.services.service import StackInABoxService
+
+from stackinawsgi.exceptions import HoldQuotaExceeded
+from stackinawsgi.session.context import serving
+from stackinawsgi.session.hold import (
+    SessionHold,
+    current_hold,
+    sizeof
+)
+from stackinawsgi.session.session import Session
+
+
+class HoldService(StackInABoxService):
+    """
+    Service caching data in the session hold
+    """
+
+    def __init__(self):
+        """
+        Register the end-point
+        """
+        super(HoldService, self).__init__('cache')
+        self.register(StackInABoxService.GET, '/', HoldService.handler)
+
+    def handler(self, request, uri, headers):
+        """
+        Store and return a value from the current session's hold
+        """
+        hold = current_hold()
+        hold['visits'] = hold.get('visits', 0) + 1
+        return (200, headers, str(hold['visits']))
+
+
+@ddt.ddt
+class TestSessionHold(unittest.TestCase):
+    """
+    Test the per-session hold
+    """
+
+    def setUp(self):
+        """
+        configure env for the test
+        """
+        pass
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        pass
+
+    @ddt.unpack
+    @ddt.data(
+        (b'1234', 4),
+        (bytearray(b'12'), 2),
+        (u'é', 2),
+    )
+    def test_sizeof(self, value, expected):
+        """
+        Test the size of bytes and text values
+        """
+        self.assertEqual(expected, sizeof(value))
+
+    def test_sizeof_objects(self):
+        """
+        Test the size of other objects
+        """
+        self.assertGreater(sizeof({'key': 'value' * 10}), 50)
+        self.assertGreater(sizeof(threading.Lock()), 0)
+
+    def test_mapping(self):
+        """
+        Test the hold behaves as a mapping with byte accounting
+        """
+        hold = SessionHold()
+        hold['a'] = b'12345'
+        hold['b'] = b'123'
+        self.assertEqual(2, len(hold))
+        self.assertEqual(8, hold.used)
+        self.assertEqual({'a': 5, 'b': 3}, hold.sizes())
+
+        hold['a'] = b'1'
+        self.assertEqual(4, hold.used)
+
+        del hold['b']
+        self.assertEqual(1, hold.used)
+        self.assertEqual(['a'], list(hold))
+
+        hold.clear()
+        self.assertEqual(0, hold.used)
+        self.assertEqual(0, len(hold))
+
+    def test_quota_eviction(self):
+        """
+        Test least recently used values are evicted to fit the quota
+        """
+        hold = SessionHold(quota=10)
+        hold['a'] = b'1234'
+        hold['b'] = b'1234'
+        self.assertEqual(b'1234', hold['a'])
+        hold['c'] = b'1234'
+
+        self.assertNotIn('b', hold)
+        self.assertIn('a', hold)
+        self.assertIn('c', hold)
+        self.assertEqual(8, hold.used)
+        self.assertEqual(1, hold.evictions)
+
+        with self.assertRaises(HoldQuotaExceeded):
+            hold['d'] = b'12345678901'
+        self.assertEqual(8, hold.used)
+
+    def test_current_hold(self):
+        """
+        Test the current hold follows the session being served
+        """
+        outer = Session('outer', [HoldService])
+        inner = Session('inner', [HoldService])
+        self.assertIsNone(current_hold())
+        with serving(outer):
+            self.assertIs(outer.hold, current_hold())
+            with serving(inner):
+                self.assertIs(inner.hold, current_hold())
+            self.assertIs(outer.hold, current_hold())
+        self.assertIsNone(current_hold())
+
+    def test_session_isolation(self):
+        """
+        Test services see their own session's hold
+        """
+        first = Session('first', [HoldService], hold_quota=1024)
+        second = Session('second', [HoldService])
+        self.assertIs(first.hold, first.stack.holds)
+        self.assertEqual(1024, first.hold.quota)
+        self.assertIsNone(second.hold.quota)
+
+        for _ in range(2):
+            result = first.call('GET', None, 'first/cache/', {})
+        self.assertEqual('2', result[2])
+        result = second.call('GET', None, 'second/cache/', {})
+        self.assertEqual('1', result[2])
+
+        first.stack.into_hold('fixture', b'data')
+        self.assertEqual(b'data', first.hold['fixture'])
+
+        first.reset()
+        self.assertEqual(0, len(first.hold))
+        self.assertIs(first.hold, first.stack.holds)
@@ -0,0 +1,366 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.persistence testing
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import ddt
+
+from stackinabox.services.hello import HelloService
+from stackinabox.services.service import StackInABoxService
+
+from stackinawsgi.exceptions import InvalidSessionId
+from stackinawsgi.session.persistence import (
+    FileSessionStore,
+    SessionPersistence,
+    SqliteSessionStore,
+    is_persistable
+)
+from stackinawsgi.session.service import (
+    global_sessions,
+    StackInAWsgiSessionManager
+)
+from stackinawsgi.session.session import Session
+from stackinawsgi.wsgi.request import Request
+from stackinawsgi.test.helpers import make_environment
+
+
+class CounterService(StackInABoxService):
+    """
+    Service with state that should survive a restart
+    """
+
+    def __init__(self):
+        """
+        Register the counter end-point
+        """
+        super(CounterService, self).__init__('counter')
+        self.count = 0
+        self.register(StackInABoxService.POST, '/', CounterService.increment)
+
+    def increment(self, request, uri, headers):
+        """
+        Increment and return the counter
+        """
+        self.count = self.count + 1
+        return (200, headers, str(self.count))
+
+
+class OptOutService(CounterService):
+    """
+    Service that opted out of persistence
+    """
+
+    stackinawsgi_persist = False
+
+    def __init__(self):
+        """
+        Rename the counter service
+        """
+        super(OptOutService, self).__init__()
+        self.name = 'opt-out'
+
+
+class UnpicklableService(CounterService):
+    """
+    Service holding state that cannot be pickled
+    """
+
+    def __init__(self):
+        """
+        Add an unpicklable attribute
+        """
+        super(UnpicklableService, self).__init__()
+        self.name = 'unpicklable'
+        self.lock = threading.Lock()
+
+
+@ddt.ddt
+class TestSessionPersistence(unittest.TestCase):
+    """
+    Test checkpointing and restoring sessions
+    """
+
+    def setUp(self):
+        """
+        configure env for the test
+        """
+        self.directory = tempfile.mkdtemp()
+        self.services = [CounterService, OptOutService, UnpicklableService]
+        self.stores = []
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        keys = tuple(global_sessions.keys())
+        for k in keys:
+            del global_sessions[k]
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.directory)
+
+    def helper_store(self, kind):
+        """
+        Create a store of the requested kind
+        """
+        if kind == 'file':
+            store = FileSessionStore(os.path.join(self.directory, 'store'))
+        else:
+            store = SqliteSessionStore(
+                os.path.join(self.directory, 'store.db')
+            )
+        self.stores.append(store)
+        return store
+
+    def helper_increment(self, session, service_name):
+        """
+        Call a counter service in the session
+        """
+        uri = '/{0}/'.format(service_name)
+        request = Request(make_environment(self, method='POST', path=uri))
+        return session.call(
+            'POST',
+            request,
+            '{0}{1}'.format(session.session_id, uri),
+            {}
+        )
+
+    @ddt.data('file', 'sqlite')
+    def test_store(self, kind):
+        """
+        Test the store backends
+        """
+        store = self.helper_store(kind)
+        self.assertIsNone(store.load('missing'))
+        store.save('session-1', b'first')
+        store.save('session-1', b'second')
+        store.save('session-2', b'other')
+        self.assertEqual(b'second', store.load('session-1'))
+        self.assertEqual(
+            ['session-1', 'session-2'],
+            sorted(store.session_ids())
+        )
+        store.delete('session-1')
+        store.delete('missing')
+        self.assertIsNone(store.load('session-1'))
+        self.assertEqual(['session-2'], store.session_ids())
+
+    @ddt.data('../../tmp/evil', 'a/b', '', 'id\n')
+    def test_file_store_invalid_session_id(self, session_id):
+        """
+        Test session-ids cannot reach outside of the store directory
+        """
+        store = self.helper_store('file')
+        with self.assertRaises(InvalidSessionId):
+            store.save(session_id, b'data')
+        with self.assertRaises(InvalidSessionId):
+            store.load(session_id)
+        self.assertEqual([], store.session_ids())
+
+    def test_restore_missing(self):
+        """
+        Test the store is not queried again for a missing session
+        """
+        store = self.helper_store('file')
+        loads = []
+        load = store.load
+
+        def counting_load(session_id):
+            loads.append(session_id)
+            return load(session_id)
+
+        store.load = counting_load
+        persistence = SessionPersistence(store, interval=0)
+        for _ in range(2):
+            self.assertIsNone(
+                persistence.restore('missing', self.services, {})
+            )
+        self.assertEqual(['missing'], loads)
+
+        # the checkpoint is found once the missing entry expired
+        store.save('missing', persistence.dumps(
+            Session('missing', self.services)
+        ))
+        persistence.missing_ttl = 0
+        self.assertIsNotNone(
+            persistence.restore('missing', self.services, {})
+        )
+        self.assertEqual(['missing', 'missing'], loads)
+
+        persistence.max_missing = 1
+        persistence.missing_ttl = 60.0
+        for session_id in ('first', 'second'):
+            persistence.restore(session_id, self.services, {})
+        self.assertEqual(['second'], list(persistence._missing))
+
+    def test_is_persistable(self):
+        """
+        Test services can opt out
+        """
+        self.assertTrue(is_persistable(HelloService()))
+        self.assertFalse(is_persistable(OptOutService()))
+
+    @ddt.data('file', 'sqlite')
+    def test_round_trip(self, kind):
+        """
+        Test a session is restored with its service state and trackers
+        """
+        persistence = SessionPersistence(self.helper_store(kind), interval=0)
+        session = Session('session-id', self.services)
+        for name in ('counter', 'opt-out', 'unpicklable'):
+            self.helper_increment(session, name)
+        self.assertEqual(
+            (200, {}, '2'),
+            self.helper_increment(session, 'counter')
+        )
+
+        session.hold['fixture'] = b'data'
+        session.hold['lock'] = threading.Lock()
+
+        self.assertTrue(persistence.checkpoint(session))
+        self.assertFalse(persistence.checkpoint(session))
+
+        sessions = {}
+        restored = persistence.restore('session-id', self.services, sessions)
+        self.assertIs(restored, sessions['session-id'])
+        self.assertIs(
+            restored,
+            persistence.restore('session-id', self.services, sessions)
+        )
+        self.assertEqual(session.access_count, restored.access_count)
+        self.assertEqual(session.created_at, restored.created_at)
+        self.assertEqual(session.status_tracker, restored.status_tracker)
+        self.assertFalse(restored.dirty)
+        self.assertEqual(['fixture'], list(restored.hold))
+        self.assertIs(restored.hold, restored.stack.holds)
+
+        # persisted service continues counting, the others start over
+        self.assertEqual(
+            (200, {}, '3'),
+            self.helper_increment(restored, 'counter')
+        )
+        self.assertEqual(
+            (200, {}, '1'),
+            self.helper_increment(restored, 'opt-out')
+        )
+        self.assertEqual(
+            (200, {}, '1'),
+            self.helper_increment(restored, 'unpicklable')
+        )
+        self.assertTrue(restored.dirty)
+
+        self.assertIsNone(
+            persistence.restore('missing', self.services, sessions)
+        )
+
+    def test_restore_corrupt(self):
+        """
+        Test a corrupt checkpoint is treated as missing
+        """
+        store = self.helper_store('file')
+        store.save('session-id', b'not a pickle')
+        persistence = SessionPersistence(store, interval=0)
+        self.assertIsNone(
+            persistence.restore('session-id', self.services, {})
+        )
+
+    def test_restore_broken_service(self):
+        """
+        Test a service that fails to unpickle starts over
+        """
+        persistence = SessionPersistence(self.helper_store('file'), interval=0)
+        session = Session('session-id', self.services)
+        self.helper_increment(session, 'counter')
+        self.assertEqual(1, persistence.checkpoint_all({'a': session}))
+        self.assertEqual(0, persistence.checkpoint_all({'a': session}))
+
+        state = pickle.loads(persistence.dumps(session))
+        state['services']['counter'] = b'not a pickle'
+        restored = persistence.loads(
+            'session-id',
+            self.services,
+            pickle.dumps(state)
+        )
+        self.assertEqual(
+            (200, {}, '1'),
+            self.helper_increment(restored, 'counter')
+        )
+
+    def test_checkpoint_failure(self):
+        """
+        Test a failed write leaves the session dirty
+        """
+        class BrokenStore(FileSessionStore):
+            def save(self, session_id, data):
+                raise IOError('disk full')
+
+        persistence = SessionPersistence(
+            BrokenStore(self.directory),
+            interval=0
+        )
+        session = Session('session-id', self.services)
+        self.assertFalse(persistence.checkpoint(session))
+        self.assertTrue(session.dirty)
+
+    def test_manager_warm_restart(self):
+        """
+        Test the manager restores sessions lazily after a restart
+        """
+        store = self.helper_store('sqlite')
+        manager = StackInAWsgiSessionManager(
+            persistence=SessionPersistence(store, interval=0)
+        )
+        manager.register_service(CounterService)
+        session_id = manager.create_session()
+        self.helper_increment(global_sessions[session_id], 'counter')
+        removed_id = manager.create_session()
+        self.assertEqual(
+            2,
+            manager.persistence.checkpoint_all(global_sessions)
+        )
+        manager.remove_session(removed_id)
+
+        # simulate the worker restart
+        global_sessions.clear()
+        manager = StackInAWsgiSessionManager(
+            persistence=SessionPersistence(store, interval=0)
+        )
+        manager.register_service(CounterService)
+        self.assertEqual([session_id], manager.session_ids())
+        self.assertNotIn(session_id, global_sessions)
+
+        uri = '/{0}/counter/'.format(session_id)
+        request = Request(make_environment(self, method='POST', path=uri))
+        result = manager.request('POST', request, uri, {})
+        self.assertEqual((200, {}, '2'), result)
+        self.assertIn(session_id, global_sessions)
+
+        manager.reset_session(session_id)
+        self.assertIsNone(store.load(session_id))
+
+    def test_background_checkpoint(self):
+        """
+        Test the background thread writes changed sessions
+        """
+        store = self.helper_store('file')
+        persistence = SessionPersistence(store, interval=0.01)
+        sessions = {'session-id': Session('session-id', self.services)}
+        persistence.start(sessions)
+        persistence.start(sessions)
+        try:
+            deadline = time.time() + 5
+            while store.load('session-id') is None:
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.01)
+        finally:
+            persistence.stop()
+
+        sessions['session-id'].reset()
+        persistence.stop(sessions)
+        self.assertFalse(sessions['session-id'].dirty)
@@ -0,0 +1,263 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.ratelimit testing
+"""
+import unittest
+
+import ddt
+
+from stackinabox.services.hello import HelloService
+
+from stackinawsgi.session.ratelimit import (
+    RateLimiter,
+    TokenBucket
+)
+from stackinawsgi.session.service import (
+    global_sessions,
+    StackInAWsgiSessionManager
+)
+from stackinawsgi.session.session import Session
+
+
+@ddt.ddt
+class TestTokenBucket(unittest.TestCase):
+    """
+    Test the token bucket
+    """
+
+    def test_burst(self):
+        """
+        test the bucket allows the burst then limits
+        """
+        bucket = TokenBucket(1, 3)
+        self.assertEqual([0.0, 0.0, 0.0], [bucket.take() for _ in range(3)])
+        wait = bucket.take()
+        self.assertGreater(wait, 0.0)
+        self.assertLessEqual(wait, 1.0)
+
+        bucket.refund()
+        self.assertEqual(0.0, bucket.take())
+
+    def test_refill(self):
+        """
+        test the bucket refills from the elapsed time
+        """
+        bucket = TokenBucket(10)
+        self.assertEqual(10.0, bucket.burst)
+        for _ in range(10):
+            bucket.take()
+        self.assertGreater(bucket.take(), 0.0)
+
+        # pretend half a second went by
+        bucket.updated = bucket.updated - 0.5
+        self.assertEqual([0.0] * 5, [bucket.take() for _ in range(5)])
+        self.assertGreater(bucket.take(), 0.0)
+
+        # the refill never exceeds the burst
+        bucket.updated = bucket.updated - 60
+        self.assertEqual([0.0] * 10, [bucket.take() for _ in range(10)])
+        self.assertGreater(bucket.take(), 0.0)
+
+    @ddt.data(
+        (0, None),
+        (-1, None),
+        (1, 0.5),
+        (None, None),
+        ('fast', None),
+    )
+    @ddt.unpack
+    def test_invalid(self, rate, burst):
+        """
+        test invalid bucket configurations
+        """
+        with self.assertRaises(ValueError):
+            TokenBucket(rate, burst)
+
+
+@ddt.ddt
+class TestRateLimiter(unittest.TestCase):
+    """
+    Test the per-session rate limiter
+    """
+
+    def test_config(self):
+        """
+        test building the limiter from its configuration
+        """
+        config = {
+            'rate': 2.0,
+            'burst': 4.0,
+            'services': {
+                'hello': {'rate': 1.0, 'burst': 1.0}
+            }
+        }
+        limiter = RateLimiter.from_config(config)
+        self.assertEqual(config, limiter.config())
+        self.assertEqual(
+            {'services': {'hello': {'rate': 3.0, 'burst': 3.0}}},
+            RateLimiter.from_config({'services': {'hello': 3}}).config()
+        )
+
+    @ddt.data(None, {}, {'services': {}})
+    def test_config_no_limit(self, config):
+        """
+        test configurations without a limit
+        """
+        self.assertIsNone(RateLimiter.from_config(config))
+
+    @ddt.data(
+        [1],
+        {'rate': 0},
+        {'services': [1]},
+        {'services': {'hello': {'burst': 1}}},
+    )
+    def test_config_invalid(self, config):
+        """
+        test invalid configurations
+        """
+        with self.assertRaises(ValueError):
+            RateLimiter.from_config(config)
+
+    @ddt.data(
+        ('5', {'rate': 5.0, 'burst': None}),
+        (' 5/10 ', {'rate': 5.0, 'burst': 10.0}),
+    )
+    @ddt.unpack
+    def test_parse_header(self, value, expected):
+        """
+        test parsing the rate limit header
+        """
+        self.assertEqual(expected, RateLimiter.parse_header(value))
+
+    def test_parse_service_header(self):
+        """
+        test parsing the per-service rate limit header
+        """
+        self.assertEqual(
+            {
+                'hello': {'rate': 5.0, 'burst': None},
+                'other': {'rate': 1.0, 'burst': 2.0}
+            },
+            RateLimiter.parse_service_header('hello=5, other=1/2,')
+        )
+        for value in ('hello', '=5', 'hello=fast'):
+            with self.assertRaises(ValueError):
+                RateLimiter.parse_service_header(value)
+
+    def test_take(self):
+        """
+        test a request needs a token from the session and its service
+        """
+        limiter = RateLimiter.from_config({
+            'rate': 1,
+            'burst': 2,
+            'services': {'hello': {'rate': 1, 'burst': 1}}
+        })
+        self.assertEqual(0.0, limiter.take('hello'))
+        self.assertGreater(limiter.take('hello'), 0.0)
+        self.assertEqual(0.0, limiter.take('other'))
+
+        # the session bucket is empty; the service token is returned
+        limiter.services['hello'].updated -= 1.0
+        self.assertGreater(limiter.take('hello'), 0.0)
+        self.assertEqual(1.0, limiter.services['hello'].tokens)
+
+    def test_take_service_only(self):
+        """
+        test a limiter without a session limit only limits its services
+        """
+        limiter = RateLimiter.from_config({
+            'services': {'hello': {'rate': 1, 'burst': 1}}
+        })
+        self.assertIsNone(limiter.bucket)
+        self.assertEqual(0.0, limiter.take('hello'))
+        self.assertGreater(limiter.take('hello'), 0.0)
+        self.assertEqual(0.0, limiter.take('other'))
+
+    @ddt.data(
+        {'rate': 1, 'services': {'hello': {'rate': 1}}},
+        {'services': {'hello': {'rate': 1}}},
+    )
+    def test_post_fork(self, config):
+        """
+        test the bucket locks are replaced after a fork
+        """
+        limiter = RateLimiter.from_config(config)
+        buckets = list(limiter.services.values())
+        if limiter.bucket is not None:
+            buckets.append(limiter.bucket)
+        locks = [bucket.lock for bucket in buckets]
+        for lock in locks:
+            lock.acquire()
+
+        limiter.post_fork()
+        for bucket, lock in zip(buckets, locks):
+            self.assertIsNot(lock, bucket.lock)
+        self.assertEqual(0.0, limiter.take('hello'))
+
+    @ddt.data(
+        (0.001, '1'),
+        (1.0, '1'),
+        (1.2, '2'),
+    )
+    @ddt.unpack
+    def test_retry_after(self, wait, expected):
+        """
+        test the Retry-After value is rounded up to whole seconds
+        """
+        self.assertEqual(expected, RateLimiter.retry_after(wait))
+
+
+class TestSessionRateLimit(unittest.TestCase):
+    """
+    Test enforcing the rate limits on session requests
+    """
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        for session_id in tuple(global_sessions.keys()):
+            del global_sessions[session_id]
+
+    def test_throttle_unlimited(self):
+        """
+        test a session without rate limits never throttles
+        """
+        session = Session('session-id', [HelloService])
+        self.assertIsNone(session.rate_limiter)
+        self.assertIsNone(session.throttle('hello'))
+
+    def test_request(self):
+        """
+        test the manager answers limited requests with a 429
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+        session_id = manager.create_session(
+            rate_limiter=RateLimiter.from_config({'rate': 1, 'burst': 2})
+        )
+        session = global_sessions[session_id]
+
+        results = [
+            manager.request(
+                'GET',
+                None,
+                u'/{0}/hello/'.format(session_id),
+                {}
+            )
+            for _ in range(3)
+        ]
+        self.assertEqual([200, 200, 429], [result[0] for result in results])
+        self.assertEqual({'Retry-After': '1'}, results[2][1])
+        self.assertEqual({200: 2, 429: 1}, session.status_tracker)
+        self.assertEqual(2, session.access_count)
+
+        # the limits survive a reset and a checkpoint
+        manager.reset_session(session_id)
+        session = global_sessions[session_id]
+        self.assertEqual(
+            {'rate': 1.0, 'burst': 2.0},
+            session.rate_limiter.config()
+        )
+        state, _ = session.export_state()
+        self.assertEqual({'rate': 1.0, 'burst': 2.0}, state['rate_limit'])
@@ -0,0 +1,221 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.recorder.Recorder testing
+"""
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from stackinawsgi.session.recorder import (
+    Recorder,
+    read_request_body
+)
+from stackinawsgi.wsgi.request import Request
+from stackinawsgi.test.helpers import make_environment
+
+
+class TestSessionRecorder(unittest.TestCase):
+    """
+    Test the session traffic recorder
+    """
+
+    def setUp(self):
+        """
+        configure env for the test
+        """
+        self.journal_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.journal_dir, 'session.jsonl')
+        self.recorders = []
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        for recorder in self.recorders:
+            recorder.close()
+        shutil.rmtree(self.journal_dir)
+
+    def helper_recorder(self, **kwargs):
+        """
+        Create a recorder that is closed on teardown
+        """
+        recorder = Recorder(self.path, **kwargs)
+        self.recorders.append(recorder)
+        return recorder
+
+    def helper_request(self, body=b''):
+        """
+        Build a request with the given body
+        """
+        environment = make_environment(
+            self,
+            method='POST',
+            path=u'/hello/',
+            headers={'x-test': 'value'}
+        )
+        environment['wsgi.input'] = io.BytesIO(body)
+        environment['CONTENT_LENGTH'] = str(len(body))
+        environment['CONTENT_TYPE'] = 'application/json'
+        return Request(environment)
+
+    def helper_entries(self, recorder):
+        """
+        Read back the journal entries
+        """
+        data = b''.join(recorder.iter_journal()).decode('utf-8')
+        return [json.loads(line) for line in data.splitlines()]
+
+    def test_read_request_body(self):
+        """
+        Test the request body remains readable after being recorded
+        """
+        request = self.helper_request(b'payload')
+        self.assertEqual(b'payload', read_request_body(request))
+        self.assertEqual(b'payload', request.stream.read())
+        self.assertIs(request.stream, request.environment['wsgi.input'])
+
+        request.environment['CONTENT_LENGTH'] = 'bad'
+        self.assertEqual(b'', read_request_body(request))
+
+    def test_capture(self):
+        """
+        Test capturing an exchange writes a journal entry
+        """
+        recorder = self.helper_recorder()
+        request = self.helper_request(b'payload')
+        calls = []
+
+        def call(*args):
+            calls.append(args)
+            return (201, {}, 'created')
+
+        result = recorder.capture(
+            call, 'POST', request, 'session/hello/', {}, '/hello/'
+        )
+        self.assertEqual((201, {}, 'created'), result)
+        self.assertEqual(
+            [('POST', request, 'session/hello/', {})],
+            calls
+        )
+
+        entries = self.helper_entries(recorder)
+        self.assertEqual(1, len(entries))
+        entry = entries[0]
+        self.assertEqual('POST', entry['method'])
+        self.assertEqual('/hello/', entry['uri'])
+        self.assertEqual(201, entry['status'])
+        self.assertEqual('value', entry['headers']['x-test'])
+        self.assertEqual('application/json', entry['headers']['CONTENT_TYPE'])
+        self.assertEqual('7', entry['headers']['CONTENT_LENGTH'])
+        self.assertIsNotNone(entry['request_digest'])
+        self.assertIsNotNone(entry['response_digest'])
+        self.assertGreaterEqual(entry['duration'], 0)
+        self.assertNotIn('request_body', entry)
+
+    def test_capture_with_bodies(self):
+        """
+        Test the bodies are stored when requested
+        """
+        recorder = self.helper_recorder(include_bodies=True)
+        recorder.capture(
+            lambda *args: (200, {}, b'response'),
+            'POST', self.helper_request(b'payload'), '', {}, '/hello/'
+        )
+        recorder.capture(
+            lambda *args: (200, {}, iter([b'streamed'])),
+            'POST', self.helper_request(b'payload'), '', {}, '/hello/'
+        )
+
+        entries = self.helper_entries(recorder)
+        self.assertEqual(
+            b'payload',
+            base64.b64decode(entries[0]['request_body'])
+        )
+        self.assertEqual(
+            b'response',
+            base64.b64decode(entries[0]['response_body'])
+        )
+        self.assertIsNone(entries[1]['response_digest'])
+        self.assertNotIn('response_body', entries[1])
+
+    def test_capture_invalid_result(self):
+        """
+        Test the result is returned even if it cannot be recorded
+        """
+        recorder = self.helper_recorder()
+        result = recorder.capture(
+            lambda *args: (200, {}),
+            'POST', self.helper_request(b'payload'), '', {}, '/hello/'
+        )
+        self.assertEqual((200, {}), result)
+        self.assertEqual([], self.helper_entries(recorder))
+
+    def test_write_failure(self):
+        """
+        Test the writer keeps going after an entry fails to serialize
+        """
+        recorder = self.helper_recorder()
+        recorder.record({'index': object()})
+        recorder.record({'index': 1})
+        self.assertEqual([{'index': 1}], self.helper_entries(recorder))
+
+    def test_iter_journal_missing(self):
+        """
+        Test journals rotated away while streaming are skipped
+        """
+        recorder = self.helper_recorder()
+        recorder.record({'index': 1})
+        missing = os.path.join(self.journal_dir, 'missing.jsonl')
+        with mock.patch.object(
+                Recorder,
+                'journals',
+                new_callable=mock.PropertyMock,
+                return_value=[missing, self.path]):
+            self.assertEqual([{'index': 1}], self.helper_entries(recorder))
+
+    def test_rotation(self):
+        """
+        Test the journal is rotated by size
+        """
+        recorder = self.helper_recorder(max_bytes=200, backup_count=2)
+        for index in range(10):
+            recorder.record({'index': index, 'padding': 'x' * 50})
+        recorder.flush()
+
+        self.assertEqual(3, len(recorder.journals))
+        for path in recorder.journals:
+            self.assertLessEqual(os.path.getsize(path), 200)
+
+        indexes = [entry['index'] for entry in self.helper_entries(recorder)]
+        self.assertEqual(sorted(indexes), indexes)
+        self.assertEqual(9, indexes[-1])
+
+    def test_rotation_without_backups(self):
+        """
+        Test the journal is truncated when no backups are kept
+        """
+        recorder = self.helper_recorder(max_bytes=100, backup_count=0)
+        for index in range(4):
+            recorder.record({'index': index, 'padding': 'x' * 50})
+        recorder.flush()
+        self.assertEqual([self.path], recorder.journals)
+        self.assertEqual(
+            [3],
+            [entry['index'] for entry in self.helper_entries(recorder)]
+        )
+
+    def test_record_drops_when_full(self):
+        """
+        Test entries are dropped rather than blocking the caller
+        """
+        recorder = self.helper_recorder(queue_size=1)
+        with recorder._file_lock:
+            # the writer blocks on the file lock, filling the queue
+            results = [recorder.record({'index': i}) for i in range(5)]
+        self.assertIn(False, results)
+        self.assertEqual(results.count(False), recorder.dropped)
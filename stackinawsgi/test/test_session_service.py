@@ -2,6 +2,9 @@
 Stack-In-A-WSGI: stackinawsgi.session.service.StackInAWsgiSessionManager
 """
 
+import os
+import shutil
+import tempfile
 import unittest
 import uuid
 
@@ -9,7 +12,8 @@ from stackinabox.services.service import StackInABoxService
 from stackinabox.services.hello import HelloService
 
 from stackinawsgi.exceptions import (
-    InvalidSessionId
+    InvalidSessionId,
+    SessionExists
 )
 from stackinawsgi.session.service import (
     global_sessions,
@@ -20,6 +24,34 @@ from stackinawsgi.wsgi.response import Response
 from stackinawsgi.test.helpers import make_environment
 
 
+class SeededService(StackInABoxService):
+    """
+    Service keeping the number of items seeded into it
+    """
+
+    def __init__(self):
+        """
+        Register the end-points
+        """
+        super(SeededService, self).__init__('seeded')
+        self.items = 0
+        self.register(StackInABoxService.POST, '/', SeededService.seed)
+        self.register(StackInABoxService.GET, '/', SeededService.count)
+
+    def seed(self, request, uri, headers):
+        """
+        Add an item
+        """
+        self.items = self.items + 1
+        return (201, {}, '')
+
+    def count(self, request, uri, headers):
+        """
+        Return the number of items
+        """
+        return (200, {}, str(self.items))
+
+
 class TestSessionManager(unittest.TestCase):
     """
     Test the interaction of StackInAWSGI's Session Manager
@@ -98,6 +130,18 @@ class TestSessionManager(unittest.TestCase):
         manager.register_service(HelloService)
         self.assertEqual(len(manager.services), 1)
 
+    def test_service_map(self):
+        """
+        test the service map is computed once per registered service list
+        """
+        manager = StackInAWsgiSessionManager()
+        self.assertEqual({}, manager.service_map)
+
+        manager.register_service(HelloService)
+        service_map = manager.service_map
+        self.assertEqual({'hello': 'HelloService'}, service_map)
+        self.assertIs(service_map, manager.service_map)
+
     def test_create_session_no_session_id(self):
         """
         test creating a session
@@ -125,6 +169,30 @@ class TestSessionManager(unittest.TestCase):
         )
         self.assertIn(session_id, global_sessions)
 
+    def test_create_session_with_invalid_session_id(self):
+        """
+        test session ids with path separators are rejected
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+
+        with self.assertRaises(InvalidSessionId):
+            manager.create_session(session_id='../../tmp/evil')
+        self.assertNotIn('../../tmp/evil', global_sessions)
+        self.assertIsNone(manager.restore_session('../../tmp/evil'))
+
+    def test_create_session_with_reserved_session_id(self):
+        """
+        test the session ids of the admin resources are rejected
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+
+        for session_id in ('bulk', 'events'):
+            with self.assertRaises(InvalidSessionId):
+                manager.create_session(session_id=session_id)
+            self.assertNotIn(session_id, global_sessions)
+
     def test_create_an_existing_session(self):
         """
         test creating a session using an existing session id
@@ -157,6 +225,19 @@ class TestSessionManager(unittest.TestCase):
         manager.reset_session(session_id)
         self.assertIn(session_id, global_sessions)
 
+    def test_reset_session_keeps_profiler(self):
+        """
+        test the profiler of a session is kept when it is reset
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+
+        session_id = manager.create_session()
+        profiler = global_sessions[session_id].profiler = object()
+
+        manager.reset_session(session_id)
+        self.assertIs(profiler, global_sessions[session_id].profiler)
+
     def test_reset_session_invalid_session_id(self):
         """
         test reseting an invalid session id
@@ -166,6 +247,26 @@ class TestSessionManager(unittest.TestCase):
         with self.assertRaises(InvalidSessionId):
             manager.reset_session('some invalid id')
 
+    def test_recording(self):
+        """
+        test starting and stopping the journal of a session
+        """
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        manager = StackInAWsgiSessionManager(
+            journal_dir=os.path.join(journal_dir, 'journals')
+        )
+        manager.register_service(HelloService)
+        session_id = manager.create_session()
+
+        manager.stop_recording(session_id)
+        recorder = manager.start_recording(session_id)
+        self.assertTrue(os.path.isdir(manager.journal_dir))
+        self.assertIs(recorder, manager.start_recording(session_id))
+
+        manager.stop_recording(session_id)
+        self.assertIsNone(global_sessions[session_id].recorder)
+
     def test_remove_session(self):
         """
         test removing a session
@@ -179,6 +280,178 @@ class TestSessionManager(unittest.TestCase):
         manager.remove_session(session_id)
         self.assertNotIn(session_id, global_sessions)
 
+    def test_session_events(self):
+        """
+        test the session lifecycle and tracker events
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+
+        session_id = manager.create_session()
+        manager.create_session(session_id)
+        manager.request('GET', None, u'/{0}/hello/'.format(session_id), {})
+        manager.request('GET', None, u'/{0}/hello/'.format(session_id), {})
+        manager.reset_session(session_id)
+        manager.remove_session(session_id)
+
+        events = manager.events.since(0)['events']
+        self.assertEqual(
+            ['created', 'updated', 'reset', 'removed'],
+            [event['event'] for event in events]
+        )
+        self.assertEqual(
+            set([session_id]),
+            set(event['session-id'] for event in events)
+        )
+        self.assertEqual(
+            {'access-count': 2, 'status': {200: 2}},
+            events[1]['data']
+        )
+
+    def test_clone_session(self):
+        """
+        test cloning a session into new sessions
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+        manager.register_service(SeededService)
+
+        session_id = manager.create_session()
+        seed_uri = u'/{0}/seeded/'.format(session_id)
+        manager.request('POST', None, seed_uri, {})
+        manager.request('POST', None, seed_uri, {})
+        global_sessions[session_id].hold['key'] = b'value'
+
+        cursor = manager.events.since(None)['version']
+        clone_ids = manager.clone_session(session_id, ['shard-1'], 2)
+        self.assertEqual(3, len(clone_ids))
+        self.assertEqual('shard-1', clone_ids[0])
+        self.assertEqual(
+            ['created'] * 3,
+            [event['event'] for event in manager.events.since(cursor)[
+                'events'
+            ]]
+        )
+
+        for clone_id in clone_ids:
+            clone = global_sessions[clone_id]
+            self.assertEqual(0, clone.access_count)
+            self.assertEqual({}, clone.status_tracker)
+            self.assertEqual(b'value', clone.hold['key'])
+            self.assertTrue(clone.dirty)
+            result = manager.request(
+                'GET', None, u'/{0}/seeded/'.format(clone_id), {}
+            )
+            self.assertEqual((200, '2'), (result[0], result[2]))
+            # services that were not used stay lazy
+            self.assertEqual(['seeded'], list(clone._stack.services))
+
+        # the clones are independent of the source and of each other
+        manager.request(
+            'POST', None, u'/{0}/seeded/'.format(clone_ids[0]), {}
+        )
+        for target_id, expected in (
+                (session_id, '2'), (clone_ids[0], '3'), (clone_ids[1], '2')):
+            result = manager.request(
+                'GET', None, u'/{0}/seeded/'.format(target_id), {}
+            )
+            self.assertEqual(expected, result[2])
+
+    def test_clone_session_unpicklable(self):
+        """
+        test cloning a session whose state cannot be pickled
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+        session_id = manager.create_session()
+        global_sessions[session_id].hold['callback'] = lambda: 'called'
+
+        clone_id, = manager.clone_session(session_id, count=1)
+        self.assertEqual(
+            'called',
+            global_sessions[clone_id].hold['callback']()
+        )
+
+    def test_clone_session_base_url(self):
+        """
+        test the clones only take over a base URL under the source session
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+        session_id = manager.create_session()
+
+        clone_id, = manager.clone_session(session_id, count=1)
+        self.assertEqual(clone_id, global_sessions[clone_id].base_url)
+
+        global_sessions[session_id].base_url = 'custom'
+        clone_id, = manager.clone_session(session_id, count=1)
+        self.assertEqual('custom', global_sessions[clone_id].base_url)
+
+    def test_clone_session_invalid(self):
+        """
+        test cloning an invalid session or into an existing session
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+        session_id = manager.create_session()
+        other_id = manager.create_session()
+
+        with self.assertRaises(InvalidSessionId):
+            manager.clone_session('some-invalid-id', count=1)
+        with self.assertRaises(SessionExists):
+            manager.clone_session(session_id, ['new-id', other_id])
+        self.assertNotIn('new-id', global_sessions)
+        for target_id in ('events', '../evil'):
+            with self.assertRaises(ValueError):
+                manager.clone_session(session_id, [target_id])
+            self.assertNotIn(target_id, global_sessions)
+
+    def test_clone_session_concurrent_create(self):
+        """
+        test a session created while the clones are built is not replaced
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+        session_id = manager.create_session()
+        build_session = manager._build_session
+
+        def racing_build_session(target_id, rate_limiter):
+            manager._build_session = build_session
+            manager.create_session(target_id)
+            return build_session(target_id, rate_limiter)
+
+        manager._build_session = racing_build_session
+        with self.assertRaises(SessionExists):
+            manager.clone_session(session_id, ['racing-id'])
+        self.assertEqual(0, global_sessions['racing-id'].hold.used)
+        self.assertEqual(
+            ['created', 'created'],
+            [event['event'] for event in manager.events.since(0)['events']]
+        )
+
+    def test_create_session_concurrent_create(self):
+        """
+        test a session created while another is built is not replaced
+        """
+        manager = StackInAWsgiSessionManager()
+        manager.register_service(HelloService)
+        build_session = manager._build_session
+        racing_sessions = []
+
+        def racing_build_session(session_id, rate_limiter):
+            manager._build_session = build_session
+            manager.create_session(session_id)
+            racing_sessions.append(global_sessions[session_id])
+            return build_session(session_id, rate_limiter)
+
+        manager._build_session = racing_build_session
+        self.assertEqual('racing-id', manager.create_session('racing-id'))
+        self.assertIs(racing_sessions[0], global_sessions['racing-id'])
+        self.assertEqual(
+            ['created'],
+            [event['event'] for event in manager.events.since(0)['events']]
+        )
+
     def test_remove_invalid_session(self):
         """
         test removing an invalid session id
@@ -1,6 +1,7 @@
 """
 Stack-In-A-WSGI: stackinawsgi.session.session.Session testing
 """
+import collections
 import unittest
 from threading import Lock
 import uuid
@@ -10,13 +11,44 @@ import mock
 
 from stackinabox.stack import StackInABox
 from stackinabox.services.hello import HelloService
+from stackinabox.services.service import StackInABoxService
 
 from stackinawsgi.exceptions import (
     InvalidSessionId,
     InvalidServiceList,
     NoServicesProvided
 )
-from stackinawsgi.session.session import Session
+from stackinawsgi.session.session import Session, service_routes
+
+
+class ResetCountingService(StackInABoxService):
+    """
+    Service counting how many times it was reset
+    """
+
+    resets = 0
+
+    def __init__(self):
+        """
+        Register the single end-point
+        """
+        super(ResetCountingService, self).__init__('counting')
+        self.register(
+            StackInABoxService.GET, '/', ResetCountingService.handler
+        )
+
+    def handler(self, request, uri, headers):
+        """
+        Return ok
+        """
+        return (200, headers, 'ok')
+
+    def reset(self):
+        """
+        Count the reset
+        """
+        ResetCountingService.resets = ResetCountingService.resets + 1
+        super(ResetCountingService, self).reset()
 
 
 @ddt.ddt
@@ -158,6 +190,239 @@ class TestSessionSession(unittest.TestCase):
         self.assertIn(result[0], session.status_tracker)
         self.assertEqual(1, session.status_tracker[result[0]])
 
+    def test_call_profiled(self):
+        """
+        test the session calls run under the profiler of the session
+        """
+        result = (200, {}, 'ok')
+        session = Session(self.session_id, self.services)
+        session.stack.call = mock.Mock(return_value=result)
+        session.faults = mock.Mock()
+        session.faults.call.return_value = result
+        session.profiler = mock.Mock()
+        session.profiler.runcall.side_effect = (
+            lambda func, *args, **kwargs: func(*args, **kwargs)
+        )
+
+        self.assertEqual(result, session.call('hello', 'world'))
+        self.assertEqual(1, session.profiler.runcall.call_count)
+        session.faults.call.assert_called_once_with(
+            session.stack.call,
+            'hello',
+            'world'
+        )
+
+    def test_tracker_version(self):
+        """
+        test the tracker version changes with the tracker values
+        """
+        session = Session(self.session_id, self.services)
+        session.stack.call = mock.Mock(return_value=(200, {}, 'ok'))
+        versions = [session.tracker_version]
+
+        session.call('hello', 'world')
+        versions.append(session.tracker_version)
+        session.reset()
+        versions.append(session.tracker_version)
+        session.import_state(session.export_state()[0], {})
+        versions.append(session.tracker_version)
+        self.assertEqual(sorted(set(versions)), versions)
+
+    def test_import_state_replaces_service(self):
+        """
+        test an imported service replaces the one already created
+        """
+        session = Session(self.session_id, self.services)
+        created = session.stack.services['hello'][1]
+        imported = HelloService()
+
+        session.import_state(
+            session.export_state()[0],
+            {'hello': imported}
+        )
+        self.assertIsNot(created, session.stack.services['hello'][1])
+        self.assertIs(imported, session.stack.services['hello'][1])
+
+    def test_deferred_stack(self):
+        """
+        test the stack and services are created on first use
+        """
+        session = Session(self.session_id, self.services)
+        self.assertFalse(hasattr(session, '__dict__'))
+        self.assertIsNone(session._stack)
+        self.assertEqual(self.session_id, session.base_url)
+
+        state, services = session.export_state()
+        self.assertEqual({}, services)
+        self.assertEqual(self.session_id, state['base_url'])
+        self.assertIsNone(session._stack)
+
+        session.base_url = 'deferred'
+        session.reset()
+        self.assertIsNone(session._stack)
+        self.assertEqual('deferred', session.stack.base_url)
+        self.assertIs(session.hold, session.stack.holds)
+
+        stack = session.stack
+        self.assertIs(stack, session.stack)
+        session.reset()
+        self.assertIsNone(session._stack)
+        self.assertEqual('deferred', session.base_url)
+
+    def test_deferred_state(self):
+        """
+        test the lock, hold and fixtures are created on first use
+        """
+        session = Session(self.session_id, self.services, hold_quota=10)
+        state, _ = session.export_state()
+        self.assertEqual({}, state['hold'])
+        self.assertEqual(({}, []), state['fixtures'])
+        session.reset()
+        session.post_fork()
+        self.assertIsNone(session._hold)
+        self.assertIsNone(session._fixtures)
+
+        lock = session.lock
+        self.assertIs(lock, session.lock)
+        session.post_fork()
+        self.assertIsNot(lock, session.lock)
+
+        hold = session.hold
+        self.assertIs(hold, session.hold)
+        self.assertEqual(10, hold.quota)
+        hold['key'] = b'value'
+        fixtures = session.fixtures
+        self.assertIs(fixtures, session.fixtures)
+        state, _ = session.export_state()
+        self.assertEqual({'key': b'value'}, state['hold'])
+
+        session.reset()
+        self.assertIs(hold, session.hold)
+        self.assertEqual(0, len(hold))
+
+        session._hold = mock.Mock()
+        session.recorder = mock.Mock()
+        session.rate_limiter = mock.Mock()
+        session.post_fork()
+        session._hold.post_fork.assert_called_once_with()
+        session.recorder.post_fork.assert_called_once_with()
+        session.rate_limiter.post_fork.assert_called_once_with()
+
+    @ddt.data(
+        ('lock', '_lock'),
+        ('hold', '_hold'),
+        ('fixtures', '_fixtures'),
+    )
+    @ddt.unpack
+    def test_deferred_state_race(self, name, slot):
+        """
+        test a value created by another thread while waiting for the
+        creation lock is used
+        """
+        session = Session(self.session_id, self.services)
+        created = object()
+        creation_lock = mock.MagicMock()
+        creation_lock.__enter__.side_effect = (
+            lambda *args: setattr(session, slot, created)
+        )
+        with mock.patch(
+                'stackinawsgi.session.session.session_creation_lock',
+                creation_lock):
+            self.assertIs(created, getattr(session, name))
+
+    def test_service_routes_cache(self):
+        """
+        test the service names are only cached for the recent service lists
+        """
+        service_lists = [
+            [HelloService],
+            [ResetCountingService],
+            [HelloService, ResetCountingService]
+        ]
+        with mock.patch(
+                'stackinawsgi.session.session.service_routes_cache_size', 2):
+            with mock.patch(
+                    'stackinawsgi.session.session.service_routes_cache',
+                    collections.OrderedDict()) as cache:
+                for services in service_lists:
+                    routes = service_routes(services)
+                    self.assertIs(routes, service_routes(services))
+                self.assertEqual(
+                    [tuple(services) for services in service_lists[1:]],
+                    list(cache)
+                )
+                self.assertEqual(
+                    ['hello', 'counting'],
+                    list(service_routes(service_lists[2]))
+                )
+
+    def test_lazy_services(self):
+        """
+        test services are created on the first request routed to them
+        """
+        session = Session(
+            self.session_id,
+            [HelloService, ResetCountingService]
+        )
+        result = session.call(
+            'GET', None, '{0}/hello/'.format(self.session_id), {}
+        )
+        self.assertEqual(200, result[0])
+        self.assertEqual(['hello'], list(session._stack.services))
+
+        result = session.call(
+            'GET', None, '{0}/unknown/'.format(self.session_id), {}
+        )
+        self.assertEqual(597, result[0])
+        self.assertEqual(['hello'], list(session._stack.services))
+
+        # only the services created are reset
+        resets = ResetCountingService.resets
+        session.reset()
+        self.assertEqual(resets, ResetCountingService.resets)
+
+        result = session.call(
+            'GET', None, '{0}/counting/'.format(self.session_id), {}
+        )
+        self.assertEqual(200, result[0])
+        self.assertEqual(['counting'], list(session._stack.services))
+        session.reset()
+        self.assertEqual(resets + 1, ResetCountingService.resets)
+
+        self.assertEqual(
+            set(['hello', 'counting']),
+            set(session.stack.services)
+        )
+
+    @ddt.data(
+        {},
+        {200: 3, 404: 1},
+        {200: 1, 418: 2, 599: 1}
+    )
+    def test_status_tracker(self, statuses):
+        """
+        test the common and the other statuses are tracked
+        """
+        session = Session(self.session_id, self.services)
+        for status, count in statuses.items():
+            for _ in range(count):
+                session._track_result((status, {}, ''))
+        self.assertEqual(statuses, session.status_tracker)
+        for status in (200, 404, 418, 500):
+            self.assertEqual(
+                statuses.get(status, 0),
+                session.status_count(status)
+            )
+
+        restored = Session(self.session_id, self.services)
+        restored.import_state(session.export_state()[0], {})
+        self.assertEqual(statuses, restored.status_tracker)
+        self.assertEqual(session.created_at, restored.created_at)
+        self.assertEqual(session.last_accessed_at, restored.last_accessed_at)
+
+        session.reset()
+        self.assertEqual({}, session.status_tracker)
+
     def test_try_handle_route(self):
         """
         test calling the session request handler
@@ -0,0 +1,277 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.shaping testing
+"""
+import random
+import unittest
+from timeit import default_timer
+
+import ddt
+
+from stackinabox.services.hello import HelloService
+from stackinabox.stack import StackInABox
+
+from stackinawsgi.session.service import global_sessions
+from stackinawsgi.session.shaping import (
+    HistogramLatency,
+    ShapedBody,
+    Shaper,
+    latency_from_config
+)
+from stackinawsgi.wsgi.app import App
+from stackinawsgi.test.helpers import (
+    WsgiMock,
+    make_environment
+)
+
+
+@ddt.ddt
+class TestLatency(unittest.TestCase):
+    """
+    Test the latency distributions
+    """
+
+    @ddt.data(
+        {'distribution': 'fixed', 'ms': 250.0},
+        {'distribution': 'normal', 'mean-ms': 100.0, 'stddev-ms': 20.0},
+        {'distribution': 'histogram', 'buckets': [[10.0, 3], [50.0, 1]]},
+    )
+    def test_config(self, config):
+        """
+        test the distributions round-trip their configuration
+        """
+        self.assertEqual(config, latency_from_config(config).config())
+
+    @ddt.data(
+        [],
+        {'distribution': 'poisson'},
+        {'distribution': 'fixed'},
+        {'distribution': 'fixed', 'ms': -1},
+        {'distribution': 'normal', 'mean-ms': None},
+        {'distribution': 'normal', 'mean-ms': -1, 'stddev-ms': 1},
+        {'distribution': 'histogram', 'buckets': [[-1, 1]]},
+        {'distribution': 'histogram', 'buckets': [[10, 0]]},
+        {'distribution': 'histogram', 'buckets': [[10]]},
+    )
+    def test_config_invalid(self, config):
+        """
+        test invalid distributions
+        """
+        with self.assertRaises(ValueError):
+            latency_from_config(config)
+
+    def test_normal(self):
+        """
+        test normal delays are reproducible and never negative
+        """
+        latency = latency_from_config(
+            {'distribution': 'normal', 'mean-ms': 1, 'stddev-ms': 100}
+        )
+        first = [latency.sample(random.Random(7)) for _ in range(50)]
+        second = [latency.sample(random.Random(7)) for _ in range(50)]
+        self.assertEqual(first, second)
+        self.assertTrue(all(delay >= 0.0 for delay in first))
+
+    def test_histogram(self):
+        """
+        test histogram delays fall in the recorded buckets
+        """
+        latency = HistogramLatency([[20, 0], [10, 1], [30, 1]])
+        rng = random.Random(1)
+        samples = [latency.sample(rng) for _ in range(200)]
+        self.assertTrue(all(
+            0.0 <= delay <= 0.01 or 0.02 <= delay <= 0.03
+            for delay in samples
+        ))
+        self.assertTrue(any(delay <= 0.01 for delay in samples))
+        self.assertTrue(any(delay >= 0.02 for delay in samples))
+
+
+@ddt.ddt
+class TestShaper(unittest.TestCase):
+    """
+    Test the session shaper
+    """
+
+    def test_config(self):
+        """
+        test the shaper round-trips its configuration
+        """
+        config = {
+            'latency': {'distribution': 'fixed', 'ms': 10.0},
+            'bandwidth': 1024.0,
+            'seed': 3,
+            'routes': [{
+                'method': 'GET',
+                'path': '^/hello/',
+                'latency': {'distribution': 'fixed', 'ms': 100.0}
+            }]
+        }
+        self.assertEqual(config, Shaper.from_config(config).config())
+
+        config = {'bandwidth': 1024.0, 'routes': []}
+        self.assertEqual(config, Shaper.from_config(config).config())
+
+    @ddt.data(None, {}, {'routes': []})
+    def test_config_none(self, config):
+        """
+        test configurations that do not shape anything
+        """
+        self.assertIsNone(Shaper.from_config(config))
+
+    @ddt.data(
+        [],
+        {'bandwidth': 0},
+        {'bandwidth': 'fast'},
+        {'bandwidth': [1]},
+        {'routes': {}},
+        {'routes': [1]},
+        {'routes': [{'path': '('}]},
+        {'routes': [{'method': 1}]},
+    )
+    def test_config_invalid(self, config):
+        """
+        test invalid configurations
+        """
+        with self.assertRaises(ValueError):
+            Shaper.from_config(config)
+
+    def test_plan(self):
+        """
+        test the first matching route overrides the session values
+        """
+        shaper = Shaper.from_config({
+            'latency': {'distribution': 'fixed', 'ms': 10},
+            'routes': [
+                {'method': 'post', 'path': '^/hello/', 'bandwidth': 100},
+                {'path': '^/hello/', 'latency': {'ms': 500}},
+                {'path': '^/hello/', 'latency': {'ms': 900}},
+            ]
+        })
+        self.assertEqual((0.01, 100.0), shaper.plan('POST', '/hello/'))
+        self.assertEqual((0.5, None), shaper.plan('GET', '/hello/'))
+        self.assertEqual((0.01, None), shaper.plan('GET', '/other/'))
+        self.assertIsNone(
+            Shaper.from_config({'routes': [
+                {'path': '^/free/', 'latency': {'ms': 0}}
+            ]}).plan('GET', '/free/')
+        )
+
+    def test_plan_seeded(self):
+        """
+        test sessions with the same seed draw the same delays
+        """
+        config = {
+            'latency': {'distribution': 'normal', 'mean-ms': 50,
+                        'stddev-ms': 10},
+            'seed': 11
+        }
+        first = Shaper.from_config(config)
+        second = Shaper.from_config(config)
+        self.assertEqual(
+            [first.plan('GET', '/') for _ in range(10)],
+            [second.plan('GET', '/') for _ in range(10)]
+        )
+
+
+class TestShapedBody(unittest.TestCase):
+    """
+    Test the shaped response body
+    """
+
+    def test_delay(self):
+        """
+        test the first chunk waits for the delay
+        """
+        start = default_timer()
+        self.assertEqual([b'ab', b'c'], list(ShapedBody([b'ab', b'c'], 0.05)))
+        self.assertGreaterEqual(default_timer() - start, 0.05)
+
+    def test_bandwidth(self):
+        """
+        test the body is split and paced to the bandwidth
+        """
+        start = default_timer()
+        chunks = list(
+            ShapedBody([b'x' * 100, b'y' * 50], 0.0, 1000.0, chunk_size=40)
+        )
+        elapsed = default_timer() - start
+        self.assertEqual(b'x' * 100 + b'y' * 50, b''.join(chunks))
+        self.assertEqual([40, 40, 20, 40, 10], [len(c) for c in chunks])
+        self.assertEqual(100, ShapedBody([], 0.0, 1000.0).chunk_size)
+        self.assertGreaterEqual(elapsed, 0.15)
+
+    def test_close(self):
+        """
+        test closing the shaped body closes the wrapped body
+        """
+        closed = []
+
+        class Body(list):
+            def close(self):
+                closed.append(True)
+
+        ShapedBody(Body(), 0.0).close()
+        self.assertEqual([True], closed)
+        ShapedBody([], 0.0).close()
+
+
+class TestAppShaping(unittest.TestCase):
+    """
+    Test the application applies the session shaping
+    """
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        StackInABox.reset_services()
+        for session_id in tuple(global_sessions.keys()):
+            del global_sessions[session_id]
+
+    def test_app(self):
+        """
+        test the response is delayed after the session lock was released
+        """
+        the_app = App([HelloService])
+        the_app.StackInABoxUriUpdate('localhost')
+        session_id = the_app.stack_service.create_session()
+        session = global_sessions[session_id]
+        session.shaper = Shaper.from_config(
+            {'latency': {'distribution': 'fixed', 'ms': 50}}
+        )
+        environment = make_environment(
+            self,
+            method='GET',
+            path=u'/stackinabox/{0}/hello/'.format(session_id)
+        )
+
+        start = default_timer()
+        body = the_app(environment, WsgiMock())
+        self.assertIsInstance(body, ShapedBody)
+        self.assertLess(default_timer() - start, 0.05)
+        self.assertFalse(session.lock.locked())
+        self.assertEqual('Hello', ''.join(body))
+        self.assertGreaterEqual(default_timer() - start, 0.05)
+
+    def test_app_unshaped_route(self):
+        """
+        test a route exempt from the shaping is served directly
+        """
+        the_app = App([HelloService])
+        the_app.StackInABoxUriUpdate('localhost')
+        session_id = the_app.stack_service.create_session()
+        global_sessions[session_id].shaper = Shaper.from_config({
+            'latency': {'distribution': 'fixed', 'ms': 500},
+            'routes': [{'path': '^/hello/', 'latency': {'ms': 0}}]
+        })
+        environment = make_environment(
+            self,
+            method='GET',
+            path=u'/stackinabox/{0}/hello/'.format(session_id)
+        )
+
+        start = default_timer()
+        body = the_app(environment, WsgiMock())
+        self.assertNotIsInstance(body, ShapedBody)
+        self.assertEqual('Hello', ''.join(body))
+        self.assertLess(default_timer() - start, 0.5)
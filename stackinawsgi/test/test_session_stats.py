@@ -0,0 +1,122 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.session.stats testing
+"""
+import unittest
+import uuid
+
+import ddt
+import mock
+
+from stackinabox.services.hello import HelloService
+
+from stackinawsgi.session.session import Session
+from stackinawsgi.session.stats import (
+    CallStats,
+    SessionStats,
+    latency_buckets_ms,
+    overflow_route,
+    route_template
+)
+
+
+@ddt.ddt
+class TestSessionStats(unittest.TestCase):
+    """
+    Test the per-service and per-route statistics
+    """
+
+    @ddt.data(
+        ('/hello/', '/hello/'),
+        ('/hello/42', '/hello/{id}'),
+        ('/hello/42/items/7?full=1', '/hello/{id}/items/{id}'),
+        ('/hello/0123456789abcdef0123', '/hello/{id}'),
+        ('/hello/{0}/x'.format(uuid.UUID(int=1)), '/hello/{id}/x'),
+        ('/hello/v2', '/hello/v2'),
+    )
+    @ddt.unpack
+    def test_route_template(self, path, expected):
+        """
+        test the id-like segments are replaced in the route templates
+        """
+        self.assertEqual(expected, route_template(path))
+
+    def test_call_stats(self):
+        """
+        test the counters and the latency histogram
+        """
+        stats = CallStats()
+        stats.record(200, 0.0005)
+        stats.record(503, 0.003)
+        stats.record(200, 60.0)
+
+        info = stats.info()
+        self.assertEqual(3, info['count'])
+        self.assertEqual(1, info['errors'])
+        self.assertEqual(len(latency_buckets_ms) + 1, len(info['histogram']))
+        self.assertEqual(1, info['histogram'][0])
+        self.assertEqual(1, info['histogram'][2])
+        self.assertEqual(1, info['histogram'][-1])
+        self.assertEqual(info, CallStats.load(stats.export()).info())
+
+        # a histogram from other bucket bounds is dropped, the counters kept
+        count, errors, total, buckets = stats.export()
+        restored = CallStats.load((count, errors, total, buckets[1:]))
+        self.assertEqual(3, restored.info()['count'])
+        self.assertEqual(
+            [0] * len(restored.buckets),
+            restored.info()['histogram']
+        )
+
+    def test_record(self):
+        """
+        test calls are counted per service and per route
+        """
+        stats = SessionStats()
+        stats.record('GET', '/hello/1', 200, 0.001)
+        stats.record('GET', '/hello/2', 200, 0.001)
+        stats.record('POST', '/hello/2', 500, 0.001)
+        stats.record('GET', '/other/', 200, 0.001)
+
+        info = stats.info()
+        self.assertEqual(
+            {'hello': 3, 'other': 1},
+            {name: s['count'] for name, s in info['services'].items()}
+        )
+        self.assertEqual(
+            {'GET /hello/{id}': 2, 'POST /hello/{id}': 1, 'GET /other/': 1},
+            {name: s['count'] for name, s in info['routes'].items()}
+        )
+        self.assertEqual(1, info['services']['hello']['errors'])
+
+        restored = SessionStats()
+        restored.load(stats.export())
+        self.assertEqual(info, restored.info())
+        restored.load(None)
+        self.assertEqual({}, restored.routes)
+
+    def test_bounded_routes(self):
+        """
+        test new routes are counted together once the limit is reached
+        """
+        stats = SessionStats(max_routes=2)
+        for index in range(10):
+            stats.record('GET', '/hello/v{0}'.format(index), 200, 0.001)
+        self.assertEqual(3, len(stats.routes))
+        self.assertEqual(8, stats.routes[('GET', overflow_route)].count)
+
+        for index in range(10):
+            stats.record('GET', '/svc{0}/'.format(index), 200, 0.001)
+        self.assertEqual(3, len(stats.services))
+        self.assertEqual(9, stats.services[overflow_route].count)
+
+    def test_session(self):
+        """
+        test the session counts its calls and clears them on reset
+        """
+        session = Session('stats', [HelloService])
+        session.call('GET', mock.Mock(environment={}), 'stats/hello/', {})
+        self.assertEqual(1, session.stats.services['hello'].count)
+        self.assertEqual(1, session.stats.routes[('GET', '/hello/')].count)
+
+        session.reset()
+        self.assertEqual({}, session.stats.services)
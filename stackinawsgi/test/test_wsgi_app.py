@@ -3,14 +3,26 @@ Stack-In-A-WSGI: wsgi.app.App testing
 """
 from __future__ import print_function
 
+import gc
+import os
+import shutil
+import tempfile
 import unittest
 
 import ddt
+import mock
 
 from stackinabox.services.hello import HelloService
+from stackinabox.services.service import StackInABoxService
 from stackinabox.stack import StackInABox
 
+from stackinawsgi.session.persistence import (
+    FileSessionStore,
+    SessionPersistence,
+    SqliteSessionStore
+)
 from stackinawsgi.wsgi.app import App
+from stackinawsgi.wsgi.compression import Compressor
 from stackinawsgi.wsgi.request import Request
 from stackinawsgi.wsgi.response import Response
 from stackinawsgi.test.helpers import (
@@ -20,6 +32,29 @@ from stackinawsgi.test.helpers import (
 )
 
 
+class InvalidHeaderService(StackInABoxService):
+    """
+    Service answering with a header value WSGI servers cannot send
+    """
+
+    def __init__(self):
+        """
+        Register the single end-point
+        """
+        super(InvalidHeaderService, self).__init__('invalid')
+        self.register(
+            StackInABoxService.GET,
+            '/',
+            InvalidHeaderService.handler
+        )
+
+    def handler(self, request, uri, headers):
+        """
+        Return a header value with a line break
+        """
+        return (200, {'X-Split': 'a\r\nX-Injected: 1'}, b'body')
+
+
 @ddt.ddt
 class TestWsgiApp(unittest.TestCase):
     """
@@ -186,6 +221,33 @@ class TestWsgiApp(unittest.TestCase):
         self.assertEqual(response.status, 200)
         self.assertEqual(response.body, 'Hello')
 
+    def test_request_headers_not_echoed(self):
+        """
+        Validate the request headers a service returns as its response
+        headers are not sent back to the client
+        """
+        the_app = App([HelloService])
+        self.helper_make_session(the_app)
+        the_app.StackInABoxUriUpdate('localhost')
+        for path in (
+            u'{0}/hello/'.format(self.session_id_uri),
+            u'/stackinabox/unknown/hello/',
+            u'/admin/{0}'.format(self.session_id)
+        ):
+            environment = make_environment(
+                self,
+                method='GET',
+                path=path,
+                headers={'COOKIE': 'a=1', 'AUTHORIZATION': 'secret'}
+            )
+            wsgi_mock = WsgiMock()
+            b''.join(
+                chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+                for chunk in the_app(environment, wsgi_mock)
+            )
+            self.assertNotIn('COOKIE', wsgi_mock.headers)
+            self.assertNotIn('AUTHORIZATION', wsgi_mock.headers)
+
     def test_handle_as_callable(self):
         """
         Validate that calling into StackInAWSGI with a loaded StackInBoxService
@@ -206,6 +268,26 @@ class TestWsgiApp(unittest.TestCase):
         self.assertEqual(wsgi_mock.status, '200 OK')
         self.assertEqual(response_body, 'Hello')
 
+    def test_handle_invalid_header(self):
+        """
+        Validate a service answering with an invalid header value yields
+        a 500 response instead of an exception
+        """
+        the_app = App([InvalidHeaderService])
+        self.helper_make_session(the_app)
+        the_app.StackInABoxUriUpdate('localhost')
+        environment = make_environment(
+            self,
+            method='GET',
+            path=u'{0}/invalid/'.format(self.session_id_uri)
+        )
+
+        wsgi_mock = WsgiMock()
+        response_body = b''.join(the_app(environment, wsgi_mock))
+        self.assertEqual('500 Internal Server Error', wsgi_mock.status)
+        self.assertEqual(b'Internal Server Error', response_body)
+        self.assertNotIn('X-Split', wsgi_mock.headers)
+
     @ddt.data(
         (160, "Unknown Informational Status"),
         (260, "Unknown Success Status"),
@@ -225,3 +307,141 @@ class TestWsgiApp(unittest.TestCase):
             the_app.response_for_status(status),
             expected_value
         )
+
+    def test_handle_with_compression(self):
+        """
+        Validate the compression stage is applied to responses when the
+        App is configured with one.
+        """
+        the_app = App([HelloService], compression=Compressor(min_size=1))
+        self.helper_make_session(the_app)
+        the_app.StackInABoxUriUpdate('localhost')
+        environment = make_environment(
+            self,
+            method='GET',
+            path=u'{0}/hello/'.format(self.session_id_uri),
+            headers={'ACCEPT_ENCODING': 'gzip'}
+        )
+
+        wsgi_mock = WsgiMock()
+        response_body = ''.join(the_app(environment, wsgi_mock))
+        self.assertEqual(wsgi_mock.status, '200 OK')
+        # HelloService does not provide a Content-Type
+        self.assertNotIn('content-encoding', wsgi_mock.headers)
+        self.assertEqual(response_body, 'Hello')
+
+    def test_session_hold(self):
+        """
+        Add and retrieve a value in a session's hold via StackInAWSGI
+        """
+        the_app = App(self.apps, hold_quota=1024)
+        self.helper_make_session(the_app)
+        the_app.StackInABoxHoldOnto(
+            'name',
+            b'value',
+            session_id=self.session_id
+        )
+        self.assertEqual(
+            b'value',
+            the_app.StackInABoxHoldOut('name', session_id=self.session_id)
+        )
+        self.assertNotIn('name', the_app.stackinabox.holds)
+        self.assertEqual(
+            1024,
+            the_app.stack_service.get_session(self.session_id).hold.quota
+        )
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_fork_hooks(self):
+        """
+        Validate a preloaded App keeps working in a forked worker after
+        the pre-fork and post-fork hooks run.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        persistence = SessionPersistence(
+            SqliteSessionStore(os.path.join(directory, 'store.db')),
+            interval=60
+        )
+        the_app = App(
+            [HelloService],
+            compression=Compressor(),
+            journal_dir=directory,
+            persistence=persistence
+        )
+        self.helper_make_session(the_app)
+        the_app.StackInABoxUriUpdate('localhost')
+        the_app.stack_service.start_recording(self.session_id)
+        self.addCleanup(
+            the_app.stack_service.remove_session,
+            self.session_id
+        )
+        self.addCleanup(persistence.stop)
+
+        the_app.pre_fork()
+        self.assertIsNone(persistence._thread)
+        if hasattr(gc, 'unfreeze'):
+            self.addCleanup(gc.unfreeze)
+
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            status = b'failed'
+            try:
+                os.close(read_end)
+                the_app.post_fork()
+                environment = make_environment(
+                    self,
+                    method='GET',
+                    path=u'{0}/hello/'.format(self.session_id_uri)
+                )
+                wsgi_mock = WsgiMock()
+                body = ''.join(the_app(environment, wsgi_mock))
+                running = persistence._thread is not None
+                if running and (wsgi_mock.status, body) == ('200 OK', 'Hello'):
+                    status = b'ok'
+            finally:
+                os.write(write_end, status)
+                os._exit(0)
+
+        os.close(write_end)
+        result = os.read(read_end, 16)
+        os.close(read_end)
+        os.waitpid(pid, 0)
+        self.assertEqual(b'ok', result)
+
+        the_app.post_fork()
+        self.assertIsNotNone(persistence._thread)
+
+    def test_fork_hooks_in_process(self):
+        """
+        Validate the fork hooks on an App without journals, with a file
+        store and on an interpreter without gc.freeze.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        persistence = SessionPersistence(
+            FileSessionStore(directory),
+            interval=60
+        )
+        the_app = App([HelloService], persistence=persistence)
+        self.helper_make_session(the_app)
+        self.addCleanup(
+            the_app.stack_service.remove_session,
+            self.session_id
+        )
+        self.addCleanup(persistence.stop)
+        session = the_app.stack_service.get_session(self.session_id)
+        session.hold['name'] = b'value'
+
+        with mock.patch(
+            'stackinawsgi.wsgi.app.gc',
+            mock.Mock(spec=['collect'])
+        ) as gc_mock:
+            the_app.pre_fork()
+        gc_mock.collect.assert_called_once_with()
+        self.assertIsNone(persistence._thread)
+
+        the_app.post_fork()
+        self.assertIsNotNone(persistence._thread)
+        self.assertEqual(b'value', session.hold['name'])
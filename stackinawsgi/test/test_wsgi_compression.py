@@ -0,0 +1,207 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.wsgi.compression.Compressor testing
+"""
+import gzip
+import io
+import unittest
+import zlib
+
+import ddt
+
+from stackinawsgi.wsgi.compression import Compressor
+from stackinawsgi.wsgi.request import Request
+from stackinawsgi.wsgi.response import Response
+from stackinawsgi.test.helpers import make_environment
+
+
+@ddt.ddt
+class TestWsgiCompression(unittest.TestCase):
+    """
+    Test the response compression stage
+    """
+
+    def setUp(self):
+        """
+        Test setup
+        """
+        self.compressor = Compressor(min_size=16)
+        self.body = b'{"key": "value"}' * 64
+
+    def tearDown(self):
+        """
+        Test Teardown
+        """
+        pass
+
+    def helper_apply(self, accept_encoding='gzip', body=None, headers=None,
+                     status=200):
+        """
+        Run the compressor against a request/response pair
+        """
+        environ_headers = {}
+        if accept_encoding is not None:
+            environ_headers['ACCEPT_ENCODING'] = accept_encoding
+
+        request = Request(
+            make_environment(self, method='GET', headers=environ_headers)
+        )
+        response = Response()
+        response.from_stackinabox(
+            status,
+            headers if headers is not None else {
+                'Content-Type': 'application/json'
+            },
+            self.body if body is None else body
+        )
+        self.compressor.apply(request, response)
+        return response
+
+    @ddt.unpack
+    @ddt.data(
+        (None, None),
+        ('', None),
+        ('identity', None),
+        ('gzip', 'gzip'),
+        ('deflate', 'deflate'),
+        ('deflate, gzip', 'gzip'),
+        ('gzip;q=0.5, deflate', 'deflate'),
+        ('gzip;q=0, deflate;q=0', None),
+        ('*', 'gzip'),
+        ('gzip;q=bad, deflate', 'deflate'),
+        ('gzip;level=1', 'gzip'),
+    )
+    def test_negotiate(self, accept_encoding, expected):
+        """
+        Test content-coding negotiation
+        """
+        self.assertEqual(expected, Compressor.negotiate(accept_encoding))
+
+    @ddt.unpack
+    @ddt.data(
+        (None, False),
+        ('application/json', True),
+        ('application/json; charset=utf-8', True),
+        ('text/plain', True),
+        ('image/png', False),
+    )
+    def test_is_compressible_type(self, content_type, expected):
+        """
+        Test the content-type allowlist
+        """
+        self.assertEqual(
+            expected,
+            self.compressor.is_compressible_type(content_type)
+        )
+
+    def test_apply_gzip(self):
+        """
+        Test compressing a bytes body with gzip
+        """
+        response = self.helper_apply()
+        self.assertEqual('gzip', response.headers['content-encoding'])
+        self.assertEqual('Accept-Encoding', response.headers['vary'])
+        self.assertEqual(
+            str(len(response.body)),
+            response.headers['content-length']
+        )
+        self.assertEqual(
+            self.body,
+            gzip.GzipFile(fileobj=io.BytesIO(response.body)).read()
+        )
+
+    def test_apply_deflate_streaming(self):
+        """
+        Test compressing an iterable body with deflate
+        """
+        response = self.helper_apply(
+            accept_encoding='deflate',
+            body=(self.body[i:i + 100] for i in range(0, len(self.body), 100))
+        )
+        self.assertEqual('deflate', response.headers['content-encoding'])
+        self.assertNotIn('content-length', response.headers)
+        self.assertEqual(
+            self.body,
+            zlib.decompress(b''.join(response.iter_body()))
+        )
+
+    def test_apply_text(self):
+        """
+        Test text bodies and chunks are compressed as UTF-8
+        """
+        text = self.body.decode('utf-8')
+        response = self.helper_apply(body=text)
+        self.assertEqual(self.body, zlib.decompress(response.body, 31))
+
+        response = self.helper_apply(
+            body=[text],
+            headers={
+                'Content-Type': 'text/plain',
+                'Content-Length': str(len(self.body))
+            }
+        )
+        self.assertEqual('gzip', response.headers['content-encoding'])
+        self.assertNotIn('content-length', response.headers)
+        self.assertEqual(
+            self.body,
+            zlib.decompress(b''.join(response.iter_body()), 31)
+        )
+
+    @ddt.data(
+        {'accept_encoding': None},
+        {'body': b'small'},
+        {'headers': {'Content-Type': 'image/png'}},
+        {'headers': {'Content-Type': 'text/plain',
+                     'Content-Encoding': 'br'}},
+        {'status': 304},
+        {'body': [b'small'],
+         'headers': {'Content-Type': 'text/plain', 'Content-Length': '5'}},
+        {'body': [b'x' * 2048],
+         'headers': {'Content-Type': 'text/plain',
+                     'Content-Length': 'lots'}},
+    )
+    def test_apply_skipped(self, kwargs):
+        """
+        Test responses that must not be compressed
+        """
+        response = self.helper_apply(**kwargs)
+        self.assertNotEqual(
+            response.headers.get('content-encoding'),
+            'gzip'
+        )
+
+    def test_apply_vary_and_etag(self):
+        """
+        Test Vary is extended and a strong ETag is weakened
+        """
+        response = self.helper_apply(
+            headers={
+                'Content-Type': 'text/plain',
+                'Vary': 'Cookie',
+                'ETag': '"abc"'
+            }
+        )
+        self.assertEqual('Cookie, Accept-Encoding', response.headers['vary'])
+        self.assertEqual('W/"abc"', response.headers['etag'])
+
+        response = self.helper_apply(
+            headers={
+                'Content-Type': 'text/plain',
+                'Vary': 'accept-encoding'
+            }
+        )
+        self.assertEqual('accept-encoding', response.headers['vary'])
+
+    def test_apply_cache(self):
+        """
+        Test compressed bodies are re-used for a repeated ETag
+        """
+        headers = {'Content-Type': 'text/plain', 'ETag': '"abc"'}
+        first = self.helper_apply(headers=dict(headers))
+        second = self.helper_apply(headers=dict(headers))
+        self.assertIs(first.body, second.body)
+
+        self.compressor.cache_size = 1
+        self.helper_apply(
+            headers={'Content-Type': 'text/plain', 'ETag': '"def"'}
+        )
+        self.assertEqual(1, len(self.compressor._cache))
@@ -0,0 +1,217 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.wsgi.etag testing
+"""
+import hashlib
+import unittest
+
+import ddt
+
+from stackinabox.services.hello import HelloService
+from stackinabox.stack import StackInABox
+
+from stackinawsgi.session.service import global_sessions
+from stackinawsgi.wsgi import etag
+from stackinawsgi.wsgi.app import App
+from stackinawsgi.wsgi.request import Request
+from stackinawsgi.wsgi.response import Response
+from stackinawsgi.test.helpers import (
+    WsgiMock,
+    make_environment
+)
+
+
+@ddt.ddt
+class TestWsgiEtag(unittest.TestCase):
+    """
+    Test the ETag and conditional GET support
+    """
+
+    def setUp(self):
+        """
+        Test setup
+        """
+        self.body = b'Response Body'
+        self.expected_etag = '"{0}"'.format(
+            hashlib.md5(self.body).hexdigest()
+        )
+
+    def tearDown(self):
+        """
+        Test Teardown
+        """
+        StackInABox.reset_services()
+        keys = tuple(global_sessions.keys())
+        for k in keys:
+            del global_sessions[k]
+
+    def test_hash_body(self):
+        """
+        Test hashing a complete body
+        """
+        self.assertEqual(self.expected_etag, etag.hash_body(self.body))
+        self.assertEqual(
+            self.expected_etag,
+            etag.hash_body(self.body.decode('utf-8'))
+        )
+        self.assertEqual(
+            etag.hash_body(b''),
+            etag.hash_body(None)
+        )
+
+    def test_hash_stream(self):
+        """
+        Test hashing an iterable body retains the chunks
+        """
+        chunks = [b'Response', b' ', b'Body']
+        result_etag, result_chunks = etag.hash_stream(
+            (chunk for chunk in chunks)
+        )
+        self.assertEqual(self.expected_etag, result_etag)
+        self.assertEqual(chunks, result_chunks)
+
+    @ddt.unpack
+    @ddt.data(
+        (None, []),
+        ('*', ['*']),
+        ('"abc"', ['"abc"']),
+        ('"abc", W/"def" ,', ['"abc"', 'W/"def"']),
+    )
+    def test_parse_if_none_match(self, value, expected):
+        """
+        Test parsing the If-None-Match header
+        """
+        self.assertEqual(expected, etag.parse_if_none_match(value))
+
+    @ddt.unpack
+    @ddt.data(
+        ('"abc"', '"abc"', True),
+        ('"abc"', 'W/"abc"', True),
+        ('"abc"', '"def", "abc"', True),
+        ('"abc"', '*', True),
+        ('"abc"', '"def"', False),
+    )
+    def test_etag_matches(self, current, if_none_match, expected):
+        """
+        Test the weak comparison of entity tags
+        """
+        self.assertEqual(expected, etag.etag_matches(current, if_none_match))
+
+    def helper_apply(self, method='GET', status=200, body=None, headers=None,
+                     if_none_match=None):
+        """
+        Run apply_etag against a request/response pair
+        """
+        environ_headers = {}
+        if if_none_match is not None:
+            environ_headers['IF_NONE_MATCH'] = if_none_match
+
+        request = Request(
+            make_environment(self, method=method, headers=environ_headers)
+        )
+        response = Response()
+        response.from_stackinabox(
+            status,
+            headers or {},
+            self.body if body is None else body
+        )
+        etag.apply_etag(request, response)
+        return response
+
+    def test_apply_etag(self):
+        """
+        Test a successful GET is tagged
+        """
+        response = self.helper_apply()
+        self.assertEqual(200, response.status)
+        self.assertEqual(self.expected_etag, response.headers['etag'])
+        self.assertEqual(self.body, response.body)
+
+    def test_apply_etag_streaming(self):
+        """
+        Test a successful GET with an iterable body is tagged
+        """
+        response = self.helper_apply(
+            body=(chunk for chunk in [b'Response ', b'Body'])
+        )
+        self.assertEqual(self.expected_etag, response.headers['etag'])
+        self.assertEqual(self.body, b''.join(response.iter_body()))
+
+    @ddt.unpack
+    @ddt.data(
+        ('POST', 200),
+        ('GET', 404),
+    )
+    def test_apply_etag_skipped(self, method, status):
+        """
+        Test only successful GET/HEAD responses are tagged
+        """
+        response = self.helper_apply(method=method, status=status)
+        self.assertNotIn('etag', response.headers)
+
+    def test_apply_etag_service_provided(self):
+        """
+        Test a service provided ETag is preserved
+        """
+        response = self.helper_apply(
+            headers={'ETag': '"service"'},
+            if_none_match='"service"'
+        )
+        self.assertEqual(304, response.status)
+        self.assertEqual('"service"', response.headers['etag'])
+
+    def test_apply_etag_not_modified(self):
+        """
+        Test a matching If-None-Match yields a 304 without a body
+        """
+        response = self.helper_apply(
+            headers={'Content-Length': '13', 'Cache-Control': 'no-cache'},
+            if_none_match=self.expected_etag
+        )
+        self.assertEqual(304, response.status)
+        self.assertEqual(b'', response.body)
+        self.assertIn('etag', response.headers)
+        self.assertIn('cache-control', response.headers)
+        self.assertNotIn('content-length', response.headers)
+
+    def test_apply_etag_modified(self):
+        """
+        Test a non-matching If-None-Match yields the full response
+        """
+        response = self.helper_apply(if_none_match='"stale"')
+        self.assertEqual(200, response.status)
+        self.assertEqual(self.body, response.body)
+
+    def test_app_conditional_get(self):
+        """
+        Test the App answers a repeated poll with a 304
+        """
+        the_app = App([HelloService], etags=True)
+        session_id = the_app.stack_service.create_session()
+        the_app.StackInABoxUriUpdate('localhost')
+        path = u'/stackinabox/{0}/hello/'.format(session_id)
+
+        wsgi_mock = WsgiMock()
+        response_body = ''.join(
+            the_app(
+                make_environment(self, method='GET', path=path),
+                wsgi_mock
+            )
+        )
+        self.assertEqual('200 OK', wsgi_mock.status)
+        self.assertEqual('Hello', response_body)
+        self.assertEqual(etag.hash_body('Hello'), wsgi_mock.headers['etag'])
+
+        wsgi_mock = WsgiMock()
+        response_body = b''.join(
+            the_app(
+                make_environment(
+                    self,
+                    method='GET',
+                    path=path,
+                    headers={'IF_NONE_MATCH': etag.hash_body('Hello')}
+                ),
+                wsgi_mock
+            )
+        )
+        self.assertEqual('304 Not Modified', wsgi_mock.status)
+        self.assertEqual(b'', response_body)
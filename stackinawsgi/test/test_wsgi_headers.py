@@ -0,0 +1,172 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.wsgi.headers testing
+"""
+import unittest
+
+import ddt
+import mock
+
+from stackinabox.util.tools import CaseInsensitiveDict
+
+from stackinawsgi.wsgi.headers import (
+    Headers,
+    header_name,
+    header_value
+)
+
+
+@ddt.ddt
+class TestWsgiHeaders(unittest.TestCase):
+    """
+    Test the response header container
+    """
+
+    def test_pairs(self):
+        """
+        test the headers are kept as the pairs for start_response
+        """
+        headers = Headers({'Content-Type': 'text/plain'})
+        headers['X-Count'] = 3
+        headers.add('Set-Cookie', 'a=1')
+        headers.add('Set-Cookie', 'b=2')
+        self.assertEqual(
+            [
+                ('Content-Type', 'text/plain'),
+                ('X-Count', '3'),
+                ('Set-Cookie', 'a=1'),
+                ('Set-Cookie', 'b=2')
+            ],
+            headers.wsgi_headers()
+        )
+        self.assertIs(headers.wsgi_headers(), headers.wsgi_headers())
+        self.assertEqual(headers.wsgi_headers(), headers.items())
+        self.assertEqual(['a=1', 'b=2'], headers.get_all('set-cookie'))
+
+    def test_lookup(self):
+        """
+        test the lookups are case insensitive
+        """
+        headers = Headers()
+        headers['Content-Type'] = 'text/plain'
+        headers['ETag'] = '"a"'
+
+        self.assertEqual('text/plain', headers['content-type'])
+        self.assertIn('etag', headers)
+        self.assertNotIn('vary', headers)
+        self.assertNotIn(None, headers)
+        self.assertEqual('"a"', headers.get('ETAG'))
+        self.assertIsNone(headers.get('vary'))
+
+        # the index follows the changes
+        headers['Vary'] = 'Accept'
+        self.assertEqual('Accept', headers['vary'])
+        headers['content-type'] = 'text/html'
+        self.assertEqual('text/html', headers['Content-Type'])
+        self.assertEqual(
+            ['ETag', 'Vary', 'content-type'],
+            list(headers)
+        )
+        del headers['ETAG']
+        self.assertNotIn('etag', headers)
+        self.assertEqual('Accept', headers['vary'])
+        with self.assertRaises(KeyError):
+            del headers['etag']
+        with self.assertRaises(KeyError):
+            headers['etag']
+
+    def test_repeated_keys(self):
+        """
+        test a repeated header is one key
+        """
+        headers = Headers()
+        headers.add('Set-Cookie', 'a=1')
+        headers['Vary'] = 'Accept'
+        headers.add('set-cookie', 'b=2')
+        self.assertEqual(['Set-Cookie', 'Vary'], list(headers.keys()))
+        self.assertEqual(2, len(headers))
+        self.assertEqual(3, len(headers.items()))
+        for name in list(headers.keys()):
+            del headers[name]
+        self.assertEqual([], headers.wsgi_headers())
+
+    def test_set_new_names(self):
+        """
+        test setting new headers does not scan the pairs
+        """
+        headers = Headers()
+        with mock.patch.object(Headers, '_remove') as remove:
+            for position in range(100):
+                headers['X-Header-{0}'.format(position)] = position
+        self.assertFalse(remove.called)
+        self.assertEqual(100, len(headers))
+        self.assertEqual('42', headers['x-header-42'])
+
+    def test_equality(self):
+        """
+        test comparing the headers with other mappings
+        """
+        headers = Headers({'Content-Type': 'text/plain'})
+        self.assertEqual(headers, {'content-type': 'text/plain'})
+        self.assertEqual(
+            headers,
+            CaseInsensitiveDict({'CONTENT-TYPE': 'text/plain'})
+        )
+        self.assertNotEqual(headers, {'content-type': 'text/html'})
+        self.assertNotEqual(headers, [('Content-Type', 'text/plain')])
+
+        copy = headers.copy()
+        copy['Vary'] = 'Accept'
+        self.assertNotIn('vary', headers)
+
+    def test_repr(self):
+        """
+        test the representation shows the pairs
+        """
+        self.assertEqual(
+            "Headers([('Content-Type', 'text/plain')])",
+            repr(Headers({'Content-Type': 'text/plain'}))
+        )
+
+    @ddt.data(
+        ('Content-Type', 'Content-Type'),
+        (b'X-Bytes', 'X-Bytes'),
+        (u'X-Text', 'X-Text'),
+    )
+    @ddt.unpack
+    def test_header_name(self, name, expected):
+        """
+        test header names are converted to native strings
+        """
+        self.assertEqual(expected, header_name(name))
+        self.assertIsInstance(header_name(name), str)
+
+    @ddt.data('', 'Bad Name', 'Bad:Name', u'Caf\xe9', None, 1)
+    def test_header_name_invalid(self, name):
+        """
+        test invalid header names
+        """
+        with self.assertRaises(ValueError):
+            header_name(name)
+
+    @ddt.data(
+        (u'caf\xe9', u'caf\xe9'),
+        (b'bytes', 'bytes'),
+        (42, '42'),
+    )
+    @ddt.unpack
+    def test_header_value(self, value, expected):
+        """
+        test header values are converted to latin-1 native strings
+        """
+        self.assertEqual(expected, header_value(value))
+        self.assertIsInstance(header_value(value), str)
+
+    @ddt.data(u'snow \u2603', 'split\r\nX-Injected: 1', 'line\n')
+    def test_header_value_invalid(self, value):
+        """
+        test values that are not latin-1 or contain line breaks
+        """
+        with self.assertRaises(ValueError):
+            header_value(value)
+        with self.assertRaises(ValueError):
+            Headers({'X-Value': value})
@@ -0,0 +1,162 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.wsgi.payload testing
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from wsgiref.util import FileWrapper
+
+import ddt
+
+from stackinabox.services.service import StackInABoxService
+
+from stackinawsgi.session.service import global_sessions
+from stackinawsgi.wsgi.app import App
+from stackinawsgi.wsgi.payload import FileRegion
+from stackinawsgi.test.helpers import make_environment, WsgiMock
+
+
+class BlobService(StackInABoxService):
+    """
+    Service serving a blob from a file
+    """
+
+    path = None
+
+    def __init__(self):
+        """
+        Register the end-point
+        """
+        super(BlobService, self).__init__('blob')
+        self.register(StackInABoxService.GET, '/', BlobService.get_blob)
+
+    def get_blob(self, request, uri, headers):
+        """
+        Return the blob as a file region
+        """
+        return (
+            200,
+            {'Content-Type': 'application/octet-stream'},
+            FileRegion(BlobService.path, offset=1, chunk_size=4000)
+        )
+
+
+@ddt.ddt
+class TestWsgiPayload(unittest.TestCase):
+    """
+    Test file region bodies
+    """
+
+    def setUp(self):
+        """
+        configure env for the test
+        """
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'blob.bin')
+        self.data = bytes(bytearray(i % 251 for i in range(70000)))
+        with open(self.path, 'wb') as data_file:
+            data_file.write(self.data)
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        keys = tuple(global_sessions.keys())
+        for k in keys:
+            del global_sessions[k]
+        shutil.rmtree(self.directory)
+
+    @ddt.unpack
+    @ddt.data(
+        (0, None, 1024),
+        (1, 10, 3),
+        (65537, 100, 64),
+        (70000, 0, 64),
+    )
+    def test_iteration(self, offset, length, chunk_size):
+        """
+        Test the region is sliced from the file in chunks
+        """
+        region = FileRegion(
+            self.path,
+            offset=offset,
+            length=length,
+            chunk_size=chunk_size
+        )
+        chunks = list(region)
+        expected = self.data[offset:]
+        if length is not None:
+            expected = expected[:length]
+        self.assertEqual(expected, b''.join(chunks))
+        self.assertEqual(len(expected), len(region))
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), chunk_size)
+
+    @ddt.unpack
+    @ddt.data(
+        (-1, None),
+        (0, 70001),
+        (70001, None),
+    )
+    def test_outside_of_file(self, offset, length):
+        """
+        Test regions must be within the file
+        """
+        with self.assertRaises(ValueError):
+            FileRegion(self.path, offset=offset, length=length)
+
+    def test_region(self):
+        """
+        Test sub-regions and their entity tags
+        """
+        region = FileRegion(self.path, offset=10)
+        self.assertTrue(region.reaches_eof)
+        part = region.region(5, 15)
+        self.assertFalse(part.reaches_eof)
+        self.assertEqual(self.data[15:25], b''.join(part))
+        self.assertEqual(region.etag, FileRegion(self.path, offset=10).etag)
+        self.assertNotEqual(region.etag, part.etag)
+
+    def test_wsgi_iterable(self):
+        """
+        Test the server's file wrapper is used for regions ending at EOF
+        """
+        region = FileRegion(self.path, offset=100)
+        wrapped = region.wsgi_iterable({'wsgi.file_wrapper': FileWrapper})
+        self.assertIsInstance(wrapped, FileWrapper)
+        self.assertEqual(self.data[100:], b''.join(wrapped))
+        wrapped.close()
+
+        part = region.region(0, 10)
+        iterable = part.wsgi_iterable({'wsgi.file_wrapper': FileWrapper})
+        self.assertNotIsInstance(iterable, FileWrapper)
+        self.assertEqual(self.data[100:110], b''.join(iterable))
+
+    def test_app(self):
+        """
+        Test the App serves file regions with a Content-Length and ETag
+        """
+        BlobService.path = self.path
+        the_app = App([BlobService], etags=True)
+        the_app.StackInABoxUriUpdate('localhost')
+        session_id = the_app.stack_service.create_session()
+        environment = make_environment(
+            self,
+            method='GET',
+            path=u'/stackinabox/{0}/blob/'.format(session_id)
+        )
+        environment['wsgi.file_wrapper'] = FileWrapper
+
+        wsgi_mock = WsgiMock()
+        result = the_app(environment, wsgi_mock)
+        self.assertEqual('200 OK', wsgi_mock.status)
+        self.assertEqual(str(len(self.data) - 1),
+                         wsgi_mock.headers['content-length'])
+        self.assertEqual(
+            FileRegion(self.path, offset=1).etag,
+            wsgi_mock.headers['etag']
+        )
+        self.assertIsInstance(result, FileWrapper)
+        self.assertEqual(self.data[1:], b''.join(result))
+        result.close()
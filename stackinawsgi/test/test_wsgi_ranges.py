@@ -0,0 +1,308 @@
+"""
+Stack-In-A-WSGI: stackinawsgi.wsgi.ranges testing
+"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import ddt
+import mock
+
+from stackinabox.services.service import StackInABoxService
+
+from stackinawsgi.session.service import global_sessions
+from stackinawsgi.wsgi.app import App
+from stackinawsgi.wsgi.payload import FileRegion
+from stackinawsgi.wsgi.ranges import (
+    apply_range,
+    if_range_matches,
+    parse_range,
+    read_region
+)
+from stackinawsgi.wsgi.request import Request
+from stackinawsgi.wsgi.response import Response
+from stackinawsgi.test.helpers import make_environment, WsgiMock
+
+
+class DigitsService(StackInABoxService):
+    """
+    Service returning a small bytes body
+    """
+
+    def __init__(self):
+        """
+        Register the end-point
+        """
+        super(DigitsService, self).__init__('digits')
+        self.register(StackInABoxService.GET, '/', DigitsService.digits)
+
+    def digits(self, request, uri, headers):
+        """
+        Return the digits
+        """
+        return (200, {'Content-Type': 'text/plain'}, b'0123456789')
+
+
+@ddt.ddt
+class TestWsgiRanges(unittest.TestCase):
+    """
+    Test Range request handling
+    """
+
+    def setUp(self):
+        """
+        configure env for the test
+        """
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        clean up after the test
+        """
+        keys = tuple(global_sessions.keys())
+        for k in keys:
+            del global_sessions[k]
+        shutil.rmtree(self.directory)
+
+    def helper_apply(self, body, range_header, method='GET', headers=None,
+                     if_range=None):
+        """
+        Apply the Range stage to a 200 response
+        """
+        request_headers = {}
+        if range_header is not None:
+            request_headers['RANGE'] = range_header
+        if if_range is not None:
+            request_headers['IF_RANGE'] = if_range
+        request = Request(
+            make_environment(self, method=method, headers=request_headers)
+        )
+        response = Response()
+        response.from_stackinabox(200, headers or {}, body)
+        apply_range(request, response)
+        return response
+
+    @ddt.unpack
+    @ddt.data(
+        (None, None),
+        ('items=0-1', None),
+        ('bytes=', None),
+        ('bytes=5', None),
+        ('bytes=a-1', None),
+        ('bytes=5-1', None),
+        ('bytes=--5', None),
+        ('bytes=0-0', [(0, 1)]),
+        ('bytes=2-', [(2, 10)]),
+        ('bytes=-3', [(7, 10)]),
+        ('bytes=-30', [(0, 10)]),
+        ('bytes=8-20', [(8, 10)]),
+        ('bytes=0-1, 4-5', [(0, 2), (4, 6)]),
+        ('bytes=0-1,,4-5', [(0, 2), (4, 6)]),
+        ('bytes=10-', []),
+        ('bytes=-0', []),
+    )
+    def test_parse_range(self, value, expected):
+        """
+        Test parsing Range headers for a 10 byte representation
+        """
+        self.assertEqual(expected, parse_range(value, 10))
+
+    def test_parse_too_many_ranges(self):
+        """
+        Test requests with too many ranges are ignored
+        """
+        value = 'bytes=' + ','.join('{0}-{0}'.format(i) for i in range(100))
+        self.assertIsNone(parse_range(value, 1000))
+
+    @ddt.unpack
+    @ddt.data(
+        (None, {}, True),
+        ('"abc"', {'etag': '"abc"'}, True),
+        ('"abc"', {'etag': '"def"'}, False),
+        ('"abc"', {'etag': 'W/"abc"'}, False),
+        ('W/"abc"', {'etag': 'W/"abc"'}, False),
+        ('"abc"', {}, False),
+        ('Sat, 01 Jan 2000 00:00:00 GMT',
+         {'last-modified': 'Sat, 01 Jan 2000 00:00:00 GMT'}, True),
+        ('Sat, 01 Jan 2000 00:00:00 GMT', {}, False),
+    )
+    def test_if_range(self, if_range, headers, expected):
+        """
+        Test If-Range evaluation
+        """
+        self.assertEqual(expected, if_range_matches(if_range, headers))
+
+    @ddt.data(
+        b'0123456789',
+        u'0123456789',
+    )
+    def test_single_range(self, body):
+        """
+        Test a single range of a bytes or text body
+        """
+        response = self.helper_apply(body, 'bytes=2-4')
+        self.assertEqual(206, response.status)
+        self.assertEqual(b'234', response.body)
+        self.assertEqual('bytes 2-4/10', response.headers['content-range'])
+        self.assertEqual('3', response.headers['content-length'])
+        self.assertEqual('bytes', response.headers['accept-ranges'])
+
+    def test_seekable_body(self):
+        """
+        Test ranges of a seekable body
+        """
+        body = io.BytesIO(b'xx0123456789')
+        body.seek(2)
+        response = self.helper_apply(body, 'bytes=-2')
+        self.assertEqual(206, response.status)
+        self.assertEqual(b'89', b''.join(response.iter_body()))
+
+    def test_unseekable_body(self):
+        """
+        Test bodies failing to seek do not support ranges
+        """
+        body = mock.Mock()
+        body.tell.side_effect = IOError('not seekable')
+        response = self.helper_apply(body, 'bytes=0-1')
+        self.assertEqual(200, response.status)
+        self.assertNotIn('accept-ranges', response.headers)
+
+    def test_read_region_short_body(self):
+        """
+        Test reading a region stops at the end of a shorter body
+        """
+        self.assertEqual(
+            [b'1234'],
+            list(read_region(io.BytesIO(b'01234'), 1, 10))
+        )
+
+    def test_file_region(self):
+        """
+        Test ranges of a file region keep it a file region
+        """
+        path = os.path.join(self.directory, 'blob.bin')
+        with open(path, 'wb') as data_file:
+            data_file.write(b'0123456789')
+        response = self.helper_apply(FileRegion(path, offset=1), 'bytes=1-2')
+        self.assertEqual(206, response.status)
+        self.assertIsInstance(response.body, FileRegion)
+        self.assertEqual(b'23', b''.join(response.body))
+        self.assertEqual('bytes 1-2/9', response.headers['content-range'])
+
+    def test_multiple_ranges(self):
+        """
+        Test several ranges are sent as multipart/byteranges
+        """
+        response = self.helper_apply(
+            b'0123456789',
+            'bytes=0-1,-2',
+            headers={'Content-Type': 'text/plain'}
+        )
+        self.assertEqual(206, response.status)
+        content_type = response.headers['content-type']
+        self.assertTrue(content_type.startswith('multipart/byteranges; '))
+        boundary = content_type.split('boundary=')[1]
+
+        body = b''.join(response.iter_body())
+        self.assertEqual(str(len(body)), response.headers['content-length'])
+        self.assertEqual(
+            (
+                '\r\n--{0}\r\n'
+                'Content-Type: text/plain\r\n'
+                'Content-Range: bytes 0-1/10\r\n\r\n01'
+                '\r\n--{0}\r\n'
+                'Content-Type: text/plain\r\n'
+                'Content-Range: bytes 8-9/10\r\n\r\n89'
+                '\r\n--{0}--\r\n'
+            ).format(boundary).encode('latin-1'),
+            body
+        )
+
+    def test_multiple_ranges_seekable(self):
+        """
+        Test several ranges of a seekable body without a Content-Type
+        """
+        response = self.helper_apply(io.BytesIO(b'0123456789'), 'bytes=0-1,-2')
+        self.assertEqual(206, response.status)
+        boundary = response.headers['content-type'].split('boundary=')[1]
+
+        body = b''.join(response.iter_body())
+        self.assertEqual(str(len(body)), response.headers['content-length'])
+        self.assertEqual(
+            (
+                '\r\n--{0}\r\n'
+                'Content-Range: bytes 0-1/10\r\n\r\n01'
+                '\r\n--{0}\r\n'
+                'Content-Range: bytes 8-9/10\r\n\r\n89'
+                '\r\n--{0}--\r\n'
+            ).format(boundary).encode('latin-1'),
+            body
+        )
+
+    def test_invalid_range(self):
+        """
+        Test an invalid Range header is ignored
+        """
+        response = self.helper_apply(b'0123456789', 'items=0-1')
+        self.assertEqual(200, response.status)
+        self.assertEqual('bytes', response.headers['accept-ranges'])
+        self.assertEqual(b'0123456789', response.body)
+
+    def test_unsatisfiable(self):
+        """
+        Test unsatisfiable ranges are answered with a 416
+        """
+        response = self.helper_apply(b'0123456789', 'bytes=20-')
+        self.assertEqual(416, response.status)
+        self.assertEqual('bytes */10', response.headers['content-range'])
+        self.assertEqual(b'', response.body)
+
+    @ddt.unpack
+    @ddt.data(
+        ('HEAD', None, {}),
+        ('GET', None, {'Content-Encoding': 'gzip'}),
+        ('GET', '"old"', {'ETag': '"new"'}),
+    )
+    def test_full_response(self, method, if_range, headers):
+        """
+        Test the full body is sent when the range does not apply
+        """
+        response = self.helper_apply(
+            b'0123456789',
+            'bytes=0-1',
+            method=method,
+            headers=headers,
+            if_range=if_range
+        )
+        self.assertEqual(200, response.status)
+        self.assertEqual(b'0123456789', response.body)
+
+    def test_streaming_body(self):
+        """
+        Test streaming bodies do not support ranges
+        """
+        response = self.helper_apply(iter([b'01', b'23']), 'bytes=0-1')
+        self.assertEqual(200, response.status)
+        self.assertNotIn('accept-ranges', response.headers)
+
+    def test_app(self):
+        """
+        Test the App answers Range requests when enabled
+        """
+        the_app = App([DigitsService], etags=True, ranges=True)
+        the_app.StackInABoxUriUpdate('localhost')
+        session_id = the_app.stack_service.create_session()
+        environment = make_environment(
+            self,
+            method='GET',
+            path=u'/stackinabox/{0}/digits/'.format(session_id),
+            headers={'RANGE': 'bytes=5-'}
+        )
+
+        wsgi_mock = WsgiMock()
+        body = b''.join(the_app(environment, wsgi_mock))
+        self.assertEqual('206 Partial Content', wsgi_mock.status)
+        self.assertEqual(b'56789', body)
+        self.assertIn('etag', wsgi_mock.headers)
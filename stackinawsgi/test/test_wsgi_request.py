@@ -5,7 +5,7 @@ import unittest
 
 import ddt
 
-from stackinawsgi.wsgi.request import Request
+from stackinawsgi.wsgi.request import Request, RequestHeaders
 from stackinawsgi.test.helpers import (
     make_environment
 )
@@ -229,3 +229,34 @@ class TestWsgiRequest(unittest.TestCase):
             request.headers['x-example'],
             self.example_headers['x-example']
         )
+
+    def test_headers_assigned(self):
+        """
+        Validate only the headers set after parsing become response headers
+        """
+        request = Request(self.environment_headers)
+        self.assertIsInstance(request.headers, RequestHeaders)
+        self.assertEqual({}, request.headers.response_headers())
+
+        request.headers['content-type'] = 'text/plain'
+        request.headers.update({'x-one': '1'}, x_two='2')
+        request.headers.setdefault('x-example', 'ignored')
+        request.headers.setdefault('x-three', '3')
+        self.assertEqual(
+            self.example_headers['x-example'],
+            request.headers['x-example']
+        )
+        del request.headers['x-one']
+        request.headers.pop('x_two')
+        self.assertEqual(
+            {'content-type': 'text/plain', 'x-three': '3'},
+            request.headers.response_headers()
+        )
+
+        while 'x-three' in request.headers:
+            request.headers.popitem()
+        self.assertNotIn('x-three', request.headers.response_headers())
+
+        request.headers.clear()
+        self.assertEqual(0, len(request.headers))
+        self.assertEqual({}, request.headers.response_headers())
@@ -6,6 +6,7 @@ import unittest
 
 from stackinabox.util.tools import CaseInsensitiveDict
 
+from stackinawsgi.wsgi.headers import Headers
 from stackinawsgi.wsgi.response import Response
 
 
@@ -30,7 +31,7 @@ class TestWsgiRequest(unittest.TestCase):
         """
         Test default construction
         """
-        self.assertIsInstance(self.response.headers, CaseInsensitiveDict)
+        self.assertIsInstance(self.response.headers, Headers)
         self.assertEqual(self.response.status, 500)
         self.assertEqual(self.response._body, b'Internal Server Error')
 
@@ -87,3 +88,38 @@ class TestWsgiRequest(unittest.TestCase):
             expected_headers
         )
         self.assertEqual(self.response.body, body)
+
+    def test_not_modified(self):
+        """
+        Test the 304 drops the repeated headers not permitted for it
+        """
+        self.response.from_stackinabox(200, {'ETag': '"a"'}, b'body')
+        self.response.headers.add('Set-Cookie', 'a=1')
+        self.response.headers.add('Set-Cookie', 'b=2')
+        self.response.not_modified()
+        self.assertEqual(304, self.response.status)
+        self.assertEqual(
+            [('ETag', '"a"')],
+            self.response.headers.wsgi_headers()
+        )
+        self.assertEqual(b'', self.response.body)
+
+    def test_is_streaming(self):
+        """
+        Test detection of iterable bodies
+        """
+        self.assertFalse(self.response.is_streaming)
+        self.response.body = u'text'
+        self.assertFalse(self.response.is_streaming)
+        self.response.body = [b'chunk-1', b'chunk-2']
+        self.assertTrue(self.response.is_streaming)
+
+    def test_iter_body(self):
+        """
+        Test iterating the body as chunks
+        """
+        self.assertEqual([b'Internal Server Error'],
+                         list(self.response.iter_body()))
+        self.response.body = (chunk for chunk in [b'chunk-1', b'chunk-2'])
+        self.assertEqual([b'chunk-1', b'chunk-2'],
+                         list(self.response.iter_body()))
@@ -3,13 +3,20 @@ Stack-In-A-WSGI Application
 """
 from __future__ import absolute_import
 
+import gc
 import logging
 from collections import Iterable
 
+from . import etag, ranges
+from .payload import FileRegion
 from .request import Request
 from .response import Response
 
-from stackinawsgi.session.service import StackInAWsgiSessionManager
+from stackinawsgi.session.service import (
+    StackInAWsgiSessionManager,
+    default_hold_quota
+)
+from stackinawsgi.session import faults, shaping
 from stackinawsgi.admin.admin import StackInAWsgiAdmin
 
 from stackinabox.services.service import StackInABoxService
@@ -128,15 +135,47 @@ class App(object):
         594: "Invalid Session ID"
     }
 
-    def __init__(self, services=None):
+    def __init__(self, services=None, etags=False, compression=None,
+                 journal_dir=None, persistence=None,
+                 hold_quota=default_hold_quota, fixtures=None, ranges=False,
+                 executor=None):
         """
         Create the WSGI Application
 
         :param list services: list of :obj:`StackInABoxService`s to load into
             StackInABox.
+        :param bool etags: whether to compute a strong ETag for successful
+            GET/HEAD responses and answer matching If-None-Match requests
+            with a 304 Not Modified.
+        :param :obj:`Compressor` compression: optional compression stage
+            applied to responses when the client sends Accept-Encoding.
+        :param text_type journal_dir: optional directory for the session
+            traffic journals recorded via the admin API.
+        :param :obj:`SessionPersistence` persistence: optional session
+            checkpointing so sessions survive a worker restart.
+        :param int hold_quota: maximum number of bytes each session may keep
+            in its hold; None for unlimited.
+        :param :obj:`FixtureStore` fixtures: optional store of read-only data
+            shared by all sessions; services may also load their own data
+            via a ``stackinawsgi_fixtures(store)`` classmethod.
+        :param bool ranges: whether to answer Range and If-Range requests for
+            bytes, text, file region and seekable bodies with partial content.
+        :param :obj:`SessionExecutor` executor: optional thread pool running
+            the session calls with bounded per-session queues and timeouts
+            instead of on the server thread.
         """
+        self.etags = etags
+        self.ranges = ranges
+        self.compression = compression
         self.stackinabox = StackInABox()
-        self.stack_service = StackInAWsgiSessionManager()
+        self.stack_service = StackInAWsgiSessionManager(
+            journal_dir=journal_dir,
+            persistence=persistence,
+            hold_quota=hold_quota,
+            fixtures=fixtures,
+            executor=executor
+        )
+        self.fixtures = self.stack_service.fixtures
         self.admin_service = StackInAWsgiAdmin(
             self.stack_service,
             'http://localhost/stackinabox/'
@@ -178,6 +217,38 @@ class App(object):
                 "No services registered on initialization"
             )
 
+    def pre_fork(self):
+        """
+        Prepare the application for a pre-forking server
+
+        Call in the master process after the application and its services
+        were created and before the workers are forked, e.g. from a
+        gunicorn ``pre_fork`` server hook with ``--preload``. Background
+        threads are stopped, journals are flushed and the objects created
+        so far, including the compiled routes and the fixture data, are
+        moved out of the garbage collector's reach so the workers share
+        their memory pages copy-on-write instead of touching them.
+        """
+        logger.debug('Preparing to fork')
+        self.stack_service.pre_fork()
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+    def post_fork(self):
+        """
+        Re-initialize the per-worker state after a fork
+
+        Call in each worker after it was forked, e.g. from a gunicorn
+        ``post_fork`` server hook. Locks, store connections, the compression
+        cache lock and background threads are replaced since they cannot be
+        shared with the master.
+        """
+        logger.debug('Initializing forked worker')
+        self.stack_service.post_fork()
+        if self.compression is not None:
+            self.compression.post_fork()
+
     def RegisterWithStackInABox(self, service):
         """
         Add a :obj:`StackInABoxService` to the StackInABox instance
@@ -193,22 +264,34 @@ class App(object):
         """
         self.stack_service.reset_session(session_uuid)
 
-    def StackInABoxHoldOnto(self, name, obj):
+    def StackInABoxHoldOnto(self, name, obj, session_id=None):
         """
         Add something into the StackInABox KV store
 
         :param text_type name: name of the value for the KV store
         :param any obj: a value to associate in the KV store
+        :param text_type session_id: optional session whose hold to use
+            instead of the application wide hold
+        :raises: InvalidSessionId if the session is not found
+        :raises: HoldQuotaExceeded if the value exceeds the session quota
         """
-        self.stackinabox.into_hold(name, obj)
+        if session_id is not None:
+            self.stack_service.get_session(session_id).hold[name] = obj
+        else:
+            self.stackinabox.into_hold(name, obj)
 
-    def StackInABoxHoldOut(self, name):
+    def StackInABoxHoldOut(self, name, session_id=None):
         """
         Retrieve a value from the KV store
 
         :param text_type name: name of the value for the KV store
+        :param text_type session_id: optional session whose hold to use
+            instead of the application wide hold
         :returns: the value if the KV store associated with the given name
+        :raises: InvalidSessionId if the session is not found
         """
+        if session_id is not None:
+            return self.stack_service.get_session(session_id).hold[name]
         return self.stackinabox.from_hold(name)
 
     def StackInABoxUriUpdate(self, uri):
@@ -236,9 +319,14 @@ class App(object):
             request.url,
             request.headers
         )
+        headers = result[1]
+        if headers is request.headers:
+            # the service answered with the request headers; only send
+            # back the headers it set
+            headers = headers.response_headers()
         response.from_stackinabox(
             result[0],
-            result[1],
+            headers,
             result[2]
         )
 
@@ -277,13 +365,36 @@ class App(object):
         :param dict environ: the environment dictionary from the WSGI stack
         :param callable start_response: the start_response callable for the
             WSGI stack
-        :returns: generator for the response body
+        :returns: iterable for the response body
         """
         logger.debug('Instance ID: {0}'.format(id(self)))
         logger.debug('Environment: {0}'.format(environ))
         request = Request(environ)
         response = Response()
-        self.CallStackInABox(request, response)
+        try:
+            self.CallStackInABox(request, response)
+        except ValueError:
+            # f.e. a service answered with a header value that is not
+            # latin-1; the client still gets a response
+            logger.exception('Invalid response for {0} {1}'.format(
+                request.method,
+                request.url
+            ))
+            response = Response()
+        if self.etags:
+            etag.apply_etag(request, response)
+        if self.ranges:
+            ranges.apply_range(request, response)
+        if self.compression is not None:
+            self.compression.apply(request, response)
+        fault = environ.get(faults.environ_key)
+        if fault is not None and 'Content-Length' not in response.headers:
+            # announce the full body so clients can detect the fault
+            length = ranges.body_length(response.body)
+            if length is not None:
+                response.headers['Content-Length'] = str(length)
+        if isinstance(response.body, FileRegion):
+            response.headers['Content-Length'] = str(len(response.body))
         start_response(
             "{0} {1}".format(
                 response.status,
@@ -291,6 +402,17 @@ class App(object):
                     response.status
                 )
             ),
-            [(k, v) for k, v in response.headers.items()]
+            response.headers.wsgi_headers()
         )
-        yield response.body
+        plan = environ.get(shaping.environ_key)
+        if fault is None and plan is None:
+            if isinstance(response.body, FileRegion):
+                return response.body.wsgi_iterable(environ)
+            return response.iter_body()
+
+        body = response.iter_body()
+        if fault is not None:
+            body = faults.FaultBody(body, fault, environ)
+        if plan is not None:
+            body = shaping.ShapedBody(body, *plan)
+        return body
@@ -0,0 +1,247 @@
+"""
+Stack-In-A-WSGI Response Compression Module
+"""
+import collections
+import logging
+import threading
+import zlib
+
+import six
+
+
+logger = logging.getLogger(__name__)
+
+
+class Compressor(object):
+    """
+    Streaming gzip/deflate compression stage for the response pipeline
+
+    :ivar int min_size: bodies smaller than this many bytes are not
+        compressed
+    :ivar tuple content_types: media types (or prefixes ending in '/')
+        eligible for compression
+    :ivar int level: zlib compression level
+    :ivar int cache_size: number of compressed bodies to keep for
+        responses carrying an ETag; 0 disables the cache
+    """
+
+    # zlib window bits for each supported content-coding
+    codings = {
+        'gzip': 16 + zlib.MAX_WBITS,
+        'deflate': zlib.MAX_WBITS
+    }
+
+    # preferred coding when the client weights them equally
+    preference = ('gzip', 'deflate')
+
+    default_content_types = (
+        'text/',
+        'application/json',
+        'application/javascript',
+        'application/xml',
+    )
+
+    def __init__(self, min_size=1024, content_types=None, level=6,
+                 cache_size=128):
+        """
+        Configure the compression stage
+        """
+        self.min_size = min_size
+        self.content_types = tuple(
+            content_types
+            if content_types is not None
+            else self.default_content_types
+        )
+        self.level = level
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @classmethod
+    def negotiate(cls, accept_encoding):
+        """
+        Select the content-coding to use for the Accept-Encoding value
+
+        :param text_type accept_encoding: value of the Accept-Encoding header
+        :returns: 'gzip', 'deflate', or None if neither is acceptable
+        """
+        if not accept_encoding:
+            return None
+
+        weights = {}
+        for entry in accept_encoding.split(','):
+            parts = entry.strip().split(';')
+            coding = parts[0].strip().lower()
+            weight = 1.0
+            for param in parts[1:]:
+                name, _, value = param.strip().partition('=')
+                if name.strip().lower() == 'q':
+                    try:
+                        weight = float(value)
+                    except ValueError:
+                        weight = 0.0
+            weights[coding] = weight
+
+        best = None
+        best_weight = 0.0
+        for coding in cls.preference:
+            weight = weights.get(coding, weights.get('*', 0.0))
+            if weight > best_weight:
+                best = coding
+                best_weight = weight
+        return best
+
+    def is_compressible_type(self, content_type):
+        """
+        Check the Content-Type against the allowlist
+
+        :param text_type content_type: value of the Content-Type header
+        :returns: boolean
+        """
+        if not content_type:
+            return False
+
+        media_type = content_type.split(';')[0].strip().lower()
+        for allowed in self.content_types:
+            if allowed.endswith('/'):
+                if media_type.startswith(allowed):
+                    return True
+            elif media_type == allowed:
+                return True
+        return False
+
+    def compress_chunks(self, body, coding):
+        """
+        Compress an iterable body chunk-by-chunk
+
+        :param iterable body: iterable of bytes or text_type chunks
+        :param text_type coding: content-coding from :meth:`negotiate`
+        :returns: generator of compressed chunks
+        """
+        compressor = zlib.compressobj(
+            self.level,
+            zlib.DEFLATED,
+            self.codings[coding]
+        )
+        for chunk in body:
+            if isinstance(chunk, six.text_type):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def compress_body(self, body, coding):
+        """
+        Compress a complete body
+
+        :param bytes body: the body to compress
+        :param text_type coding: content-coding from :meth:`negotiate`
+        :returns: bytes
+        """
+        return b''.join(self.compress_chunks([body], coding))
+
+    def _cached_compress(self, etag, body, coding):
+        """
+        Compress a complete body, re-using the result for a repeated ETag
+
+        :param text_type etag: strong ETag identifying the body, or None
+        :param bytes body: the body to compress
+        :param text_type coding: content-coding from :meth:`negotiate`
+        :returns: bytes
+        """
+        if etag is None or etag.startswith('W/') or not self.cache_size:
+            return self.compress_body(body, coding)
+
+        key = (etag, coding)
+        with self._cache_lock:
+            if key in self._cache:
+                compressed = self._cache.pop(key)
+                self._cache[key] = compressed
+                return compressed
+
+        compressed = self.compress_body(body, coding)
+        with self._cache_lock:
+            self._cache[key] = compressed
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return compressed
+
+    def post_fork(self):
+        """
+        Replace the cache lock in a forked worker
+        """
+        self._cache_lock = threading.Lock()
+
+    def apply(self, request, response):
+        """
+        Compress the response if the client and the content allow it
+
+        :param :obj:`Request` request: the request being served
+        :param :obj:`Response` response: the response to update
+        """
+        # partial content describes byte offsets of the identity encoding
+        if response.status in (204, 206, 304, 416) or response.status < 200:
+            return
+
+        if 'content-encoding' in response.headers:
+            return
+
+        if not self.is_compressible_type(
+            response.headers.get('content-type')
+        ):
+            return
+
+        coding = self.negotiate(
+            request.environment.get('HTTP_ACCEPT_ENCODING')
+        )
+        if coding is None:
+            return
+
+        if response.is_streaming:
+            length = response.headers.get('content-length')
+            if length is not None:
+                try:
+                    length = int(length)
+                except ValueError:
+                    # the service sent a broken Content-Length, the body is
+                    # relayed as it is
+                    logger.debug(
+                        'Not compressing; invalid Content-Length {0}'.format(
+                            length
+                        )
+                    )
+                    return
+                if length < self.min_size:
+                    return
+            response.body = self.compress_chunks(response.body, coding)
+            if 'content-length' in response.headers:
+                del response.headers['content-length']
+
+        else:
+            body = response.body
+            if isinstance(body, six.text_type):
+                body = body.encode('utf-8')
+            if body is None or len(body) < self.min_size:
+                return
+            response.body = self._cached_compress(
+                response.headers.get('etag'),
+                body,
+                coding
+            )
+            response.headers['Content-Length'] = str(len(response.body))
+
+        logger.debug('Compressed response using {0}'.format(coding))
+        response.headers['Content-Encoding'] = coding
+
+        vary = response.headers.get('vary')
+        if not vary:
+            response.headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            response.headers['Vary'] = '{0}, Accept-Encoding'.format(vary)
+
+        # The encoded representation is no longer byte-identical to the one
+        # the strong ETag describes.
+        etag = response.headers.get('etag')
+        if etag is not None and not etag.startswith('W/'):
+            response.headers['ETag'] = 'W/{0}'.format(etag)
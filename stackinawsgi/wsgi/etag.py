@@ -0,0 +1,156 @@
+"""
+Stack-In-A-WSGI ETag Module
+"""
+import hashlib
+import logging
+
+import six
+
+from .payload import FileRegion
+
+logger = logging.getLogger(__name__)
+
+
+def _as_bytes(chunk):
+    """
+    Normalize a body chunk to bytes for hashing
+
+    :param chunk: bytes or text_type chunk of the body
+    :returns: bytes
+    """
+    if chunk is None:
+        return b''
+    if isinstance(chunk, six.text_type):
+        return chunk.encode('utf-8')
+    return chunk
+
+
+def format_etag(digest):
+    """
+    Format a hex digest as a strong entity tag
+
+    :param text_type digest: hex digest of the body
+    :returns: text_type containing the quoted entity tag
+    """
+    return '"{0}"'.format(digest)
+
+
+def hash_body(body):
+    """
+    Compute a strong ETag for a complete bytes or text body
+
+    :param body: bytes or text_type body
+    :returns: text_type containing the quoted entity tag
+    """
+    return format_etag(hashlib.md5(_as_bytes(body)).hexdigest())
+
+
+def hash_stream(body):
+    """
+    Compute a strong ETag for an iterable body
+
+    The body is hashed incrementally as each chunk is pulled from the
+    iterable. Since the ETag must be sent before the body, the chunks are
+    retained so they can still be sent to the client afterwards.
+
+    :param iterable body: iterable providing bytes or text_type chunks
+    :returns: tuple of (etag, list of chunks)
+    """
+    hasher = hashlib.md5()
+    chunks = []
+    for chunk in body:
+        hasher.update(_as_bytes(chunk))
+        chunks.append(chunk)
+    return (format_etag(hasher.hexdigest()), chunks)
+
+
+def parse_if_none_match(value):
+    """
+    Parse an If-None-Match header value
+
+    :param text_type value: value of the If-None-Match header
+    :returns: list of entity tags; ['*'] if the header matches anything
+    """
+    if value is None:
+        return []
+
+    value = value.strip()
+    if value == '*':
+        return ['*']
+
+    return [
+        tag.strip()
+        for tag in value.split(',')
+        if tag.strip()
+    ]
+
+
+def strip_weak(etag):
+    """
+    Remove the weak indicator from an entity tag
+
+    :param text_type etag: entity tag
+    :returns: text_type entity tag without the W/ prefix
+    """
+    if etag.startswith('W/'):
+        return etag[2:]
+    return etag
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Determine whether an entity tag satisfies an If-None-Match header
+
+    Per RFC-7232 Section 3.2 the comparison is the weak comparison.
+
+    :param text_type etag: entity tag of the current representation
+    :param text_type if_none_match: value of the If-None-Match header
+    :returns: boolean, True if the client already has the representation
+    """
+    tags = parse_if_none_match(if_none_match)
+    if tags == ['*']:
+        return True
+
+    current = strip_weak(etag)
+    for tag in tags:
+        if strip_weak(tag) == current:
+            return True
+    return False
+
+
+def apply_etag(request, response):
+    """
+    Add an ETag to the response and handle If-None-Match
+
+    Only successful GET and HEAD responses are tagged. If the service
+    already provided an ETag it is preserved and only used for the
+    If-None-Match comparison. :obj:`FileRegion` bodies are tagged from the
+    file's metadata instead of being read.
+
+    :param :obj:`Request` request: the request being served
+    :param :obj:`Response` response: the response to update
+    """
+    if request.method not in ('GET', 'HEAD') or response.status != 200:
+        return
+
+    if 'etag' not in response.headers:
+        if isinstance(response.body, FileRegion):
+            etag = response.body.etag
+        elif response.is_streaming:
+            etag, response.body = hash_stream(response.body)
+        else:
+            etag = hash_body(response.body)
+        response.headers['ETag'] = etag
+
+    if_none_match = request.environment.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None and etag_matches(
+        response.headers['etag'],
+        if_none_match
+    ):
+        logger.debug(
+            'ETag {0} matched If-None-Match {1}'.format(
+                response.headers['etag'],
+                if_none_match
+            )
+        )
+        response.not_modified()
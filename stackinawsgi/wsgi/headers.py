@@ -0,0 +1,208 @@
+"""
+Stack-In-A-WSGI Response Headers Module
+"""
+import re
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping, MutableMapping
+
+import six
+
+
+# RFC-7230 token characters allowed in a header name
+header_name_matcher = re.compile(r"^[!#$%&'*+\-.^_`|~0-9A-Za-z]+$")
+
+
+def header_name(name):
+    """
+    Validate a header name and convert it to a native string
+
+    :param name: header name
+    :returns: str
+    :raises: ValueError if the name is not an RFC-7230 token
+    """
+    if isinstance(name, (six.binary_type, six.text_type)):
+        name = six.ensure_str(name, 'latin-1', 'replace')
+    if not isinstance(name, str) or not header_name_matcher.match(name):
+        raise ValueError('Invalid header name: {0!r}'.format(name))
+    return name
+
+
+def header_value(value):
+    """
+    Validate a header value and convert it to a latin-1 native string
+
+    Per PEP-3333 header values are native strings containing only
+    latin-1 characters; values that are not strings are formatted.
+
+    :param value: header value
+    :returns: str
+    :raises: ValueError if the value is not latin-1 or contains a line break
+    """
+    if isinstance(value, six.text_type):
+        try:
+            value.encode('latin-1')
+        except UnicodeEncodeError:
+            raise ValueError('Header value is not latin-1: {0!r}'.format(
+                value
+            ))
+    if isinstance(value, (six.binary_type, six.text_type)):
+        value = six.ensure_str(value, 'latin-1')
+    else:
+        value = str(value)
+
+    if '\r' in value or '\n' in value:
+        raise ValueError('Header value contains a line break: {0!r}'.format(
+            value
+        ))
+    return value
+
+
+class Headers(MutableMapping):
+    """
+    Response headers stored as the list of (name, value) pairs handed to
+    the WSGI start_response callable
+
+    Names keep their case and lookups are case insensitive. An index of
+    the lower-case names is built by the first lookup or set and then kept
+    up to date, so setting a new header does not scan the pairs. Setting a
+    header replaces every header of the same name; :meth:`add` keeps them,
+    e.g. for Set-Cookie. The keys are the distinct names, in the order
+    they were first added.
+    """
+
+    __slots__ = ('_pairs', '_index')
+
+    def __init__(self, data=None):
+        """
+        :param data: optional mapping or iterable of (name, value) pairs
+        """
+        self._pairs = []
+        self._index = None
+        if data is not None:
+            self.update(data)
+
+    def _lookup(self):
+        """
+        Lower-case name to the position of its first pair, built on demand
+        """
+        if self._index is None:
+            index = {}
+            for position, (name, _) in enumerate(self._pairs):
+                index.setdefault(name.lower(), position)
+            self._index = index
+        return self._index
+
+    def _remove(self, key):
+        """
+        Remove every pair with a name
+
+        :param text_type key: lower-case header name
+        :returns: boolean, whether a pair was removed
+        """
+        pairs = [pair for pair in self._pairs if pair[0].lower() != key]
+        if len(pairs) == len(self._pairs):
+            return False
+        self._pairs[:] = pairs
+        self._index = None
+        return True
+
+    def add(self, name, value):
+        """
+        Add a header without replacing those of the same name
+
+        :param text_type name: header name
+        :param value: header value
+        :raises: ValueError if the name or value is invalid
+        """
+        name = header_name(name)
+        self._pairs.append((name, header_value(value)))
+        if self._index is not None:
+            self._index.setdefault(name.lower(), len(self._pairs) - 1)
+
+    def __setitem__(self, name, value):
+        name = header_name(name)
+        value = header_value(value)
+        key = name.lower()
+        if key in self._lookup():
+            self._remove(key)
+        self._pairs.append((name, value))
+        self._lookup().setdefault(key, len(self._pairs) - 1)
+
+    def __getitem__(self, name):
+        return self._pairs[self._lookup()[name.lower()]][1]
+
+    def __delitem__(self, name):
+        if not self._remove(name.lower()):
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        if not isinstance(name, six.string_types):
+            return False
+        return name.lower() in self._lookup()
+
+    def __iter__(self):
+        seen = set()
+        for name, _ in self._pairs:
+            key = name.lower()
+            if key not in seen:
+                seen.add(key)
+                yield name
+
+    def __len__(self):
+        return len(self._lookup())
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        pairs = dict((name.lower(), value) for name, value in self._pairs)
+        other_pairs = dict(
+            (name.lower(), value) for name, value in other.items()
+        )
+        return pairs == other_pairs
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Headers({0!r})'.format(self._pairs)
+
+    def items(self):
+        """
+        The (name, value) pairs, including repeated headers
+
+        :returns: list of tuples
+        """
+        return list(self._pairs)
+
+    def get_all(self, name):
+        """
+        Every value of a header
+
+        :param text_type name: header name
+        :returns: list of values
+        """
+        key = name.lower()
+        return [value for pair_name, value in self._pairs
+                if pair_name.lower() == key]
+
+    def copy(self):
+        """
+        :returns: :obj:`Headers` with the same pairs
+        """
+        headers = Headers()
+        headers._pairs = list(self._pairs)
+        return headers
+
+    def wsgi_headers(self):
+        """
+        The pairs for start_response, without copying
+
+        :returns: list of (str, str) tuples
+        """
+        return self._pairs
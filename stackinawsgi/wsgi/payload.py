@@ -0,0 +1,157 @@
+"""
+Stack-In-A-WSGI File Payloads
+"""
+from __future__ import absolute_import
+
+import logging
+import mmap
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class FileRegion(object):
+    """
+    Response body referencing a region of a file
+
+    Services return a :obj:`FileRegion` instead of reading a large payload
+    into memory. The region is sent in chunks sliced from a read-only memory
+    map, or handed to the server's ``wsgi.file_wrapper`` when the region
+    runs to the end of the file, so the payload is never held in memory as a
+    whole.
+
+    :ivar text_type path: the file
+    :ivar int offset: first byte of the region
+    :ivar int length: number of bytes in the region
+    :ivar int chunk_size: number of bytes per chunk sent to the server
+    """
+
+    default_chunk_size = 64 * 1024
+
+    def __init__(self, path, offset=0, length=None, chunk_size=None):
+        """
+        Reference a file region
+
+        :param text_type path: the file
+        :param int offset: first byte of the region
+        :param int length: number of bytes in the region, defaults to the
+            rest of the file
+        :param int chunk_size: number of bytes per chunk
+        :raises: ValueError if the region is not within the file
+        """
+        self.path = path
+        stat = os.stat(path)
+        self.file_size = stat.st_size
+        self.mtime = stat.st_mtime
+        if length is None:
+            length = self.file_size - offset
+        if offset < 0 or length < 0 or offset + length > self.file_size:
+            raise ValueError(
+                'Region {0}+{1} is outside of {2} ({3} bytes)'.format(
+                    offset,
+                    length,
+                    path,
+                    self.file_size
+                )
+            )
+        self.offset = offset
+        self.length = length
+        self.chunk_size = chunk_size or self.default_chunk_size
+
+    def __len__(self):
+        """
+        Number of bytes in the region
+        """
+        return self.length
+
+    @property
+    def reaches_eof(self):
+        """
+        Whether the region runs to the end of the file
+        """
+        return self.offset + self.length == self.file_size
+
+    @property
+    def etag(self):
+        """
+        Strong entity tag derived from the file's size, modification time
+        and the region, so the payload does not need to be hashed
+
+        :returns: text_type quoted entity tag
+        """
+        return '"{0:x}-{1:x}-{2:x}-{3:x}"'.format(
+            self.file_size,
+            int(self.mtime * 1000000),
+            self.offset,
+            self.length
+        )
+
+    def region(self, start, stop):
+        """
+        A sub-region of this region
+
+        :param int start: first byte relative to this region
+        :param int stop: byte after the last byte relative to this region
+        :returns: :obj:`FileRegion`
+        """
+        return FileRegion(
+            self.path,
+            offset=self.offset + start,
+            length=stop - start,
+            chunk_size=self.chunk_size
+        )
+
+    def open(self):
+        """
+        Open the file positioned at the start of the region
+
+        :returns: file object
+        """
+        data_file = open(self.path, 'rb')
+        data_file.seek(self.offset)
+        return data_file
+
+    def __iter__(self):
+        """
+        Iterate the region as chunks sliced from a memory map
+
+        :returns: generator of bytes
+        """
+        if not self.length:
+            return
+
+        # mmap offsets must be aligned to the allocation granularity
+        aligned = self.offset - (self.offset % mmap.ALLOCATIONGRANULARITY)
+        skip = self.offset - aligned
+        with open(self.path, 'rb') as data_file:
+            mapped = mmap.mmap(
+                data_file.fileno(),
+                skip + self.length,
+                access=mmap.ACCESS_READ,
+                offset=aligned
+            )
+        try:
+            position = skip
+            end = skip + self.length
+            while position < end:
+                stop = min(position + self.chunk_size, end)
+                yield mapped[position:stop]
+                position = stop
+        finally:
+            mapped.close()
+
+    def wsgi_iterable(self, environ):
+        """
+        The iterable to hand to the WSGI server
+
+        :param dict environ: the WSGI environment
+        :returns: iterable of bytes
+        """
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None and self.reaches_eof and self.length:
+            logger.debug(
+                'Serving {0} via wsgi.file_wrapper'.format(self.path)
+            )
+            return file_wrapper(self.open(), self.chunk_size)
+        return iter(self)
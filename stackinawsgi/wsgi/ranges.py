@@ -0,0 +1,287 @@
+"""
+Stack-In-A-WSGI Range Requests Module
+"""
+import binascii
+import logging
+import os
+
+import six
+
+from .payload import FileRegion
+
+
+logger = logging.getLogger(__name__)
+
+# Requests asking for more ranges than this are answered with the whole
+# representation instead
+max_ranges = 64
+
+# Number of bytes read at a time from seekable bodies
+read_chunk_size = 64 * 1024
+
+
+def parse_range(value, length):
+    """
+    Parse a Range header value per RFC-7233 Section 2.1
+
+    :param text_type value: value of the Range header
+    :param int length: length of the representation
+    :returns: None if the header is invalid and must be ignored, otherwise
+        a list of (start, stop) tuples; an empty list when none of the
+        ranges can be satisfied
+    """
+    if value is None:
+        return None
+
+    unit, _, specs = value.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+
+        first, dash, last = spec.partition('-')
+        if not dash:
+            return None
+        first = first.strip()
+        last = last.strip()
+        try:
+            if not first:
+                # suffix range: the final N bytes
+                suffix = int(last)
+                if suffix < 0:
+                    return None
+                if suffix == 0:
+                    continue
+                ranges.append((max(length - suffix, 0), length))
+                continue
+
+            start = int(first)
+            stop = int(last) + 1 if last else None
+        except ValueError:
+            return None
+
+        if start < 0 or (stop is not None and stop <= start):
+            return None
+        if start >= length:
+            continue
+        if stop is None or stop > length:
+            stop = length
+        ranges.append((start, stop))
+
+    if len(ranges) > max_ranges:
+        logger.debug('Ignoring Range header with {0} ranges'.format(
+            len(ranges)
+        ))
+        return None
+    return ranges
+
+
+def if_range_matches(if_range, headers):
+    """
+    Evaluate an If-Range header per RFC-7233 Section 3.2
+
+    :param text_type if_range: value of the If-Range header
+    :param dict headers: response headers
+    :returns: boolean, True if the Range header should be honored
+    """
+    if if_range is None:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # entity tags must match using the strong comparison
+        etag = headers.get('etag')
+        if etag is None or etag.startswith('W/'):
+            return False
+        return not if_range.startswith('W/') and etag == if_range
+
+    return headers.get('last-modified') == if_range
+
+
+def body_length(body):
+    """
+    Length of a body that supports range requests
+
+    :param body: the response body
+    :returns: int number of bytes, or None if the body does not support
+        range requests
+    """
+    if isinstance(body, (six.binary_type, FileRegion)):
+        return len(body)
+    if hasattr(body, 'seek') and hasattr(body, 'read'):
+        try:
+            position = body.tell()
+            body.seek(0, 2)
+            length = body.tell() - position
+            body.seek(position)
+            return length
+        except Exception:
+            return None
+    return None
+
+
+def read_region(body, start, stop):
+    """
+    Iterate a region of a seekable body
+
+    :param file body: file-like body
+    :param int start: first byte relative to the current position
+    :param int stop: byte after the last byte relative to the current
+        position
+    :returns: generator of bytes
+    """
+    body.seek(start, 1)
+    remaining = stop - start
+    while remaining > 0:
+        chunk = body.read(min(read_chunk_size, remaining))
+        if not chunk:
+            break
+        remaining = remaining - len(chunk)
+        yield chunk
+
+
+def slice_body(body, start, stop, base=0):
+    """
+    Select a byte range of a body
+
+    :param body: bytes, :obj:`FileRegion`, or seekable body
+    :param int start: first byte
+    :param int stop: byte after the last byte
+    :param int base: position of the first byte in a seekable body
+    :returns: bytes, :obj:`FileRegion`, or generator of bytes
+    """
+    if isinstance(body, six.binary_type):
+        return body[start:stop]
+    if isinstance(body, FileRegion):
+        return body.region(start, stop)
+    body.seek(base)
+    return read_region(body, start, stop)
+
+
+def content_range(start, stop, length):
+    """
+    Format a Content-Range header value
+
+    :returns: text_type
+    """
+    return 'bytes {0}-{1}/{2}'.format(start, stop - 1, length)
+
+
+def multipart_body(body, ranges, length, content_type, boundary, base=0):
+    """
+    Iterate a multipart/byteranges body per RFC-7233 Appendix A
+
+    :returns: generator of bytes
+    """
+    for start, stop in ranges:
+        yield part_header(start, stop, length, content_type, boundary)
+        part = slice_body(body, start, stop, base)
+        if isinstance(part, six.binary_type):
+            yield part
+        else:
+            for chunk in part:
+                yield chunk
+    yield '\r\n--{0}--\r\n'.format(boundary).encode('latin-1')
+
+
+def part_header(start, stop, length, content_type, boundary):
+    """
+    Header of a multipart/byteranges part
+
+    :returns: bytes
+    """
+    lines = ['\r\n--{0}'.format(boundary)]
+    if content_type is not None:
+        lines.append('Content-Type: {0}'.format(content_type))
+    lines.append('Content-Range: {0}'.format(
+        content_range(start, stop, length)
+    ))
+    lines.append('\r\n')
+    return '\r\n'.join(lines).encode('latin-1')
+
+
+def apply_range(request, response):
+    """
+    Answer Range requests with partial content
+
+    Only successful GET responses with bytes, text, :obj:`FileRegion` or
+    seekable bodies are considered; they are also advertised with
+    ``Accept-Ranges: bytes``. A single range is answered with a 206 and the
+    selected bytes, several ranges with a multipart/byteranges 206, and
+    unsatisfiable ranges with a 416.
+
+    :param :obj:`Request` request: the request being served
+    :param :obj:`Response` response: the response to update
+    """
+    if request.method != 'GET' or response.status != 200:
+        return
+    if 'content-encoding' in response.headers:
+        return
+
+    body = response.body
+    if isinstance(body, six.text_type):
+        body = body.encode('utf-8')
+    length = body_length(body)
+    if length is None:
+        return
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    ranges = parse_range(request.environment.get('HTTP_RANGE'), length)
+    if ranges is None:
+        return
+    if not if_range_matches(
+        request.environment.get('HTTP_IF_RANGE'),
+        response.headers
+    ):
+        logger.debug('If-Range did not match; sending the full body')
+        return
+
+    if not ranges:
+        response.status = 416
+        response.headers['Content-Range'] = 'bytes */{0}'.format(length)
+        response.headers['Content-Length'] = '0'
+        response.body = b''
+        return
+
+    # seekable bodies are sliced relative to their current position
+    base = 0
+    if hasattr(body, 'seek'):
+        base = body.tell()
+    response.status = 206
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response.body = slice_body(body, start, stop, base)
+        response.headers['Content-Range'] = content_range(
+            start,
+            stop,
+            length
+        )
+        response.headers['Content-Length'] = str(stop - start)
+        return
+
+    boundary = binascii.hexlify(os.urandom(16)).decode('ascii')
+    content_type = response.headers.get('content-type')
+    response.body = multipart_body(
+        body,
+        ranges,
+        length,
+        content_type,
+        boundary,
+        base
+    )
+    response.headers['Content-Type'] = (
+        'multipart/byteranges; boundary={0}'.format(boundary)
+    )
+    headers_length = sum(
+        len(part_header(start, stop, length, content_type, boundary))
+        for start, stop in ranges
+    )
+    ranges_length = sum(stop - start for start, stop in ranges)
+    closing_length = len('\r\n--{0}--\r\n'.format(boundary))
+    response.headers['Content-Length'] = str(
+        headers_length + ranges_length + closing_length
+    )
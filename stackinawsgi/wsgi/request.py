@@ -14,6 +14,82 @@ else:
 logger = logging.getLogger(__name__)
 
 
+class RequestHeaders(dict):
+    """
+    Request header dictionary that records the headers set on it
+
+    StackInABox hands the header dictionary it is called with to the
+    services, which commonly set their response headers on it and return
+    it, e.g. ``return (200, headers, body)``. The headers set after the
+    request was parsed are recorded so the response carries only those
+    instead of echoing every request header back to the client.
+
+    :ivar set assigned: names of the headers set since construction
+    """
+
+    __slots__ = ('assigned',)
+
+    def __init__(self, *args, **kwargs):
+        """
+        Populate the headers without recording them
+        """
+        super(RequestHeaders, self).__init__(*args, **kwargs)
+        self.assigned = set()
+
+    def __setitem__(self, key, value):
+        super(RequestHeaders, self).__setitem__(key, value)
+        self.assigned.add(key)
+
+    def __delitem__(self, key):
+        super(RequestHeaders, self).__delitem__(key)
+        self.assigned.discard(key)
+
+    def pop(self, key, *default):
+        """
+        Remove a header, which is no longer a response header
+        """
+        self.assigned.discard(key)
+        return super(RequestHeaders, self).pop(key, *default)
+
+    def popitem(self):
+        """
+        Remove any header, which is no longer a response header
+        """
+        key, value = super(RequestHeaders, self).popitem()
+        self.assigned.discard(key)
+        return (key, value)
+
+    def clear(self):
+        """
+        Remove all of the headers, including the response headers
+        """
+        super(RequestHeaders, self).clear()
+        self.assigned.clear()
+
+    def setdefault(self, key, default=None):
+        """
+        Set a header that is not present, recording it
+        """
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        """
+        Set several headers, recording them
+        """
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def response_headers(self):
+        """
+        The headers set on the dictionary as the response headers
+
+        :returns: dict
+        """
+        return {key: self[key] for key in self.assigned}
+
+
 class Request(object):
     """
     The Request Object Model for the StackInAWSGI Framework
@@ -62,21 +138,22 @@ class Request(object):
         else:
             self.query = None
 
-        self.headers = {}
+        headers = {}
         # build out the headers
         for k, v in self.environment.items():
             env_key = k.upper()
             if env_key.startswith('HTTP_'):
                 header_key = k[len('HTTP_'):]
-                self.headers[header_key] = v
+                headers[header_key] = v
                 logger.debug(
                     'Headers[{0} -> {1}] = {2} -> {3}'.format(
                         k,
                         header_key,
                         v,
-                        self.headers[header_key]
+                        headers[header_key]
                     )
                 )
+        self.headers = RequestHeaders(headers)
 
     @property
     def url(self):
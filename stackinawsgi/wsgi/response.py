@@ -1,9 +1,14 @@
 """
 Stack-In-A-WSGI Response Module
 """
+try:
+    from collections.abc import Iterable
+except ImportError:  # pragma: no cover
+    from collections import Iterable
 
+import six
 
-from stackinabox.util.tools import CaseInsensitiveDict
+from .headers import Headers
 
 
 class Response(object):
@@ -11,11 +16,21 @@ class Response(object):
     The Response Object Model for the StackInAWSGI Framework
     """
 
+    # Headers that are retained on a 304 Not Modified response
+    not_modified_headers = (
+        'cache-control',
+        'content-location',
+        'date',
+        'etag',
+        'expires',
+        'vary'
+    )
+
     def __init__(self):
         """
         Create the Response Model Object
         """
-        self.headers = CaseInsensitiveDict()
+        self.headers = Headers()
         self.status = 500
         self._body = b'Internal Server Error'
 
@@ -25,6 +40,8 @@ class Response(object):
 
         :param integer status: the HTTP Status Code for the Response Message
         :param dict headers: the HTTP Headers for the Response Message
+        :raises: ValueError if a header name or value is not valid per
+            PEP-3333
         :param generator body: the HTTP Message Body for the Response Message
         """
         self.status = status
@@ -41,3 +58,46 @@ class Response(object):
         """
         # Note: This needs to act like an iterable or FILE-like object
         return self._body
+
+    @body.setter
+    def body(self, value):
+        """
+        Replace the Response Message Body
+
+        :param value: bytes, text_type, or an iterable of chunks
+        """
+        self._body = value
+
+    @property
+    def is_streaming(self):
+        """
+        Whether the body is an iterable of chunks instead of a single value
+        """
+        if isinstance(self._body, (six.binary_type, six.text_type)):
+            return False
+        return isinstance(self._body, Iterable)
+
+    def iter_body(self):
+        """
+        Iterate the Response Message Body as chunks for the WSGI server
+
+        :returns: generator of body chunks
+        """
+        if self.is_streaming:
+            for chunk in self._body:
+                yield chunk
+        else:
+            yield self._body
+
+    def not_modified(self):
+        """
+        Convert the response into a 304 Not Modified response
+
+        Only the headers permitted by RFC-7232 Section 4.1 are kept and the
+        body is dropped.
+        """
+        self.status = 304
+        for header in list(self.headers.keys()):
+            if header.lower() not in self.not_modified_headers:
+                del self.headers[header]
+        self._body = b''
@@ -0,0 +1,168 @@
+"""
+Stack-In-A-WSGI: Response Header Size Benchmark
+
+Measures the response header bytes a mock server sends back to a bare
+client and to a header-heavy client, e.g. a browser or an SDK sending
+cookies, tracing and authentication headers:
+
+    python tools/header_benchmark.py --extra-headers 20 --header-bytes 200
+
+The bytes saved per response are the difference between the header bytes
+the header-heavy client would receive if its request headers were echoed
+back and the header bytes it receives.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import io
+import json
+import sys
+
+from stackinabox.services.hello import HelloService
+from stackinabox.stack import StackInABox
+
+from stackinawsgi.wsgi.app import App
+
+
+# Headers sent by a typical header-heavy client
+client_headers = {
+    'HTTP_ACCEPT': 'application/json, text/plain, */*',
+    'HTTP_ACCEPT_ENCODING': 'gzip, deflate, br',
+    'HTTP_ACCEPT_LANGUAGE': 'en-US,en;q=0.9',
+    'HTTP_AUTHORIZATION': 'Bearer ' + 'a' * 600,
+    'HTTP_COOKIE': '; '.join(
+        'cookie{0}={1}'.format(index, 'v' * 40) for index in range(10)
+    ),
+    'HTTP_USER_AGENT': (
+        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, '
+        'like Gecko) Chrome/120.0 Safari/537.36'
+    ),
+    'HTTP_TRACEPARENT': (
+        '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+    ),
+}
+
+
+def header_bytes(headers):
+    """
+    Size of the headers as sent on the wire
+
+    :param list headers: (name, value) pairs given to start_response
+    :returns: int number of bytes
+    """
+    return sum(
+        len('{0}: {1}\r\n'.format(name, value).encode('latin-1'))
+        for name, value in headers
+    )
+
+
+def measure(app, path, extra_headers):
+    """
+    Serve one request and measure its response headers
+
+    :param :obj:`App` app: the application
+    :param text_type path: request path
+    :param dict extra_headers: WSGI environ keys of the request headers
+    :returns: tuple of (status, response header bytes, request header bytes)
+    """
+    environ = {
+        'wsgi.input': io.BytesIO(),
+        'wsgi.url_scheme': 'http',
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SCRIPT_NAME': '',
+        'HTTP_HOST': 'localhost',
+    }
+    environ.update(extra_headers)
+    captured = []
+
+    def start_response(status, headers):
+        captured.append((status, headers))
+
+    b''.join(
+        chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+        for chunk in app(environ, start_response)
+    )
+    status, headers = captured[0]
+    request_bytes = header_bytes(
+        (name[len('HTTP_'):], value)
+        for name, value in extra_headers.items()
+    )
+    return (status, header_bytes(headers), request_bytes)
+
+
+def run(extra_headers=0, header_bytes_each=100):
+    """
+    Measure the response headers for the bare and header-heavy clients
+
+    :param int extra_headers: number of generated X-Client-* headers added
+        to the typical client headers
+    :param int header_bytes_each: size of each generated header value
+    :returns: dict of results per endpoint
+    """
+    heavy = dict(client_headers)
+    for index in range(extra_headers):
+        heavy['HTTP_X_CLIENT_{0}'.format(index)] = 'x' * header_bytes_each
+
+    app = App([HelloService])
+    app.StackInABoxUriUpdate('localhost')
+    session_id = app.stack_service.create_session()
+    endpoints = {
+        'service': '/stackinabox/{0}/hello/'.format(session_id),
+        'unknown-session': '/stackinabox/unknown/hello/',
+        'admin-info': '/admin/{0}'.format(session_id),
+    }
+
+    results = {}
+    try:
+        for name, path in sorted(endpoints.items()):
+            status, bare, _ = measure(app, path, {})
+            _, received, sent = measure(app, path, heavy)
+            results[name] = {
+                'status': status,
+                'request-header-bytes': sent,
+                'bare-client-bytes': bare,
+                'heavy-client-bytes': received,
+                'saved-bytes': bare + sent - received
+            }
+    finally:
+        app.stack_service.remove_session(session_id)
+        StackInABox.reset_services()
+    return results
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description='Measure the response header bytes per client'
+    )
+    parser.add_argument('--extra-headers', type=int, default=0)
+    parser.add_argument('--header-bytes', type=int, default=100)
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args.extra_headers, args.header_bytes)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print('{0:<16} {1:>8} {2:>8} {3:>8} {4:>8}'.format(
+            'endpoint', 'request', 'bare', 'heavy', 'saved'
+        ))
+        for name, result in sorted(results.items()):
+            print('{0:<16} {1:>8} {2:>8} {3:>8} {4:>8}'.format(
+                name,
+                result['request-header-bytes'],
+                result['bare-client-bytes'],
+                result['heavy-client-bytes'],
+                result['saved-bytes']
+            ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Stack-In-A-WSGI: Session Memory Benchmark
+
+Measures the memory used per session by creating many sessions in one
+process and tracing the allocations:
+
+    python tools/session_memory_benchmark.py --sessions 20000 \\
+        --service stackinabox.services.hello:HelloService
+
+Idle sessions are only created; active sessions are also sent one
+request. Requires Python 3 for tracemalloc.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import gc
+import importlib
+import json
+import sys
+import tracemalloc
+
+from stackinawsgi.session.service import (
+    global_sessions,
+    StackInAWsgiSessionManager
+)
+
+
+def load_service(spec):
+    """
+    Import a service class
+
+    :param text_type spec: service as ``module:Class``
+    :returns: the service class
+    """
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def measure(service, count, path=None):
+    """
+    Measure the memory used by new sessions
+
+    :param service: service class registered in each session
+    :param int count: number of sessions to create
+    :param text_type path: optional service path requested once in each
+        session after it is created
+    :returns: int bytes allocated per session
+    """
+    manager = StackInAWsgiSessionManager()
+    manager.register_service(service)
+    # the first session loads what is shared between the sessions
+    manager.remove_session(manager.create_session())
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    session_ids = [manager.create_session() for _ in range(count)]
+    if path is not None:
+        for session_id in session_ids:
+            manager.request(
+                'GET',
+                None,
+                u'/{0}/{1}'.format(session_id, path),
+                {}
+            )
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    for session_id in session_ids:
+        del global_sessions[session_id]
+    return (after - before) // count
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description='Measure the memory used per session'
+    )
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument(
+        '--service',
+        default='stackinabox.services.hello:HelloService'
+    )
+    parser.add_argument('--path', default='hello/',
+                        help='service path requested by active sessions')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    service = load_service(args.service)
+    results = {
+        'sessions': args.sessions,
+        'idle-bytes': measure(service, args.sessions),
+        'active-bytes': measure(service, args.sessions, args.path)
+    }
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print('sessions:               {0}'.format(results['sessions']))
+        print('bytes per idle session:   {0}'.format(results['idle-bytes']))
+        print('bytes per active session: {0}'.format(
+            results['active-bytes']
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Stack-In-A-WSGI: Start-up Benchmark
+
+Measures, in fresh interpreters, how long a mock server takes from
+``import stackinawsgi`` to serving its first request:
+
+    python tools/startup_benchmark.py --runs 20 \\
+        --service stackinabox.services.hello:HelloService
+
+Each run reports the time spent importing the package, importing
+:obj:`App`, constructing it with the service, creating a session and
+serving the first request in-process.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import subprocess
+import sys
+
+
+# Runs in the child interpreter; prints the phase timings as JSON
+measure_script = """
+from timeit import default_timer
+start = default_timer()
+import stackinawsgi
+imported = default_timer()
+App = stackinawsgi.App
+app_imported = default_timer()
+
+import importlib, io, json
+module_name, _, class_name = {service!r}.partition(':')
+service = getattr(importlib.import_module(module_name), class_name)
+app = App([service])
+app.StackInABoxUriUpdate('localhost')
+constructed = default_timer()
+
+session_id = app.stack_service.create_session()
+environ = {{
+    'wsgi.input': io.BytesIO(),
+    'wsgi.url_scheme': 'http',
+    'REQUEST_METHOD': 'GET',
+    'PATH_INFO': '/stackinabox/{{0}}/{path}'.format(session_id),
+    'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80',
+    'SCRIPT_NAME': '',
+}}
+statuses = []
+body = list(app(environ, lambda status, headers: statuses.append(status)))
+served = default_timer()
+
+print(json.dumps({{
+    'import': imported - start,
+    'import_app': app_imported - imported,
+    'construct': constructed - app_imported,
+    'first_request': served - constructed,
+    'total': served - start,
+    'status': statuses[0],
+}}))
+"""
+
+phases = ('import', 'import_app', 'construct', 'first_request', 'total')
+
+
+def run_once(service, path, python=sys.executable):
+    """
+    Measure one cold start in a new interpreter
+
+    :param text_type service: service as ``module:Class``
+    :param text_type path: service path requested after the session id
+    :param text_type python: interpreter to use
+    :returns: dict of phase to seconds
+    """
+    output = subprocess.check_output([
+        python,
+        '-c',
+        measure_script.format(service=service, path=path)
+    ])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def summarize(runs):
+    """
+    Summarize the runs
+
+    :param list runs: dicts from :func:`run_once`
+    :returns: dict of phase to dict of min, median and max milliseconds
+    """
+    summary = {}
+    for phase in phases:
+        values = sorted(run[phase] * 1000.0 for run in runs)
+        summary[phase] = {
+            'min': values[0],
+            'median': values[len(values) // 2],
+            'max': values[-1]
+        }
+    return summary
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description='Measure stackinawsgi start-up time'
+    )
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument(
+        '--service',
+        default='stackinabox.services.hello:HelloService'
+    )
+    parser.add_argument('--path', default='hello/')
+    parser.add_argument('--json', action='store_true',
+                        help='print the summary as JSON')
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.service, args.path) for _ in range(args.runs)]
+    summary = summarize(runs)
+    if args.json:
+        print(json.dumps(summary, indent=2, sort_keys=True))
+    else:
+        print('{0:<14} {1:>10} {2:>10} {3:>10}'.format(
+            'phase (ms)', 'min', 'median', 'max'
+        ))
+        for phase in phases:
+            print('{0:<14} {1:>10.2f} {2:>10.2f} {3:>10.2f}'.format(
+                phase,
+                summary[phase]['min'],
+                summary[phase]['median'],
+                summary[phase]['max']
+            ))
+        print('first response status: {0}'.format(runs[-1]['status']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())